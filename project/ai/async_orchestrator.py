@@ -0,0 +1,503 @@
+"""
+Async Multi-Simulation Orchestrator (asyncio, non-blocking TraCI)
+- Drives many SUMO instances from ONE process: every simulation is a coroutine
+  talking TraCI over its own non-blocking socket (asyncio streams, framing from
+  traci_wire.py), so dozens of controller evaluations need no process per sim.
+- Pipelining: the setup queries go out as one message, all subscriptions as a
+  second one; after that a step is ONE round trip: the controller's set commands
+  and the simulationStep share a message, and everything it observes (halting
+  numbers of the TLS lanes, current phase, time, expected / arrived vehicles)
+  comes back as variable subscriptions inside the step response.
+  (The blocking traci loop of minqueue_tls.py needs lanes + 3 round trips per step.)
+- Backpressure: --max-active worker coroutines take jobs from a bounded queue, so
+  at most that many SUMO processes / sockets exist at once; each connection has a
+  single request in flight, so no write buffer can grow.
+- Timeouts: every simulation has a wall-clock budget (--timeout) and a deadline per
+  request (--step-timeout); a sim that exceeds either is killed and reported as
+  "timeout" while the others carry on.
+- Controllers: minqueue (same decisions as minqueue_tls.run_controller) and fixed
+  (the program of the net file).
+- bench: records one run through traci_replay.py, then serves it to 1..N
+  concurrent clients without SUMO, which isolates the coordinator's own cost
+  (CPU us per simulated step of this process, aggregate steps/s).
+
+Usage (examples):
+  python ai/async_orchestrator.py run --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --controllers minqueue fixed --min-green 6 8 12 --seeds 1 2 3 4 --until 1800 --max-active 12
+  python ai/async_orchestrator.py bench --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --until 600 --sims 1 8 32
+
+Outputs (in --out, default runs/orchestrator):
+  - runs.csv         one row per simulation: status, steps, switches, queue integral, arrivals, wall time
+  - sim-<id>.log     SUMO's console output; with --xml-outputs also sim-<id>/tripinfo.xml, edgeData.xml
+  - bench.csv        (bench) coordinator overhead per number of concurrent simulations
+Dependencies:
+  - SUMO installed, SUMO_HOME set
+"""
+import os, sys, csv, time
+import argparse
+import asyncio
+import socket
+import struct
+from pathlib import Path
+
+import numpy as np
+
+# --- SUMO bootstrap ---
+SUMO_HOME = os.environ.get("SUMO_HOME")
+if not SUMO_HOME:
+    raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+
+AI_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(AI_DIR))
+import traci_wire as tw  # noqa: E402
+from sim_checkpoint import quiet_cfg, output_args  # noqa: E402
+from phase_scoring import PhaseScorer  # noqa: E402
+from minqueue_tls import phase_lane_map, choose_phase  # noqa: E402
+
+RESP_LANE = tw.CMD_SUBSCRIBE_LANE_VARIABLE + tw.RESPONSE_OFFSET
+RESP_TL = tw.CMD_SUBSCRIBE_TL_VARIABLE + tw.RESPONSE_OFFSET
+RESP_SIM = tw.CMD_SUBSCRIBE_SIM_VARIABLE + tw.RESPONSE_OFFSET
+
+_INT = struct.Struct("!i")
+_DOUBLE = struct.Struct("!d")
+
+RUN_FIELDS = ["id", "controller", "min_green", "seed", "status", "error", "sim_end", "steps",
+              "switches", "queue_veh_s", "arrived", "round_trips", "wall_s"]
+
+class TraCIError(RuntimeError):
+    pass
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+# ---------------- connection ----------------
+
+class _Framer(asyncio.Protocol):
+    """Cuts the byte stream into TraCI messages and hands each to the request waiting for it."""
+
+    def __init__(self):
+        self.transport = None
+        self.buf = bytearray()
+        self.waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        if self.waiter is None or len(self.buf) < 4:
+            return
+        n = int.from_bytes(self.buf[:4], "big")
+        if len(self.buf) >= n:
+            msg = bytes(self.buf[4:n])
+            del self.buf[:n]
+            if not self.waiter.done():
+                self.waiter.set_result(msg)
+
+    def connection_lost(self, exc):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(ConnectionError(str(exc) if exc else "connection closed by the simulation"))
+
+class AsyncConnection:
+    """
+    One TraCI connection on a non-blocking socket; request() sends several commands as
+    one message and awaits the answer. A connection never has more than one request in
+    flight, so its write buffer cannot grow (no drain needed).
+    """
+
+    def __init__(self, transport, framer: _Framer, step_timeout: float, budget: float | None = None):
+        self.transport = transport
+        self.framer = framer
+        self.step_timeout = step_timeout
+        self.subs = {}  # (response id, object id) -> {variable: value}, refreshed by every step
+        self._subs_raw = {}  # same dicts keyed by the raw object id bytes
+        self.round_trips = 0
+        # deadlines are timer handles that abort the transport (no wait_for task per request)
+        self.expired = None
+        self._loop = asyncio.get_running_loop()
+        self._budget = self._loop.call_later(budget, self._expire, "simulation") if budget else None
+
+    @classmethod
+    async def connect(cls, port: int, proc, startup_timeout: float, step_timeout: float,
+                      budget: float | None = None):
+        """Retry until the simulation listens on port (or exits / times out)."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + startup_timeout
+        while True:
+            try:
+                transport, framer = await loop.create_connection(_Framer, "localhost", port)
+                break
+            except OSError:
+                if proc.returncode is not None:
+                    raise TraCIError(f"simulation exited with code {proc.returncode} before accepting TraCI")
+                if loop.time() > deadline:
+                    raise asyncio.TimeoutError("startup")
+                await asyncio.sleep(0.05)
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(transport, framer, step_timeout, budget)
+
+    def _expire(self, which: str):
+        self.expired = which
+        self.transport.abort()
+
+    async def request(self, *commands):
+        """Send commands in one message; returns the values of its get commands, in order."""
+        msg = b"".join(commands)
+        timer = self._loop.call_later(self.step_timeout, self._expire, "request")
+        self.framer.waiter = self._loop.create_future()
+        try:
+            self.transport.write(tw.frame(msg))
+            payload = await self.framer.waiter
+        except ConnectionError:
+            if self.expired:
+                raise asyncio.TimeoutError(self.expired) from None
+            raise
+        finally:
+            timer.cancel()
+            self.framer.waiter = None
+        self.round_trips += 1
+        return self._parse(payload, [cmd_id for cmd_id, _ in tw.iter_commands(msg)])
+
+    def _parse(self, payload: bytes, cmd_ids):
+        r = tw.Reader(payload)
+        values = []
+        for cmd_id in cmd_ids:
+            sid, result, description = r.status()
+            if result != tw.RTYPE_OK:
+                raise TraCIError(f"command 0x{sid:02x} failed: {description}")
+            if cmd_id == tw.CMD_SIMSTEP:
+                for _ in range(r.i32()):
+                    self._read_subscription(r)
+            elif 0xd0 <= cmd_id <= 0xdf:
+                self._read_subscription(r)
+            elif 0xa0 <= cmd_id <= 0xaf:
+                _, end = r.command()
+                r.u8()        # variable
+                r.string()    # object id
+                values.append(r.typed())
+                r.pos = end
+        return values
+
+    def _read_subscription(self, r: tw.Reader):
+        # hot path (every subscription, every step): index the buffer directly and unpack the
+        # int / double values inline; anything else goes through Reader.typed()
+        buf, pos = r.buf, r.pos
+        n = buf[pos]
+        head = pos + 1 if n else pos + 5
+        end = pos + (n or _INT.unpack_from(buf, pos + 1)[0])
+        resp = buf[head]
+        p = head + 1
+        k = _INT.unpack_from(buf, p)[0]
+        key = (resp, buf[p + 4:p + 4 + k])
+        vals = self._subs_raw.get(key)
+        if vals is None:
+            vals = self._subs_raw[key] = self.subs.setdefault((resp, key[1].decode("utf-8")), {})
+        p += 4 + k + 1
+        for _ in range(buf[p - 1]):
+            var, st, t = buf[p], buf[p + 1], buf[p + 2]
+            if t == tw.TYPE_INTEGER and not st:
+                vals[var] = _INT.unpack_from(buf, p + 3)[0]
+                p += 7
+            elif t == tw.TYPE_DOUBLE and not st:
+                vals[var] = _DOUBLE.unpack_from(buf, p + 3)[0]
+                p += 11
+            else:
+                r.pos = p + 2
+                value = r.typed()
+                if st != tw.RTYPE_OK:
+                    raise TraCIError(f"subscription 0x{resp:02x} variable 0x{var:02x}: {value}")
+                vals[var] = value
+                p = r.pos
+        r.pos = end
+
+    async def close(self):
+        if self._budget is not None:
+            self._budget.cancel()
+        try:
+            await self.request(tw.command(tw.CMD_CLOSE))
+        finally:
+            self.transport.close()
+
+# ---------------- controllers ----------------
+
+def _links_by_index(flat):
+    """Incoming lane per link index from a flat TL_CONTROLLED_LINKS compound (see traci's _readLinks)."""
+    lanes, pos = [], 1
+    for _ in range(flat[0]):
+        n = flat[pos]
+        links = flat[pos + 1:pos + 1 + n]
+        lanes.append(links[0][0] if links else None)
+        pos += 1 + n
+    return lanes
+
+def _phase_states(flat):
+    """Phase state strings of the first program from a flat TL_COMPLETE_DEFINITION_RYG compound."""
+    if not flat:
+        raise TraCIError("no signal program")
+    # program = [programID, type, currentPhase, [phase compounds...], [params...]],
+    # phase = [duration, state, minDur, maxDur, [next...], name]
+    return [ph[1] for ph in flat[0][3]]
+
+class MinQueuePolicy:
+    """minqueue_tls.run_controller on subscribed halting numbers: the same PhaseScorer
+    (queue mode) and choose_phase rule, fed from the wire instead of traci."""
+
+    def __init__(self, states, link_lanes, min_green: float):
+        self.scorer = PhaseScorer.from_phase_lanes({"tls": phase_lane_map(states, link_lanes)})
+        self.min_green = min_green
+        self.last_switch = -1e9
+
+    def __call__(self, t: float, halting: dict, cur_phase: int):
+        x = np.fromiter((halting[ln] for ln in self.scorer.lanes), np.float64, len(self.scorer.lanes))
+        best = choose_phase(self.scorer.scores(x), cur_phase, t - self.last_switch, self.min_green)
+        if best is not None:
+            self.last_switch = t
+        return best
+
+async def drive(conn: AsyncConnection, job: dict, rec: dict):
+    """Set up subscriptions, then step the simulation under the job's controller until done."""
+    tls = job["tls"]
+    logic, links, step_len = await conn.request(
+        tw.get_variable(tw.CMD_GET_TL_VARIABLE, tw.TL_COMPLETE_DEFINITION_RYG, tls),
+        tw.get_variable(tw.CMD_GET_TL_VARIABLE, tw.TL_CONTROLLED_LINKS, tls),
+        tw.get_variable(tw.CMD_GET_SIM_VARIABLE, tw.VAR_DELTA_T))
+    link_lanes = _links_by_index(links)
+    phases = _phase_states(logic)
+    lanes = sorted({ln for ln in link_lanes if ln})
+    await conn.request(
+        *[tw.subscribe(tw.CMD_SUBSCRIBE_LANE_VARIABLE, ln, [tw.LAST_STEP_VEHICLE_HALTING_NUMBER]) for ln in lanes],
+        tw.subscribe(tw.CMD_SUBSCRIBE_TL_VARIABLE, tls, [tw.TL_CURRENT_PHASE]),
+        tw.subscribe(tw.CMD_SUBSCRIBE_SIM_VARIABLE, "",
+                     [tw.VAR_TIME, tw.VAR_MIN_EXPECTED_VEHICLES, tw.VAR_ARRIVED_VEHICLES_NUMBER]))
+    policy = MinQueuePolicy(phases, link_lanes, job["min_green"]) if job["controller"] == "minqueue" else None
+    lane_subs = [conn.subs[(RESP_LANE, ln)] for ln in lanes]
+    tl_sub = conn.subs[(RESP_TL, tls)]
+    sim = conn.subs[(RESP_SIM, "")]
+    until = job["until"]
+    H = tw.LAST_STEP_VEHICLE_HALTING_NUMBER
+
+    while True:
+        t = sim[tw.VAR_TIME]
+        rec["sim_end"] = t
+        if until is not None and t >= until:
+            break
+        if sim[tw.VAR_MIN_EXPECTED_VEHICLES] <= 0:
+            break
+        cmds = []
+        if policy is not None:
+            halting = {ln: s[H] for ln, s in zip(lanes, lane_subs)}
+            best = policy(t, halting, tl_sub[tw.TL_CURRENT_PHASE])
+            if best is not None:
+                cmds.append(tw.set_int(tw.CMD_SET_TL_VARIABLE, tw.TL_PHASE_INDEX, tls, best))
+                rec["switches"] += 1
+        await conn.request(*cmds, tw.simstep())
+        rec["steps"] += 1
+        rec["queue_veh_s"] += sum(s[H] for s in lane_subs) * step_len
+        rec["arrived"] += sim[tw.VAR_ARRIVED_VEHICLES_NUMBER]
+
+# ---------------- simulations ----------------
+
+def sumo_command(job: dict, binary: str = "sumo", extra_args: str = "", xml_outputs: bool = False):
+    cmd = [binary, "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--no-step-log", "true"]
+    if xml_outputs:
+        out = Path(job["dir"])
+        out.mkdir(parents=True, exist_ok=True)
+        cmd += output_args({"tripinfo-output": out / "tripinfo.xml", "edgedata-output": out / "edgeData.xml"})
+    return cmd + (extra_args.split() if extra_args else [])
+
+def sumo_launcher(binary: str = "sumo", extra_args: str = "", xml_outputs: bool = False):
+    """launch(job, port) -> command line of a SUMO instance serving TraCI on port."""
+    return lambda job, port: sumo_command(job, binary, extra_args, xml_outputs) + ["--remote-port", str(port)]
+
+async def run_simulation(job: dict, launch, opts) -> dict:
+    """One simulation, start to close; failures and timeouts end up in the returned record."""
+    rec = {"id": job["id"], "controller": job["controller"], "min_green": job["min_green"],
+           "seed": job["seed"], "status": "ok", "error": "", "sim_end": None, "steps": 0,
+           "switches": 0, "queue_veh_s": 0.0, "arrived": 0, "round_trips": 0, "wall_s": 0.0}
+    t0 = time.perf_counter()
+    port = _free_port()
+    log_path = Path(opts.out) / f"sim-{job['id']:04d}.log"
+    conn = None
+    with log_path.open("w", encoding="utf-8") as log:
+        proc = await asyncio.create_subprocess_exec(*launch(job, port), stdout=log, stderr=asyncio.subprocess.STDOUT)
+        try:
+            conn = await AsyncConnection.connect(port, proc, opts.startup_timeout, opts.step_timeout,
+                                                 budget=opts.timeout)
+            await drive(conn, job, rec)
+            await conn.close()
+            await asyncio.wait_for(proc.wait(), opts.step_timeout)
+        except asyncio.TimeoutError as e:
+            rec["status"], rec["error"] = "timeout", str(e)
+        except (TraCIError, OSError) as e:
+            rec["status"], rec["error"] = "error", str(e) or type(e).__name__
+        finally:
+            if conn is not None:
+                rec["round_trips"] = conn.round_trips
+                if conn._budget is not None:
+                    conn._budget.cancel()
+                conn.transport.close()
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+    rec["queue_veh_s"] = round(rec["queue_veh_s"], 3)
+    rec["wall_s"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+async def run_all(jobs, launch, opts, on_done=None):
+    """Run jobs with at most opts.max_active simulations alive at a time."""
+    queue = asyncio.Queue(maxsize=opts.max_active)
+    results = []
+
+    async def worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            rec = await run_simulation(job, launch, opts)
+            results.append(rec)
+            if on_done is not None:
+                on_done(rec)
+
+    workers = [asyncio.create_task(worker()) for _ in range(opts.max_active)]
+    for job in jobs:
+        await queue.put(job)  # blocks while all workers are busy: the producer never runs ahead
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+    return sorted(results, key=lambda r: r["id"])
+
+def orchestrate(jobs, launch, opts):
+    """Run the jobs; returns (records, stats) with the coordinator's own wall / CPU cost."""
+    Path(opts.out).mkdir(parents=True, exist_ok=True)
+
+    def on_done(rec):
+        if opts.verbose:
+            print(f"[{rec['status']}] sim {rec['id']} {rec['controller']} seed={rec['seed']} "
+                  f"t={rec['sim_end']} steps={rec['steps']} {rec['wall_s']:.1f}s {rec['error']}")
+
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    records = asyncio.run(run_all(jobs, launch, opts, on_done))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    steps = sum(r["steps"] for r in records)
+    stats = {"sims": len(records), "max_active": opts.max_active, "steps": steps,
+             "wall_s": round(wall, 3), "coordinator_cpu_s": round(cpu, 3),
+             "cpu_us_per_step": round(cpu / steps * 1e6, 2) if steps else None,
+             "steps_per_s": round(steps / wall, 1) if wall > 0 else None,
+             "failed": sum(r["status"] != "ok" for r in records)}
+    return records, stats
+
+def write_records(path: Path, records):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=RUN_FIELDS)
+        w.writeheader()
+        w.writerows(records)
+
+def make_jobs(args):
+    jobs = []
+    for controller in args.controllers:
+        for mg in (args.min_green if controller == "minqueue" else [None]):
+            for seed in args.seeds:
+                jobs.append({"id": len(jobs), "controller": controller, "min_green": mg, "seed": seed,
+                             "cfg": str(Path(args.cfg).resolve()), "tls": args.tls, "until": args.until,
+                             "dir": str(Path(args.out) / f"sim-{len(jobs):04d}")})
+    return jobs
+
+# ---------------- bench ----------------
+
+def replay_launcher(trace: Path, record_cmd=None):
+    """launch(job, port) via traci_replay.py: record through a real SUMO, or serve the trace."""
+    script = str(AI_DIR / "traci_replay.py")
+
+    def launch(job: dict, port: int):
+        if record_cmd is not None:
+            return [sys.executable, script, "record", "--trace", str(trace), "--port", str(port), "--"] + record_cmd(job)
+        return [sys.executable, script, "serve", "--trace", str(trace), "--port", str(port)]
+    return launch
+
+def bench(args):
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    trace = Path(args.trace) if args.trace else out / "bench.trc"
+    base = {"controller": "minqueue", "min_green": args.min_green[0], "seed": args.seeds[0],
+            "cfg": str(Path(args.cfg).resolve()), "tls": args.tls, "until": args.until, "dir": str(out)}
+    if not trace.exists():
+        print(f"[INFO] Recording one run through SUMO -> {trace}")
+        record_cmd = lambda job: sumo_command(job, args.sumo_binary, args.sumo_args)
+        args.max_active = 1
+        recs, _ = orchestrate([{"id": 0, **base}], replay_launcher(trace, record_cmd), args)
+        if recs[0]["status"] != "ok":
+            raise SystemExit(f"[ERROR] Recording failed: {recs[0]['status']} {recs[0]['error']}")
+    rows = []
+    for n in args.sims:
+        args.max_active = n
+        recs, stats = orchestrate([{"id": i, **base} for i in range(n)], replay_launcher(trace), args)
+        if stats["failed"]:
+            bad = next(r for r in recs if r["status"] != "ok")
+            raise SystemExit(f"[ERROR] {stats['failed']} replayed simulation(s) failed: {bad['error'] or bad['status']}")
+        rows.append(stats)
+        print(f"[bench] {n:4d} sims  {stats['steps']:8d} steps  wall {stats['wall_s']:7.2f}s  "
+              f"{stats['steps_per_s']:9.1f} steps/s  coordinator {stats['cpu_us_per_step']:7.1f} us CPU/step")
+    path = out / "bench.csv"
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    print(f"[OK] Wrote {path}")
+
+# ---------------- CLI ----------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Run many SUMO controller evaluations from one asyncio process")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def common(p):
+        p.add_argument("--cfg", required=True, help="*.sumocfg path")
+        p.add_argument("--tls", required=True, help="Traffic light ID to control")
+        p.add_argument("--min-green", type=float, nargs="+", default=[8.0], help="minqueue minimum green values (s)")
+        p.add_argument("--seeds", type=int, nargs="+", default=[7], help="SUMO seeds")
+        p.add_argument("--until", type=float, default=None, help="Stop time (s); default: cfg end / no vehicles left")
+        p.add_argument("--timeout", type=float, default=3600.0, help="Wall-clock budget per simulation (s)")
+        p.add_argument("--step-timeout", type=float, default=60.0, help="Deadline per TraCI request (s)")
+        p.add_argument("--startup-timeout", type=float, default=60.0, help="Deadline for SUMO to accept TraCI (s)")
+        p.add_argument("--sumo-binary", default="sumo")
+        p.add_argument("--sumo-args", default="", help="Extra args passed to SUMO")
+        p.add_argument("--out", default="runs/orchestrator", help="Output folder")
+        p.add_argument("--verbose", action="store_true", help="One line per finished simulation")
+
+    p = sub.add_parser("run", help="Evaluate controllers x settings x seeds concurrently")
+    common(p)
+    p.add_argument("--controllers", nargs="+", choices=["minqueue", "fixed"], default=["minqueue"])
+    p.add_argument("--max-active", type=int, default=16, help="Simulations alive at the same time")
+    p.add_argument("--xml-outputs", action="store_true", help="Write tripinfo/edgeData per simulation")
+
+    p = sub.add_parser("bench", help="Coordinator overhead against replayed simulations (no SUMO cost)")
+    common(p)
+    p.add_argument("--sims", type=int, nargs="+", default=[1, 8, 32], help="Concurrent simulation counts")
+    p.add_argument("--trace", default=None, help="Recorded session to serve (default <out>/bench.trc, recorded once)")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "bench":
+        bench(args)
+        return
+    jobs = make_jobs(args)
+    print(f"[INFO] {len(jobs)} simulations, at most {args.max_active} at a time")
+    launch = sumo_launcher(args.sumo_binary, args.sumo_args, args.xml_outputs)
+    records, stats = orchestrate(jobs, launch, args)
+    path = Path(args.out) / "runs.csv"
+    write_records(path, records)
+    print(f"[OK] Wrote {path}")
+    for r in records:
+        print(f"  sim {r['id']:3d} {r['controller']:9s} min_green={r['min_green']} seed={r['seed']} "
+              f"{r['status']:7s} steps={r['steps']} switches={r['switches']} queue={r['queue_veh_s']:.0f} veh*s"
+              + (f"  ({r['error']})" if r["error"] else ""))
+    print(f"[INFO] {stats['steps']} steps in {stats['wall_s']:.1f}s wall ({stats['steps_per_s']} steps/s), "
+          f"coordinator {stats['coordinator_cpu_s']:.2f}s CPU = {stats['cpu_us_per_step']} us/step; "
+          f"{stats['failed']} failed")
+
+if __name__ == "__main__":
+    main()
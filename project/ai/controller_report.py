@@ -0,0 +1,172 @@
+"""
+Controller Comparison Report (throughput and time loss on the same route files)
+- Runs each controller (max-pressure, min-queue, rule-based, and the unchanged
+  signal program as "fixed") on the same cfg, seed and step length, once per route
+  file, in a pool of worker processes (one SUMO each).
+- Throughput: vehicles served by the TLS (first seen on one of its outgoing lanes)
+  per simulated hour, and vehicles arrived per hour.
+- Time loss from the run's tripinfo (scripts/kpi_by_road.summarize_tripinfo), with
+  unfinished vehicles written too, so a controller that leaves vehicles stuck
+  cannot look better for it.
+- Every pair of controllers is compared per route file (served/h, total time loss).
+
+Usage (example):
+  python ai/controller_report.py --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --routes routes/four_roads_ramped.rou.xml --until 1800 --out runs/controller_report
+
+Outputs (in --out):
+  - controller_report.csv   one row per (route file, controller)
+  - <routes>/<controller>/tripinfo.xml, run.log
+Dependencies:
+  - SUMO installed, SUMO_HOME set
+"""
+import os, sys, time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+# --- SUMO / TraCI bootstrap ---
+SUMO_HOME = os.environ.get("SUMO_HOME")
+if not SUMO_HOME:
+    raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+tools = Path(SUMO_HOME) / "tools"
+sys.path.insert(0, str(tools))
+import traci  # noqa: E402
+
+AI_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = AI_DIR.parent
+sys.path.insert(0, str(AI_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from sim_checkpoint import quiet_cfg, output_args, cfg_inputs  # noqa: E402
+from kpi_by_road import summarize_tripinfo  # noqa: E402
+
+CONTROLLERS = ["maxpressure", "minqueue", "rule", "fixed"]
+
+def _run_controller(controller: str, tls_id: str, until: float, step_len: float, params: dict, on_step):
+    if controller == "maxpressure":
+        import maxpressure_tls
+        maxpressure_tls.run_controller(tls_id, params["min_green"], until, on_step=on_step,
+                                       max_green=params["max_green"], max_red=params["max_red"],
+                                       yellow=params["yellow"])
+    elif controller == "minqueue":
+        import minqueue_tls
+        minqueue_tls.run_controller(tls_id, params["min_green"], step_len, until, on_step=on_step)
+    elif controller == "rule":
+        import controller_rule_based
+        controller_rule_based.run_controller(tls_id, until=until, on_step=on_step)
+    else:
+        while traci.simulation.getTime() < until and traci.simulation.getMinExpectedNumber() > 0:
+            traci.simulationStep()
+            on_step()
+
+def _evaluate(job: dict) -> dict:
+    """One controller on one route file; returns the report row."""
+    out = Path(job["dir"])
+    out.mkdir(parents=True, exist_ok=True)
+    tripinfo = out / "tripinfo.xml"
+    cmd = ["sumo", "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--step-length", str(job["step"]),
+           "--no-step-log", "true", "--tripinfo-output.write-unfinished", "true",
+           "-r", job["routes"]] + output_args({"tripinfo-output": tripinfo})
+    t0 = time.perf_counter()
+    with open(out / "run.log", "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        traci.start(cmd)
+        try:
+            out_lanes = sorted({lane_out for lk in traci.trafficlight.getControlledLinks(job["tls"])
+                                for _lane_in, lane_out, _via in lk if lane_out})
+            served, acc = set(), {"arrived": 0}
+
+            def on_step():
+                for ln in out_lanes:
+                    served.update(traci.lane.getLastStepVehicleIDs(ln))
+                acc["arrived"] += traci.simulation.getArrivedNumber()
+
+            start = traci.simulation.getTime()
+            _run_controller(job["controller"], job["tls"], job["until"], job["step"], job["params"], on_step)
+            end = traci.simulation.getTime()
+            running = traci.vehicle.getIDCount()
+        finally:
+            traci.close()
+    trips = next(r for r in summarize_tripinfo(tripinfo) if r["Group"] == "ALL")
+    hours = max(end - start, 1e-9) / 3600.0
+    loss_avg = trips["TimeLoss_avg_s"] if trips["N"] else 0.0
+    return {
+        "routes": Path(job["routes"]).name, "controller": job["controller"],
+        "sim_s": end - start, "served": len(served), "served_per_h": round(len(served) / hours, 1),
+        "arrived": acc["arrived"], "arrived_per_h": round(acc["arrived"] / hours, 1),
+        "running_at_end": running, "trips": trips["N"],
+        "time_loss_avg_s": loss_avg, "time_loss_total_h": round(loss_avg * trips["N"] / 3600.0, 2),
+        "wait_avg_s": trips["Wait_avg_s"] if trips["N"] else 0.0,
+        "wall_s": round(time.perf_counter() - t0, 1),
+    }
+
+def relative(df: pd.DataFrame) -> list[str]:
+    """Lines 'A vs B: throughput +x%, time loss -y%' for every controller pair per route file."""
+    lines = []
+    for routes, g in df.groupby("routes", sort=False):
+        rows = g.set_index("controller")
+        for a in rows.index:
+            for b in rows.index:
+                if a == b or CONTROLLERS.index(a) > CONTROLLERS.index(b):
+                    continue
+                ra, rb = rows.loc[a], rows.loc[b]
+                thr = 100.0 * (ra["served_per_h"] / rb["served_per_h"] - 1.0) if rb["served_per_h"] else float("nan")
+                loss = (100.0 * (ra["time_loss_total_h"] / rb["time_loss_total_h"] - 1.0)
+                        if rb["time_loss_total_h"] else float("nan"))
+                lines.append(f"[{routes}] {a} vs {b}: served/h {thr:+.1f}%, total time loss {loss:+.1f}%")
+    return lines
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare TLS controllers on throughput and time loss")
+    p.add_argument("--cfg", required=True, help="*.sumocfg path (net, outputs; routes replaced by --routes)")
+    p.add_argument("--tls", required=True, help="Traffic light ID to control")
+    p.add_argument("--routes", nargs="+", default=None, help="Route files to compare on (default: the cfg's)")
+    p.add_argument("--controllers", nargs="+", choices=CONTROLLERS, default=CONTROLLERS[:3])
+    p.add_argument("--until", type=float, default=1800.0, help="Simulated seconds per run")
+    p.add_argument("--step", type=float, default=1.0, help="Simulation step length (s), same for all")
+    p.add_argument("--seed", type=int, default=7, help="SUMO seed, same for all")
+    p.add_argument("--min-green", type=float, default=8.0, help="Min green for minqueue / maxpressure")
+    p.add_argument("--max-green", type=float, default=60.0, help="Max green for maxpressure (0 = off)")
+    p.add_argument("--max-red", type=float, default=120.0, help="Max red for maxpressure (0 = off)")
+    p.add_argument("--yellow", type=float, default=3.0, help="Yellow seconds for maxpressure")
+    p.add_argument("--workers", type=int, default=0, help="Worker processes (0 = all cores)")
+    p.add_argument("--out", default="runs/controller_report", help="Output folder")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    cfg = Path(args.cfg).resolve()
+    if not cfg.exists():
+        raise SystemExit(f"[ERROR] Config not found: {cfg}")
+    routes = [Path(r).resolve() for r in args.routes] if args.routes else cfg_inputs(cfg)[1]
+    missing = [str(r) for r in routes if not r.exists()]
+    if missing:
+        raise SystemExit(f"[ERROR] Route file(s) not found: {', '.join(missing)}")
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    params = {"min_green": args.min_green, "max_green": args.max_green,
+              "max_red": args.max_red, "yellow": args.yellow}
+    jobs = [{"controller": c, "tls": args.tls, "cfg": str(cfg), "routes": str(r), "seed": args.seed,
+             "step": args.step, "until": args.until, "params": params,
+             "dir": str(out / r.name.split(".")[0] / c)}
+            for r in routes for c in args.controllers]
+    print(f"[INFO] {len(args.controllers)} controllers x {len(routes)} route file(s), until {args.until:.0f}s")
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1) as pool:
+        rows = list(pool.map(_evaluate, jobs))
+    df = pd.DataFrame(rows)
+    report = out / "controller_report.csv"
+    df.to_csv(report, index=False)
+
+    print(f"[OK] Wrote {report}")
+    print(df.drop(columns=["wall_s"]).to_string(index=False))
+    for line in relative(df):
+        print(line)
+    print(f"[INFO] {len(jobs)} runs in {time.perf_counter() - t0:.1f}s wall")
+
+if __name__ == "__main__":
+    main()
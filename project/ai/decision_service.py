@@ -0,0 +1,641 @@
+"""
+Batched Decision Service (one long-running process deciding phases for many TLS)
+- A TCP service (length-prefixed JSON frames, like TraCI's 4-byte framing) that any
+  number of clients (simulations, field controllers, the load tester) talk to:
+    register  {"op": "register", "tls": {id: {"states": [...], "links": [[[in, out, via], ...], ...]}}}
+              -> {"ok": true, "lanes": {id: [lane, ...]}}   the lane order of that TLS's queues
+    decide    {"op": "decide", "id": k, "t": sim_time, "obs": {id: {"phase": p, "queues": [...]}}}
+              -> {"id": k, "decisions": {id: new_phase}}  (only TLS that switch), "late": bool
+    stats     {"op": "stats", "since": n} -> policy, counters and the latency percentiles
+              of the requests after the first n (default 0: the whole window)
+  Links / states are what traci.trafficlight.getControlledLinks and the program's phase
+  states return; a TLS registered again is replaced.
+- Micro-batching: decide requests from all connections are queued; the batcher waits
+  at most --max-wait-ms after the first one (or until --max-batch TLS are queued), then
+  decides the whole batch at once: one lane vector, one sparse mat-vec over every
+  registered TLS (ai/phase_scoring.py) and vectorised switch rules; under load the
+  queue fills while a batch runs, so batches grow with the load, not the wait.
+- Policies (--policy):
+    minqueue  minqueue_tls.py's rule: the phase with the largest queue on its green
+              incoming lanes, after --min-green, if it beats the current one
+    rule      the same comparison over green phases only, decided every --check-every s
+              (controller_rule_based.py's MIN_GREEN / CHECK_EVERY cadence)
+    dqn       a SharedDQNAgent network (--weights, multi_agent_train.py); obs carry the
+              agent's "state" vector, all TLS of a batch go through one forward pass and
+              action 1 switches to the next green phase (masked until --min-green)
+  An observation with the wrong number of queues / state values (or a bad phase) is
+  not decided; the reply lists it under "errors" and the rest of the batch goes on.
+- Latency: measured per request from the frame's arrival to its reply; the service
+  keeps the last --window latencies for p50 / p99 and counts replies later than
+  --budget-ms as late.
+- load: starts the service as a child process and runs closed-loop clients (one
+  request in flight each) over synthetic 4-arm junctions; reports decisions/s and
+  client round-trip and server latency percentiles per setting.
+- drive: a TraCI client that registers every TLS of a SUMO net and asks the service
+  once per step for all of them (one process for the whole corridor); against a dqn
+  service it sends multi_agent_train.py's state vectors instead of queues.
+
+Usage (examples):
+  python ai/decision_service.py serve --policy minqueue --port 8765 --min-green 8
+  python ai/decision_service.py load --clients 1 8 32 --tls-per-request 1 16 --duration 5
+  python ai/decision_service.py drive --cfg north_test.sumocfg --port 8765 --until 1800
+
+Outputs:
+  - load: <out>/load.csv, one row per (clients, TLS per request) setting
+Dependencies:
+  - NumPy; SUMO + SUMO_HOME for drive; TensorFlow (Keras) for --policy dqn
+"""
+import os, sys, csv, json, time
+import argparse
+import asyncio
+import socket
+import struct
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+AI_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(AI_DIR))
+from phase_scoring import PhaseScorer  # noqa: E402
+
+POLICIES = ["minqueue", "rule", "dqn"]
+GREEN = ("G", "g")
+_LEN = struct.Struct("!I")
+
+def encode(msg: dict) -> bytes:
+    body = json.dumps(msg, separators=(",", ":")).encode()
+    return _LEN.pack(len(body)) + body
+
+# ---------------- policy state ----------------
+
+class Registry:
+    """Registered TLS and the scorer over all of them; rebuilt when a TLS is (re)registered."""
+
+    def __init__(self):
+        self.defs = {}  # tls -> (states, links)
+        self.scorer = None
+        self.index = {}
+        self.lane_idx = []
+        self.last_switch = np.zeros(0)
+        self.last_check = np.zeros(0)
+
+    def register(self, tls_defs: dict) -> dict:
+        for tls, d in tls_defs.items():
+            links = [[tuple(lk) for lk in link] for link in d["links"]]
+            self.defs[tls] = (list(d["states"]), links)
+        self._rebuild(set(tls_defs))
+        return {tls: [self.scorer.lanes[j] for j in self.lane_idx[self.index[tls]]] for tls in tls_defs}
+
+    def _rebuild(self, changed: set):
+        # switch / check times of the TLS that were not (re)registered survive the rebuild
+        prev = {tls: (self.last_switch[t], self.last_check[t]) for tls, t in self.index.items() if tls not in changed}
+        self.scorer = PhaseScorer.from_links(self.defs, "queue")
+        sc = self.scorer
+        self.index = {tls: t for t, tls in enumerate(sc.tls_ids)}
+        # lanes of each TLS (its queue vector order) as indices into the shared lane vector
+        self.lane_idx = []
+        for t, tls in enumerate(sc.tls_ids):
+            rows = slice(sc.indptr[sc.tls_start[t]], sc.indptr[sc.tls_start[t + 1]])
+            self.lane_idx.append(np.unique(sc.indices[rows]))
+        states = [st for tls in sc.tls_ids for st in self.defs[tls][0]]
+        self.row_green = np.array([any(c in GREEN for c in st) and "y" not in st for st in states])
+        # next green phase after every phase (the DQN's "switch"), as a global row index
+        self.next_green = np.zeros(len(states), dtype=np.int64)
+        for t in range(len(sc.tls_ids)):
+            a, b = sc.tls_start[t], sc.tls_start[t + 1]
+            greens = [r for r in range(a, b) if self.row_green[r]] or list(range(a, b))
+            for r in range(a, b):
+                self.next_green[r] = next((g for g in greens if g > r), greens[0])
+        n = len(sc.tls_ids)
+        self.last_switch = np.full(n, -1e9)
+        self.last_check = np.full(n, -1e9)
+        for tls, (switched, checked) in prev.items():
+            t = self.index[tls]
+            self.last_switch[t], self.last_check[t] = switched, checked
+
+class Decider:
+    """Vectorised switch decisions for a batch of (tls index, time, phase, queues / state)."""
+
+    def __init__(self, registry: Registry, policy: str, min_green: float, check_every: float, agent=None):
+        self.reg = registry
+        self.policy = policy
+        self.min_green = min_green
+        self.check_every = check_every
+        self.agent = agent
+
+    def parse(self, ti: int, ob) -> tuple:
+        """(phase, values) of one TLS observation; ValueError if it cannot be decided."""
+        if not isinstance(ob, dict):
+            raise ValueError("observation must be an object")
+        phase = ob.get("phase", 0)
+        if isinstance(phase, bool) or not isinstance(phase, (int, float)) or phase < 0 or phase != int(phase):
+            raise ValueError(f"bad phase {phase!r}")
+        if self.policy == "dqn":
+            key, width = "state", self.agent.state_size
+        else:
+            key, width = "queues", len(self.reg.lane_idx[ti])
+        vals = ob.get(key)
+        if not isinstance(vals, list) or len(vals) != width:
+            raise ValueError(f"{key!r} needs {width} values")
+        try:
+            vals = np.array(vals, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key!r} must be numbers") from None
+        if not np.isfinite(vals).all():
+            raise ValueError(f"{key!r} must be finite")
+        return int(phase), vals
+
+    def decide(self, t_idx: np.ndarray, times: np.ndarray, phases: np.ndarray, obs: list) -> np.ndarray:
+        """New phase per item (-1 = keep). t_idx must not repeat within one call."""
+        reg = self.reg
+        sc = reg.scorer
+        start = sc.tls_start[t_idx]
+        cur = start + np.minimum(phases, sc.n_phases[t_idx] - 1)
+        since = times - reg.last_switch[t_idx]
+        if self.policy == "dqn":
+            states = np.asarray(obs, dtype=np.float32)
+            allowed = np.ones((len(t_idx), 2), dtype=bool)
+            allowed[:, 1] = since >= self.min_green
+            switch = self.agent.act(states, allowed) == 1
+            target = reg.next_green[cur]
+        else:
+            x = np.zeros(len(sc.lanes))
+            idx = np.concatenate([reg.lane_idx[t] for t in t_idx])
+            x[idx] = np.concatenate(obs)
+            scores = sc.scores(x)
+            if self.policy == "rule":
+                scores = np.where(reg.row_green, scores, -np.inf)
+            best = start + sc.best(scores)[t_idx]
+            switch = (best != cur) & (since >= self.min_green) & (scores[best] > scores[cur])
+            if self.policy == "rule":
+                due = times - reg.last_check[t_idx] >= self.check_every
+                reg.last_check[t_idx[due]] = times[due]
+                switch &= due
+            target = best
+        reg.last_switch[t_idx[switch]] = times[switch]
+        return np.where(switch, target - start, -1)
+
+# ---------------- service ----------------
+
+class LatencyLog:
+    """Ring buffer of the last `window` latencies (ms) with totals."""
+
+    def __init__(self, window: int, budget_ms: float):
+        self.values = np.zeros(window)
+        self.n = 0
+        self.budget_ms = budget_ms
+        self.late = 0
+
+    def add(self, ms: np.ndarray):
+        k = len(ms)
+        pos = (self.n + np.arange(k)) % len(self.values)
+        self.values[pos] = ms
+        self.n += k
+        self.late += int((ms > self.budget_ms).sum())
+
+    def summary(self, since: int = 0) -> dict:
+        """Counters and the percentiles of the requests after the first `since` (as far as the window reaches)."""
+        k = min(self.n - max(since, 0), len(self.values))
+        if k <= 0:
+            return {"requests": self.n, "late": self.late}
+        v = self.values[(self.n - k + np.arange(k)) % len(self.values)]
+        p50, p99, pmax = np.percentile(v, [50, 99, 100])
+        return {"requests": self.n, "late": self.late, "p50_ms": round(float(p50), 3),
+                "p99_ms": round(float(p99), 3), "max_ms": round(float(pmax), 3)}
+
+class DecisionService:
+    """Queue of pending decide requests and the micro-batching loop that answers them."""
+
+    def __init__(self, decider: Decider, max_batch: int, max_wait_ms: float, budget_ms: float, window: int):
+        self.decider = decider
+        self.reg = decider.reg
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.latency = LatencyLog(window, budget_ms)
+        self.pending = []  # (protocol, request, arrival perf_counter)
+        self.pending_tls = 0
+        self.batches = 0
+        self.decisions = 0
+        self._work = asyncio.Event()
+        self._full = asyncio.Event()
+
+    def submit(self, proto, msg: dict, arrived: float):
+        self.pending.append((proto, msg, arrived))
+        self.pending_tls += len(msg.get("obs", ()))
+        self._work.set()
+        if self.pending_tls >= self.max_batch:
+            self._full.set()
+
+    def handle(self, proto, msg: dict, arrived: float):
+        op = msg.get("op") if isinstance(msg, dict) else None
+        if op == "decide":
+            t = msg.get("t", 0.0)
+            if not isinstance(msg.get("obs"), dict) or isinstance(t, bool) or not isinstance(t, (int, float)):
+                proto.send({"id": msg.get("id"), "ok": False, "error": "decide needs a numeric 't' and an 'obs' object"})
+                return
+            self.submit(proto, msg, arrived)
+        elif op == "register":
+            try:
+                lanes = self.reg.register(msg["tls"])
+                proto.send({"ok": True, "lanes": lanes})
+            except (KeyError, TypeError, ValueError) as exc:
+                proto.send({"ok": False, "error": f"bad registration: {exc}"})
+        elif op == "stats":
+            since = msg.get("since", 0)
+            agent = self.decider.agent
+            proto.send({"ok": True, "policy": self.decider.policy,
+                        "state_size": agent.state_size if agent is not None else None,
+                        "batches": self.batches, "decisions": self.decisions, "tls": len(self.reg.defs),
+                        **self.latency.summary(since if isinstance(since, int) else 0)})
+        else:
+            proto.send({"ok": False, "error": f"unknown op {op!r}"})
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._work.wait()
+            deadline = self.pending[0][2] + self.max_wait
+            while self.pending_tls < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._full.clear()
+                timer = loop.call_later(remaining, self._full.set)
+                await self._full.wait()
+                timer.cancel()
+            batch, self.pending, self.pending_tls = self.pending, [], 0
+            self._work.clear()
+            self._full.clear()
+            try:
+                self._answer(batch)
+            except Exception as exc:  # noqa: BLE001 - fail the batch, never the batcher
+                print(f"[WARN] Batch of {len(batch)} requests failed: {exc!r}", flush=True)
+                for proto, msg, _ in batch:
+                    proto.send({"id": msg.get("id"), "ok": False, "error": f"internal error: {exc}"})
+
+    def _answer(self, batch):
+        # a TLS may appear in several requests of one batch: decide it once per round
+        rounds, seen = [[]], [set()]
+        replies = []
+        for proto, msg, arrived in batch:
+            out = {"id": msg.get("id"), "decisions": {}}
+            replies.append((proto, out, arrived))
+            t = float(msg.get("t", 0.0))
+            for tls, ob in msg["obs"].items():
+                ti = self.reg.index.get(tls)
+                if ti is None:
+                    out.setdefault("unknown", []).append(tls)
+                    continue
+                try:
+                    phase, vals = self.decider.parse(ti, ob)
+                except ValueError as exc:
+                    out.setdefault("errors", {})[tls] = str(exc)
+                    continue
+                k = next((i for i, s in enumerate(seen) if ti not in s), None)
+                if k is None:
+                    rounds.append([])
+                    seen.append(set())
+                    k = len(rounds) - 1
+                seen[k].add(ti)
+                rounds[k].append((ti, t, phase, vals, out["decisions"], tls))
+        for items in rounds:
+            if not items:
+                continue
+            t_idx = np.array([it[0] for it in items], dtype=np.int64)
+            new = self.decider.decide(t_idx, np.array([it[1] for it in items]),
+                                      np.array([it[2] for it in items], dtype=np.int64), [it[3] for it in items])
+            for it, ph in zip(items, new.tolist()):
+                if ph >= 0:
+                    it[4][it[5]] = ph
+            self.decisions += len(items)
+        self.batches += 1
+        now = time.perf_counter()
+        ms = np.array([(now - arrived) * 1000.0 for _, _, arrived in replies])
+        self.latency.add(ms)
+        for (proto, out, _), m in zip(replies, ms):
+            out["late"] = bool(m > self.latency.budget_ms)
+            proto.send(out)
+
+class _ServiceProtocol(asyncio.Protocol):
+    """Cuts frames off the stream and hands each request to the service."""
+
+    def __init__(self, service: DecisionService):
+        self.service = service
+        self.transport = None
+        self.buf = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data):
+        arrived = time.perf_counter()
+        self.buf += data
+        while len(self.buf) >= 4:
+            n = _LEN.unpack_from(self.buf)[0]
+            if len(self.buf) < 4 + n:
+                break
+            body = bytes(self.buf[4:4 + n])
+            del self.buf[:4 + n]
+            try:
+                msg = json.loads(body)
+            except ValueError:
+                self.send({"ok": False, "error": "invalid JSON"})
+                continue
+            self.service.handle(self, msg, arrived)
+
+    def send(self, msg: dict):
+        if not self.transport.is_closing():
+            self.transport.write(encode(msg))
+
+def load_agent(weights: str, state_size: int):
+    from dqn_agent import SharedDQNAgent
+    agent = SharedDQNAgent(state_size, 2)
+    agent.load(weights)
+    agent.epsilon = 0.0
+    return agent
+
+async def serve(args):
+    agent = load_agent(args.weights, args.state_size) if args.policy == "dqn" else None
+    decider = Decider(Registry(), args.policy, args.min_green, args.check_every, agent)
+    service = DecisionService(decider, args.max_batch, args.max_wait_ms, args.budget_ms, args.window)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: _ServiceProtocol(service), args.host, args.port)
+    print(f"[OK] Decision service ({args.policy}) on {args.host}:{args.port}", flush=True)
+    batcher = asyncio.ensure_future(service.run())
+    try:
+        while True:
+            await asyncio.sleep(args.report_every)
+            s = service.latency.summary()
+            if s["requests"]:
+                print(f"[INFO] {service.decisions} decisions in {service.batches} batches, "
+                      f"p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms, late {s['late']}", flush=True)
+    finally:
+        batcher.cancel()
+        server.close()
+
+# ---------------- clients ----------------
+
+class DecisionClient:
+    """Blocking client (one request at a time), e.g. inside a TraCI control loop."""
+
+    def __init__(self, host: str = "localhost", port: int = 8765, timeout: float = 10.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.next_id = 0
+
+    def _call(self, msg: dict) -> dict:
+        self.sock.sendall(encode(msg))
+        n = _LEN.unpack(self._recv(4))[0]
+        return json.loads(self._recv(n))
+
+    def _recv(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("decision service closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    def register(self, tls_defs: dict) -> dict:
+        res = self._call({"op": "register", "tls": tls_defs})
+        if not res.get("ok"):
+            raise RuntimeError(res.get("error", "registration failed"))
+        return res["lanes"]
+
+    def decide(self, t: float, obs: dict) -> dict:
+        self.next_id += 1
+        return self._call({"op": "decide", "id": self.next_id, "t": t, "obs": obs})
+
+    def stats(self) -> dict:
+        return self._call({"op": "stats"})
+
+    def close(self):
+        self.sock.close()
+
+class AsyncDecisionClient:
+    """asyncio client with one request in flight (the load tester's connections)."""
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host: str, port: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(reader, writer)
+
+    async def call(self, msg: dict) -> dict:
+        self.writer.write(encode(msg))
+        n = _LEN.unpack(await self.reader.readexactly(4))[0]
+        return json.loads(await self.reader.readexactly(n))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def synthetic_junction(name: str) -> dict:
+    """4-arm junction, 2 lanes per arm, NS / EW greens with yellows (load testing)."""
+    arms = ["n", "e", "s", "w"]
+    links = [[[f"{name}_{a}_in_{k}", f"{name}_{arms[(i + 2) % 4]}_out_{k}", ""]] for i, a in enumerate(arms)
+             for k in range(2)]
+    return {"states": ["GGrrGGrr", "yyrryyrr", "rrGGrrGG", "rryyrryy"], "links": links}
+
+async def _load_client(host, port, names, duration: float, rng, rtts: list) -> int:
+    client = await AsyncDecisionClient.connect(host, port)
+    lanes = (await client.call({"op": "register", "tls": {n: synthetic_junction(n) for n in names}}))["lanes"]
+    widths = [len(lanes[n]) for n in names]
+    t_sim, done = 0.0, 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        q = rng.integers(0, 15, sum(widths)).tolist()
+        obs, k = {}, 0
+        for n, w in zip(names, widths):
+            obs[n] = {"phase": 0, "queues": q[k:k + w]}
+            k += w
+        t0 = time.perf_counter()
+        await client.call({"op": "decide", "id": done, "t": t_sim, "obs": obs})
+        rtts.append((time.perf_counter() - t0) * 1000.0)
+        t_sim += 1.0
+        done += len(names)
+    await client.close()
+    return done
+
+async def _load_setting(host, port, clients: int, per_req: int, duration: float):
+    names = [[f"c{c}_j{j}" for j in range(per_req)] for c in range(clients)]
+    probe = await AsyncDecisionClient.connect(host, port)
+    before = await probe.call({"op": "stats"})
+    rtts = []
+    t0 = time.perf_counter()
+    done = await asyncio.gather(*[_load_client(host, port, names[c], duration,
+                                               np.random.default_rng(c), rtts) for c in range(clients)])
+    wall = time.perf_counter() - t0
+    after = await probe.call({"op": "stats", "since": before["requests"]})  # this setting's latencies only
+    await probe.close()
+    r = np.array(rtts)
+    batches = after["batches"] - before["batches"]
+    return {"clients": clients, "tls_per_request": per_req, "decisions": sum(done),
+            "decisions_per_s": round(sum(done) / wall, 1), "requests": len(r),
+            "rtt_p50_ms": round(float(np.percentile(r, 50)), 3), "rtt_p99_ms": round(float(np.percentile(r, 99)), 3),
+            "server_p50_ms": after.get("p50_ms"), "server_p99_ms": after.get("p99_ms"),
+            "tls_per_batch": round((after["decisions"] - before["decisions"]) / max(batches, 1), 1),
+            "late": after["late"] - before["late"]}
+
+def load_test(args):
+    cmd = [sys.executable, str(Path(__file__).resolve()), "serve", "--policy", args.policy, "--host", args.host,
+           "--port", str(args.port), "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms),
+           "--budget-ms", str(args.budget_ms), "--min-green", str(args.min_green), "--report-every", "3600"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        line = proc.stdout.readline()
+        if not line.startswith("[OK]"):
+            raise SystemExit(f"[ERROR] Service did not start: {line.strip()}")
+        rows = []
+        for clients in args.clients:
+            for per_req in args.tls_per_request:
+                row = asyncio.run(_load_setting(args.host, args.port, clients, per_req, args.duration))
+                rows.append(row)
+                print(f"[load] {clients:4d} clients x {per_req:3d} TLS/request  {row['decisions_per_s']:10.1f} "
+                      f"decisions/s  rtt p50 {row['rtt_p50_ms']:.2f} p99 {row['rtt_p99_ms']:.2f} ms  "
+                      f"server p50 {row['server_p50_ms']} p99 {row['server_p99_ms']} ms  "
+                      f"{row['tls_per_batch']} TLS/batch  late {row['late']}")
+    finally:
+        proc.terminate()
+        proc.wait()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    path = out / "load.csv"
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    print(f"[OK] Wrote {path}")
+
+def drive(args):
+    """All TLS of a SUMO run decided by the service, one request per step."""
+    sumo_home = os.environ.get("SUMO_HOME")
+    if not sumo_home:
+        raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+    sys.path.insert(0, str(Path(sumo_home) / "tools"))
+    import traci
+    from sim_checkpoint import quiet_cfg
+
+    client = DecisionClient(args.host, args.port)
+    service = client.stats()
+    traci.start(["sumo", "-c", str(quiet_cfg(args.cfg)), "--step-length", str(args.step), "--no-step-log", "true"])
+    try:
+        defs = {}
+        for tls in traci.trafficlight.getIDList():
+            states = [ph.state for ph in traci.trafficlight.getCompleteRedYellowGreenDefinition(tls)[0].getPhases()]
+            defs[tls] = {"states": states, "links": [[list(lk) for lk in link]
+                                                     for link in traci.trafficlight.getControlledLinks(tls)]}
+        lanes = client.register(defs)
+        print(f"[INFO] Registered {len(defs)} TLS, {sum(len(v) for v in lanes.values())} lanes")
+        inter = None
+        if service.get("policy") == "dqn":
+            # the service's network sees multi_agent_train.py's observation; greens are held as there
+            from multi_agent_train import Intersections
+            from maxpressure_tls import HOLD_S
+            inter = Intersections(list(defs), args.max_approaches, args.max_phases, args.obs_scale)
+            if inter.state_size != service.get("state_size"):
+                raise SystemExit(f"[ERROR] State size {inter.state_size} != service network input "
+                                 f"{service.get('state_size')} (check --max-approaches / --max-phases)")
+            states, _ = inter.observe(0.0)
+        switches, late, errors, t0 = 0, 0, 0, time.perf_counter()
+        while traci.simulation.getMinExpectedNumber() > 0:
+            t = traci.simulation.getTime()
+            if args.until is not None and t >= args.until:
+                break
+            if inter is not None:
+                obs = {tls: {"phase": int(inter.phase[a]), "state": states[a].tolist()}
+                       for a, tls in enumerate(inter.tls_ids)}
+            else:
+                obs = {tls: {"phase": traci.trafficlight.getPhase(tls),
+                             "queues": [traci.lane.getLastStepHaltingNumber(ln) for ln in lanes[tls]]}
+                       for tls in defs}
+            res = client.decide(t, obs)
+            if not res.get("ok", True):
+                raise SystemExit(f"[ERROR] Decision service: {res.get('error')}")
+            late += res.get("late", False)
+            errors += len(res.get("errors", ()))
+            for tls, phase in res["decisions"].items():
+                traci.trafficlight.setPhase(tls, phase)
+                if inter is not None:
+                    traci.trafficlight.setPhaseDuration(tls, HOLD_S)
+                switches += 1
+            traci.simulationStep()
+            if inter is not None:
+                states, _ = inter.observe(traci.simulation.getTime() - t)
+        stats = client.stats()
+    finally:
+        traci.close()
+        client.close()
+    if errors:
+        print(f"[WARN] {errors} observations rejected by the service")
+    print(f"[OK] {len(defs)} TLS to t={t:.0f}: {switches} switches, {late} late replies, "
+          f"{time.perf_counter() - t0:.1f}s wall; service p50 {stats.get('p50_ms')} ms, p99 {stats.get('p99_ms')} ms")
+
+# ---------------- CLI ----------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Batched phase-decision service for many TLS")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def service_opts(p):
+        p.add_argument("--policy", choices=POLICIES, default="minqueue")
+        p.add_argument("--min-green", type=float, default=8.0, help="Minimum green before a switch (s)")
+        p.add_argument("--max-batch", type=int, default=4096, help="TLS per batch before it is decided at once")
+        p.add_argument("--max-wait-ms", type=float, default=1.0, help="Longest wait for a batch to fill (ms)")
+        p.add_argument("--budget-ms", type=float, default=20.0, help="Replies later than this count as late")
+
+    def endpoint(p):
+        p.add_argument("--host", default="localhost")
+        p.add_argument("--port", type=int, default=8765)
+
+    p = sub.add_parser("serve", help="Run the service")
+    service_opts(p)
+    endpoint(p)
+    p.add_argument("--check-every", type=float, default=2.0, help="rule policy: decision cadence (s)")
+    p.add_argument("--weights", default=None, help="dqn policy: SharedDQNAgent weights (.weights.h5)")
+    p.add_argument("--state-size", type=int, default=25, help="dqn policy: state width of the weights")
+    p.add_argument("--window", type=int, default=100000, help="Latencies kept for the percentiles")
+    p.add_argument("--report-every", type=float, default=10.0, help="Seconds between log lines")
+
+    p = sub.add_parser("load", help="Load-test a local service with synthetic junctions")
+    service_opts(p)
+    endpoint(p)
+    p.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="Concurrent connections")
+    p.add_argument("--tls-per-request", type=int, nargs="+", default=[1, 16], help="TLS per decide request")
+    p.add_argument("--duration", type=float, default=5.0, help="Seconds per setting")
+    p.add_argument("--out", default="runs/decision_service", help="Output folder")
+
+    p = sub.add_parser("drive", help="Control every TLS of a SUMO run through the service")
+    endpoint(p)
+    p.add_argument("--cfg", required=True, help="*.sumocfg path")
+    p.add_argument("--step", type=float, default=1.0, help="Simulation step length (s)")
+    p.add_argument("--until", type=float, default=None, help="Stop time (s)")
+    p.add_argument("--max-approaches", type=int, default=8, help="dqn service: approach slots per TLS (as trained)")
+    p.add_argument("--max-phases", type=int, default=8, help="dqn service: green phase slots per TLS (as trained)")
+    p.add_argument("--obs-scale", type=float, default=10.0, help="dqn service: vehicle count divisor (as trained)")
+    args = ap.parse_args()
+    if args.cmd == "serve" and args.policy == "dqn" and not args.weights:
+        ap.error("--policy dqn needs --weights")
+    return args
+
+def main():
+    args = parse_args()
+    if args.cmd == "serve":
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "load":
+        load_test(args)
+    else:
+        drive(args)
+
+if __name__ == "__main__":
+    main()
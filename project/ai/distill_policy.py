@@ -0,0 +1,443 @@
+"""
+Policy Distillation (trained DQN -> decision tree / lookup table as plain Python)
+- Teacher: a DQNAgent / SharedDQNAgent network (Dense 64-64-linear). Its weights are
+  read once through Keras and kept as <weights>.npz; from then on the teacher runs as a
+  NumPy MLP, so labelling millions of states needs no ML framework either.
+- States: sampled from recorded traces (transition_dataset.py: states and next states
+  of the logged runs), optionally widened with integer jitter around them (--jitter)
+  and uniform samples over the observed per-feature range (--uniform), so the student
+  also sees the neighbourhood of the traffic it was recorded in.
+- Students, fitted to the teacher's greedy action:
+    tree  CART (gini) with sample weights = the teacher's Q gap |Q(switch) - Q(keep)|,
+          so splits are spent where a wrong action costs the most; sibling leaves with
+          the same action are merged afterwards
+    lut   a quantised lookup table: --bins quantile bins per feature, one action per
+          cell (gap-weighted majority of the samples in it, the teacher at the cell's
+          centre where there are none); small state sizes only (bins^features cells)
+- Report on the dataset's holdout rows (every 10th transition): action agreement with
+  the teacher (overall and where the teacher switches), mean regret in teacher Q
+  units, and the per-decision latency of the exported code next to the NumPy teacher.
+- Export: a self-contained module with decide(state) -> action (pure Python: nested
+  ifs for the tree, bisect + table for the LUT) and decide_batch(states) (NumPy if
+  available); nothing else is imported.
+
+Usage (example):
+  python ai/distill_policy.py --weights checkpoints/dqn_pretrained.weights.h5 --data runs/transitions \
+      --student tree --max-depth 8 --jitter 2 --out checkpoints/dqn_policy.py
+  python ai/distill_policy.py --weights checkpoints/dqn_pretrained.weights.h5.npz --student lut --bins 12
+
+Outputs:
+  - the policy module (--out, default <weights stem>_policy.py) and <out>.json with the report
+  - <weights>.npz (teacher weights as NumPy arrays) when the teacher was read from Keras weights
+Dependencies:
+  - NumPy; TensorFlow (Keras) only to read a .h5 teacher the first time
+"""
+import sys, json, time
+import argparse
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+AI_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(AI_DIR))
+from transition_dataset import ACTION_SIZE, TransitionDataset  # noqa: E402
+
+STUDENTS = ["tree", "lut"]
+MAX_DEPTH_LIMIT = 24
+MAX_CELLS = 1 << 20
+
+# ---------------------------------------------------------------------------
+# Teacher
+# ---------------------------------------------------------------------------
+
+class MLPTeacher:
+    """The DQN's Q-network as NumPy: ReLU hidden layers, linear output."""
+
+    def __init__(self, layers: list):
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+        self.state_size = self.layers[0][0].shape[0]
+        self.action_size = self.layers[-1][0].shape[1]
+
+    def q(self, states: np.ndarray, batch: int = 65536) -> np.ndarray:
+        out = np.empty((len(states), self.action_size), dtype=np.float32)
+        for i in range(0, len(states), batch):
+            h = np.asarray(states[i:i + batch], dtype=np.float32)
+            for k, (w, b) in enumerate(self.layers):
+                h = h @ w + b
+                if k < len(self.layers) - 1:
+                    np.maximum(h, 0.0, out=h)
+            out[i:i + batch] = h
+        return out
+
+def load_teacher(path: Path, state_size: int) -> MLPTeacher:
+    """Teacher from a .npz (w0, b0, w1, b1, ...) or from Keras weights (then also saved as <path>.npz)."""
+    path = Path(path)
+    if not path.exists():
+        raise SystemExit(f"[ERROR] Missing teacher weights {path}")
+    if path.suffix == ".npz":
+        with np.load(path) as z:
+            n = len([k for k in z.files if k.startswith("w")])
+            return MLPTeacher([(z[f"w{k}"], z[f"b{k}"]) for k in range(n)])
+    from dqn_agent import DQNAgent
+    agent = DQNAgent(state_size, ACTION_SIZE)
+    agent.load(str(path))
+    arrays = agent.model.get_weights()
+    npz = Path(str(path) + ".npz")
+    np.savez(npz, **{f"{'w' if k % 2 == 0 else 'b'}{k // 2}": a for k, a in enumerate(arrays)})
+    print(f"[OK] Wrote {npz} (teacher weights for runs without TensorFlow)")
+    return MLPTeacher(list(zip(arrays[0::2], arrays[1::2])))
+
+# ---------------------------------------------------------------------------
+# State sampling
+# ---------------------------------------------------------------------------
+
+def sample_states(ds: TransitionDataset, jitter: int, uniform: int, rng) -> np.ndarray:
+    """Training states: trace states and next states, jittered copies, uniform samples over their range."""
+    rows = ds.rows(holdout=False)
+    base = np.unique(np.concatenate([rows["state"], rows["next_state"]]), axis=0)
+    parts = [base]
+    for _ in range(jitter):
+        noise = rng.integers(-2, 3, base.shape)
+        parts.append(np.maximum(base + noise, 0.0))
+    if uniform:
+        lo, hi = base.min(axis=0), base.max(axis=0)
+        parts.append(np.floor(rng.uniform(lo, hi + 1, (uniform, base.shape[1]))))
+    return np.concatenate(parts).astype(np.float32)
+
+# ---------------------------------------------------------------------------
+# Students
+# ---------------------------------------------------------------------------
+
+class TreePolicy:
+    """Binary decision tree in arrays: feature / threshold / left / right (-1 = leaf) / action."""
+
+    kind = "tree"
+
+    def __init__(self, feature, threshold, left, right, action):
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.action = np.asarray(action, dtype=np.int64)
+
+    @property
+    def size(self) -> int:
+        return len(self.feature)
+
+    @property
+    def depth(self) -> int:
+        def d(n):
+            return 0 if self.left[n] < 0 else 1 + max(d(self.left[n]), d(self.right[n]))
+        return d(0)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        node = np.zeros(len(X), dtype=np.int64)
+        rows = np.arange(len(X))
+        for _ in range(self.depth):
+            inner = self.left[node] >= 0
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(inner, np.where(go_left, self.left[node], self.right[node]), node)
+        return self.action[node]
+
+def _best_split(X: np.ndarray, y: np.ndarray, w: np.ndarray, min_leaf: int):
+    """(feature, threshold, impurity) of the lowest weighted-gini split, or None."""
+    best = None
+    total1 = float((w * y).sum())
+    total = float(w.sum())
+    n = len(y)
+    for f in range(X.shape[1]):
+        order = np.argsort(X[:, f], kind="stable")
+        xs = X[order, f]
+        cw = np.cumsum(w[order])[:-1]
+        c1 = np.cumsum((w * y)[order])[:-1]
+        pos = np.arange(1, n)  # rows on the left of a cut after index pos - 1
+        ok = (xs[:-1] < xs[1:]) & (pos >= min_leaf) & (n - pos >= min_leaf) & (cw > 0) & (total - cw > 0)
+        if not ok.any():
+            continue
+        cw, c1 = cw[ok], c1[ok]
+        rw, r1 = total - cw, total1 - c1
+        # weighted gini of both sides: w - (w1^2 + w0^2) / w
+        imp = (cw - (c1 ** 2 + (cw - c1) ** 2) / cw) + (rw - (r1 ** 2 + (rw - r1) ** 2) / rw)
+        k = int(np.argmin(imp))
+        if best is None or imp[k] < best[2]:
+            i = np.flatnonzero(ok)[k]
+            best = (f, float((xs[i] + xs[i + 1]) / 2), float(imp[k]))
+    return best
+
+def fit_tree(X: np.ndarray, y: np.ndarray, w: np.ndarray, max_depth: int, min_leaf: int) -> TreePolicy:
+    feature, threshold, left, right, action = [], [], [], [], []
+
+    def leaf(idx):
+        w1 = float((w[idx] * y[idx]).sum())
+        return int(w1 > float(w[idx].sum()) - w1)
+
+    def new_node():
+        for lst, v in ((feature, -1), (threshold, 0.0), (left, -1), (right, -1), (action, 0)):
+            lst.append(v)
+        return len(feature) - 1
+
+    stack = [(new_node(), np.arange(len(y)), 0)]
+    while stack:
+        node, idx, depth = stack.pop()
+        action[node] = leaf(idx)
+        yi = y[idx]
+        if depth >= max_depth or len(idx) < 2 * min_leaf or yi.min() == yi.max():
+            continue
+        parent_w = float(w[idx].sum())
+        parent_w1 = float((w[idx] * yi).sum())
+        split = _best_split(X[idx], yi, w[idx], min_leaf)
+        if split is None or split[2] >= parent_w - (parent_w1 ** 2 + (parent_w - parent_w1) ** 2) / parent_w - 1e-12:
+            continue
+        f, thr, _ = split
+        go = X[idx, f] <= thr
+        feature[node], threshold[node] = f, thr
+        left[node], right[node] = new_node(), new_node()
+        stack.append((left[node], idx[go], depth + 1))
+        stack.append((right[node], idx[~go], depth + 1))
+    return _merge_leaves(TreePolicy(feature, threshold, left, right, action))
+
+def _merge_leaves(tree: TreePolicy) -> TreePolicy:
+    """Collapse splits whose subtrees all give the same action, and renumber the nodes."""
+    def uniform(n):
+        if tree.left[n] < 0:
+            return int(tree.action[n])
+        a, b = uniform(tree.left[n]), uniform(tree.right[n])
+        return a if a == b else None
+
+    feature, threshold, left, right, action = [], [], [], [], []
+
+    def copy(n):
+        k = len(feature)
+        for lst in (feature, threshold, left, right, action):
+            lst.append(None)
+        a = uniform(n)
+        if a is not None:
+            feature[k], threshold[k], left[k], right[k], action[k] = -1, 0.0, -1, -1, a
+        else:
+            feature[k], threshold[k], action[k] = int(tree.feature[n]), float(tree.threshold[n]), int(tree.action[n])
+            left[k] = copy(tree.left[n])
+            right[k] = copy(tree.right[n])
+        return k
+
+    copy(0)
+    return TreePolicy(feature, threshold, left, right, action)
+
+class LUTPolicy:
+    """Quantised lookup table: per-feature bin edges, one action per cell (C order)."""
+
+    kind = "lut"
+
+    def __init__(self, edges: list, table: np.ndarray):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.sizes = [len(e) + 1 for e in self.edges]
+        self.table = np.asarray(table, dtype=np.uint8)
+
+    @property
+    def size(self) -> int:
+        return len(self.table)
+
+    def cells(self, X: np.ndarray) -> np.ndarray:
+        idx = [np.searchsorted(e, X[:, f], side="right") for f, e in enumerate(self.edges)]
+        return np.ravel_multi_index(idx, self.sizes)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.table[self.cells(X)].astype(np.int64)
+
+def fit_lut(X: np.ndarray, y: np.ndarray, w: np.ndarray, bins: int, teacher: MLPTeacher) -> LUTPolicy:
+    edges = []
+    for f in range(X.shape[1]):
+        qs = np.unique(np.quantile(X[:, f], np.linspace(0, 1, bins + 1)[1:-1]))
+        edges.append(qs)
+    sizes = [len(e) + 1 for e in edges]
+    n_cells = int(np.prod(sizes))
+    if n_cells > MAX_CELLS:
+        raise SystemExit(f"[ERROR] {n_cells} LUT cells (bins^features) exceed {MAX_CELLS}; "
+                         f"use fewer --bins or --student tree")
+    # teacher at every cell centre (outer bins: one bin width beyond the edge) for empty cells
+    centres = []
+    for e in edges:
+        if len(e) == 0:
+            centres.append(np.zeros(1))
+            continue
+        step = np.diff(e).mean() if len(e) > 1 else 1.0
+        bounds = np.concatenate([[e[0] - step], e, [e[-1] + step]])
+        centres.append((bounds[:-1] + bounds[1:]) / 2)
+    grid = np.stack(np.meshgrid(*centres, indexing="ij"), axis=-1).reshape(-1, len(edges))
+    table = teacher.q(grid).argmax(axis=1).astype(np.uint8)
+    lut = LUTPolicy(edges, table)
+    cell = lut.cells(X)
+    w1 = np.bincount(cell, w * y, n_cells)
+    w0 = np.bincount(cell, w * (1 - y), n_cells)
+    seen = (w1 + w0) > 0
+    lut.table[seen] = (w1[seen] > w0[seen]).astype(np.uint8)
+    return lut
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def _tree_code(tree: TreePolicy, names: list) -> list:
+    lines = ["def decide(s):", f'    """Action (0 keep, 1 switch) for one state s (sequence of {len(names)} numbers)."""']
+
+    def emit(n, ind):
+        pad = "    " * ind
+        if tree.left[n] < 0:
+            lines.append(f"{pad}return {int(tree.action[n])}")
+            return
+        lines.append(f"{pad}if s[{int(tree.feature[n])}] <= {float(tree.threshold[n])!r}:  # {names[tree.feature[n]]}")
+        emit(tree.left[n], ind + 1)
+        lines.append(f"{pad}else:")
+        emit(tree.right[n], ind + 1)
+
+    emit(0, 1)
+    lines += ["", f"FEATURE = {tuple(tree.feature.tolist())!r}", f"THRESHOLD = {tuple(tree.threshold.tolist())!r}",
+              f"LEFT = {tuple(tree.left.tolist())!r}", f"RIGHT = {tuple(tree.right.tolist())!r}",
+              f"ACTION = {tuple(tree.action.tolist())!r}", f"DEPTH = {tree.depth}", "",
+              "def decide_batch(states):",
+              '    """Actions for an (N, features) array of states (NumPy)."""',
+              "    X = np.asarray(states, dtype=np.float64)",
+              "    f, t, l, r, a = (np.array(v) for v in (FEATURE, THRESHOLD, LEFT, RIGHT, ACTION))",
+              "    node = np.zeros(len(X), dtype=np.int64)",
+              "    rows = np.arange(len(X))",
+              "    for _ in range(DEPTH):",
+              "        go_left = X[rows, f[node]] <= t[node]",
+              "        node = np.where(l[node] >= 0, np.where(go_left, l[node], r[node]), node)",
+              "    return a[node]"]
+    return lines
+
+def _lut_code(lut: LUTPolicy, names: list) -> list:
+    return ["from bisect import bisect_right", "",
+            f"EDGES = {tuple(tuple(e.tolist()) for e in lut.edges)!r}",
+            f"SIZES = {tuple(lut.sizes)!r}",
+            f"TABLE = bytes.fromhex({lut.table.tobytes().hex()!r})", "",
+            "def decide(s):",
+            f'    """Action (0 keep, 1 switch) for one state s (sequence of {len(names)} numbers)."""',
+            "    i = 0",
+            "    for f, e in enumerate(EDGES):",
+            "        i = i * SIZES[f] + bisect_right(e, s[f])",
+            "    return TABLE[i]", "",
+            "def decide_batch(states):",
+            '    """Actions for an (N, features) array of states (NumPy)."""',
+            "    X = np.asarray(states, dtype=np.float64)",
+            "    idx = [np.searchsorted(np.array(e), X[:, f], side='right') for f, e in enumerate(EDGES)]",
+            "    return np.frombuffer(TABLE, dtype=np.uint8)[np.ravel_multi_index(idx, SIZES)].astype(np.int64)"]
+
+def export(policy, names: list, report: dict, out: Path):
+    head = ['"""',
+            f"Distilled traffic-light policy ({policy.kind}, {policy.size} "
+            f"{'nodes' if policy.kind == 'tree' else 'cells'}), generated by ai/distill_policy.py.",
+            f"- Teacher: {report['teacher']}",
+            f"- State: {', '.join(names)}",
+            f"- Holdout agreement with the teacher: {report['agreement']:.4f} "
+            f"(on teacher switches {report['switch_agreement']:.4f}), mean regret {report['mean_regret']:.4f}",
+            "- decide(state) -> 0 keep / 1 switch needs nothing but Python; decide_batch needs NumPy.",
+            '"""',
+            "try:",
+            "    import numpy as np",
+            "except ImportError:  # decide() still works",
+            "    np = None", "",
+            f"STATE = {tuple(names)!r}", ""]
+    body = _tree_code(policy, names) if policy.kind == "tree" else _lut_code(policy, names)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text("\n".join(head + body) + "\n", encoding="utf-8")
+
+def load_exported(path: Path):
+    spec = importlib.util.spec_from_file_location(Path(path).stem, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _per_call_us(fn, states: list, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in states:
+            fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(states) * 1e6
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Distill a trained DQN into a decision tree / lookup table")
+    ap.add_argument("--weights", required=True, help="Teacher weights (.weights.h5, or the .npz written from it)")
+    ap.add_argument("--data", default="runs/transitions", help="Recorded traces (transition_dataset.py folder)")
+    ap.add_argument("--student", choices=STUDENTS, default="tree")
+    ap.add_argument("--max-depth", type=int, default=8, help="tree: maximum depth")
+    ap.add_argument("--min-leaf", type=int, default=20, help="tree: minimum samples per leaf")
+    ap.add_argument("--bins", type=int, default=8, help="lut: quantile bins per feature")
+    ap.add_argument("--jitter", type=int, default=2, help="Jittered copies (+-2 vehicles) of every trace state")
+    ap.add_argument("--uniform", type=int, default=20000, help="Uniform samples over the observed state range")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="Policy module (default: <weights stem>_policy.py)")
+    args = ap.parse_args()
+    if not 1 <= args.max_depth <= MAX_DEPTH_LIMIT:
+        ap.error(f"--max-depth must be 1..{MAX_DEPTH_LIMIT}")
+    return args
+
+def main():
+    args = parse_args()
+    ds = TransitionDataset(Path(args.data))
+    names = ds.parts[0].get("state_groups") or [f"s{k}" for k in range(ds.state_size)]
+    teacher = load_teacher(Path(args.weights), ds.state_size)
+    if teacher.state_size != ds.state_size or teacher.action_size != ACTION_SIZE:
+        raise SystemExit(f"[ERROR] Teacher is {teacher.state_size} -> {teacher.action_size}, "
+                         f"dataset states have {ds.state_size} features and {ACTION_SIZE} actions")
+    rng = np.random.default_rng(args.seed)
+
+    t0 = time.perf_counter()
+    X = sample_states(ds, args.jitter, args.uniform, rng)
+    q = teacher.q(X)
+    y = q.argmax(axis=1)
+    gap = np.abs(q[:, 1] - q[:, 0]).astype(np.float64)
+    w = gap / gap.mean() if gap.mean() > 0 else np.ones(len(y))
+    print(f"[INFO] {len(X)} training states labelled by the teacher ({y.mean():.1%} switch) "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    if args.student == "tree":
+        policy = fit_tree(X, y, w, args.max_depth, args.min_leaf)
+        shape = f"{policy.size} nodes, depth {policy.depth}"
+    else:
+        policy = fit_lut(X, y, w, args.bins, teacher)
+        shape = f"{policy.size} cells ({' x '.join(map(str, policy.sizes))})"
+    print(f"[INFO] {args.student}: {shape}, fitted in {time.perf_counter() - t0:.2f}s")
+
+    H = ds.rows(holdout=True)["state"].astype(np.float32)
+    qh = teacher.q(H)
+    th = qh.argmax(axis=1)
+    sh = policy.predict(H)
+    rows = np.arange(len(H))
+    switch = th == 1
+    report = {"teacher": str(args.weights), "student": args.student, "size": policy.size,
+              "training_states": len(X), "holdout_states": len(H),
+              "agreement": float((sh == th).mean()),
+              "switch_agreement": float((sh[switch] == 1).mean()) if switch.any() else float("nan"),
+              "mean_regret": float((qh[rows, th] - qh[rows, sh]).mean()),
+              "train_agreement": float((policy.predict(X) == y).mean())}
+
+    out = Path(args.out) if args.out else Path(args.weights).with_name(Path(args.weights).name.split(".")[0]
+                                                                       + "_policy.py")
+    export(policy, names, report, out)
+    mod = load_exported(out)
+    exported = np.array([mod.decide(s) for s in H.tolist()])
+    if not np.array_equal(exported, sh):
+        raise SystemExit(f"[ERROR] {out}: exported decide() disagrees with the fitted {args.student}")
+    sample = H[:min(len(H), 20000)].tolist()
+    report["decide_us"] = round(_per_call_us(mod.decide, sample), 3)
+    report["teacher_numpy_us"] = round(_per_call_us(lambda s: teacher.q(np.array([s])), sample[:2000]), 3)
+    report["created"] = datetime.now().isoformat(timespec="seconds")
+    Path(str(out) + ".json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    print(f"[OK] Holdout agreement {report['agreement']:.4f} (teacher switches {report['switch_agreement']:.4f}), "
+          f"mean regret {report['mean_regret']:.4f}, train agreement {report['train_agreement']:.4f}")
+    print(f"[OK] decide(): {report['decide_us']:.2f} us/decision vs NumPy teacher "
+          f"{report['teacher_numpy_us']:.2f} us")
+    print(f"[OK] Wrote {out}")
+
+if __name__ == "__main__":
+    main()
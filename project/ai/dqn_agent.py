@@ -56,3 +56,120 @@ class DQNAgent:
 
     def save(self, name):
         self.model.save_weights(name)
+
+class ReplayBuffer:
+    """Fixed-size transition store in preallocated arrays; add/sample whole batches."""
+
+    def __init__(self, state_size, capacity=100000):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.pos = 0
+        self.size = 0
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        n = len(actions)
+        idx = (self.pos + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.pos = int((self.pos + n) % self.capacity)
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, batch_size, rng):
+        idx = rng.integers(0, self.size, batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
+
+    def __len__(self):
+        return self.size
+
+class SharedDQNAgent:
+    """
+    One Q-network shared by many agents (parameter sharing): act() takes the states of
+    all agents as one (N, state_size) batch, transitions of all agents go into one
+    ReplayBuffer, and replay() does a fixed number of minibatch updates however many
+    agents there are. A target network is synced every target_sync updates.
+    Epsilon decays per decision (decay_epsilon); set_epsilon_schedule() picks the rate.
+    """
+
+    def __init__(self, state_size, action_size, capacity=100000, batch_size=256, target_sync=500, seed=0):
+        self.state_size = state_size
+        self.action_size = action_size
+        self.memory = ReplayBuffer(state_size, capacity)
+        self.gamma = 0.99
+        self.epsilon = 1.0
+        self.epsilon_min = 0.01
+        self.epsilon_decay = 0.995
+        self.batch_size = batch_size
+        self.target_sync = target_sync
+        self.updates = 0
+        self.rng = np.random.default_rng(seed)
+
+        self.model = self._build_model()
+        self.target = self._build_model()
+        self.target.set_weights(self.model.get_weights())
+
+    def _build_model(self):
+        model = Sequential()
+        model.add(InputLayer(input_shape=(self.state_size,)))
+        model.add(Dense(64, activation='relu'))
+        model.add(Dense(64, activation='relu'))
+        model.add(Dense(self.action_size, activation='linear'))
+        model.compile(loss='mse', optimizer='adam')
+        return model
+
+    def act(self, states, allowed=None):
+        """Epsilon-greedy action per row of states (N, state_size), one forward pass.
+        allowed: optional (N, action_size) bool mask of actions each agent may take."""
+        q = self.model(states.astype(np.float32), training=False).numpy()
+        if allowed is not None:
+            q = np.where(allowed, q, -np.inf)
+        actions = q.argmax(axis=1)
+        explore = self.rng.random(len(states)) <= self.epsilon
+        if explore.any():
+            rand = self.rng.random((int(explore.sum()), self.action_size))
+            if allowed is not None:
+                rand = np.where(allowed[explore], rand, -1.0)
+            actions[explore] = rand.argmax(axis=1)
+        return actions
+
+    def remember(self, states, actions, rewards, next_states, dones):
+        self.memory.add_batch(states, actions, rewards, next_states, dones)
+
+    def replay(self, updates=1):
+        """Minibatch Q-learning updates on the shared buffer; returns the last loss (or None)."""
+        if len(self.memory) < self.batch_size:
+            return None
+        loss = None
+        for _ in range(updates):
+            s, a, r, s2, d = self.memory.sample(self.batch_size, self.rng)
+            q_next = self.target(s2, training=False).numpy().max(axis=1)
+            target_q = self.model(s, training=False).numpy()
+            target_q[np.arange(len(a)), a] = r + self.gamma * q_next * (1.0 - d)
+            loss = self.model.train_on_batch(s, target_q)
+            self.updates += 1
+            if self.updates % self.target_sync == 0:
+                self.target.set_weights(self.model.get_weights())
+        return loss
+
+    def set_epsilon_schedule(self, decisions: int):
+        """Decay rate that takes epsilon from its current value to epsilon_min in `decisions` decisions."""
+        if self.epsilon > self.epsilon_min:
+            self.epsilon_decay = (self.epsilon_min / self.epsilon) ** (1.0 / max(decisions, 1))
+
+    def decay_epsilon(self):
+        """One decision's worth of decay; call once per act() over all agents."""
+        if self.epsilon > self.epsilon_min:
+            self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
+
+    def load(self, name):
+        self.model.load_weights(name)
+        self.target.set_weights(self.model.get_weights())
+
+    def save(self, name):
+        self.model.save_weights(name)
@@ -0,0 +1,175 @@
+"""
+Streaming KPI Collector (inside the TraCI loop)
+- Subscribes once to halting count, vehicle count, mean speed and vehicle IDs of
+  every EDGE_GROUPS edge; each step the subscription results are folded into NumPy
+  accumulators per RoadDir (no per-edge getter calls, no XML outputs needed).
+- Per step and edge:  waiting     += halting * dt
+                      timeLoss    += n * (1 - speed / allowed_speed) * dt
+                      sampled     += n * dt          (vehicle-seconds, speed weight)
+                      nVehContrib += vehicles not on the edge the step before
+- Speeds are weighted by vehicle-seconds, as kpi_by_road.py does for SUMO's
+  edgeData (sampledSeconds; SUMO 1.x writes no nVehContrib, so its fallback applies).
+- Every --window seconds a row per RoadDir is pushed to an in-memory ring buffer
+  and (optionally) appended to a CSV, so progress is visible during the run.
+- write_summary() emits the same columns as scripts/kpi_by_road.py's kpi_by_road.csv,
+  so the comparison pipeline works on runs made with SUMO XML outputs disabled.
+
+Usage (from a controller loop):
+  collector = StreamingKPICollector(window=60, windows_csv=out / "kpi_windows.csv")
+  collector.attach()
+  ... call collector.on_step() after every traci.simulationStep() ...
+  collector.write_summary(out / "kpi_by_road.csv")
+
+  Both controllers expose it: minqueue_tls.py --live-kpi DIR [--no-xml-outputs],
+  controller_rule_based.py via LIVE_KPI_DIR / NO_XML_OUTPUTS.
+"""
+import sys
+import csv
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from kpi_by_road import EDGE_GROUPS, write_csv  # noqa: E402
+
+SUBSCRIBED = [tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_MEAN_SPEED,
+              tc.LAST_STEP_VEHICLE_ID_LIST]
+WINDOW_FIELDS = ["begin", "end", "RoadDir", "AvgSpeed_mps", "Waiting_s", "TimeLoss_s",
+                 "VehSeconds", "Halting_avg", "Halting_max"]
+SUMMARY_FIELDS = ["RoadDir", "AvgSpeed_mps", "AvgSpeed_kph", "TotalWaiting_s", "TotalTimeLoss_s",
+                  "Samples_weight", "nVehContrib_sum"]
+
+class StreamingKPICollector:
+    """Incremental per-RoadDir KPIs from edge subscriptions."""
+
+    def __init__(self, edge_groups=None, window: float = 60.0, ring_size: int = 1024,
+                 windows_csv: Path | None = None, conn=None):
+        self.groups = list((edge_groups or EDGE_GROUPS).keys())
+        self.edges = [e for g in self.groups for e in (edge_groups or EDGE_GROUPS)[g]]
+        self.edge_group = np.array([gi for gi, g in enumerate(self.groups)
+                                    for _ in (edge_groups or EDGE_GROUPS)[g]], dtype=np.int64)
+        self.window = float(window)
+        self.ring = deque(maxlen=ring_size)
+        self.windows_csv = Path(windows_csv) if windows_csv else None
+        self.conn = conn or traci
+        self._active = np.ones(len(self.edges), dtype=bool)
+        self._vmax = np.ones(len(self.edges))
+        G = len(self.groups)
+        self.total = {k: np.zeros(G) for k in ("wait", "loss", "vehs", "speedw", "nveh")}
+        self._on_edge = [()] * len(self.edges)  # vehicle IDs per edge at the last step
+        self._win = {k: np.zeros(G) for k in ("wait", "loss", "vehs", "speedw", "halt", "haltmax")}
+        self._win_steps = 0
+        self._win_begin = None
+        self._dt = 1.0
+
+    def attach(self):
+        """Subscribe to all edges; call once on a started connection."""
+        self._dt = self.conn.simulation.getDeltaT()
+        known = set(self.conn.edge.getIDList())
+        for i, e in enumerate(self.edges):
+            if e not in known:
+                self._active[i] = False  # edge not in this scenario
+                continue
+            self.conn.edge.subscribe(e, SUBSCRIBED)
+            self._vmax[i] = max(self.conn.lane.getMaxSpeed(f"{e}_0"), 0.1)
+        self._win_begin = self.conn.simulation.getTime()
+        if self.windows_csv:
+            self.windows_csv.parent.mkdir(parents=True, exist_ok=True)
+            with self.windows_csv.open("w", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=WINDOW_FIELDS).writeheader()
+        return self
+
+    def on_step(self):
+        res = self.conn.edge.getAllSubscriptionResults()
+        n_edges = len(self.edges)
+        halt = np.zeros(n_edges); n = np.zeros(n_edges); spd = np.zeros(n_edges); new = np.zeros(n_edges)
+        on_edge = self._on_edge
+        for i, e in enumerate(self.edges):
+            r = res.get(e)
+            if r:
+                halt[i] = r[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+                n[i] = r[tc.LAST_STEP_VEHICLE_NUMBER]
+                spd[i] = r[tc.LAST_STEP_MEAN_SPEED]
+                ids = r[tc.LAST_STEP_VEHICLE_ID_LIST]
+                if ids != on_edge[i]:
+                    new[i] = len(set(ids).difference(on_edge[i]))
+                    on_edge[i] = ids
+        dt = self._dt
+        G = len(self.groups)
+        g = self.edge_group
+        wait = np.bincount(g, halt * dt, G)
+        loss = np.bincount(g, n * np.clip(1.0 - spd / self._vmax, 0.0, 1.0) * dt, G)
+        vehs = np.bincount(g, n * dt, G)
+        speedw = np.bincount(g, spd * n * dt, G)
+        halting = np.bincount(g, halt, G)
+        for acc in (self.total, self._win):
+            acc["wait"] += wait; acc["loss"] += loss; acc["vehs"] += vehs; acc["speedw"] += speedw
+        self.total["nveh"] += np.bincount(g, new, G)
+        self._win["halt"] += halting
+        np.maximum(self._win["haltmax"], halting, out=self._win["haltmax"])
+        self._win_steps += 1
+
+        t = self.conn.simulation.getTime()
+        if t - self._win_begin >= self.window:
+            self._flush_window(t)
+
+    def _flush_window(self, t: float):
+        w = self._win
+        steps = max(self._win_steps, 1)
+        rows = []
+        for gi, g in enumerate(self.groups):
+            rows.append({
+                "begin": self._win_begin, "end": t, "RoadDir": g,
+                "AvgSpeed_mps": round(w["speedw"][gi] / w["vehs"][gi], 3) if w["vehs"][gi] > 0 else 0.0,
+                "Waiting_s": round(w["wait"][gi], 2),
+                "TimeLoss_s": round(w["loss"][gi], 2),
+                "VehSeconds": round(w["vehs"][gi], 2),
+                "Halting_avg": round(w["halt"][gi] / steps, 3),
+                "Halting_max": int(w["haltmax"][gi]),
+            })
+        self.ring.extend(rows)
+        if self.windows_csv:
+            with self.windows_csv.open("a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=WINDOW_FIELDS).writerows(rows)
+        for v in w.values():
+            v[:] = 0.0
+        self._win_steps = 0
+        self._win_begin = t
+
+    def latest(self, n_windows: int = 1):
+        """Rows of the last n completed windows from the ring buffer."""
+        k = n_windows * len(self.groups)
+        return list(self.ring)[-k:]
+
+    def summary_rows(self):
+        """Whole-run KPIs with the kpi_by_road.csv columns."""
+        rows = []
+        for gi, g in enumerate(self.groups):
+            vehs = self.total["vehs"][gi]
+            if vehs <= 0:
+                continue
+            spd = self.total["speedw"][gi] / vehs
+            rows.append({
+                "RoadDir": g,
+                "AvgSpeed_mps": round(spd, 3),
+                "AvgSpeed_kph": round(spd * 3.6, 3),
+                "TotalWaiting_s": round(self.total["wait"][gi], 2),
+                "TotalTimeLoss_s": round(self.total["loss"][gi], 2),
+                "Samples_weight": round(vehs, 2),
+                "nVehContrib_sum": round(self.total["nveh"][gi], 2),
+            })
+        return rows
+
+    def close(self):
+        """Flush a partial last window."""
+        if self._win_steps:
+            self._flush_window(self.conn.simulation.getTime())
+
+    def write_summary(self, path: Path):
+        self.close()
+        write_csv(Path(path), self.summary_rows(), fieldnames=SUMMARY_FIELDS)
+        return Path(path)
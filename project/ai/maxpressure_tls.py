@@ -0,0 +1,241 @@
+"""
+Max-Pressure TLS Controller (TraCI)
+- Controls ONE traffic light with the max-pressure rule: every controlled link
+  (movement in lane -> out lane, from getControlledLinks) has pressure
+  queue(in) - queue(out); a phase's pressure is the sum over the links it serves
+  green, and the green phase with the highest pressure gets the right of way.
+  A movement whose downstream lane is backed up adds little or negative pressure,
+  so green is not spent on traffic that cannot leave the junction.
+- All phase pressures come from one sparse mat-vec (ai/phase_scoring.py, pressure
+  mode) over the queues of the TLS's in and out lanes, each lane read once per step.
+- The controller owns the timing: a green it sets is held (setPhaseDuration) until
+  it decides otherwise, instead of running out after the program's duration.
+- Cycle constraints:
+    --min-green   s a green phase is held before any switch
+    --max-green   s after which the best OTHER green phase with waiting traffic is forced
+    --max-red     s a green phase with waiting traffic may go unserved; it is served
+                  next (no starvation)
+    --yellow      s of the program's yellow phase (the one after the green) shown
+                  between greens; 0 switches directly like minqueue_tls.py
+- Queues: halting vehicles (default) or all vehicles on the lane (--measure vehicles),
+  optionally vType-weighted (--vtype-weights) or per 100 m (--lane-weight length).
+
+Usage (example):
+  python ai/maxpressure_tls.py --cfg north_test.sumocfg --tls <TLS_ID> --out runs/maxpressure/out --nogui \
+      --min-green 8 --max-green 60 --max-red 120 --yellow 3
+  (ai/controller_report.py compares it with minqueue_tls.py and controller_rule_based.py)
+
+Outputs:
+  - tripinfo.xml and edgeData.xml as configured (enable via additional options passed through --sumo-args)
+  - with --live-kpi: kpi_windows.csv (rolling) and kpi_by_road.csv computed in-loop (ai/kpi_stream.py)
+Dependencies:
+  - SUMO installed, SUMO_HOME set
+"""
+import os, sys, time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# --- SUMO / TraCI bootstrap ---
+SUMO_HOME = os.environ.get("SUMO_HOME")
+if not SUMO_HOME:
+    raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+tools = Path(SUMO_HOME) / "tools"
+sys.path.insert(0, str(tools))
+import traci  # noqa: E402
+from kpi_stream import StreamingKPICollector  # noqa: E402
+from sim_checkpoint import quiet_cfg  # noqa: E402
+from profiling import span, count  # noqa: E402
+from phase_scoring import PhaseScorer, length_weights, parse_vtype_weights  # noqa: E402
+from minqueue_tls import start_sumo, lane_halting, forget_arrived, _fmt_scores  # noqa: E402
+
+HOLD_S = 1e6  # phase duration that keeps a green until the controller switches
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Max-Pressure TLS Controller (TraCI)")
+    p.add_argument("--cfg", required=True, help="*.sumocfg path")
+    p.add_argument("--tls", required=True, help="Traffic light ID to control")
+    p.add_argument("--out", required=True, help="Output folder (will be created)")
+    p.add_argument("--min-green", type=float, default=8.0, help="Minimum green seconds before allowing a switch")
+    p.add_argument("--max-green", type=float, default=60.0, help="Force a switch after this many seconds of green (0 = off)")
+    p.add_argument("--max-red", type=float, default=120.0, help="Serve a green phase unserved for this long (0 = off)")
+    p.add_argument("--yellow", type=float, default=3.0, help="Yellow seconds between greens (0 = switch directly)")
+    p.add_argument("--measure", choices=["halting", "vehicles"], default="halting",
+                   help="Lane queue: halting vehicles or all vehicles on the lane")
+    p.add_argument("--lane-weight", choices=["none", "length"], default="none",
+                   help="Lane weighting: plain counts or vehicles per 100 m")
+    p.add_argument("--vtype-weights", default="",
+                   help="Count halting vehicles by vType weight, e.g. 'bus=2.5,truck=2' (others 1)")
+    p.add_argument("--step", type=float, default=1.0, help="Simulation step length (s)")
+    p.add_argument("--nogui", action="store_true", help="Use sumo (CLI) instead of sumo-gui")
+    p.add_argument("--until", type=float, default=None, help="Optional hard stop time (s); if omitted, uses cfg end time")
+    p.add_argument("--sumo-args", default="", help="Extra args passed to SUMO, e.g. '--time-to-teleport -1'")
+    p.add_argument("--live-kpi", default=None, help="Folder for in-loop KPI CSVs (kpi_windows.csv, kpi_by_road.csv)")
+    p.add_argument("--kpi-window", type=float, default=60.0, help="Rolling KPI window (s)")
+    p.add_argument("--no-xml-outputs", action="store_true", help="Disable the SUMO XML outputs declared in the cfg")
+    return p.parse_args()
+
+def tls_definition(tls_id: str):
+    """Phase states of the current program and the controlled links (in, out, via) per link index."""
+    progs = traci.trafficlight.getCompleteRedYellowGreenDefinition(tls_id)
+    if not progs:
+        raise RuntimeError(f"No signal program for TLS '{tls_id}'")
+    states = [ph.state for ph in progs[0].getPhases()]
+    links = traci.trafficlight.getControlledLinks(tls_id)
+    return states, links
+
+def lane_vehicles(lanes: list[str]) -> np.ndarray:
+    """Vehicle count per lane (0 for lanes that are gone)."""
+    x = np.zeros(len(lanes))
+    for j, ln in enumerate(lanes):
+        try:
+            x[j] = traci.lane.getLastStepVehicleNumber(ln)
+        except traci.TraCIException:
+            pass
+    return x
+
+def is_green_state(state: str) -> bool:
+    """A green phase: some link has right of way and none shows yellow."""
+    return any(c in "Gg" for c in state) and "y" not in state
+
+def set_green(tls_id: str, phase: int):
+    traci.trafficlight.setPhase(tls_id, phase)
+    traci.trafficlight.setPhaseDuration(tls_id, HOLD_S)
+
+class CycleRules:
+    """Which green phase to switch to, given pressures and the min/max green, max red limits."""
+
+    def __init__(self, states: list[str], min_green: float, max_green: float, max_red: float):
+        self.is_green = np.array([is_green_state(st) for st in states])
+        if not self.is_green.any():
+            raise RuntimeError("TLS program has no green phase")
+        self.min_green = min_green
+        self.max_green = max_green
+        self.max_red = max_red
+        self.last_served = np.zeros(len(states))
+
+    def choose(self, t: float, cur: int, since: float, pressure: np.ndarray, demand: np.ndarray):
+        """Target phase index, or None to keep the current one (demand: incoming queue per phase)."""
+        waiting = self.is_green & (demand > 0)
+        # a phase nobody waits for is not owed a green
+        self.last_served[~waiting] = t
+        self.last_served[cur] = t
+        if not self.is_green[cur] or since < self.min_green:
+            return None
+        masked = np.where(self.is_green, pressure, -np.inf)
+        if self.max_red > 0:
+            waited = t - self.last_served
+            starved = int(waited.argmax())
+            if waited[starved] >= self.max_red:
+                return starved
+        if self.max_green > 0 and since >= self.max_green:
+            others = np.where(waiting, masked, -np.inf)
+            others[cur] = -np.inf
+            other = int(others.argmax())
+            if np.isfinite(others[other]):
+                return other
+        best = int(masked.argmax())
+        if best != cur and masked[best] > masked[cur]:
+            return best
+        return None
+
+def run_controller(tls_id: str, min_green: float, until: float | None, on_step=None,
+                   max_green: float = 60.0, max_red: float = 120.0, yellow: float = 3.0,
+                   measure: str = "halting", lane_weight: str = "none", vtype_weights: dict | None = None):
+    states, links = tls_definition(tls_id)
+    scorer = PhaseScorer.from_links({tls_id: (states, links)}, "pressure")
+    # incoming queue per phase on the same lane vector, for the cycle rules
+    demand_scorer = PhaseScorer.from_links({tls_id: (states, links)}, "queue", lanes=scorer.lanes)
+    if lane_weight == "length":
+        weights = length_weights({ln: traci.lane.getLength(ln) for ln in scorer.lanes})
+        scorer.set_lane_weights(weights)
+        demand_scorer.set_lane_weights(weights)
+    rules = CycleRules(states, min_green, max_green, max_red)
+    type_cache = {} if vtype_weights else None
+
+    cur_phase = traci.trafficlight.getPhase(tls_id)
+    phase_start = traci.simulation.getTime()
+    rules.last_served[:] = phase_start
+    held = None  # green phase whose hold is set
+    if rules.is_green[cur_phase]:
+        set_green(tls_id, cur_phase)
+        held = cur_phase
+    pending = None  # (target phase, time the yellow ends)
+
+    while True:
+        sim_time = traci.simulation.getTime()
+        if until is not None and sim_time >= until:
+            break
+        if traci.simulation.getMinExpectedNumber() <= 0:
+            break
+
+        if pending is not None and sim_time >= pending[1]:
+            with span("actuation"):
+                set_green(tls_id, pending[0])
+            held = pending[0]
+            pending = None
+        if pending is None:
+            with span("observation"):
+                if measure == "vehicles":
+                    queues = lane_vehicles(scorer.lanes)
+                else:
+                    queues = lane_halting(scorer.lanes, vtype_weights, type_cache)
+                phase = traci.trafficlight.getPhase(tls_id)
+                if phase != cur_phase:
+                    cur_phase, phase_start = phase, sim_time
+            if rules.is_green[cur_phase] and cur_phase != held:
+                # the program ran into a green (started on yellow / red): hold it from here
+                with span("actuation"):
+                    traci.trafficlight.setPhaseDuration(tls_id, HOLD_S)
+                held = cur_phase
+
+            with span("decision"):
+                pressure = scorer.scores(queues)
+                target = rules.choose(sim_time, cur_phase, sim_time - phase_start, pressure,
+                                      demand_scorer.scores(queues))
+            if target is not None:
+                nxt = (cur_phase + 1) % len(states)
+                with span("actuation"):
+                    if yellow > 0 and "y" in states[nxt]:
+                        traci.trafficlight.setPhase(tls_id, nxt)
+                        pending = (target, sim_time + yellow)
+                    else:
+                        set_green(tls_id, target)
+                        held = target
+                count("switches")
+                print(f"[t={sim_time:.0f}] Switch {cur_phase} -> {target} (pressure={_fmt_scores(pressure)})")
+
+        with span("sim_step"):
+            traci.simulationStep()
+        forget_arrived(type_cache)
+        if on_step is not None:
+            with span("on_step"):
+                on_step()
+
+def main():
+    args = parse_args()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    cfg = str(quiet_cfg(args.cfg)) if args.no_xml_outputs else args.cfg
+    start_sumo(cfg, not args.nogui, args.step, args.sumo_args)
+    collector = None
+    if args.live_kpi:
+        collector = StreamingKPICollector(window=args.kpi_window,
+                                          windows_csv=Path(args.live_kpi) / "kpi_windows.csv").attach()
+    t0 = time.time()
+    try:
+        run_controller(args.tls, args.min_green, args.until,
+                       on_step=collector.on_step if collector else None,
+                       max_green=args.max_green, max_red=args.max_red, yellow=args.yellow,
+                       measure=args.measure, lane_weight=args.lane_weight,
+                       vtype_weights=parse_vtype_weights(args.vtype_weights))
+        if collector:
+            print("[OK] Wrote", collector.write_summary(Path(args.live_kpi) / "kpi_by_road.csv"))
+    finally:
+        traci.close()
+    print(f"[OK] Finished in {time.time() - t0:.1f}s wall time")
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ Min-Queue AI TLS Controller (TraCI)
 - Controls ONE traffic light (TLS) using a greedy queue-minimising policy.
 - Action each decision step: keep current phase OR switch to the phase whose approaches have the highest halting queue.
 - Respects a configurable minimum green.
+- Phase queues come from ai/phase_scoring.py: a sparse phase x lane matrix built once,
+  scored each step as one mat-vec over the halting counts of the distinct TLS lanes
+  (optionally per-100 m by lane length, --lane-weight length, and/or weighted per
+  vType, --vtype-weights bus=2.5,truck=2).
 
 Usage (example):
   python ai/minqueue_tls.py --cfg runs/north_test.sumocfg --tls <TLS_ID> --out runs/ai/out --min-green 8 --step 1.0
 
 Outputs:
   - tripinfo.xml and edgeData.xml inside --out (enable via additional options passed through --sumo-args)
+  - with --live-kpi: kpi_windows.csv (rolling) and kpi_by_road.csv computed in-loop (ai/kpi_stream.py);
+    add --no-xml-outputs to switch off the SUMO XML outputs of the cfg for faster runs
 Dependencies:
   - SUMO installed, SUMO_HOME set
 """
@@ -16,6 +22,8 @@ import os, sys, time
 import argparse
 from pathlib import Path
 
+import numpy as np
+
 # --- SUMO / TraCI bootstrap ---
 SUMO_HOME = os.environ.get("SUMO_HOME")
 if not SUMO_HOME:
@@ -23,6 +31,10 @@ if not SUMO_HOME:
 tools = Path(SUMO_HOME) / "tools"
 sys.path.insert(0, str(tools))
 import traci  # noqa: E402
+from kpi_stream import StreamingKPICollector  # noqa: E402
+from sim_checkpoint import quiet_cfg  # noqa: E402
+from profiling import span, count  # noqa: E402
+from phase_scoring import PhaseScorer, length_weights, parse_vtype_weights  # noqa: E402
 
 def parse_args():
     p = argparse.ArgumentParser(description="Min-Queue AI TLS Controller (TraCI)")
@@ -34,6 +46,13 @@ def parse_args():
     p.add_argument("--nogui", action="store_true", help="Use sumo (CLI) instead of sumo-gui")
     p.add_argument("--until", type=float, default=None, help="Optional hard stop time (s); if omitted, uses cfg end time")
     p.add_argument("--sumo-args", default="", help="Extra args passed to SUMO, e.g. '--time-to-teleport -1'")
+    p.add_argument("--live-kpi", default=None, help="Folder for in-loop KPI CSVs (kpi_windows.csv, kpi_by_road.csv)")
+    p.add_argument("--kpi-window", type=float, default=60.0, help="Rolling KPI window (s)")
+    p.add_argument("--no-xml-outputs", action="store_true", help="Disable the SUMO XML outputs declared in the cfg")
+    p.add_argument("--lane-weight", choices=["none", "length"], default="none",
+                   help="Phase score weighting per lane: plain counts or vehicles per 100 m")
+    p.add_argument("--vtype-weights", default="",
+                   help="Count halting vehicles by vType weight, e.g. 'bus=2.5,truck=2' (others 1)")
     return p.parse_args()
 
 def start_sumo(cfg: str, use_gui: bool, step_len: float, extra_args: str):
@@ -58,34 +77,91 @@ def group_links_by_phase(tls_id: str):
     # link structure: for each controlled link index, we get tuples of (incoming, outgoing, via)
     links = traci.trafficlight.getControlledLinks(tls_id)  # list[list[ (in, out, via) ]]
     controlled_lanes = [triple[0][0] if triple else None for triple in links]
+    return phases, phase_lane_map([ph.state for ph in phases], controlled_lanes)
 
-    link_phase_map = {pi: set() for pi in range(len(phases))}
-    for pi, ph in enumerate(phases):
-        st = ph.state
+def phase_lane_map(states: list[str], controlled_lanes: list) -> dict:
+    """dict[phase_index] -> set(incoming lanes served green), from the phase states and
+    the incoming lane of every link index (None for links without one)."""
+    link_phase_map = {pi: set() for pi in range(len(states))}
+    for pi, st in enumerate(states):
         # For each signal group index (character in phase state)
         for gi, ch in enumerate(st):
             if gi < len(controlled_lanes) and ch in ("G", "g"):
                 lane_in = controlled_lanes[gi]
                 if lane_in:
                     link_phase_map[pi].add(lane_in)
-    return phases, link_phase_map
+    return link_phase_map
+
+def choose_phase(phase_queues: np.ndarray, cur_phase: int, time_since_switch: float, min_green: float):
+    """The min-queue rule: the phase with the longest queue once min_green has passed,
+    if it beats the current phase's queue; None to keep the current phase."""
+    best_phase = int(phase_queues.argmax())  # one TLS: first maximum, as max() over range()
+    if (best_phase != cur_phase
+            and time_since_switch >= min_green
+            and phase_queues[best_phase] > phase_queues[cur_phase]):
+        return best_phase
+    return None
 
-def queue_for_lanes(lanes: set[str]) -> int:
-    q = 0
-    for ln in lanes:
+def lane_halting(lanes: list[str], vtype_weights: dict | None = None, type_cache: dict | None = None) -> np.ndarray:
+    """
+    Halting vector over lanes (one read per lane). With vtype_weights, each halting
+    vehicle (speed < 0.1 m/s, SUMO's threshold) counts its vType's weight (default 1).
+    """
+    if not vtype_weights:
+        get = traci.lane.getLastStepHaltingNumber
         try:
-            q += traci.lane.getLastStepHaltingNumber(ln)
+            return np.fromiter(map(get, lanes), np.float64, len(lanes))
+        except traci.TraCIException:
+            pass  # some lane is gone: fall back to lane by lane below
+    x = np.zeros(len(lanes))
+    for j, ln in enumerate(lanes):
+        try:
+            if not vtype_weights:
+                x[j] = traci.lane.getLastStepHaltingNumber(ln)
+                continue
+            q = 0.0
+            for veh in traci.lane.getLastStepVehicleIDs(ln):
+                if traci.vehicle.getSpeed(veh) < 0.1:
+                    vt = type_cache.get(veh) if type_cache is not None else None
+                    if vt is None:
+                        vt = traci.vehicle.getTypeID(veh)
+                        if type_cache is not None:
+                            type_cache[veh] = vt
+                    q += vtype_weights.get(vt, 1.0)
+            x[j] = q
         except traci.TraCIException:
             # Lane might disappear in some dynamic nets; ignore gracefully
             pass
-    return q
+    return x
 
-def run_controller(tls_id: str, min_green: float, decision_period: float, until: float|None):
+def forget_arrived(type_cache: dict | None):
+    """Drop the vehicles that left the network in the last step from a lane_halting type cache."""
+    if type_cache:
+        for veh in traci.simulation.getArrivedIDList():
+            type_cache.pop(veh, None)
+
+def build_scorer(tls_id: str, lane_weight: str = "none"):
+    """Phases of the TLS and a queue-mode PhaseScorer over their green incoming lanes."""
     phases, link_phase_map = group_links_by_phase(tls_id)
+    scorer = PhaseScorer.from_phase_lanes({tls_id: link_phase_map})
+    if lane_weight == "length":
+        scorer.set_lane_weights(length_weights({ln: traci.lane.getLength(ln) for ln in scorer.lanes}))
+    return phases, scorer
+
+def _fmt_scores(scores: np.ndarray) -> list:
+    return [int(q) if q == int(q) else round(q, 2) for q in scores.tolist()]
+
+def run_controller(tls_id: str, min_green: float, decision_period: float, until: float|None, on_step=None,
+                   lane_weight: str = "none", vtype_weights: dict | None = None, last_switch_time: float = -1e9):
+    """
+    Control loop on an already started TraCI connection. last_switch_time resumes a run
+    (e.g. from a saved state) with its min-green timer; returns the last switch time.
+    """
+    phases, scorer = build_scorer(tls_id, lane_weight)
     if len(phases) == 0:
         raise RuntimeError(f"TLS '{tls_id}' has no phases.")
+    type_cache = {} if vtype_weights else None
 
-    last_switch_time = -1e9
     sim_time = traci.simulation.getTime()
     # Ensure we’re on a valid phase index
     cur_phase = traci.trafficlight.getPhase(tls_id)
@@ -103,6 +179,49 @@ def run_controller(tls_id: str, min_green: float, decision_period: float, until:
         time_since_switch = sim_time - last_switch_time
 
         # Compute queues by candidate phase
-        phase_queues = []
-        for pi in range(len(phases)):
-            q = queue_f_
+        with span("observation"):
+            halting = lane_halting(scorer.lanes, vtype_weights, type_cache)
+            cur_phase = traci.trafficlight.getPhase(tls_id)
+
+        with span("decision"):
+            phase_queues = scorer.scores(halting)
+            best_phase = choose_phase(phase_queues, cur_phase, time_since_switch, min_green)
+        if best_phase is not None:
+            with span("actuation"):
+                traci.trafficlight.setPhase(tls_id, best_phase)
+            count("switches")
+            last_switch_time = sim_time
+            print(f"[t={sim_time:.0f}] Switch {cur_phase} -> {best_phase} (queues={_fmt_scores(phase_queues)})")
+
+        with span("sim_step"):
+            traci.simulationStep()
+        forget_arrived(type_cache)
+        if on_step is not None:
+            with span("on_step"):
+                on_step()
+    return last_switch_time
+
+def main():
+    args = parse_args()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    cfg = str(quiet_cfg(args.cfg)) if args.no_xml_outputs else args.cfg
+    start_sumo(cfg, not args.nogui, args.step, args.sumo_args)
+    collector = None
+    if args.live_kpi:
+        collector = StreamingKPICollector(window=args.kpi_window,
+                                          windows_csv=Path(args.live_kpi) / "kpi_windows.csv").attach()
+    t0 = time.time()
+    try:
+        run_controller(args.tls, args.min_green, args.step, args.until,
+                       on_step=collector.on_step if collector else None,
+                       lane_weight=args.lane_weight, vtype_weights=parse_vtype_weights(args.vtype_weights))
+        if collector:
+            print("[OK] Wrote", collector.write_summary(Path(args.live_kpi) / "kpi_by_road.csv"))
+    finally:
+        traci.close()
+    print(f"[OK] Finished in {time.time() - t0:.1f}s wall time")
+
+if __name__ == "__main__":
+    main()
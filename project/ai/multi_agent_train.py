@@ -0,0 +1,274 @@
+"""
+Multi-Agent DQN Training (parameter sharing over every TLS of the net)
+- Every traffic light is an agent; all agents share ONE Q-network (dqn_agent.SharedDQNAgent).
+- Observation per TLS (fixed width, so intersections of any shape share the network):
+    halting and vehicle counts per approach (incoming edge, up to --max-approaches,
+    busiest first, zero-padded) / --obs-scale, one-hot of the current green phase
+    (up to --max-phases), and the time since the last switch / 60 s.
+- Actions: 0 = keep, 1 = switch to the next green phase of the program; switching
+  is masked until --min-green has passed. Greens are held (setPhaseDuration) so
+  "keep" really keeps, as in maxpressure_tls.py (whose green test and hold are used).
+- Exploration: epsilon decays per decision, from 1 to 0.01 over --epsilon-decay-frac
+  of the planned decisions (episodes * episode-len / decision-every).
+- Per decision (every --decision-every s) the states of all agents form one batch and
+  one forward pass picks all actions. Lane and TLS values come from subscriptions
+  (one getAllSubscriptionResults per domain), binned per approach with NumPy.
+- Transitions of all agents go into one shared replay buffer and training does a
+  fixed number of minibatch updates per decision (--updates), so its cost does not
+  grow with the number of intersections; more agents only mean more data per step.
+- Reward per agent: minus the halting vehicles on its incoming lanes / --obs-scale.
+  The episode's time limit truncates it (the last transition still bootstraps); only
+  an emptied network is terminal.
+
+Usage (example):
+  python ai/multi_agent_train.py --cfg north_test.sumocfg --episodes 50 --episode-len 1800 --out runs/marl
+  python ai/multi_agent_train.py --cfg north_test.sumocfg --tls cluster_3500447461_85576972 ...   # subset
+
+Outputs (in --out):
+  - shared_dqn.weights.h5   shared network weights (after every episode)
+  - episodes.csv            per episode: agents, decisions, mean reward, epsilon, loss, wall time
+Dependencies:
+  - SUMO installed, SUMO_HOME set; TensorFlow (Keras)
+"""
+import os, sys, csv, time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# --- SUMO / TraCI bootstrap ---
+SUMO_HOME = os.environ.get("SUMO_HOME")
+if not SUMO_HOME:
+    raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+tools = Path(SUMO_HOME) / "tools"
+sys.path.insert(0, str(tools))
+import traci  # noqa: E402
+import traci.constants as tc  # noqa: E402
+from dqn_agent import SharedDQNAgent  # noqa: E402
+from sim_checkpoint import SnapshotCache, load_state_args, quiet_cfg  # noqa: E402
+from profiling import span  # noqa: E402
+from maxpressure_tls import HOLD_S, is_green_state  # noqa: E402
+
+ACTION_SIZE = 2  # keep, next green phase
+LANE_VARS = [tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_VEHICLE_NUMBER]
+EPISODE_FIELDS = ["episode", "agents", "decisions", "reward_mean", "epsilon", "loss", "buffer", "wall_s"]
+
+class Intersections:
+    """Observation / actuation side of all agents on a started TraCI connection."""
+
+    def __init__(self, tls_ids, max_approaches: int, max_phases: int, obs_scale: float):
+        self.max_a = max_approaches
+        self.max_p = max_phases
+        self.obs_scale = obs_scale
+        self.tls_ids, self.greens, self.phase_slot, self.is_green = [], [], [], []
+        lane_ids, lane_slot, lane_agent = [], [], []
+        for tls in tls_ids:
+            progs = traci.trafficlight.getCompleteRedYellowGreenDefinition(tls)
+            if not progs:
+                continue
+            states = [ph.state for ph in progs[0].getPhases()]
+            greens = [i for i, st in enumerate(states) if is_green_state(st)]
+            if len(greens) < 2:
+                continue  # nothing to decide
+            if len(greens) > max_phases:
+                print(f"[WARN] {tls}: {len(greens)} green phases, one-hot keeps the first {max_phases}")
+            lanes = sorted({lk[0][0] for lk in traci.trafficlight.getControlledLinks(tls) if lk and lk[0][0]})
+            by_edge = {}
+            for ln in lanes:
+                by_edge.setdefault(traci.lane.getEdgeID(ln), []).append(ln)
+            approaches = sorted(by_edge, key=lambda e: (-len(by_edge[e]), e))
+            if len(approaches) > max_approaches:
+                print(f"[WARN] {tls}: {len(approaches)} approaches, keeping {max_approaches}")
+            a = len(self.tls_ids)
+            for k, edge in enumerate(approaches):
+                for ln in by_edge[edge]:
+                    lane_ids.append(ln)
+                    lane_slot.append(a * max_approaches + k if k < max_approaches else -1)
+                    lane_agent.append(a)
+            # phase index -> slot in the one-hot (-1 for yellow / red phases)
+            slot = np.full(len(states), -1, dtype=np.int64)
+            for j, pi in enumerate(greens[:max_phases]):
+                slot[pi] = j
+            self.tls_ids.append(tls)
+            self.greens.append(greens)
+            self.phase_slot.append(slot)
+            self.is_green.append(np.array([is_green_state(st) for st in states]))
+
+        self.n = len(self.tls_ids)
+        self.lanes = sorted(set(lane_ids))
+        idx = {ln: j for j, ln in enumerate(self.lanes)}
+        self.entry_lane = np.array([idx[ln] for ln in lane_ids], dtype=np.int64)
+        slots = np.array(lane_slot, dtype=np.int64)
+        self.entry_keep = slots >= 0
+        self.entry_slot = slots[self.entry_keep]
+        self.entry_agent = np.array(lane_agent, dtype=np.int64)
+        self.state_size = 2 * max_approaches + max_phases + 1
+        self.phase = np.zeros(self.n, dtype=np.int64)
+        self.since = np.zeros(self.n)
+        self.held = np.full(self.n, -1, dtype=np.int64)  # green phase whose hold is set
+
+        for ln in self.lanes:
+            traci.lane.subscribe(ln, LANE_VARS)
+        for tls in self.tls_ids:
+            traci.trafficlight.subscribe(tls, [tc.TL_CURRENT_PHASE])
+        self.hold_greens([traci.trafficlight.getPhase(tls) for tls in self.tls_ids])
+
+    def hold_greens(self, phase):
+        """Hold every green the program has reached on its own (start, or after yellow / red)."""
+        for a, p in enumerate(phase):
+            if self.is_green[a][p] and p != self.held[a]:
+                traci.trafficlight.setPhaseDuration(self.tls_ids[a], HOLD_S)
+                self.held[a] = p
+
+    def observe(self, dt: float):
+        """(states (N, state_size), halting on each agent's incoming lanes (N,))."""
+        res = traci.lane.getAllSubscriptionResults()
+        halt = np.fromiter((res[ln][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for ln in self.lanes),
+                           np.float64, len(self.lanes))
+        vehs = np.fromiter((res[ln][tc.LAST_STEP_VEHICLE_NUMBER] for ln in self.lanes),
+                           np.float64, len(self.lanes))
+        h = halt[self.entry_lane]
+        cells = self.n * self.max_a
+        halt_a = np.bincount(self.entry_slot, weights=h[self.entry_keep], minlength=cells).reshape(self.n, -1)
+        veh_a = np.bincount(self.entry_slot, weights=vehs[self.entry_lane][self.entry_keep],
+                            minlength=cells).reshape(self.n, -1)
+        queue = np.bincount(self.entry_agent, weights=h, minlength=self.n)
+
+        tl = traci.trafficlight.getAllSubscriptionResults()
+        phase = np.array([tl[tls][tc.TL_CURRENT_PHASE] for tls in self.tls_ids], dtype=np.int64)
+        self.hold_greens(phase)
+        self.since = np.where(phase == self.phase, self.since + dt, 0.0)
+        self.phase = phase
+        onehot = np.zeros((self.n, self.max_p))
+        slot = np.array([self.phase_slot[a][p] for a, p in enumerate(phase)])
+        has = slot >= 0
+        onehot[np.flatnonzero(has), slot[has]] = 1.0
+        states = np.hstack([halt_a / self.obs_scale, veh_a / self.obs_scale, onehot,
+                            (self.since / 60.0)[:, None]])
+        return states.astype(np.float32), queue
+
+    def allowed(self, min_green: float) -> np.ndarray:
+        """(N, ACTION_SIZE) mask: switching only on a green phase held for min_green."""
+        on_green = np.array([self.phase_slot[a][p] >= 0 for a, p in enumerate(self.phase)])
+        mask = np.ones((self.n, ACTION_SIZE), dtype=bool)
+        mask[:, 1] = on_green & (self.since >= min_green)
+        return mask
+
+    def apply(self, actions: np.ndarray):
+        """Set the next green phase on every agent whose action is 1."""
+        for a in np.flatnonzero(actions == 1):
+            greens = self.greens[a]
+            cur = int(self.phase[a])
+            nxt = next((g for g in greens if g > cur), greens[0])
+            traci.trafficlight.setPhase(self.tls_ids[a], nxt)
+            traci.trafficlight.setPhaseDuration(self.tls_ids[a], HOLD_S)
+            self.held[a] = nxt
+            self.phase[a] = nxt
+            self.since[a] = 0.0
+
+def run_episode(agent: SharedDQNAgent, cmd: list, args) -> dict:
+    traci.start(cmd)
+    try:
+        tls_ids = args.tls or list(traci.trafficlight.getIDList())
+        inter = Intersections(tls_ids, args.max_approaches, args.max_phases, args.obs_scale)
+        if inter.n == 0:
+            raise SystemExit("[ERROR] No controllable TLS (need at least two green phases)")
+        if inter.state_size != agent.state_size:
+            raise SystemExit(f"[ERROR] State size {inter.state_size} != network input {agent.state_size}")
+        t0 = traci.simulation.getTime()
+        with span("observation"):
+            states, _ = inter.observe(0.0)
+        rewards, loss, decisions = [], None, 0
+        end = t0 + args.episode_len
+        while traci.simulation.getTime() < end and traci.simulation.getMinExpectedNumber() > 0:
+            with span("decision"):
+                actions = agent.act(states, inter.allowed(args.min_green))
+                agent.decay_epsilon()
+            with span("actuation"):
+                inter.apply(actions)
+            t = traci.simulation.getTime()
+            with span("sim_step"):
+                traci.simulationStep(min(t + args.decision_every, end))
+            with span("observation"):
+                next_states, queue = inter.observe(traci.simulation.getTime() - t)
+            reward = -queue / args.obs_scale
+            # hitting `end` only truncates the episode; no vehicles left is a real terminal state
+            done = traci.simulation.getMinExpectedNumber() <= 0
+            agent.remember(states, actions, reward, next_states, np.full(inter.n, float(done)))
+            with span("learning"):
+                step_loss = agent.replay(args.updates)
+            loss = step_loss if step_loss is not None else loss
+            rewards.append(reward.mean())
+            states = next_states
+            decisions += 1
+        return {"agents": inter.n, "decisions": decisions,
+                "reward_mean": float(np.mean(rewards)) if rewards else 0.0,
+                "loss": float(loss) if loss is not None else ""}
+    finally:
+        traci.close()
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Parameter-shared multi-agent DQN over all TLS")
+    p.add_argument("--cfg", required=True, help="*.sumocfg path")
+    p.add_argument("--tls", nargs="*", default=None, help="TLS IDs to control (default: all)")
+    p.add_argument("--episodes", type=int, default=50)
+    p.add_argument("--episode-len", type=float, default=1800.0, help="Simulated seconds per episode")
+    p.add_argument("--decision-every", type=float, default=5.0, help="Seconds between decisions")
+    p.add_argument("--min-green", type=float, default=8.0, help="Seconds before a green may be switched")
+    p.add_argument("--warmup", type=float, default=0.0, help="Cached warm-up (s) every episode starts from")
+    p.add_argument("--seed", type=int, default=7, help="SUMO seed")
+    p.add_argument("--step", type=float, default=1.0, help="Simulation step length (s)")
+    p.add_argument("--max-approaches", type=int, default=8, help="Approach slots per TLS")
+    p.add_argument("--max-phases", type=int, default=8, help="Green phase slots per TLS")
+    p.add_argument("--obs-scale", type=float, default=10.0, help="Divide vehicle counts by this")
+    p.add_argument("--updates", type=int, default=1, help="Minibatch updates per decision")
+    p.add_argument("--epsilon-decay-frac", type=float, default=0.5,
+                   help="Fraction of all planned decisions over which epsilon decays to its minimum")
+    p.add_argument("--batch-size", type=int, default=256)
+    p.add_argument("--buffer", type=int, default=200_000, help="Shared replay capacity (transitions)")
+    p.add_argument("--target-sync", type=int, default=500, help="Updates between target-network syncs")
+    p.add_argument("--load", default=None, help="Start from these weights")
+    p.add_argument("--out", default="runs/marl", help="Output folder")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    cfg = Path(args.cfg)
+    if not cfg.exists():
+        raise SystemExit(f"[ERROR] Config not found: {cfg}")
+
+    cmd = ["sumo", "-c", str(quiet_cfg(cfg)), "--seed", str(args.seed), "--step-length", str(args.step),
+           "--no-step-log", "true"]
+    if args.warmup > 0:
+        warm = SnapshotCache().ensure(cfg, args.seed, args.warmup, f"--step-length {args.step}")
+        cmd += load_state_args(warm, args.warmup)
+
+    agent = SharedDQNAgent(2 * args.max_approaches + args.max_phases + 1, ACTION_SIZE,
+                           capacity=args.buffer, batch_size=args.batch_size,
+                           target_sync=args.target_sync, seed=args.seed)
+    if args.load:
+        agent.load(args.load)
+    decisions = args.episodes * int(np.ceil(args.episode_len / args.decision_every))
+    agent.set_epsilon_schedule(int(decisions * args.epsilon_decay_frac))
+    weights = out / "shared_dqn.weights.h5"
+    log_path = out / "episodes.csv"
+    with log_path.open("w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=EPISODE_FIELDS).writeheader()
+
+    for e in range(args.episodes):
+        t0 = time.perf_counter()
+        rec = run_episode(agent, cmd, args)
+        agent.save(str(weights))
+        rec.update(episode=e + 1, epsilon=round(agent.epsilon, 4), buffer=len(agent.memory),
+                   wall_s=round(time.perf_counter() - t0, 1))
+        with log_path.open("a", newline="", encoding="utf-8") as f:
+            csv.DictWriter(f, fieldnames=EPISODE_FIELDS).writerow(rec)
+        print(f"Episode {e + 1}/{args.episodes}: {rec['agents']} agents, {rec['decisions']} decisions, "
+              f"reward/agent {rec['reward_mean']:.3f}, epsilon {agent.epsilon:.2f}, {rec['wall_s']}s")
+    print(f"[OK] Wrote {weights}")
+    print(f"[OK] Wrote {log_path}")
+
+if __name__ == "__main__":
+    main()
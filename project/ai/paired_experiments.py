@@ -0,0 +1,280 @@
+"""
+Paired Controller Experiments (common random numbers, sequential stopping)
+- Runs a baseline controller A and a challenger B (controller_report.py's
+  controllers: maxpressure, minqueue, rule, fixed) as pairs: both arms of a pair use
+  the same SUMO seed, route file, step length and horizon (common random numbers), so
+  the randomness of demand and driving is shared and cancels in the difference.
+- Per pair, trips are joined on their vehicle ID and the per-trip differences B - A of
+  the headline metric (--metric time_loss / duration / waiting_time, unfinished trips
+  included) are averaged into one paired difference D per seed.
+- Sequential stopping: seeds are added in batches (one SUMO per arm and seed in a pool
+  of worker processes) until the confidence interval of the mean D is narrower than
+  --width seconds (or --rel-width % of A's mean), at least --min-seeds and at most
+  --max-seeds pairs. The t quantile is exact for 1, 2 and 4 degrees of freedom and
+  a Cornish-Fisher expansion of the normal one otherwise (no SciPy).
+- The report also gives the unpaired interval from the same runs and the seeds an
+  unpaired design would need for the same width (variance ratio), so the saving from
+  pairing is visible.
+
+Usage (example):
+  python ai/paired_experiments.py --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --baseline fixed --challenger minqueue --width 2.0 --until 1800 --out runs/paired
+
+Outputs (in --out):
+  - paired.csv     one row per seed: trips, arm means, paired difference
+  - summary.json   mean difference, CI, relative change, variance reduction, stop reason
+  - headline.txt   "time loss decreased by x% (95% CI ...)" over all seeds
+  - s<seed>/<controller>/run.log (tripinfo.xml too with --keep-tripinfo)
+Dependencies:
+  - SUMO installed, SUMO_HOME set
+"""
+import os, sys, csv, json, time, math
+import argparse
+import contextlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+
+AI_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = AI_DIR.parent
+sys.path.insert(0, str(AI_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from controller_report import CONTROLLERS, _run_controller, traci  # noqa: E402
+from sim_checkpoint import cfg_inputs, quiet_cfg, output_args  # noqa: E402
+
+METRICS = {"time_loss": "timeLoss", "duration": "duration", "waiting_time": "waitingTime"}
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def t_quantile(p: float, df: float) -> float:
+    """
+    Student t quantile. Closed forms for df = 1, 2 and 4; a Cornish-Fisher expansion
+    around the normal for df >= 3 (within 1% at df = 3, 0.1% from df = 5), and
+    between 1 and 3 (Welch's fractional df) linear in 1/df between the integer neighbours.
+    """
+    if df < 1:
+        return float("nan")
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        q = 2 * p - 1
+        return q * math.sqrt(2 / (1 - q * q))
+    if df == 4:
+        a = 4 * p * (1 - p)
+        c = math.cos(math.acos(math.sqrt(a)) / 3) / math.sqrt(a)
+        return math.copysign(2 * math.sqrt(c - 1), p - 0.5)
+    if df < 3:
+        lo = math.floor(df)
+        w = (1 / lo - 1 / df) / (1 / lo - 1 / (lo + 1))
+        return (1 - w) * t_quantile(p, lo) + w * t_quantile(p, lo + 1)
+    z = NormalDist().inv_cdf(p)
+    z2 = z * z
+    g1 = (z2 + 1) * z / 4
+    g2 = ((5 * z2 + 16) * z2 + 3) * z / 96
+    g3 = (((3 * z2 + 19) * z2 + 17) * z2 - 15) * z / 384
+    g4 = ((((79 * z2 + 776) * z2 + 1482) * z2 - 1920) * z2 - 945) * z / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+def interval(values, confidence: float) -> tuple:
+    """(mean, half width) of the t confidence interval of the mean; inf half width below 2 values."""
+    x = np.asarray(values, dtype=np.float64)
+    if len(x) < 2:
+        return (float(x.mean()) if len(x) else float("nan")), float("inf")
+    half = t_quantile(0.5 + confidence / 2, len(x) - 1) * x.std(ddof=1) / math.sqrt(len(x))
+    return float(x.mean()), float(half)
+
+def unpaired_interval(a, b, confidence: float) -> tuple:
+    """(mean B - A, Welch half width) treating the arms as independent samples."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    va, vb = a.var(ddof=1) / len(a), b.var(ddof=1) / len(b)
+    se2 = va + vb
+    if se2 == 0:
+        return float(b.mean() - a.mean()), 0.0
+    df = se2 ** 2 / (va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    # Welch df is fractional and >= min(n) - 1; keep it fractional instead of truncating
+    return float(b.mean() - a.mean()), float(t_quantile(0.5 + confidence / 2, max(df, 1.0)) * math.sqrt(se2))
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+def read_trips(tripinfo: Path, attr: str) -> dict:
+    """vehicle id -> attr of every <tripinfo> (unfinished ones included when written)."""
+    trips = {}
+    for _ev, el in ET.iterparse(str(tripinfo), events=("end",)):
+        if el.tag == "tripinfo":
+            trips[el.get("id")] = float(el.get(attr, 0.0))
+            el.clear()
+    return trips
+
+def _run_arm(job: dict) -> dict:
+    """Worker: one controller with one seed; returns its per-trip metric values."""
+    out = Path(job["dir"])
+    out.mkdir(parents=True, exist_ok=True)
+    tripinfo = out / "tripinfo.xml"
+    cmd = ["sumo", "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--step-length", str(job["step"]),
+           "--no-step-log", "true", "--tripinfo-output.write-unfinished", "true"]
+    if job["routes"]:
+        cmd += ["-r", job["routes"]]
+    cmd += output_args({"tripinfo-output": tripinfo})
+    t0 = time.perf_counter()
+    with open(out / "run.log", "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        traci.start(cmd)
+        try:
+            _run_controller(job["controller"], job["tls"], job["until"], job["step"], job["params"], lambda: None)
+        finally:
+            traci.close()
+    trips = read_trips(tripinfo, job["attr"])
+    if not job["keep_tripinfo"]:
+        tripinfo.unlink()
+    return {"seed": job["seed"], "controller": job["controller"], "trips": trips,
+            "wall_s": round(time.perf_counter() - t0, 1)}
+
+def pair_row(seed: int, a: dict, b: dict) -> dict:
+    """Per-trip join of the two arms of one seed."""
+    common = sorted(a.keys() & b.keys())
+    va = np.array([a[k] for k in common])
+    vb = np.array([b[k] for k in common])
+    return {"seed": seed, "trips": len(common), "only_baseline": len(a.keys() - b.keys()),
+            "only_challenger": len(b.keys() - a.keys()),
+            "baseline_mean": round(float(va.mean()), 4) if len(common) else float("nan"),
+            "challenger_mean": round(float(vb.mean()), 4) if len(common) else float("nan"),
+            "diff": round(float((vb - va).mean()), 4) if len(common) else float("nan"),
+            "trip_diff_sd": round(float((vb - va).std(ddof=1)), 4) if len(common) > 1 else float("nan")}
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Paired controller comparison with common random numbers "
+                                            "and sequential stopping")
+    p.add_argument("--cfg", required=True, help="*.sumocfg path")
+    p.add_argument("--tls", required=True, help="Traffic light ID to control")
+    p.add_argument("--routes", default=None, help="Route file for every run (default: the cfg's)")
+    p.add_argument("--baseline", choices=CONTROLLERS, default="fixed", help="Arm A")
+    p.add_argument("--challenger", choices=CONTROLLERS, default="minqueue", help="Arm B")
+    p.add_argument("--metric", choices=list(METRICS), default="time_loss", help="Per-trip headline metric")
+    p.add_argument("--width", type=float, default=None, help="Target full CI width of the mean difference (s)")
+    p.add_argument("--rel-width", type=float, default=None, help="Target full CI width, %% of the baseline mean")
+    p.add_argument("--confidence", type=float, default=0.95)
+    p.add_argument("--min-seeds", type=int, default=3)
+    p.add_argument("--max-seeds", type=int, default=30)
+    p.add_argument("--batch", type=int, default=0, help="Seeds added per round (0 = workers / 2, at least 1)")
+    p.add_argument("--first-seed", type=int, default=1, help="Seeds are first-seed, first-seed + 1, ...")
+    p.add_argument("--until", type=float, default=1800.0, help="Simulated seconds per run")
+    p.add_argument("--step", type=float, default=1.0, help="Simulation step length (s), same for all")
+    p.add_argument("--min-green", type=float, default=8.0, help="Min green for minqueue / maxpressure")
+    p.add_argument("--max-green", type=float, default=60.0, help="Max green for maxpressure (0 = off)")
+    p.add_argument("--max-red", type=float, default=120.0, help="Max red for maxpressure (0 = off)")
+    p.add_argument("--yellow", type=float, default=3.0, help="Yellow seconds for maxpressure")
+    p.add_argument("--workers", type=int, default=0, help="Worker processes (0 = all cores)")
+    p.add_argument("--keep-tripinfo", action="store_true", help="Keep every run's tripinfo.xml")
+    p.add_argument("--out", default="runs/paired", help="Output folder")
+    args = p.parse_args()
+    if args.baseline == args.challenger:
+        p.error("--baseline and --challenger must differ")
+    if args.width is None and args.rel_width is None:
+        p.error("give --width (s) and/or --rel-width (%)")
+    if args.min_seeds < 2 or args.max_seeds < args.min_seeds:
+        p.error("need 2 <= --min-seeds <= --max-seeds")
+    return args
+
+def main():
+    args = parse_args()
+    cfg = Path(args.cfg).resolve()
+    if not cfg.exists():
+        raise SystemExit(f"[ERROR] Config not found: {cfg}")
+    routes = Path(args.routes).resolve() if args.routes else None
+    if routes is not None and not routes.exists():
+        raise SystemExit(f"[ERROR] Route file not found: {routes}")
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    workers = args.workers or os.cpu_count() or 1
+    batch = args.batch or max(1, workers // 2)
+    params = {"min_green": args.min_green, "max_green": args.max_green,
+              "max_red": args.max_red, "yellow": args.yellow}
+    attr = METRICS[args.metric]
+    arms = (args.baseline, args.challenger)
+    route_name = routes.name if routes else ", ".join(r.name for r in cfg_inputs(cfg)[1])
+    print(f"[INFO] {args.challenger} vs {args.baseline} on {route_name}: {args.metric}, "
+          f"{args.confidence:.0%} CI, {batch} seed(s) per round, up to {args.max_seeds}")
+
+    rows, arm_means = [], {a: [] for a in arms}
+    fields = ["seed", "trips", "only_baseline", "only_challenger", "baseline_mean", "challenger_mean", "diff",
+              "trip_diff_sd", "wall_s"]
+    paired_csv = out / "paired.csv"
+    with paired_csv.open("w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=fields).writeheader()
+
+    t0 = time.perf_counter()
+    seed, reason = args.first_seed, "max-seeds"
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(rows) < args.max_seeds:
+            need = max(args.min_seeds - len(rows), 1)
+            seeds = list(range(seed, seed + min(max(batch, need), args.max_seeds - len(rows))))
+            seed = seeds[-1] + 1
+            jobs = [{"controller": c, "tls": args.tls, "cfg": str(cfg), "routes": str(routes) if routes else None,
+                     "seed": s, "step": args.step, "until": args.until, "params": params, "attr": attr,
+                     "keep_tripinfo": args.keep_tripinfo, "dir": str(out / f"s{s}" / c)}
+                    for s in seeds for c in arms]
+            results = {(r["seed"], r["controller"]): r for r in pool.map(_run_arm, jobs)}
+            for s in seeds:
+                a, b = results[(s, arms[0])], results[(s, arms[1])]
+                row = pair_row(s, a["trips"], b["trips"])
+                row["wall_s"] = round(a["wall_s"] + b["wall_s"], 1)
+                rows.append(row)
+                arm_means[arms[0]].append(row["baseline_mean"])
+                arm_means[arms[1]].append(row["challenger_mean"])
+                with paired_csv.open("a", newline="", encoding="utf-8") as f:
+                    csv.DictWriter(f, fieldnames=fields).writerow(row)
+
+            mean, half = interval([r["diff"] for r in rows], args.confidence)
+            base_mean = float(np.mean(arm_means[arms[0]]))
+            target = min(w for w in (args.width, args.rel_width and abs(base_mean) * args.rel_width / 100.0)
+                         if w is not None)
+            print(f"[INFO] {len(rows)} seeds: diff {mean:+.3f} s +- {half:.3f} "
+                  f"(width {2 * half:.3f}, target {target:.3f})")
+            if len(rows) >= args.min_seeds and 2 * half <= target:
+                reason = "width"
+                break
+
+    n = len(rows)
+    diffs = [r["diff"] for r in rows]
+    mean, half = interval(diffs, args.confidence)
+    base_mean = float(np.mean(arm_means[arms[0]]))
+    u_mean, u_half = unpaired_interval(arm_means[arms[0]], arm_means[arms[1]], args.confidence)
+    var_d = float(np.var(diffs, ddof=1))
+    var_u = float(np.var(arm_means[arms[0]], ddof=1) + np.var(arm_means[arms[1]], ddof=1))
+    ratio = var_u / var_d if var_d > 0 else float("inf")
+    summary = {"baseline": arms[0], "challenger": arms[1], "metric": args.metric, "routes": route_name,
+               "seeds": n, "stopped_by": reason, "confidence": args.confidence, "target_width": target,
+               "baseline_mean": base_mean, "challenger_mean": float(np.mean(arm_means[arms[1]])),
+               "diff_mean": mean, "diff_ci": [mean - half, mean + half],
+               "rel_change_pct": 100.0 * mean / base_mean if base_mean else float("nan"),
+               "rel_ci_pct": ([100.0 * (mean - half) / base_mean, 100.0 * (mean + half) / base_mean]
+                              if base_mean else None),
+               "unpaired_ci": [u_mean - u_half, u_mean + u_half], "variance_ratio": ratio,
+               "unpaired_seeds_needed": int(math.ceil(n * ratio)) if math.isfinite(ratio) else None,
+               "wall_s": round(time.perf_counter() - t0, 1)}
+    (out / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    label = args.metric.replace("_", " ")
+    change = (f"{'decreased' if mean < 0 else 'increased'} by {abs(summary['rel_change_pct']):.1f}%"
+              if mean else "unchanged")
+    significant = (mean - half > 0) or (mean + half < 0)
+    headline = (f"Average {label} {change} "
+                f"({arms[0]} {base_mean:.2f}s -> {arms[1]} {summary['challenger_mean']:.2f}s; "
+                f"paired difference {mean:+.2f}s, {args.confidence:.0%} CI [{mean - half:+.2f}, {mean + half:+.2f}], "
+                f"{n} seeds{'' if significant else ', not significant'}).")
+    (out / "headline.txt").write_text(headline + "\n", encoding="utf-8")
+
+    print(f"[OK] Wrote {paired_csv}")
+    print(f"[OK] {headline}")
+    print(f"[INFO] Stopped by {reason} after {n} seeds ({2 * n} runs, {summary['wall_s']}s wall); unpaired CI "
+          f"[{u_mean - u_half:+.2f}, {u_mean + u_half:+.2f}], variance ratio {ratio:.1f} "
+          f"(~{summary['unpaired_seeds_needed']} seeds unpaired)")
+
+if __name__ == "__main__":
+    main()
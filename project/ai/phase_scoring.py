@@ -0,0 +1,156 @@
+"""
+Phase Scoring Engine (sparse phase x lane incidence)
+- Built once per controller: one row per (TLS, phase), one column per distinct lane,
+  stored as CSR arrays (indptr / indices / weights) in plain NumPy.
+- Scoring a step is one sparse mat-vec over a lane vector (halting counts, or
+  vType-weighted halting counts):  scores[r] = sum_k weights[k] * x[indices[k]]
+  over k in indptr[r]:indptr[r+1]. Each lane is read once per step, however many
+  phases serve it.
+- Modes:
+    queue     row = distinct incoming lanes served green in the phase
+              (the rule of minqueue_tls.py)
+    pressure  per green link (movement): +w on its incoming lane, -w on its outgoing
+              lane, i.e. the phase's summed in-minus-out pressure (max-pressure)
+- Lane weights multiply the matrix entries (e.g. per-100 m normalisation by lane
+  length); vType weights act on the lane vector and are the observer's business.
+- Many TLS share one matrix and one lane vector; best() returns the arg-max phase
+  of every TLS at once.
+- Small matrices (a single junction: a handful of phases x lanes) are also kept
+  dense and scored with ndarray.dot, which beats the index / bincount round for
+  them; both give the same numbers.
+
+Usage:
+  from phase_scoring import PhaseScorer
+  scorer = PhaseScorer.from_phase_lanes({tls: link_phase_map})        # queue mode
+  scorer = PhaseScorer.from_links({tls: (states, links)}, "pressure")
+  x = np.array([halting[ln] for ln in scorer.lanes], dtype=float)
+  scores = scorer.scores(x); best = scorer.best(scores)
+"""
+import numpy as np
+
+MODES = ("queue", "pressure")
+GREEN = ("G", "g")
+DENSE_MAX_CELLS = 4096  # rows x lanes up to which scores() uses a dense copy
+
+class PhaseScorer:
+    """CSR phase x lane matrix over several TLS; rows grouped per TLS in tls_ids order."""
+
+    def __init__(self, rows: dict, lane_weights: dict | None = None, lanes: list | None = None):
+        """
+        rows: tls_id -> list (one per phase) of [(lane_id, sign), ...]. lanes fixes the
+        column order (a superset of the row lanes), so several scorers can share one
+        lane vector.
+        """
+        self.tls_ids = list(rows)
+        self.lanes = (list(lanes) if lanes is not None else
+                      sorted({ln for phases in rows.values() for entries in phases for ln, _ in entries}))
+        self.lane_index = {ln: j for j, ln in enumerate(self.lanes)}
+
+        indptr, indices, signs, row_tls = [0], [], [], []
+        for t, tls in enumerate(self.tls_ids):
+            for entries in rows[tls]:
+                for ln, sign in entries:
+                    indices.append(self.lane_index[ln])
+                    signs.append(sign)
+                indptr.append(len(indices))
+                row_tls.append(t)
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.signs = np.array(signs, dtype=np.float64)
+        self.row_tls = np.array(row_tls, dtype=np.int64)
+        self.n_phases = np.bincount(self.row_tls, minlength=len(self.tls_ids))
+        self.tls_start = np.concatenate([[0], np.cumsum(self.n_phases)])
+        # row id of every stored entry, for the bincount mat-vec
+        self._entry_row = np.repeat(np.arange(len(self.row_tls)), np.diff(self.indptr))
+        self.set_lane_weights(lane_weights)
+
+    @classmethod
+    def from_phase_lanes(cls, link_phase_maps: dict, lane_weights: dict | None = None, lanes: list | None = None):
+        """Queue mode from minqueue_tls.group_links_by_phase maps: tls -> {phase: set(lanes)}."""
+        rows = {tls: [[(ln, 1.0) for ln in sorted(m[pi])] for pi in sorted(m)]
+                for tls, m in link_phase_maps.items()}
+        return cls(rows, lane_weights, lanes)
+
+    @classmethod
+    def from_links(cls, definitions: dict, mode: str = "queue", lane_weights: dict | None = None,
+                   lanes: list | None = None):
+        """
+        definitions: tls -> (phase state strings, controlled links as returned by
+        traci.trafficlight.getControlledLinks: per link index a list of (in, out, via)).
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        rows = {}
+        for tls, (states, links) in definitions.items():
+            phases = []
+            for st in states:
+                green = [links[gi] for gi, ch in enumerate(st) if gi < len(links) and ch in GREEN]
+                if mode == "queue":
+                    served = {lk[0][0] for lk in green if lk and lk[0][0]}
+                    phases.append([(ln, 1.0) for ln in sorted(served)])
+                else:
+                    entries = []
+                    for lk in green:
+                        for lane_in, lane_out, _via in lk:
+                            if lane_in:
+                                entries.append((lane_in, 1.0))
+                            if lane_out:
+                                entries.append((lane_out, -1.0))
+                    phases.append(entries)
+            rows[tls] = phases
+        return cls(rows, lane_weights, lanes)
+
+    def set_lane_weights(self, lane_weights: dict | None):
+        """Per-lane multipliers (missing lanes: 1.0); None resets to plain counts."""
+        if lane_weights:
+            w = np.array([lane_weights.get(ln, 1.0) for ln in self.lanes], dtype=np.float64)
+            self.weights = self.signs * w[self.indices]
+        else:
+            self.weights = self.signs.copy()
+        n_rows, n_lanes = self.shape
+        self._dense = self.dense() if n_rows * n_lanes <= DENSE_MAX_CELLS else None
+
+    @property
+    def shape(self):
+        return len(self.row_tls), len(self.lanes)
+
+    def scores(self, x: np.ndarray) -> np.ndarray:
+        """All phase scores (one per row) for lane vector x (ordered like self.lanes)."""
+        if self._dense is not None:
+            return self._dense.dot(x)
+        return np.bincount(self._entry_row, weights=self.weights * x[self.indices],
+                           minlength=len(self.row_tls))
+
+    def tls_scores(self, scores: np.ndarray, t: int) -> np.ndarray:
+        """The phase scores of the t-th TLS (a view)."""
+        return scores[self.tls_start[t]:self.tls_start[t + 1]]
+
+    def best(self, scores: np.ndarray) -> np.ndarray:
+        """Arg-max phase index per TLS (first one on ties, like max() over range())."""
+        # sort rows by (tls, -score, row): the first row of each TLS block is its best phase
+        rows = np.arange(len(scores))
+        order = np.lexsort((rows, -scores, self.row_tls))
+        return order[self.tls_start[:-1]] - self.tls_start[:-1]
+
+    def dense(self) -> np.ndarray:
+        """The matrix as a dense array (inspection / tests)."""
+        m = np.zeros(self.shape)
+        np.add.at(m, (self._entry_row, self.indices), self.weights)
+        return m
+
+def length_weights(lengths: dict, per: float = 100.0) -> dict:
+    """Lane weights that turn halting counts into vehicles per `per` metres of lane."""
+    return {ln: per / max(float(L), 1e-6) for ln, L in lengths.items()}
+
+def parse_vtype_weights(spec: str | None) -> dict:
+    """'bus=2.5,truck=2' -> {'bus': 2.5, 'truck': 2.0} (empty / None -> {})."""
+    out = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, val = item.partition("=")
+        if not val:
+            raise ValueError(f"vType weight '{item}' is not NAME=WEIGHT")
+        out[name.strip()] = float(val)
+    return out
@@ -0,0 +1,196 @@
+"""
+Control-Loop Profiling (named timers / counters)
+- Spans around the phases of a control loop: sim_step, observation, decision,
+  actuation, learning ... timed with time.perf_counter_ns().
+- Each span name aggregates count / total / min / max and a log2 histogram of its
+  durations (64 fixed buckets, no per-call allocation), so p50/p99 are available
+  without keeping samples.
+- Off by default: with TRAFFIC_PROFILE unset, span() hands back a shared no-op
+  context manager. With it set, the cost of one empty span is measured at start-up
+  and the estimated overhead share is written into the profile.
+- Profiles are dumped at exit as JSON, plus a Chrome trace (chrome://tracing,
+  Perfetto) when TRAFFIC_PROFILE_TRACE=1.
+
+Environment:
+  TRAFFIC_PROFILE=1           enable
+  TRAFFIC_PROFILE_OUT=<dir>   output folder (default runs/profiles)
+  TRAFFIC_PROFILE_TRACE=1     also keep every span for a Chrome trace (capped)
+
+Usage:
+  from profiling import span, count
+  with span("sim_step"):
+      traci.simulationStep()
+  count("switches")
+
+  TRAFFIC_PROFILE=1 python ai/minqueue_tls.py --cfg north_test.sumocfg --tls <TLS_ID> --out runs/ai/out --nogui
+"""
+import os, json, time, atexit
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+N_BUCKETS = 64
+TRACE_CAP = 2_000_000  # spans kept for the Chrome trace
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Stat:
+    __slots__ = ("count", "total", "min", "max", "hist")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = 1 << 62
+        self.max = 0
+        self.hist = [0] * N_BUCKETS
+
+    def add(self, dur: int):
+        self.count += 1
+        self.total += dur
+        if dur < self.min:
+            self.min = dur
+        if dur > self.max:
+            self.max = dur
+        self.hist[min(dur.bit_length(), N_BUCKETS - 1)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper edge (ns) of the histogram bucket holding the q-quantile."""
+        target = q * self.count
+        seen = 0
+        for b, c in enumerate(self.hist):
+            seen += c
+            if c and seen >= target:
+                return float(min(1 << b, self.max))
+        return float(self.max)
+
+class _Span:
+    __slots__ = ("prof", "stat", "name", "t0")
+
+    def __init__(self, prof, stat, name):
+        self.prof = prof
+        self.stat = stat
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        self.stat.add(t1 - self.t0)
+        trace = self.prof.trace
+        if trace is not None and len(trace) < TRACE_CAP:
+            trace.append((self.name, self.t0, t1 - self.t0))
+        return False
+
+class Profiler:
+    def __init__(self, run_name: str, trace: bool = False):
+        self.run_name = run_name
+        self.stats = {}
+        self.counters = {}
+        self.trace = [] if trace else None
+        self.t_start = time.perf_counter_ns()
+        self.span_cost_ns = 0.0
+        self.span_cost_ns = self._calibrate()
+
+    def span(self, name: str):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = _Stat()
+        return _Span(self, stat, name)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _calibrate(self, n: int = 20000) -> float:
+        """Cost of one empty span (ns), used for the overhead estimate."""
+        saved, self.trace = self.trace, None
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            with self.span("__calib__"):
+                pass
+        cost = (time.perf_counter_ns() - t0) / n
+        self.stats.pop("__calib__", None)
+        self.trace = saved
+        return cost
+
+    def report(self) -> dict:
+        wall = time.perf_counter_ns() - self.t_start
+        spans = {}
+        n_spans = 0
+        for name, s in sorted(self.stats.items(), key=lambda kv: -kv[1].total):
+            n_spans += s.count
+            spans[name] = {
+                "count": s.count,
+                "total_ms": round(s.total / 1e6, 3),
+                "share_%": round(100.0 * s.total / wall, 2) if wall else 0.0,
+                "mean_us": round(s.total / s.count / 1e3, 3) if s.count else 0.0,
+                "min_us": round(s.min / 1e3, 3) if s.count else 0.0,
+                "p50_us_le": round(s.quantile(0.50) / 1e3, 3),
+                "p99_us_le": round(s.quantile(0.99) / 1e3, 3),
+                "max_us": round(s.max / 1e3, 3),
+                "hist_log2_ns": {f"<{1 << b}": c for b, c in enumerate(s.hist) if c},
+            }
+        return {
+            "run": self.run_name,
+            "wall_ms": round(wall / 1e6, 3),
+            "span_cost_ns": round(self.span_cost_ns, 1),
+            "overhead_est_%": round(100.0 * n_spans * self.span_cost_ns / wall, 4) if wall else 0.0,
+            "spans": spans,
+            "counters": dict(self.counters),
+        }
+
+    def dump(self, out_dir: Path):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = out_dir / f"{self.run_name}-{stamp}-{os.getpid()}.json"
+        path.write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
+        print(f"[PROFILE] Wrote {path}")
+        if self.trace:
+            tpath = path.with_suffix(".trace.json")
+            pid = os.getpid()
+            events = [{"name": n, "ph": "X", "ts": (t0 - self.t_start) / 1e3, "dur": d / 1e3,
+                       "pid": pid, "tid": 0} for n, t0, d in self.trace]
+            tpath.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+            print(f"[PROFILE] Wrote {tpath}")
+        return path
+
+_PROFILER = None
+
+def enabled() -> bool:
+    return _PROFILER is not None
+
+def get_profiler():
+    return _PROFILER
+
+def span(name: str):
+    """Context manager timing `name`; a shared no-op when profiling is off."""
+    if _PROFILER is None:
+        return _NO_SPAN
+    return _PROFILER.span(name)
+
+def count(name: str, n: int = 1):
+    if _PROFILER is not None:
+        _PROFILER.count(name, n)
+
+def _init_from_env():
+    global _PROFILER
+    flag = os.environ.get("TRAFFIC_PROFILE", "").strip().lower()
+    if flag in ("", "0", "false", "no", "off"):
+        return
+    import sys
+    run_name = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+    _PROFILER = Profiler(run_name, trace=os.environ.get("TRAFFIC_PROFILE_TRACE", "") == "1")
+    out_dir = Path(os.environ.get("TRAFFIC_PROFILE_OUT", PROJECT_ROOT / "runs" / "profiles"))
+    atexit.register(_PROFILER.dump, out_dir)
+
+_init_from_env()
@@ -0,0 +1,447 @@
+"""
+Queue-Model Fast Simulator (store-and-forward, NumPy)
+- Point-queue model of the controlled junction: one queue per EDGE_GROUPS arm.
+  Arms whose edges feed the TLS (per the <connection tl=...> entries of the net)
+  are served by the green phase that gives them G/g; the other arms are unsignalized.
+- Arrivals come from the flows / vehicles of a .rou.xml (screen) or from the departures
+  of the baseline tripinfo.xml (calibrate), per arm, delayed by the free-flow time from
+  the start of the arm to its stop line; service is a per-arm saturation flow while
+  the arm is green.
+- The TLS program of the .net.xml (phases, durations, yellow / all-red) always runs:
+  like minqueue_tls.py and controller_rule_based.py, an adaptive configuration only
+  jumps to a phase (setPhase, which restarts that phase's duration) and the program
+  takes over again from there. Decisions follow the controllers:
+    rule      after max(MIN_GREEN, CHECK_EVERY) since its last switch, every step,
+              the axis with the larger queue (ties to axis 0, like ns >= ew)
+    minqueue  every step after MIN_GREEN since its last switch, the phase with the
+              largest queue if it beats the current phase (CHECK_EVERY is unused)
+  --threshold is the extra queue gain (veh) a switch needs.
+- Every parameter combination is one row of a (K, arms) state array, so thousands of
+  (MIN_GREEN, CHECK_EVERY, threshold) settings are simulated in ONE time loop.
+- calibrate: replays the demand the baseline actually had and fits per-arm saturation
+  flows so the fixed-time plan reproduces the TotalWaiting_s of runs/baseline/out
+  within --max-rel-err (the smallest sat flow that does, as delay flattens out). A fit on the edge of the --sat-min / --sat-max grid or outside
+  that tolerance is an error (the JSON is still written, "fit_ok": false).
+- screen: ranks a parameter grid; only the top configurations are worth a SUMO run.
+  It refuses a failed calibration, a TLS axis without demand (e.g. approaches that are
+  on no EDGE_GROUPS road) and a grid whose configurations all tie.
+
+Usage (examples):
+  python ai/queue_sim.py calibrate --out runs/queue_sim/calibration.json
+  python ai/queue_sim.py screen --calib runs/queue_sim/calibration.json --policy rule \
+      --min-green 4:40:2 --check-every 1:10:1 --threshold 0:20:2 --out runs/queue_sim/screen.csv --top 10
+
+Outputs:
+  - calibrate: JSON with sat flow per arm, lost time, the fit per arm and fit_ok / warnings
+  - screen: CSV with one row per configuration, sorted by average delay per vehicle
+"""
+import sys, json, math
+import argparse
+import itertools
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from kpi_by_road import EDGE_GROUPS  # noqa: E402
+
+NET_XML = PROJECT_ROOT / "net" / "network.net.xml"
+ROUTES_XML = PROJECT_ROOT / "routes" / "four_roads_ramped.rou.xml"
+BASE_KPI = PROJECT_ROOT / "runs" / "baseline" / "out" / "b_kpi_by_road.csv"
+BASE_TRIPINFO = PROJECT_ROOT / "runs" / "baseline" / "out" / "tripinfo.xml"
+TLS_ID = "cluster_3500447461_85576972"
+
+ARMS = list(EDGE_GROUPS)
+
+POLICIES = {"fixed": 0, "rule": 1, "minqueue": 2}
+
+# ---------------- inputs ----------------
+
+def arrival_rates(routes_xml: Path, duration: float, dt: float) -> np.ndarray:
+    """Fluid arrival rate (veh/s) per step and arm, shape (T, arms)."""
+    steps = int(math.ceil(duration / dt))
+    lam = np.zeros((steps, len(ARMS)))
+    edge_to_arm = {e: i for i, a in enumerate(ARMS) for e in EDGE_GROUPS[a]}
+    route_arm = {}
+    for ev, el in ET.iterparse(routes_xml, events=("end",)):
+        if el.tag == "route" and el.get("id"):
+            first = el.get("edges", "").split()[:1]
+            route_arm[el.get("id")] = edge_to_arm.get(first[0]) if first else None
+        elif el.tag == "flow":
+            arm = route_arm.get(el.get("route"))
+            if arm is None:
+                continue
+            b = float(el.get("begin", 0.0)); e = float(el.get("end", duration))
+            if "vehsPerHour" in el.attrib:
+                rate = float(el.get("vehsPerHour")) / 3600.0
+            elif "period" in el.attrib:
+                rate = 1.0 / float(el.get("period"))
+            elif "probability" in el.attrib:
+                rate = float(el.get("probability"))
+            elif "number" in el.attrib and e > b:
+                rate = float(el.get("number")) / (e - b)
+            else:
+                continue
+            i0 = int(b // dt); i1 = min(int(math.ceil(e / dt)), steps)
+            lam[i0:i1, arm] += rate
+        elif el.tag in ("vehicle", "trip"):
+            arm = route_arm.get(el.get("route"))
+            i = int(float(el.get("depart", 0.0)) // dt)
+            if arm is not None and i < steps:
+                lam[i, arm] += 1.0 / dt
+    return lam
+
+def baseline_arrivals(tripinfo_xml: Path, duration: float, dt: float) -> np.ndarray:
+    """Arrivals (veh/s) per step and arm from the departures of a tripinfo.xml, shape (T, arms)."""
+    steps = int(math.ceil(duration / dt))
+    lam = np.zeros((steps, len(ARMS)))
+    edge_to_arm = {e: i for i, a in enumerate(ARMS) for e in EDGE_GROUPS[a]}
+    for ev, el in ET.iterparse(tripinfo_xml, events=("end",)):
+        if el.tag != "tripinfo":
+            continue
+        arm = edge_to_arm.get(el.get("departLane", "").rpartition("_")[0])
+        i = int(float(el.get("depart", 0.0)) // dt)
+        if arm is not None and 0 <= i < steps:
+            lam[i, arm] += 1.0 / dt
+        el.clear()
+    return lam
+
+def delay_arrivals(lam: np.ndarray, offsets: np.ndarray, dt: float) -> np.ndarray:
+    """Shift each arm's arrivals by its offset (s), i.e. from departure to the stop line."""
+    out = np.zeros_like(lam)
+    for j, off in enumerate(offsets):
+        k = int(round(off / dt))
+        if k < len(lam):
+            out[k:, j] = lam[:len(lam) - k, j]
+    return out
+
+def _read_tls(net_xml: Path, tls_id: str):
+    """Phase states / durations, linkIndex -> from edge, and (length, speed) of the arm edges."""
+    states, durations = None, []
+    link_from = {}
+    lanes = {}
+    arm_edges = {e for a in ARMS for e in EDGE_GROUPS[a]}
+    for ev, el in ET.iterparse(net_xml, events=("end",)):
+        if el.tag == "tlLogic" and el.get("id") == tls_id:
+            states = [p.get("state", "") for p in el.findall("phase")]
+            durations = [float(p.get("duration")) for p in el.findall("phase")]
+        elif el.tag == "connection" and el.get("tl") == tls_id:
+            link_from[int(el.get("linkIndex"))] = el.get("from")
+        elif el.tag == "edge":
+            lane = el.find("lane")
+            if el.get("id") in arm_edges and lane is not None:
+                lanes[el.get("id")] = (float(lane.get("length")), float(lane.get("speed")))
+            el.clear()
+    if states is None:
+        raise SystemExit(f"[ERROR] TLS '{tls_id}' not found in {net_xml}")
+    return states, durations, link_from, lanes
+
+def approach_offsets(net_xml: Path, tls_id: str) -> np.ndarray:
+    """(arms,) free-flow seconds from the start of each arm to the TLS (0 for the others)."""
+    states, durations, link_from, lanes = _read_tls(net_xml, tls_id)
+    feeding = set(link_from.values())
+    offsets = np.zeros(len(ARMS))
+    for j, arm in enumerate(ARMS):
+        edges = EDGE_GROUPS[arm]
+        last = max((k for k, e in enumerate(edges) if e in feeding), default=-1)
+        offsets[j] = sum(lanes[e][0] / lanes[e][1] for e in edges[:last + 1] if e in lanes)
+    return offsets
+
+def axis_approaches(net_xml: Path, tls_id: str):
+    """Edges feeding each of the two axis greens that are on no EDGE_GROUPS road."""
+    states, durations, link_from, lanes = _read_tls(net_xml, tls_id)
+    green_states = [s for s in states if "G" in s or "g" in s][:2]
+    return [sorted({e for li, e in link_from.items() if li < len(st) and st[li] in "Gg" and e not in lanes})
+            for st in green_states]
+
+def tls_plan(net_xml: Path, tls_id: str):
+    """
+    From the static program and the connections of one TLS:
+      - durations: (phases,) duration of every phase of the program
+      - phase_axis: (phases,) 0 / 1 for the first two green phases, -1 for the others
+      - arm_axis: (arms,) axis serving each EDGE_GROUPS arm, -1 if the arm does not feed the TLS
+    """
+    states, durations, link_from, lanes = _read_tls(net_xml, tls_id)
+    phases = [(d, "G" in s or "g" in s) for d, s in zip(durations, states)]
+    green_states = [s for s, (d, g) in zip(states, phases) if g]
+    if len(green_states) < 2:
+        raise SystemExit(f"[ERROR] TLS '{tls_id}' needs at least two green phases")
+    durations = np.array([d for d, g in phases])
+    green_rank = np.cumsum([g for d, g in phases]) - 1
+    phase_axis = np.array([k if g and k < 2 else -1 for k, (d, g) in zip(green_rank, phases)], dtype=np.int64)
+
+    arm_axis = np.full(len(ARMS), -1, dtype=np.int64)
+    for j, arm in enumerate(ARMS):
+        links = [li for li, e in link_from.items() if e in EDGE_GROUPS[arm]]
+        for axis, st in enumerate(green_states[:2]):
+            if any(li < len(st) and st[li] in "Gg" for li in links):
+                arm_axis[j] = axis
+                break
+    return durations, phase_axis, arm_axis
+
+def plan_summary(durations: np.ndarray, phase_axis: np.ndarray):
+    """(durations of the two axis greens, mean non-green time per green) of a program."""
+    greens = [float(durations[phase_axis == a][0]) for a in (0, 1)]
+    lost = float(durations[phase_axis < 0].sum()) / max(int((phase_axis >= 0).sum()), 1)
+    return greens, lost
+
+# ---------------- model ----------------
+
+def simulate(lam, sat, durations, phase_axis, dt, policy, min_green, check_every, threshold, arm_axis):
+    """
+    Vectorized store-and-forward run.
+    lam: (T, A) arrivals; sat: (K, A) or (A,) saturation flow (veh/s);
+    durations / phase_axis: (P,) the TLS program (tls_plan), which runs between decisions;
+    arm_axis: (A,) axis serving each arm (-1 = unsignalized, always served);
+    policy/min_green/check_every/threshold: (K,) per configuration.
+    Returns dict of (K, A) arrays: delay (veh*s), served (veh), queue_end (veh).
+    """
+    steps, n_arms = lam.shape
+    policy = np.asarray(policy); K = policy.shape[0]
+    sat = np.broadcast_to(np.asarray(sat, dtype=float), (K, n_arms))
+    min_green = np.asarray(min_green, dtype=float)
+    threshold = np.asarray(threshold, dtype=float)
+    # the rule controller looks once t - last_change reaches both limits, then every step
+    rule_wait = np.maximum(np.asarray(check_every, dtype=float), min_green)
+    is_fixed = policy == POLICIES["fixed"]
+    is_rule = policy == POLICIES["rule"]
+    is_minq = policy == POLICIES["minqueue"]
+
+    durations = np.asarray(durations, dtype=float)
+    phase_axis = np.asarray(phase_axis, dtype=np.int64)
+    n_phases = len(durations)
+    axis_green = np.array([int(np.flatnonzero(phase_axis == a)[0]) for a in (0, 1)])  # phase of each axis
+    axis_onehot = np.zeros((n_arms, 2))          # (A, 2)
+    signalized = arm_axis >= 0
+    axis_onehot[signalized, arm_axis[signalized]] = 1.0
+    sat = np.where(signalized[None, :], sat, np.inf)  # unsignalized arms never queue
+    q = np.zeros((K, n_arms))
+    delay = np.zeros((K, n_arms))
+    served = np.zeros((K, n_arms))
+    # rule starts on its best axis at t=0 (all queues 0: axis 0) and counts from there;
+    # minqueue may switch at once
+    phase = np.zeros(K, dtype=np.int64)
+    in_phase = np.zeros(K)
+    last_change = np.where(is_rule, 0.0, -np.inf)
+    rows = np.arange(K)
+
+    for i in range(steps):
+        t = i * dt
+        q += lam[i] * dt
+        cur = phase_axis[phase]
+        green = (arm_axis[None, :] == cur[:, None]) | ~signalized[None, :]
+        out = np.minimum(q, sat * dt) * green
+        q -= out
+        served += out
+        delay += q * dt
+
+        # the program moves on when a phase has run its duration
+        in_phase += dt
+        done = in_phase >= durations[phase] - 1e-9
+        phase = np.where(done, (phase + 1) % n_phases, phase)
+        in_phase[done] = 0.0
+        t += dt
+
+        since = t - last_change
+        decide = (is_rule & (since >= rule_wait)) | (is_minq & (since >= min_green))
+        if not decide.any():
+            continue
+        qa = q @ axis_onehot                         # (K, 2) queue per axis
+        # rule: any phase but axis 0's green counts as axis 1 (cur_axis = NS only on PHASE_FOR["NS"]);
+        # it switches when the other axis has more queue, ties going to axis 0 (ns >= ew)
+        rule_axis = (phase != axis_green[0]).astype(np.int64)
+        gain = (qa[:, 1] - qa[:, 0]) * (1 - 2 * rule_axis)
+        rule_switch = np.where(rule_axis == 1, gain >= threshold, gain > threshold)
+        # minqueue: phase queue is that of the phase's axis (0 for yellow / all-red phases)
+        best_axis = (qa[:, 1] > qa[:, 0]).astype(np.int64)
+        q_cur = np.where(cur >= 0, qa[rows, np.maximum(cur, 0)], 0.0)
+        minq_switch = (phase != axis_green[best_axis]) & (qa[rows, best_axis] - q_cur > threshold)
+        switch = decide & np.where(is_rule, rule_switch, minq_switch)
+        target = axis_green[np.where(is_rule, 1 - rule_axis, best_axis)]
+        phase = np.where(switch, target, phase)
+        in_phase[switch] = 0.0
+        last_change = np.where(switch, t, last_change)
+
+    return {"delay": delay, "served": served, "queue_end": q}
+
+# ---------------- commands ----------------
+
+def load_inputs(args, lam=None):
+    if lam is None:
+        lam = arrival_rates(Path(args.routes), args.duration, args.dt)
+    lam = delay_arrivals(lam, approach_offsets(Path(args.net), args.tls), args.dt)
+    durations, phase_axis, arm_axis = tls_plan(Path(args.net), args.tls)
+    return lam, durations, phase_axis, arm_axis
+
+def require_axis_demand(args, lam, arm_axis):
+    """Stop when a TLS axis gets no vehicles: its parameters could not change anything."""
+    axis_veh = [float(lam[:, arm_axis == a].sum() * args.dt) for a in (0, 1)]
+    empty = [a for a in (0, 1) if axis_veh[a] <= 0]
+    if empty:
+        unmapped = axis_approaches(Path(args.net), args.tls)
+        detail = "; ".join(f"axis {a}: {axis_veh[a]:.0f} veh, approaches on no EDGE_GROUPS road: "
+                           f"{', '.join(unmapped[a]) or '-'}" for a in (0, 1))
+        raise SystemExit(f"[ERROR] TLS '{args.tls}' axis {empty} has no demand ({detail}); "
+                         f"every configuration would tie. Add the approaches to EDGE_GROUPS or "
+                         f"use a route file that loads them")
+    return axis_veh
+
+def calibrate(args):
+    # the baseline's own departures: its route file / end time need not be today's --routes
+    tripinfo = Path(args.tripinfo)
+    if not tripinfo.exists():
+        raise SystemExit(f"[ERROR] Baseline tripinfo not found: {tripinfo}")
+    lam, durations, phase_axis, arm_axis = load_inputs(args, baseline_arrivals(tripinfo, args.duration, args.dt))
+    greens, lost = plan_summary(durations, phase_axis)
+    base = pd.read_csv(args.kpi).set_index("RoadDir")
+    target = np.array([float(base.loc[a, "TotalWaiting_s"]) if a in base.index else np.nan for a in ARMS])
+
+    # one configuration per candidate saturation flow, all arms at once
+    grid = np.linspace(args.sat_min, args.sat_max, args.sat_steps)
+    K = len(grid)
+    res = simulate(lam, grid[:, None] * np.ones(len(ARMS)), durations, phase_axis, args.dt,
+                   np.full(K, POLICIES["fixed"]), np.zeros(K), np.ones(K), np.zeros(K), arm_axis)
+    err = np.abs(res["delay"] - np.nan_to_num(target)[None, :])    # (K, A)
+    # delay flattens out as the sat flow grows (undersaturated arms wait for the green, not the
+    # queue), so every sat flow above some value fits: take the smallest one within tolerance
+    ok = err <= args.max_rel_err * np.maximum(np.nan_to_num(target), 1.0)[None, :]
+    best = np.where(ok.any(axis=0), np.argmax(ok, axis=0), np.argmin(err, axis=0))
+    sat = {a: float(grid[best[j]]) if arm_axis[j] >= 0 else None for j, a in enumerate(ARMS)}
+    fit = {a: {"signalized": bool(arm_axis[j] >= 0), "baseline_veh": round(float(lam[:, j].sum() * args.dt)),
+               "target_s": None if np.isnan(target[j]) else float(target[j]),
+               "model_s": round(float(res["delay"][best[j], j]), 2)} for j, a in enumerate(ARMS)}
+
+    # a sat flow on the grid's edge is a bound, not a fit; a large error means the model cannot
+    # reproduce the baseline there, whatever the sat flow
+    warnings = []
+    for j, a in enumerate(ARMS):
+        if arm_axis[j] < 0 or np.isnan(target[j]):
+            continue
+        f = fit[a]
+        rel = abs(f["model_s"] - f["target_s"]) / max(f["target_s"], 1.0)
+        f["rel_err"] = round(rel, 3)
+        if best[j] in (0, K - 1) and K > 1:
+            warnings.append(f"{a}: sat flow {sat[a]:.2f} veh/s is on the edge of the grid "
+                            f"[{args.sat_min}, {args.sat_max}] (model {'above' if f['model_s'] > f['target_s'] else 'below'} target)")
+        if rel > args.max_rel_err:
+            warnings.append(f"{a}: model delay {f['model_s']} s is {rel:.0%} off the target {f['target_s']} s")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "tls": args.tls, "greens_s": greens, "lost_s": lost, "dt": args.dt,
+        "max_rel_err": args.max_rel_err, "sat_veh_per_s": sat, "fit": fit,
+        "fit_ok": not warnings, "warnings": warnings,
+    }, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote {out}")
+    for a in ARMS:
+        f = fit[a]
+        sat_txt = f"{sat[a]:.2f} veh/s" if sat[a] is not None else "-"
+        print(f"  {a:<11} {'TLS ' if f['signalized'] else '    '}veh={f['baseline_veh']:<5} sat={sat_txt}  "
+              f"target={f['target_s']}  model={f['model_s']}  err={f.get('rel_err', '-')}")
+    for w in warnings:
+        print(f"[WARN] {w}")
+    if warnings:
+        raise SystemExit(f"[ERROR] Calibration failed: {len(warnings)} arm(s) outside the grid or "
+                         f"the {args.max_rel_err:.0%} tolerance; see {out}")
+
+def parse_range(text: str):
+    """'a:b:step' (inclusive) or comma list -> float array."""
+    if ":" in text:
+        a, b, s = (float(x) for x in text.split(":"))
+        return np.arange(a, b + s / 2, s)
+    return np.array([float(x) for x in text.split(",")])
+
+def screen(args):
+    lam, durations, phase_axis, arm_axis = load_inputs(args)
+    if args.calib:
+        calib = json.loads(Path(args.calib).read_text(encoding="utf-8"))
+        if not calib.get("fit_ok", False):
+            raise SystemExit(f"[ERROR] {args.calib} is a failed calibration: " + "; ".join(calib.get("warnings", [])))
+        sat = np.array([calib["sat_veh_per_s"].get(a) or args.sat_default for a in ARMS])
+    else:
+        sat = np.full(len(ARMS), args.sat_default)
+    axis_veh = require_axis_demand(args, lam, arm_axis)
+
+    # minqueue_tls.py decides every step: one check_every value is enough
+    check_every = parse_range(args.check_every) if args.policy == "rule" else np.array([args.dt])
+    combos = np.array(list(itertools.product(parse_range(args.min_green), check_every,
+                                             parse_range(args.threshold))))
+    K = len(combos)
+    policy = np.full(K, POLICIES[args.policy])
+    res = simulate(lam, sat, durations, phase_axis, args.dt, policy, combos[:, 0], combos[:, 1], combos[:, 2],
+                   arm_axis)
+    fixed = simulate(lam, sat, durations, phase_axis, args.dt, np.array([POLICIES["fixed"]]),
+                     np.zeros(1), np.ones(1), np.zeros(1), arm_axis)
+
+    arrivals = lam.sum() * args.dt
+    df = pd.DataFrame({
+        "policy": args.policy,
+        "min_green": combos[:, 0],
+        "check_every": combos[:, 1],
+        "threshold": combos[:, 2],
+        "TotalDelay_s": res["delay"].sum(axis=1).round(1),
+        "AvgDelay_per_veh_s": (res["delay"].sum(axis=1) / max(arrivals, 1e-9)).round(3),
+        "Served_veh": res["served"].sum(axis=1).round(1),
+        "Queue_end_veh": res["queue_end"].sum(axis=1).round(1),
+    })
+    fixed_avg = float(fixed["delay"].sum() / max(arrivals, 1e-9))
+    df["vs_fixed_%"] = ((df["AvgDelay_per_veh_s"] - fixed_avg) / fixed_avg * 100.0).round(2) if fixed_avg else float("nan")
+    df = df.sort_values(["AvgDelay_per_veh_s", "Queue_end_veh"]).reset_index(drop=True)
+    if df["AvgDelay_per_veh_s"].nunique() == 1 and K > 1:
+        raise SystemExit(f"[ERROR] All {K} configurations tie: their parameters never bind at this demand "
+                         f"(axis 0: {axis_veh[0]:.0f} veh, axis 1: {axis_veh[1]:.0f} veh); no ranking written")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    print(f"[OK] Screened {K} configurations -> {out}")
+    print(f"[INFO] fixed-time plan: {fixed_avg:.3f} s delay per vehicle")
+    print(df.head(args.top).to_string(index=False))
+    return df
+
+def add_common(sp):
+    sp.add_argument("--net", default=str(NET_XML), help="network .net.xml (TLS program)")
+    sp.add_argument("--routes", default=str(ROUTES_XML), help="demand .rou.xml (screen)")
+    sp.add_argument("--tls", default=TLS_ID, help="Traffic light ID whose program sets the fixed plan")
+    sp.add_argument("--duration", type=float, default=1800.0, help="Simulated seconds")
+    sp.add_argument("--dt", type=float, default=1.0, help="Model step (s)")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Vectorized queue-model simulator for controller pre-screening")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("calibrate", help="Fit per-arm saturation flows to the baseline KPIs")
+    add_common(c)
+    c.add_argument("--kpi", default=str(BASE_KPI), help="baseline *kpi_by_road.csv")
+    c.add_argument("--tripinfo", default=str(BASE_TRIPINFO), help="baseline tripinfo.xml (its departures are the demand)")
+    c.add_argument("--sat-min", type=float, default=0.05, help="Smallest candidate sat flow (veh/s)")
+    c.add_argument("--sat-max", type=float, default=3.0, help="Largest candidate sat flow (veh/s)")
+    c.add_argument("--sat-steps", type=int, default=300, help="Number of candidates")
+    c.add_argument("--max-rel-err", type=float, default=0.15, help="Largest acceptable |model - target| / target")
+    c.add_argument("--out", default="runs/queue_sim/calibration.json", help="Calibration JSON")
+
+    s = sub.add_parser("screen", help="Rank a grid of controller parameters")
+    add_common(s)
+    s.add_argument("--calib", default=None, help="Calibration JSON from 'calibrate'")
+    s.add_argument("--sat-default", type=float, default=1.0, help="Sat flow (veh/s) when uncalibrated")
+    s.add_argument("--policy", choices=["rule", "minqueue"], default="rule")
+    s.add_argument("--min-green", default="4:40:2", help="'a:b:step' or comma list (s)")
+    s.add_argument("--check-every", default="1:10:1", help="'a:b:step' or comma list (s); rule policy only")
+    s.add_argument("--threshold", default="0", help="Queue gain (veh) needed to switch")
+    s.add_argument("--out", default="runs/queue_sim/screen.csv", help="Ranked CSV")
+    s.add_argument("--top", type=int, default=10, help="Rows to print")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "calibrate":
+        calibrate(args)
+    else:
+        screen(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Simulation checkpoints (TraCI saveState / loadState)
+- Runs the warm-up prefix of a scenario ONCE, saves the SUMO state and caches it
+  under runs/checkpoints, keyed by (net, routes, seed, time, extra SUMO args).
+- Training episodes and controller evaluations then start from that state
+  (via --load-state, or traci.simulation.loadState on a live connection)
+  instead of re-simulating the identical prefix.
+- fork: evaluates several controllers from the same snapshot in parallel workers.
+
+Usage (examples):
+  python ai/sim_checkpoint.py warm --cfg north_test.sumocfg --time 300 --seed 7
+  python ai/sim_checkpoint.py fork --cfg north_test.sumocfg --time 300 --seed 7 \
+      --tls cluster_3500447461_85576972 --controllers fixed minqueue rule --workers 3 --out runs/fork
+
+Outputs:
+  - runs/checkpoints/<key>.state.xml.gz (+ <key>.json with the key fields)
+  - runs/checkpoints/cfg/<cfg>.<digest>.sumocfg: the cfg without outputs (quiet_cfg)
+  - fork: <out>/<controller>/tripinfo.xml, edgeData.xml, summary.xml
+Dependencies:
+  - SUMO installed, SUMO_HOME set (checked when a run starts, not at import:
+    cache keys, quiet_cfg and load_state_args need no SUMO)
+"""
+import os, sys, json, hashlib
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = PROJECT_ROOT / "runs" / "checkpoints"
+QUIET_CFG_DIR = CACHE_DIR / "cfg"
+
+# --- SUMO / TraCI bootstrap, on first use ---
+def _traci():
+    sumo_home = os.environ.get("SUMO_HOME")
+    if not sumo_home:
+        raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+    tools = str(Path(sumo_home) / "tools")
+    if tools not in sys.path:
+        sys.path.insert(0, tools)
+    import traci
+    return traci
+
+def quiet_cfg(cfg: Path) -> Path:
+    """
+    Copy of a .sumocfg without its outputs (the <output> block and any *-output option),
+    with file paths made absolute; cached by content under runs/checkpoints/cfg.
+    Used for warm-ups and evaluation runs, so they never overwrite a real run's results
+    and SUMO does not compute outputs nobody reads (sending them to os.devnull does).
+    """
+    cfg = Path(cfg).resolve()
+    data = cfg.read_bytes()
+    digest = hashlib.sha1(str(cfg).encode("utf-8") + data).hexdigest()[:12]
+    dst = QUIET_CFG_DIR / f"{cfg.stem}.{digest}.sumocfg"
+    if dst.exists():
+        return dst
+    root = ET.fromstring(data)
+    for parent in list(root.iter()):
+        for el in list(parent):
+            if el.tag == "output" or el.tag.endswith("-output"):
+                parent.remove(el)
+            elif el.tag.endswith(("-file", "-files")) and el.get("value"):
+                el.set("value", ",".join(str(cfg.parent / v.strip()) for v in el.get("value").split(",") if v.strip()))
+    QUIET_CFG_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.part")
+    ET.ElementTree(root).write(tmp, encoding="utf-8", xml_declaration=True)
+    os.replace(tmp, dst)
+    return dst
+
+def output_args(keep: dict | None = None):
+    """SUMO options writing the outputs in `keep` (option -> path), for a run from quiet_cfg."""
+    return [a for opt, path in (keep or {}).items() for a in (f"--{opt}", str(path))]
+
+def cfg_inputs(cfg: Path):
+    """Return (net_file, [route_files]) referenced by a .sumocfg, resolved relative to it."""
+    root = ET.parse(cfg).getroot()
+    net = root.find("./input/net-file")
+    routes = root.find("./input/route-files")
+    if net is None:
+        raise SystemExit(f"[ERROR] {cfg} has no <net-file>")
+    base = cfg.resolve().parent
+    net_path = base / net.attrib["value"]
+    route_paths = []
+    if routes is not None:
+        route_paths = [base / r.strip() for r in routes.attrib["value"].split(",") if r.strip()]
+    return net_path, route_paths
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class SnapshotCache:
+    """Warm-up states on disk, keyed by the content of net + routes, the seed, the time
+    and the extra SUMO args the warm-up ran with (e.g. --step-length changes the state)."""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def key(self, cfg: Path, seed: int, time_s: float, extra_args: str = "") -> dict:
+        net, routes = cfg_inputs(cfg)
+        return {
+            "net": file_digest(net),
+            "routes": [file_digest(r) for r in routes],
+            "seed": int(seed),
+            "time": float(time_s),
+            "args": extra_args.split(),
+        }
+
+    def path_for(self, key: dict) -> Path:
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{digest}.state.xml.gz"
+
+    def lookup(self, cfg: Path, seed: int, time_s: float, extra_args: str = ""):
+        state = self.path_for(self.key(cfg, seed, time_s, extra_args))
+        return state if state.exists() else None
+
+    def ensure(self, cfg: Path, seed: int, time_s: float, extra_args: str = "") -> Path:
+        """Return the cached state for (cfg, seed, time, extra_args); simulate the warm-up once if missing."""
+        cfg = Path(cfg)
+        key = self.key(cfg, seed, time_s, extra_args)
+        state = self.path_for(key)
+        if state.exists():
+            return state
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cmd = ["sumo", "-c", str(quiet_cfg(cfg)), "--seed", str(seed), "--no-step-log", "true"]
+        if extra_args:
+            cmd += extra_args.split()
+        label = f"warm-{state.stem}"
+        traci = _traci()
+        traci.start(cmd, label=label)
+        con = traci.getConnection(label)
+        try:
+            con.simulationStep(time_s)
+            tmp = state.with_name(state.name.replace(".state.", ".part.state."))
+            con.simulation.saveState(str(tmp))
+        finally:
+            con.close()
+        os.replace(tmp, state)
+        state.with_name(state.name.replace(".state.xml.gz", ".json")).write_text(
+            json.dumps({**key, "cfg": str(cfg)}, indent=2), encoding="utf-8")
+        print(f"[OK] Cached warm-up state t={time_s:g}s -> {state}")
+        return state
+
+def load_state_args(state: Path, time_s: float):
+    """SUMO options that start a run directly from a cached state."""
+    return ["--load-state", str(state), "--begin", f"{time_s:g}"]
+
+def restore(state: Path):
+    """Rewind the current TraCI connection to a cached state (no SUMO restart)."""
+    _traci().simulation.loadState(str(state))
+
+# ---------------- fork: parallel controller evaluations ----------------
+
+def _run_fixed(tls_id: str, until: float):
+    # baseline: keep the static program from the net file
+    traci = _traci()
+    while traci.simulation.getTime() < until and traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+
+def _run_minqueue(tls_id: str, until: float):
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import minqueue_tls
+    minqueue_tls.run_controller(tls_id, min_green=8.0, decision_period=1.0, until=until)
+
+def _run_rule(tls_id: str, until: float):
+    sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+    import controller_rule_based
+    controller_rule_based.run_controller(tls_id, until=until)
+
+CONTROLLERS = {
+    "fixed": _run_fixed,
+    "minqueue": _run_minqueue,
+    "rule": _run_rule,
+}
+
+def _fork_worker(job: dict) -> dict:
+    out = Path(job["out"])
+    out.mkdir(parents=True, exist_ok=True)
+    cmd = ["sumo", "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--no-step-log", "true"]
+    cmd += output_args({"tripinfo-output": out / "tripinfo.xml",
+                        "edgedata-output": out / "edgeData.xml",
+                        "summary-output": out / "summary.xml"})
+    cmd += load_state_args(Path(job["state"]), job["time"])
+    if job["sumo_args"]:
+        cmd += job["sumo_args"].split()
+    traci = _traci()
+    traci.start(cmd)
+    try:
+        CONTROLLERS[job["controller"]](job["tls"], job["until"])
+        sim_end = traci.simulation.getTime()
+    finally:
+        traci.close()
+    return {"controller": job["controller"], "out": str(out), "sim_end": sim_end}
+
+def fork_controllers(state: Path, cfg: Path, time_s: float, seed: int, tls_id: str,
+                     controllers, out_dir: Path, until: float, workers: int = 0,
+                     sumo_args: str = ""):
+    """Run each controller from the same snapshot, one SUMO per worker process."""
+    unknown = [c for c in controllers if c not in CONTROLLERS]
+    if unknown:
+        raise SystemExit(f"[ERROR] Unknown controller(s): {unknown}; choose from {sorted(CONTROLLERS)}")
+    jobs = [{
+        "controller": c, "cfg": str(cfg), "state": str(state), "time": time_s,
+        "seed": seed, "tls": tls_id, "until": until, "sumo_args": sumo_args,
+        "out": str(Path(out_dir) / c),
+    } for c in controllers]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_fork_worker, jobs))
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Cache SUMO warm-up states and fork controller runs from them")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    def common(sp):
+        sp.add_argument("--cfg", required=True, help="*.sumocfg path")
+        sp.add_argument("--time", type=float, required=True, help="Warm-up length (s of sim time)")
+        sp.add_argument("--seed", type=int, default=7, help="SUMO random seed (part of the cache key)")
+        sp.add_argument("--sumo-args", default="", help="Extra args passed to SUMO")
+        sp.add_argument("--cache", default=str(CACHE_DIR), help="Checkpoint cache folder")
+
+    w = sub.add_parser("warm", help="Create (or reuse) the warm-up state")
+    common(w)
+
+    f = sub.add_parser("fork", help="Evaluate several controllers from one warm-up state")
+    common(f)
+    f.add_argument("--tls", required=True, help="Traffic light ID to control")
+    f.add_argument("--controllers", nargs="+", default=["fixed", "minqueue", "rule"],
+                   help=f"Any of {sorted(CONTROLLERS)}")
+    f.add_argument("--until", type=float, default=1800.0, help="Stop time (s)")
+    f.add_argument("--workers", type=int, default=0, help="Worker processes (0 = one per controller)")
+    f.add_argument("--out", required=True, help="Output folder (one subfolder per controller)")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    cfg = Path(args.cfg)
+    cache = SnapshotCache(Path(args.cache))
+    state = cache.ensure(cfg, args.seed, args.time, args.sumo_args)
+    if args.cmd == "warm":
+        print(state)
+        return
+    results = fork_controllers(state, cfg, args.time, args.seed, args.tls, args.controllers,
+                               Path(args.out), args.until, args.workers, args.sumo_args)
+    for r in results:
+        print(f"[OK] {r['controller']:<9} t_end={r['sim_end']:.0f}s -> {r['out']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+"""
+TraCI Record / Replay (wire-level SUMO stand-in)
+- record: a TCP proxy between a TraCI client and a real SUMO. Every request
+  message and SUMO's answer are logged, grouped by simulation step, into a compact
+  binary trace (.trc): identical byte strings are stored once in a blob table and
+  the run itself is two uint32 index arrays, zlib-compressed.
+- serve: a local TraCI server that answers from a trace. Requests of step k get the
+  answers recorded at step k in recording order; a request not asked at that step
+  gets its latest earlier answer; unrecorded set commands are acknowledged, any other
+  unrecorded request gets an error status. Replay is open-loop: setPhase() etc. do
+  not change the recorded traffic.
+- Shims: install-shim writes `sumo` / `sumo-gui` scripts that traci.start() picks up
+  from PATH, so ai/minqueue_tls.py, scripts/controller_rule_based.py and
+  ai/train_rl_agent.py record or replay without code changes. In record mode every
+  traci.start() writes <dir>/session-NNNN.trc; in replay mode the session is
+  chosen by matching command line (cycled when one is started more often than recorded).
+- run: in-process replay. traci.start() is patched in the current interpreter to
+  connect the TraCI client to a Replayer through a loopback object instead of a TCP
+  socket, then the script runs unchanged. The shim path costs a socket round trip and
+  two process switches per request, which is most of its time (the server itself is
+  ~15% of a replay); in-process replay skips both.
+
+Usage:
+  python ai/traci_replay.py install-shim --mode record --dir runs/traces/minqueue
+  PATH=runs/traci_shim:$PATH python ai/minqueue_tls.py --cfg north_test.sumocfg --tls <TLS_ID> --out runs/ai/out --nogui
+  python ai/traci_replay.py install-shim --mode replay --dir runs/traces/minqueue
+  PATH=runs/traci_shim:$PATH python ai/minqueue_tls.py ...   # same command, no SUMO needed
+  python ai/traci_replay.py run --dir runs/traces/minqueue -- ai/minqueue_tls.py ...   # same, in-process
+
+  python ai/traci_replay.py info --trace runs/traces/minqueue/session-0000.trc
+  python ai/traci_replay.py serve --trace runs/traces/minqueue/session-0000.trc --port 8813
+  python ai/traci_replay.py record --trace run.trc --port 8813 -- sumo -c north_test.sumocfg
+
+Dependencies:
+  numpy; a SUMO installation only for recording (SUMO_HOME/bin or PATH). POSIX shell
+  for the shims (on Windows run `serve` and connect with traci.init(port)).
+"""
+import os, sys, json, time, zlib, gzip, shutil, socket, struct, subprocess, types, runpy
+import argparse
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import traci_wire as tw  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SHIM_DIR = PROJECT_ROOT / "runs" / "traci_shim"
+MAGIC = b"TRCR"
+VERSION = 1
+_U32 = struct.Struct("<I")
+
+# ---------------- trace file ----------------
+
+class TraceWriter:
+    """Collects (request, response) pairs; a SIMSTEP request closes the current step."""
+
+    def __init__(self):
+        self.blob_ids = {}
+        self.blobs = []
+        self.req = []
+        self.resp = []
+        self.step_ptr = [0]
+
+    def _id(self, blob: bytes) -> int:
+        i = self.blob_ids.get(blob)
+        if i is None:
+            i = self.blob_ids[blob] = len(self.blobs)
+            self.blobs.append(blob)
+        return i
+
+    def add(self, request: bytes, response: bytes):
+        self.req.append(self._id(request))
+        self.resp.append(self._id(response))
+        if _first_cmd(request) == tw.CMD_SIMSTEP:
+            self.step_ptr.append(len(self.req))
+
+    def save(self, path: Path, header: dict):
+        ptr = self.step_ptr + ([len(self.req)] if self.step_ptr[-1] != len(self.req) else [])
+        offsets = np.cumsum([0] + [len(b) for b in self.blobs], dtype=np.uint64)
+        body = b"".join([
+            _U32.pack(len(self.blobs)), offsets.astype("<u8").tobytes(), b"".join(self.blobs),
+            _U32.pack(len(ptr)), np.asarray(ptr, dtype="<u4").tobytes(),
+            _U32.pack(len(self.req)), np.asarray(self.req, dtype="<u4").tobytes(),
+            np.asarray(self.resp, dtype="<u4").tobytes(),
+        ])
+        head = json.dumps({**header, "version": VERSION, "steps": len(ptr) - 1,
+                           "messages": len(self.req), "blobs": len(self.blobs)}).encode("utf-8")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        with tmp.open("wb") as f:
+            f.write(MAGIC + _U32.pack(len(head)) + head + zlib.compress(body, 6))
+        os.replace(tmp, path)
+        return path
+
+def read_header(path: Path) -> dict:
+    with Path(path).open("rb") as f:
+        if f.read(4) != MAGIC:
+            raise SystemExit(f"[ERROR] Not a TraCI trace: {path}")
+        n = _U32.unpack(f.read(4))[0]
+        return json.loads(f.read(n).decode("utf-8"))
+
+def load_trace(path: Path) -> dict:
+    raw = Path(path).read_bytes()
+    if raw[:4] != MAGIC:
+        raise SystemExit(f"[ERROR] Not a TraCI trace: {path}")
+    n = _U32.unpack_from(raw, 4)[0]
+    header = json.loads(raw[8:8 + n].decode("utf-8"))
+    body = zlib.decompress(raw[8 + n:])
+    pos = 0
+
+    def u32():
+        nonlocal pos
+        v = _U32.unpack_from(body, pos)[0]
+        pos += 4
+        return v
+
+    def arr(count, dtype, size):
+        nonlocal pos
+        a = np.frombuffer(body, dtype=dtype, count=count, offset=pos)
+        pos += count * size
+        return a
+
+    n_blobs = u32()
+    offsets = arr(n_blobs + 1, "<u8", 8).astype(np.int64)
+    base = pos
+    blobs = [body[base + offsets[i]:base + offsets[i + 1]] for i in range(n_blobs)]
+    pos = base + int(offsets[-1])
+    step_ptr = arr(u32(), "<u4", 4).astype(np.int64)
+    m = u32()
+    req = arr(m, "<u4", 4)
+    resp = arr(m, "<u4", 4)
+    return {"header": header, "blobs": blobs, "step_ptr": step_ptr, "req": req, "resp": resp}
+
+def _first_cmd(payload: bytes) -> int:
+    return payload[1] if payload[0] else payload[5]
+
+# ---------------- replay ----------------
+
+class Replayer:
+    """Answers request payloads from a loaded trace, advancing one step per SIMSTEP."""
+
+    def __init__(self, trace: dict):
+        self.blobs = trace["blobs"]
+        self.step_ptr = trace["step_ptr"]
+        self.req = trace["req"]
+        self.resp = trace["resp"]
+        self.n_steps = len(self.step_ptr) - 1
+        self.req_index = {b: i for i, b in enumerate(self.blobs)}
+        self.req_ids = set(np.unique(self.req).tolist())
+        self.event_step = np.repeat(np.arange(self.n_steps), np.diff(self.step_ptr))
+        # the answer to the SIMSTEP that closed each step (a step may end the trace without one)
+        self.simstep_resp = {}
+        for k in range(self.n_steps):
+            last = int(self.step_ptr[k + 1]) - 1
+            if last >= 0 and _first_cmd(self.blobs[self.req[last]]) == tw.CMD_SIMSTEP:
+                self.simstep_resp[k] = int(self.resp[last])
+        self._history = {}
+        self.step = 0
+        self.steps_replayed = 0
+        self._enter(0)
+
+    def _enter(self, k: int):
+        self._pending = {}
+        if k >= self.n_steps:
+            return
+        lo, hi = int(self.step_ptr[k]), int(self.step_ptr[k + 1])
+        for r, a in zip(self.req[lo:hi].tolist(), self.resp[lo:hi].tolist()):
+            self._pending.setdefault(r, deque()).append(a)
+
+    def _fallback(self, rid: int):
+        """Latest answer recorded for rid at or before the current step (else the first one)."""
+        hist = self._history.get(rid)
+        if hist is None:
+            idx = np.flatnonzero(self.req == rid)
+            hist = self._history[rid] = (self.event_step[idx], self.resp[idx])
+        steps, answers = hist
+        j = int(np.searchsorted(steps, self.step, side="right")) - 1
+        return int(answers[max(j, 0)])
+
+    def answer(self, payload: bytes) -> bytes:
+        cmd = _first_cmd(payload)
+        if cmd == tw.CMD_SIMSTEP:
+            k = min(self.step, self.n_steps - 1)
+            while k > 0 and k not in self.simstep_resp:
+                k -= 1
+            out = self.blobs[self.simstep_resp[k]] if k in self.simstep_resp else tw.status(cmd) + struct.pack("!i", 0)
+            self.step += 1
+            self.steps_replayed += 1
+            self._enter(self.step)
+            return out
+        rid = self.req_index.get(payload)
+        if rid is not None:
+            q = self._pending.get(rid)
+            if q:
+                return self.blobs[q.popleft()]
+            if rid in self.req_ids:
+                return self.blobs[self._fallback(rid)]
+        if all(tw.is_set_command(c) for c, _ in tw.iter_commands(payload)):
+            self._side_effects(payload)
+            return b"".join(tw.status(c) for c, _ in tw.iter_commands(payload))
+        return tw.status(cmd, tw.RTYPE_ERR, f"traci_replay: request 0x{cmd:02x} not in trace")
+
+    def _side_effects(self, payload: bytes):
+        """saveState() must leave a file behind: callers rename / cache it."""
+        for c, body in tw.iter_commands(payload):
+            if c == tw.CMD_SET_SIM_VARIABLE and body[0] == tw.CMD_SAVE_SIMSTATE:
+                _, pos = tw.read_string(body, 1)
+                fname, _ = tw.read_string(body, pos + 1)  # skip the TYPE_STRING tag
+                opener = gzip.open if fname.endswith(".gz") else open
+                with opener(fname, "wb") as f:
+                    f.write(b"<!-- traci_replay placeholder, not a SUMO state -->\n")
+
+def _listen(host: str, port: int) -> socket.socket:
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((host, port))
+    srv.listen(1)
+    return srv
+
+def _accept(srv: socket.socket) -> socket.socket:
+    conn, _ = srv.accept()
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    srv.close()
+    return conn
+
+def serve(trace_path: Path, port: int, host: str = "localhost"):
+    """Serve one client connection from a trace, until it sends CLOSE or disconnects."""
+    rep = Replayer(load_trace(trace_path))
+    conn = _accept(_listen(host, port))
+    t0 = time.perf_counter()
+    try:
+        while True:
+            msg = tw.recv_message(conn)
+            if msg is None:
+                break
+            tw.send_message(conn, rep.answer(msg))
+            if _first_cmd(msg) == tw.CMD_CLOSE:
+                break
+    finally:
+        conn.close()
+    wall = time.perf_counter() - t0
+    rate = rep.steps_replayed / wall if wall > 0 else 0.0
+    print(f"[OK] Replayed {rep.steps_replayed} steps from {trace_path} in {wall:.2f}s ({rate:.0f} steps/s)")
+
+# ---------------- record ----------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def record(sumo_cmd, port: int, trace_path: Path, host: str = "localhost", header: dict | None = None):
+    """Start SUMO on a private port and relay one client connection on `port`, logging it."""
+    srv = _listen(host, port)  # listen first: the client starts connecting right away
+    inner = _free_port()
+    proc = subprocess.Popen(list(sumo_cmd) + ["--remote-port", str(inner)])
+    sumo = None
+    for _ in range(600):
+        try:
+            sumo = socket.create_connection(("localhost", inner))
+            break
+        except OSError:
+            if proc.poll() is not None:
+                srv.close()
+                raise SystemExit(f"[ERROR] SUMO exited with code {proc.returncode} before accepting TraCI")
+            time.sleep(0.05)
+    if sumo is None:
+        proc.kill()
+        raise SystemExit("[ERROR] Could not connect to SUMO")
+    sumo.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client = _accept(srv)
+    writer = TraceWriter()
+    try:
+        while True:
+            msg = tw.recv_message(client)
+            if msg is None:
+                break
+            tw.send_message(sumo, msg)
+            ans = tw.recv_message(sumo)
+            if ans is None:
+                break
+            tw.send_message(client, ans)
+            writer.add(msg, ans)
+            if _first_cmd(msg) == tw.CMD_CLOSE:
+                break
+    finally:
+        client.close()
+        sumo.close()
+        path = writer.save(trace_path, {"args": list(sumo_cmd[1:]), "binary": Path(sumo_cmd[0]).name,
+                                        "created": time.strftime("%Y-%m-%d %H:%M:%S"), **(header or {})})
+        proc.wait()
+    print(f"[OK] Recorded {len(writer.step_ptr) - 1} steps, {len(writer.req)} messages -> {path}")
+    return path
+
+# ---------------- PATH shims ----------------
+
+SHIM = """#!/bin/sh
+exec "{python}" "{script}" shim --mode {mode} --dir "{trace_dir}" --shim-dir "{shim_dir}" --binary {binary} -- "$@"
+"""
+
+def install_shim(mode: str, trace_dir: Path, shim_dir: Path = SHIM_DIR):
+    shim_dir.mkdir(parents=True, exist_ok=True)
+    for binary in ("sumo", "sumo-gui"):
+        p = shim_dir / binary
+        p.write_text(SHIM.format(python=sys.executable, script=Path(__file__).resolve(), mode=mode,
+                                 trace_dir=Path(trace_dir).resolve(), shim_dir=shim_dir.resolve(),
+                                 binary=binary), encoding="utf-8")
+        p.chmod(0o755)
+    print(f"[OK] {mode} shims in {shim_dir} (traces: {trace_dir})")
+    print(f"     PATH={shim_dir}:$PATH python ai/minqueue_tls.py ...")
+
+def _split_port(args):
+    """(args without --remote-port N, N)."""
+    rest, port = [], None
+    it = iter(args)
+    for a in it:
+        if a == "--remote-port":
+            port = int(next(it))
+        elif a.startswith("--remote-port="):
+            port = int(a.split("=", 1)[1])
+        else:
+            rest.append(a)
+    if port is None:
+        raise SystemExit("[ERROR] No --remote-port in the SUMO command line (start it via traci.start)")
+    return rest, port
+
+def _real_binary(name: str, shim_dir: Path) -> str:
+    """The SUMO binary behind the shim: SUMO_HOME/bin first, then PATH without the shim folder."""
+    sumo_home = os.environ.get("SUMO_HOME")
+    if sumo_home:
+        for cand in (Path(sumo_home) / "bin" / name, Path(sumo_home) / "bin" / f"{name}.exe"):
+            if cand.exists():
+                return str(cand)
+    dirs = [d for d in os.environ.get("PATH", "").split(os.pathsep)
+            if d and Path(d).resolve() != shim_dir.resolve()]
+    found = shutil.which(name, path=os.pathsep.join(dirs))
+    if not found:
+        raise SystemExit(f"[ERROR] Real '{name}' binary not found (set SUMO_HOME)")
+    return found
+
+def _next_session(trace_dir: Path) -> Path:
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(100000):
+        p = trace_dir / f"session-{i:04d}.trc"
+        try:
+            os.close(os.open(p, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return p
+        except FileExistsError:
+            continue
+    raise SystemExit(f"[ERROR] Too many sessions in {trace_dir}")
+
+def _pick_session(trace_dir: Path, args) -> Path:
+    """Recorded session with the same command line, cycled per command line."""
+    import fcntl
+    sessions = sorted(p for p in trace_dir.glob("session-*.trc") if p.stat().st_size > 0)
+    if not sessions:
+        raise SystemExit(f"[ERROR] No recorded sessions in {trace_dir}")
+    same = [p for p in sessions if read_header(p).get("args") == list(args)] or sessions
+    key = json.dumps(list(args))
+    with (trace_dir / "cursor.json").open("a+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        text = f.read()
+        cursor = json.loads(text) if text.strip() else {}
+        n = cursor.get(key, 0)
+        cursor[key] = n + 1
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(cursor, indent=2))
+    return same[n % len(same)]
+
+def run_shim(mode: str, trace_dir: Path, shim_dir: Path, binary: str, sumo_args):
+    args, port = _split_port(sumo_args)
+    if mode == "record":
+        record([_real_binary(binary, shim_dir)] + args, port, _next_session(trace_dir))
+    else:
+        serve(_pick_session(trace_dir, args), port)
+
+# ---------------- in-process replay ----------------
+
+class LoopbackSocket:
+    """The socket of a traci Connection, answered by a Replayer in the same process."""
+
+    def __init__(self, replayer: Replayer):
+        self.rep = replayer
+        self.out = b""
+        self.pos = 0
+
+    def setsockopt(self, *args):
+        pass
+
+    def connect(self, address):
+        pass
+
+    def send(self, data: bytes) -> int:
+        # traci sends one whole message per call: <int32 length> <payload>
+        self.out = tw.frame(self.rep.answer(bytes(data[4:])))
+        self.pos = 0
+        return len(data)
+
+    def recv(self, n: int) -> bytes:
+        chunk = self.out[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+def install_inprocess(trace_dir: Path):
+    """Patch traci.start() to replay sessions from trace_dir in this process (no SUMO, no sockets)."""
+    sumo_home = os.environ.get("SUMO_HOME")
+    if sumo_home:
+        sys.path.insert(0, str(Path(sumo_home) / "tools"))
+    import traci
+    from traci import connection as tcon
+
+    def start(cmd, port=None, numRetries=None, label="default", verbose=False,
+              traceFile=None, traceGetters=True, stdout=None, doSwitch=True):
+        if tcon.has(label):
+            raise traci.TraCIException(f"Connection '{label}' is already active.")
+        session = _pick_session(Path(trace_dir), list(cmd[1:]))
+        if verbose:
+            print(f"Replaying {session}")
+        rep = Replayer(load_trace(session))
+        real = tcon.socket
+        tcon.socket = types.SimpleNamespace(socket=lambda *a: LoopbackSocket(rep), error=socket.error,
+                                            IPPROTO_TCP=socket.IPPROTO_TCP, TCP_NODELAY=socket.TCP_NODELAY)
+        try:
+            con = tcon.Connection("localhost", 0, None, traceFile, traceGetters, label)
+        finally:
+            tcon.socket = real
+        if doSwitch:
+            tcon.switch(label)
+        return con.getVersion()
+
+    traci.start = traci.main.start = start
+    return traci
+
+def run_inprocess(trace_dir: Path, script: str, script_args):
+    """Run a Python script as __main__ with traci.start() replaying from trace_dir."""
+    install_inprocess(trace_dir)
+    path = Path(script).resolve()
+    sys.argv = [str(path)] + list(script_args)
+    sys.path.insert(0, str(path.parent))
+    runpy.run_path(str(path), run_name="__main__")
+
+# ---------------- CLI ----------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Record TraCI sessions against SUMO and replay them without SUMO")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("record", help="Proxy one client to a real SUMO and write a trace")
+    p.add_argument("--trace", required=True)
+    p.add_argument("--port", type=int, required=True, help="Port the TraCI client connects to")
+    p.add_argument("sumo_cmd", nargs=argparse.REMAINDER, help="-- sumo -c <cfg> ... (without --remote-port)")
+
+    p = sub.add_parser("serve", help="Answer one client connection from a trace")
+    p.add_argument("--trace", required=True)
+    p.add_argument("--port", type=int, required=True)
+
+    p = sub.add_parser("info", help="Print trace statistics")
+    p.add_argument("--trace", required=True)
+
+    p = sub.add_parser("install-shim", help="Write sumo / sumo-gui PATH shims")
+    p.add_argument("--mode", choices=["record", "replay"], required=True)
+    p.add_argument("--dir", required=True, help="Session folder (written in record mode, read in replay mode)")
+    p.add_argument("--shim-dir", default=str(SHIM_DIR))
+
+    p = sub.add_parser("run", help="Run a script with traci.start() replaying in-process")
+    p.add_argument("--dir", required=True, help="Session folder written in record mode")
+    p.add_argument("script_cmd", nargs=argparse.REMAINDER, help="-- <script.py> [args...]")
+
+    p = sub.add_parser("shim", help=argparse.SUPPRESS)
+    p.add_argument("--mode", choices=["record", "replay"], required=True)
+    p.add_argument("--dir", required=True)
+    p.add_argument("--shim-dir", default=str(SHIM_DIR))
+    p.add_argument("--binary", default="sumo")
+    p.add_argument("sumo_args", nargs=argparse.REMAINDER)
+
+    args = ap.parse_args()
+    if args.cmd == "record":
+        cmd = args.sumo_cmd[1:] if args.sumo_cmd[:1] == ["--"] else args.sumo_cmd
+        if not cmd:
+            raise SystemExit("[ERROR] Give the SUMO command after --")
+        record(cmd, args.port, Path(args.trace))
+    elif args.cmd == "serve":
+        serve(Path(args.trace), args.port)
+    elif args.cmd == "info":
+        tr = load_trace(Path(args.trace))
+        h = tr["header"]
+        size = Path(args.trace).stat().st_size
+        raw = sum(len(tr["blobs"][i]) for i in tr["req"]) + sum(len(tr["blobs"][i]) for i in tr["resp"])
+        print(json.dumps(h, indent=2))
+        print(f"[INFO] {size / 1e3:.1f} kB on disk, {raw / 1e3:.1f} kB of TraCI traffic "
+              f"({raw / max(size, 1):.0f}x), {len(tr['blobs'])} distinct messages")
+    elif args.cmd == "run":
+        cmd = args.script_cmd[1:] if args.script_cmd[:1] == ["--"] else args.script_cmd
+        if not cmd:
+            raise SystemExit("[ERROR] Give the script and its arguments after --")
+        run_inprocess(Path(args.dir), cmd[0], cmd[1:])
+    elif args.cmd == "install-shim":
+        install_shim(args.mode, Path(args.dir), Path(args.shim_dir))
+    else:
+        rest = args.sumo_args[1:] if args.sumo_args[:1] == ["--"] else args.sumo_args
+        run_shim(args.mode, Path(args.dir), Path(args.shim_dir), args.binary, rest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+TraCI Wire Protocol (framing helpers, no SUMO needed)
+- A message on the socket is  <int32 total length incl. these 4 bytes> <commands...>;
+  each command is  <ubyte len> <ubyte id> <body>  or, when longer than 255 bytes,
+  <ubyte 0> <int32 len> <ubyte id> <body>.
+- A response repeats that layout: one status command per request command
+  (<len> <id> <result ubyte> <string description>), followed by the result
+  command for get / subscribe / simstep requests.
+- Only the constants used by the replay tools and the async orchestrator are
+  listed here (values as in traci/constants.py), so the module imports on
+  machines without SUMO.
+"""
+import struct
+
+CMD_GETVERSION = 0x00
+CMD_SIMSTEP = 0x02
+CMD_SETORDER = 0x03
+CMD_CLOSE = 0x7F
+CMD_SET_SIM_VARIABLE = 0xcb
+CMD_SAVE_SIMSTATE = 0x95
+
+RTYPE_OK = 0x00
+RTYPE_NOTIMPLEMENTED = 0x01
+RTYPE_ERR = 0xFF
+
+CMD_GET_TL_VARIABLE = 0xa2
+CMD_GET_LANE_VARIABLE = 0xa3
+CMD_GET_SIM_VARIABLE = 0xab
+CMD_SET_TL_VARIABLE = 0xc2
+CMD_SUBSCRIBE_TL_VARIABLE = 0xd2
+CMD_SUBSCRIBE_LANE_VARIABLE = 0xd3
+CMD_SUBSCRIBE_SIM_VARIABLE = 0xdb
+RESPONSE_OFFSET = 0x10  # get / subscribe results answer with cmd_id + 0x10
+
+LAST_STEP_VEHICLE_HALTING_NUMBER = 0x14
+TL_PHASE_INDEX = 0x22
+TL_CONTROLLED_LINKS = 0x27
+TL_CURRENT_PHASE = 0x28
+TL_COMPLETE_DEFINITION_RYG = 0x2b
+VAR_TIME = 0x66
+VAR_ARRIVED_VEHICLES_NUMBER = 0x79
+VAR_DELTA_T = 0x7b
+VAR_MIN_EXPECTED_VEHICLES = 0x7d
+
+POSITION_2D = 0x01
+TYPE_UBYTE = 0x07
+TYPE_BYTE = 0x08
+TYPE_INTEGER = 0x09
+TYPE_DOUBLE = 0x0B
+TYPE_STRING = 0x0C
+TYPE_STRINGLIST = 0x0E
+TYPE_COMPOUND = 0x0F
+TYPE_DOUBLELIST = 0x10
+
+INVALID_DOUBLE_VALUE = -1073741824.0
+
+_INT = struct.Struct("!i")
+_DOUBLE = struct.Struct("!d")
+
+def is_set_command(cmd_id: int) -> bool:
+    """Variable-setting commands (0xc0-0xcf, and 0x40-0x4f for the newer domains)."""
+    return 0xc0 <= cmd_id <= 0xcf or 0x40 <= cmd_id <= 0x4f
+
+def frame(payload: bytes) -> bytes:
+    return _INT.pack(len(payload) + 4) + payload
+
+def recv_exact(sock, n: int):
+    """n bytes from a blocking socket, or None when the peer closed."""
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+def recv_message(sock):
+    """Payload of the next message (length prefix stripped), or None on EOF."""
+    head = recv_exact(sock, 4)
+    if head is None:
+        return None
+    return recv_exact(sock, _INT.unpack(head)[0] - 4)
+
+def send_message(sock, payload: bytes):
+    sock.sendall(frame(payload))
+
+def iter_commands(payload: bytes):
+    """(command id, body bytes) for each command of a message payload."""
+    pos = 0
+    end = len(payload)
+    while pos < end:
+        length = payload[pos]
+        if length == 0:
+            length = _INT.unpack_from(payload, pos + 1)[0]
+            head = 6
+        else:
+            head = 2
+        yield payload[pos + head - 1], payload[pos + head:pos + length]
+        pos += length
+
+def read_string(buf: bytes, pos: int = 0):
+    """(string, next position) for an int32-length-prefixed UTF-8 string."""
+    n = _INT.unpack_from(buf, pos)[0]
+    return buf[pos + 4:pos + 4 + n].decode("utf-8"), pos + 4 + n
+
+def status(cmd_id: int, result: int = RTYPE_OK, description: str = "") -> bytes:
+    """Status command answering request cmd_id."""
+    d = description.encode("utf-8")
+    return struct.pack("!BBBi", 7 + len(d), cmd_id, result, len(d)) + d
+
+# ---------------- request encoding ----------------
+
+def command(cmd_id: int, body: bytes = b"") -> bytes:
+    """One command: short length form up to 255 bytes, long form beyond."""
+    n = len(body) + 2
+    if n <= 255:
+        return struct.pack("!BB", n, cmd_id) + body
+    return struct.pack("!BiB", 0, n + 4, cmd_id) + body
+
+def pack_string(s: str) -> bytes:
+    b = s.encode("utf-8")
+    return _INT.pack(len(b)) + b
+
+def get_variable(cmd_id: int, var: int, obj_id: str = "") -> bytes:
+    return command(cmd_id, bytes([var]) + pack_string(obj_id))
+
+def set_int(cmd_id: int, var: int, obj_id: str, value: int) -> bytes:
+    return command(cmd_id, bytes([var]) + pack_string(obj_id) + struct.pack("!Bi", TYPE_INTEGER, value))
+
+def subscribe(cmd_id: int, obj_id: str, variables, begin: float = INVALID_DOUBLE_VALUE,
+              end: float = INVALID_DOUBLE_VALUE) -> bytes:
+    """Variable subscription: results come with every simstep response from then on."""
+    variables = bytes(variables)
+    return command(cmd_id, struct.pack("!dd", begin, end) + pack_string(obj_id)
+                   + bytes([len(variables)]) + variables)
+
+def simstep(target: float = 0.0) -> bytes:
+    return command(CMD_SIMSTEP, _DOUBLE.pack(target))
+
+# ---------------- response decoding ----------------
+
+class Reader:
+    """Cursor over a response payload."""
+
+    def __init__(self, buf: bytes, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+
+    def u8(self) -> int:
+        self.pos += 1
+        return self.buf[self.pos - 1]
+
+    def i32(self) -> int:
+        self.pos += 4
+        return _INT.unpack_from(self.buf, self.pos - 4)[0]
+
+    def f64(self) -> float:
+        self.pos += 8
+        return _DOUBLE.unpack_from(self.buf, self.pos - 8)[0]
+
+    def string(self) -> str:
+        s, self.pos = read_string(self.buf, self.pos)
+        return s
+
+    def command(self):
+        """(command id, end position) of the command starting here; the cursor moves past its header."""
+        start = self.pos
+        n = self.u8()
+        if n == 0:
+            n = self.i32()
+        return self.u8(), start + n
+
+    def status(self):
+        """(command id, result, description) of a status command."""
+        cmd_id, end = self.command()
+        result, description = self.u8(), self.string()
+        self.pos = end
+        return cmd_id, result, description
+
+    def typed(self):
+        """One type-tagged value; compounds come back as flat lists of their items."""
+        t = self.u8()
+        if t == TYPE_INTEGER:
+            return self.i32()
+        if t == TYPE_DOUBLE:
+            return self.f64()
+        if t == TYPE_STRING:
+            return self.string()
+        if t == TYPE_STRINGLIST:
+            return [self.string() for _ in range(self.i32())]
+        if t == TYPE_COMPOUND:
+            return [self.typed() for _ in range(self.i32())]
+        if t == TYPE_DOUBLELIST:
+            return [self.f64() for _ in range(self.i32())]
+        if t == TYPE_UBYTE:
+            return self.u8()
+        if t == TYPE_BYTE:
+            self.pos += 1
+            return struct.unpack_from("!b", self.buf, self.pos - 1)[0]
+        if t == POSITION_2D:
+            return (self.f64(), self.f64())
+        raise ValueError(f"unsupported TraCI value type 0x{t:02x} at byte {self.pos - 1}")
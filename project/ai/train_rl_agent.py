@@ -1,10 +1,20 @@
+import json
 import traci
 import numpy as np
+from pathlib import Path
 from dqn_agent import DQNAgent
+from sim_checkpoint import SnapshotCache, load_state_args
+from profiling import span
 
 EPISODES = 100
+SUMO_CFG = "simulation/config.sumocfg"
+SEED = 7
+WARMUP_TIME = 300  # s: identical prefix of every episode, simulated once and cached
 STATE_SIZE = 4  # You can adjust this based on your actual state features
 ACTION_SIZE = 2  # Example: [keep current phase, switch phase]
+# Offline-pretrained weights (ai/transition_dataset.py pretrain); used when the file exists
+PRETRAINED_WEIGHTS = Path("checkpoints/dqn_pretrained.weights.h5")
+PRETRAINED_EPSILON = 0.1  # exploration left when starting from the pretrained policy
 
 # Edge groupings for state monitoring
 edges = {
@@ -19,9 +29,19 @@ edges = {
 }
 
 agent = DQNAgent(STATE_SIZE, ACTION_SIZE)
+if PRETRAINED_WEIGHTS.exists():
+    meta_path = Path(str(PRETRAINED_WEIGHTS) + ".json")
+    meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+    if meta.get("state_groups", list(edges)[:STATE_SIZE]) != list(edges)[:STATE_SIZE]:
+        print(f"[WARN] {PRETRAINED_WEIGHTS} was trained on state groups {meta['state_groups']}, "
+              f"not {list(edges)[:STATE_SIZE]}")
+    agent.load(str(PRETRAINED_WEIGHTS))
+    agent.epsilon = PRETRAINED_EPSILON
+    print(f"[INFO] Starting from {PRETRAINED_WEIGHTS} (epsilon {agent.epsilon})")
+warm_state = SnapshotCache().ensure(Path(SUMO_CFG), SEED, WARMUP_TIME)
 
 for e in range(EPISODES):
-    traci.start(["sumo", "-c", "simulation/config.sumocfg"])
+    traci.start(["sumo", "-c", SUMO_CFG, "--seed", str(SEED)] + load_state_args(warm_state, WARMUP_TIME))
     total_reward = 0
     done = False
     step = 0
@@ -38,24 +58,29 @@ for e in range(EPISODES):
             state.append(vehicle_count)
         return np.array([state[:STATE_SIZE]])
 
-    state = get_state()
+    with span("observation"):
+        state = get_state()
 
     min_expected = traci.simulation.getMinExpectedNumber()
     if isinstance(min_expected, tuple):
         min_expected = min_expected[0]
     while min_expected > 0:
-        action = agent.act(state)
+        with span("decision"):
+            action = agent.act(state)
 
         # Example signal logic: simple 2-phase toggle
         if action == 1:
-            current_phase = traci.trafficlight.getPhase("junction_id")
-            if isinstance(current_phase, tuple):
-                current_phase = current_phase[0]
-            traci.trafficlight.setPhase("junction_id", (current_phase + 1) % 2)
+            with span("actuation"):
+                current_phase = traci.trafficlight.getPhase("junction_id")
+                if isinstance(current_phase, tuple):
+                    current_phase = current_phase[0]
+                traci.trafficlight.setPhase("junction_id", (current_phase + 1) % 2)
 
-        traci.simulationStep()
+        with span("sim_step"):
+            traci.simulationStep()
 
-        next_state = get_state()
+        with span("observation"):
+            next_state = get_state()
         reward = -sum(next_state[0])  # Negative of total vehicle count as penalty
 
         done = step > 1000
@@ -69,6 +94,7 @@ for e in range(EPISODES):
             print(f"Episode {e+1}/{EPISODES}, Reward: {total_reward}, Epsilon: {agent.epsilon:.2f}")
             break
 
-    agent.replay()
+    with span("learning"):
+        agent.replay()
     agent.save("checkpoints/dqn_weights.h5")
     traci.close()
@@ -0,0 +1,399 @@
+"""
+Offline Transition Dataset (log existing controllers, pretrain the DQN from the log)
+- log: runs controller_rule_based.py / minqueue_tls.py (or maxpressure_tls.py) on the
+  cfg, one SUMO per (controller, seed) in a pool of worker processes, and records every
+  step as a transition (state, action, reward, next_state, done) in the state / action
+  space of train_rl_agent.py:
+    state   vehicles on the edges of each of the first --state-size groups (STATE_GROUPS,
+            the edge groups of train_rl_agent.py)
+    action  1 if the controller switched the phase before this step, else 0 (a phase
+            change the signal program made on its own, at getNextSwitch, counts as 0)
+    reward  minus the summed next state, as in train_rl_agent.py
+- Storage: fixed-size chunks (--chunk-rows transitions) of one NumPy structured array
+  each, written through np.lib.format.open_memmap, so a run never holds more than one
+  chunk in memory; every writer adds a <part>.json listing its chunks and row counts.
+  Parts from different runs / machines can simply be copied into one folder.
+- pretrain: streams shuffled minibatches from the memory-mapped chunks (a few chunks
+  at a time, so memory stays bounded however large the dataset grows) into the
+  DQNAgent network:
+    q   offline Q-learning with a target network plus a large-margin term: actions the
+        controller did not take are pushed --margin below the one it took (DQfD style),
+        so the greedy policy imitates the logged controller where the data says nothing else
+    bc  the margin term only (behaviour cloning on the Q outputs)
+  Every 10th transition is held out; after each epoch the greedy policy's agreement
+  with the logged actions on it (overall and on switches) is reported.
+- train_rl_agent.py loads the pretrained weights when present and starts with a small
+  epsilon instead of 1.0.
+
+Usage (example):
+  python ai/transition_dataset.py log --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --controllers rule minqueue --seeds 7 8 9 --until 1800 --out runs/transitions
+  python ai/transition_dataset.py pretrain --data runs/transitions --epochs 5 \
+      --out checkpoints/dqn_pretrained.weights.h5
+  python ai/transition_dataset.py info --data runs/transitions
+
+Outputs:
+  - log:      <out>/<controller>_s<seed>_<k>.npy chunks, <controller>_s<seed>.json, run logs
+  - pretrain: the weights (+ .json with state groups and agreement), pretrain.csv next to them
+Dependencies:
+  - SUMO installed, SUMO_HOME set (log); TensorFlow (Keras) (pretrain)
+"""
+import os, sys, csv, json, time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+AI_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = AI_DIR.parent
+sys.path.insert(0, str(AI_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+
+CHUNK_ROWS = 65536
+HOLDOUT_EVERY = 10
+LOG_CONTROLLERS = ["rule", "minqueue", "maxpressure"]
+ACTION_SIZE = 2  # [keep current phase, switch phase], as in train_rl_agent.py
+
+# Edge groups of the state, in train_rl_agent.py order
+STATE_GROUPS = {
+    "north": ["498169188#0", "498169188#1", "498169188#2", "498169188#3"],
+    "south": ["24375221#0", "24375221#1", "24375221#2", "24375221#3"],
+    "north_2": ["143957229#0", "143957229#1", "143957229#2", "143957229#3", "143957229#4", "143957229#5",
+                "143957229#6", "143957229#7", "143957229#8", "143957229#9"],
+    "south_2": ["24375222#1", "24375222#2", "24375222#3", "24375222#4", "24375222#5", "24375222#6",
+                "24375222#7", "24375222#8", "24375222#9"],
+    "east": ["343146616#0", "343146616#1", "343146616#2", "343146616#3", "343146616#4", "343146616#5",
+             "343146616#6", "343146616#7"],
+    "west": ["1088038754#0", "1088038754#1", "11075217#0", "11075217#1", "11075217#2", "11075217#3"],
+    "east_2": ["24449129#9", "24338292#1", "24338292#3", "24338292#4", "24338292#5", "24338292#6", "24338292#7"],
+    "west_2": ["144567412#0", "144567412#1", "144567412#2", "144567412#3", "144567412#5", "144567412#6",
+               "144567412#7"],
+}
+
+def transition_dtype(state_size: int) -> np.dtype:
+    return np.dtype([("state", "f4", (state_size,)), ("action", "i1"), ("reward", "f4"),
+                     ("next_state", "f4", (state_size,)), ("done", "u1")])
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+class TransitionWriter:
+    """Appends transitions to memory-mapped chunk files <root>/<part>_<k>.npy."""
+
+    def __init__(self, root: Path, part: str, state_size: int, chunk_rows: int = CHUNK_ROWS, info: dict | None = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.part = part
+        self.state_size = state_size
+        self.chunk_rows = chunk_rows
+        self.info = info or {}
+        self.dtype = transition_dtype(state_size)
+        self.chunks = []  # [{"file", "rows"}] of closed chunks
+        self._buf = None
+        self._n = 0
+
+    def _open_chunk(self):
+        name = f"{self.part}_{len(self.chunks):05d}.npy"
+        self._buf = np.lib.format.open_memmap(self.root / name, mode="w+", dtype=self.dtype,
+                                              shape=(self.chunk_rows,))
+        self._name, self._n = name, 0
+
+    def _close_chunk(self):
+        if self._buf is None:
+            return
+        self._buf.flush()
+        del self._buf
+        self._buf = None
+        if self._n:
+            self.chunks.append({"file": self._name, "rows": self._n})
+        else:
+            (self.root / self._name).unlink()
+
+    def add(self, state, action: int, reward: float, next_state, done: bool):
+        if self._buf is None:
+            self._open_chunk()
+        row = self._buf[self._n]
+        row["state"] = state
+        row["action"] = action
+        row["reward"] = reward
+        row["next_state"] = next_state
+        row["done"] = done
+        self._n += 1
+        if self._n == self.chunk_rows:
+            self._close_chunk()
+
+    def end_episode(self):
+        """Mark the last transition written as terminal."""
+        if self._buf is not None and self._n:
+            self._buf[self._n - 1]["done"] = 1
+        elif self.chunks:
+            last = np.load(self.root / self.chunks[-1]["file"], mmap_mode="r+")
+            last[self.chunks[-1]["rows"] - 1]["done"] = 1
+            last.flush()
+            del last
+
+    def close(self) -> dict:
+        self._close_chunk()
+        meta = {"state_size": self.state_size, "chunk_rows": self.chunk_rows, "chunks": self.chunks,
+                "rows": sum(c["rows"] for c in self.chunks), **self.info}
+        (self.root / f"{self.part}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        return meta
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TransitionDataset:
+    """All parts in a folder, opened as read-only memory maps."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        metas = sorted(self.root.glob("*.json"))
+        if not metas:
+            raise SystemExit(f"[ERROR] No transition parts (*.json) in {self.root}")
+        self.parts = [json.loads(p.read_text(encoding="utf-8")) for p in metas]
+        sizes = {m["state_size"] for m in self.parts}
+        if len(sizes) != 1:
+            raise SystemExit(f"[ERROR] Parts in {self.root} have different state sizes: {sorted(sizes)}")
+        self.state_size = sizes.pop()
+        self.chunks = []
+        for m in self.parts:
+            for c in m["chunks"]:
+                self.chunks.append(np.load(self.root / c["file"], mmap_mode="r")[:c["rows"]])
+        self.offsets = np.concatenate([[0], np.cumsum([len(c) for c in self.chunks])])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _holdout(self, k: int) -> np.ndarray:
+        """Holdout mask of chunk k (every HOLDOUT_EVERY-th transition of the dataset)."""
+        return np.arange(self.offsets[k], self.offsets[k + 1]) % HOLDOUT_EVERY == 0
+
+    def batches(self, batch_size: int, rng, mix: int = 4, holdout: bool = False):
+        """Shuffled minibatches (structured arrays) over the training (or holdout) rows;
+        mix chunks are read and shuffled together at a time."""
+        order = rng.permutation(len(self.chunks))
+        for g in range(0, len(order), mix):
+            group = order[g:g + mix]
+            rows = np.concatenate([self.chunks[k][self._holdout(k) == holdout] for k in group])
+            rows = rows[rng.permutation(len(rows))]
+            # training drops the ragged tail of a group; evaluation keeps every row
+            stop = len(rows) if holdout else len(rows) - batch_size + 1
+            for i in range(0, stop, batch_size):
+                yield rows[i:i + batch_size]
+
+    def rows(self, holdout: bool = False) -> np.ndarray:
+        """All training (or holdout) rows in dataset order, as one in-memory array."""
+        return np.concatenate([c[self._holdout(k) == holdout] for k, c in enumerate(self.chunks)])
+
+    def action_counts(self) -> np.ndarray:
+        counts = np.zeros(ACTION_SIZE, dtype=np.int64)
+        for c in self.chunks:
+            counts += np.bincount(c["action"], minlength=ACTION_SIZE)[:ACTION_SIZE]
+        return counts
+
+# ---------------------------------------------------------------------------
+# Logging controller runs
+# ---------------------------------------------------------------------------
+
+def _log_run(job: dict) -> dict:
+    """Worker: one controller with one seed, every step written as a transition."""
+    from controller_report import _run_controller
+    import traci
+    from sim_checkpoint import quiet_cfg
+
+    out = Path(job["out"])
+    groups = [STATE_GROUPS[g] for g in list(STATE_GROUPS)[:job["state_size"]]]
+    cmd = ["sumo", "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--step-length", str(job["step"]),
+           "--no-step-log", "true"]
+    part = f"{job['controller']}_s{job['seed']}"
+    info = {"controller": job["controller"], "seed": job["seed"], "cfg": job["cfg"], "tls": job["tls"],
+            "step": job["step"], "state_groups": list(STATE_GROUPS)[:job["state_size"]]}
+    t0 = time.perf_counter()
+    with open(out / f"{part}.log", "w", encoding="utf-8") as log, contextlib.redirect_stdout(log), \
+            TransitionWriter(out, part, job["state_size"], job["chunk_rows"], info) as writer:
+        traci.start(cmd)
+        try:
+            def observe():
+                return np.array([sum(traci.edge.getLastStepVehicleNumber(e) for e in g) for g in groups],
+                                dtype=np.float32)
+
+            prev = {"state": observe(), "phase": traci.trafficlight.getPhase(job["tls"]),
+                    "next_switch": traci.trafficlight.getNextSwitch(job["tls"])}
+            acc = {"n": 0, "switches": 0}
+
+            def on_step():
+                t = traci.simulation.getTime()
+                state = observe()
+                phase = traci.trafficlight.getPhase(job["tls"])
+                # a change before the program's own switch time was the controller's
+                switched = phase != prev["phase"] and t < prev["next_switch"] - 1e-6
+                writer.add(prev["state"], int(switched), -float(state.sum()), state, False)
+                acc["n"] += 1
+                acc["switches"] += switched
+                prev.update(state=state, phase=phase, next_switch=traci.trafficlight.getNextSwitch(job["tls"]))
+
+            _run_controller(job["controller"], job["tls"], job["until"], job["step"], job["params"], on_step)
+        finally:
+            traci.close()
+        writer.end_episode()
+    return {"part": part, "transitions": acc["n"], "switches": acc["switches"],
+            "wall_s": round(time.perf_counter() - t0, 1)}
+
+def log_transitions(args):
+    cfg = Path(args.cfg).resolve()
+    if not cfg.exists():
+        raise SystemExit(f"[ERROR] Config not found: {cfg}")
+    if not 1 <= args.state_size <= len(STATE_GROUPS):
+        raise SystemExit(f"[ERROR] --state-size must be 1..{len(STATE_GROUPS)}")
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    params = {"min_green": args.min_green, "max_green": 60.0, "max_red": 120.0, "yellow": 3.0}
+    jobs = [{"controller": c, "seed": s, "cfg": str(cfg), "tls": args.tls, "until": args.until, "step": args.step,
+             "params": params, "out": str(out), "state_size": args.state_size, "chunk_rows": args.chunk_rows}
+            for c in args.controllers for s in args.seeds]
+    print(f"[INFO] Logging {len(args.controllers)} controllers x {len(args.seeds)} seeds, until {args.until:.0f}s")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1) as pool:
+        for res in pool.map(_log_run, jobs):
+            print(f"[OK] {res['part']}: {res['transitions']} transitions, {res['switches']} switches, "
+                  f"{res['wall_s']}s")
+    ds = TransitionDataset(out)
+    print(f"[OK] {out}: {len(ds)} transitions in {len(ds.chunks)} chunks "
+          f"({time.perf_counter() - t0:.1f}s wall)")
+
+# ---------------------------------------------------------------------------
+# Offline pretraining
+# ---------------------------------------------------------------------------
+
+def margin_targets(q: np.ndarray, actions: np.ndarray, taken_value: np.ndarray, margin: float) -> np.ndarray:
+    """Regression targets: taken_value for the logged action, every other action at most
+    taken_value - margin (values already below stay)."""
+    rows = np.arange(len(actions))
+    target = np.minimum(q, (taken_value - margin)[:, None])
+    target[rows, actions] = taken_value
+    return target
+
+def agreement(model, dataset: TransitionDataset, batch_size: int = 4096):
+    """(overall, on logged switches) share of holdout rows where the greedy action matches."""
+    hits = total = sw_hits = sw_total = 0
+    for b in dataset.batches(batch_size, np.random.default_rng(0), holdout=True):
+        greedy = model(b["state"], training=False).numpy().argmax(axis=1)
+        a = b["action"].astype(np.int64)
+        hits += int((greedy == a).sum())
+        total += len(a)
+        sw = a == 1
+        sw_hits += int((greedy[sw] == 1).sum())
+        sw_total += int(sw.sum())
+    return (hits / total if total else float("nan")), (sw_hits / sw_total if sw_total else float("nan"))
+
+def pretrain(args):
+    from dqn_agent import DQNAgent
+
+    ds = TransitionDataset(Path(args.data))
+    counts = ds.action_counts()
+    print(f"[INFO] {len(ds)} transitions (keep {counts[0]}, switch {counts[1]}), state size {ds.state_size}")
+    agent = DQNAgent(ds.state_size, ACTION_SIZE)
+    agent.gamma = args.gamma
+    target = agent._build_model()
+    target.set_weights(agent.model.get_weights())
+    rng = np.random.default_rng(args.seed)
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    log_path = out.parent / "pretrain.csv"
+    fields = ["epoch", "updates", "loss", "agreement", "switch_agreement", "wall_s"]
+    with log_path.open("w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=fields).writeheader()
+
+    updates, loss = 0, None
+    for epoch in range(1, args.epochs + 1):
+        t0 = time.perf_counter()
+        for b in ds.batches(args.batch_size, rng):
+            s, a = b["state"], b["action"].astype(np.int64)
+            q = agent.model(s, training=False).numpy()
+            if args.mode == "q":
+                q_next = target(b["next_state"], training=False).numpy().max(axis=1)
+                taken = b["reward"] + args.gamma * q_next * (1.0 - b["done"])
+            else:
+                # behaviour cloning: keep the logged action's value, only open the margin
+                others = np.where(np.arange(ACTION_SIZE) == a[:, None], -np.inf, q).max(axis=1)
+                taken = np.maximum(q[np.arange(len(a)), a], others + args.margin)
+            loss = agent.model.train_on_batch(s, margin_targets(q, a, taken.astype(np.float32), args.margin))
+            updates += 1
+            if updates % args.target_sync == 0:
+                target.set_weights(agent.model.get_weights())
+        agree, sw_agree = agreement(agent.model, ds)
+        rec = {"epoch": epoch, "updates": updates, "loss": float(loss) if loss is not None else "",
+               "agreement": round(agree, 4), "switch_agreement": round(sw_agree, 4),
+               "wall_s": round(time.perf_counter() - t0, 1)}
+        with log_path.open("a", newline="", encoding="utf-8") as f:
+            csv.DictWriter(f, fieldnames=fields).writerow(rec)
+        print(f"Epoch {epoch}/{args.epochs}: {updates} updates, loss {rec['loss']}, "
+              f"agreement {agree:.3f} (switches {sw_agree:.3f})")
+        agent.save(str(out))
+
+    meta = {"state_size": ds.state_size, "action_size": ACTION_SIZE,
+            "state_groups": ds.parts[0].get("state_groups", list(STATE_GROUPS)[:ds.state_size]),
+            "controllers": sorted({m.get("controller", "?") for m in ds.parts}), "transitions": len(ds),
+            "mode": args.mode, "updates": updates, "agreement": agree, "switch_agreement": sw_agree}
+    Path(str(out) + ".json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote {out}")
+    print(f"[OK] Wrote {log_path}")
+
+def info(args):
+    ds = TransitionDataset(Path(args.data))
+    counts = ds.action_counts()
+    print(f"[INFO] {ds.root}: {len(ds)} transitions, state size {ds.state_size}, {len(ds.chunks)} chunks")
+    print(f"[INFO] actions: keep {counts[0]}, switch {counts[1]}")
+    for m in ds.parts:
+        print(f"  {m.get('controller', '?')} seed {m.get('seed', '?')}: {m['rows']} rows in {len(m['chunks'])} chunk(s)")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Log controller transitions and pretrain the DQN offline")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    lg = sub.add_parser("log", help="Record transitions from existing controllers")
+    lg.add_argument("--cfg", required=True, help="*.sumocfg path")
+    lg.add_argument("--tls", required=True, help="Traffic light ID the controllers drive")
+    lg.add_argument("--controllers", nargs="+", choices=LOG_CONTROLLERS, default=LOG_CONTROLLERS[:2])
+    lg.add_argument("--seeds", type=int, nargs="+", default=[7], help="One run per controller and seed")
+    lg.add_argument("--until", type=float, default=1800.0, help="Simulated seconds per run")
+    lg.add_argument("--step", type=float, default=1.0, help="Simulation step length (s)")
+    lg.add_argument("--min-green", type=float, default=8.0, help="Min green for minqueue / maxpressure")
+    lg.add_argument("--state-size", type=int, default=4, help="Edge groups in the state (train_rl_agent.py: 4)")
+    lg.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Transitions per chunk file")
+    lg.add_argument("--workers", type=int, default=0, help="Worker processes (0 = all cores)")
+    lg.add_argument("--out", default="runs/transitions", help="Dataset folder")
+
+    pt = sub.add_parser("pretrain", help="Offline Q-learning / behaviour cloning from a dataset")
+    pt.add_argument("--data", default="runs/transitions", help="Dataset folder")
+    pt.add_argument("--out", default="checkpoints/dqn_pretrained.weights.h5", help="Weights file")
+    pt.add_argument("--mode", choices=["q", "bc"], default="q", help="Offline Q-learning + margin, or margin only")
+    pt.add_argument("--epochs", type=int, default=5)
+    pt.add_argument("--batch-size", type=int, default=256)
+    pt.add_argument("--margin", type=float, default=1.0, help="Q gap between the logged action and the others")
+    pt.add_argument("--gamma", type=float, default=0.99)
+    pt.add_argument("--target-sync", type=int, default=500, help="Updates between target network syncs")
+    pt.add_argument("--seed", type=int, default=0)
+
+    inf = sub.add_parser("info", help="Summarise a dataset")
+    inf.add_argument("--data", default="runs/transitions", help="Dataset folder")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "log":
+        log_transitions(args)
+    elif args.cmd == "pretrain":
+        pretrain(args)
+    else:
+        info(args)
+
+if __name__ == "__main__":
+    main()
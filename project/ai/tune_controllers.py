@@ -0,0 +1,224 @@
+"""
+Controller Hyperparameter Search (successive halving, parallel SUMO workers)
+- Samples distinct candidate settings (Latin hypercube) for the rule-based controller (MIN_GREEN) or the
+  min-queue controller (--min-green), or takes the top rows of a queue_sim.py screen
+  CSV. CHECK_EVERY is not searched: the rule controller looks every step once both
+  CHECK_EVERY and MIN_GREEN have passed since its last change, so it only repeats
+  MIN_GREEN.
+- Rung r runs every surviving candidate up to RUNGS[r] seconds in a pool of worker
+  processes (one SUMO each), scoring the queue integral on the TLS lanes
+  (halting vehicles x seconds). Only the best 1/eta continue, resuming from the
+  state they saved at the end of the previous rung, so poor candidates stop early.
+  The controller's last switch time is carried over with the state, so a resumed
+  run decides exactly like an uninterrupted one.
+- All candidates start from the same cached warm-up state (sim_checkpoint.py).
+
+Usage (examples):
+  python ai/tune_controllers.py --cfg north_test.sumocfg --tls cluster_3500447461_85576972 \
+      --controller rule --samples 27 --eta 3 --rungs 600 1200 1800 --out runs/tuning
+  python ai/tune_controllers.py --cfg north_test.sumocfg --tls <TLS_ID> --controller minqueue \
+      --from-screen runs/queue_sim/screen.csv --samples 9 --out runs/tuning
+
+Outputs (in --out):
+  - <controller>_ranking.csv   every candidate, the rung it reached and its KPIs
+  - <controller>_best.json     best configuration
+Dependencies:
+  - SUMO installed, SUMO_HOME set
+"""
+import os, sys, json, time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# --- SUMO / TraCI bootstrap ---
+SUMO_HOME = os.environ.get("SUMO_HOME")
+if not SUMO_HOME:
+    raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+tools = Path(SUMO_HOME) / "tools"
+sys.path.insert(0, str(tools))
+import traci  # noqa: E402
+
+AI_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = AI_DIR.parent
+sys.path.insert(0, str(AI_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from sim_checkpoint import SnapshotCache, load_state_args, quiet_cfg  # noqa: E402
+
+# search space per controller: name -> (low, high, integer?)
+SPACES = {
+    "rule": {"min_green": (4, 40, True)},
+    "minqueue": {"min_green": (4, 40, True)},
+}
+
+def sample_candidates(controller: str, n: int, seed: int):
+    """
+    n distinct candidates from a Latin hypercube over the space (integer parameters on
+    their grid). Settings repeated by the integer rounding are redrawn; an integer-only
+    space with fewer than n settings is returned whole.
+    """
+    rng = np.random.default_rng(seed)
+    space = SPACES[controller]
+    if all(is_int for _, _, is_int in space.values()):
+        size = int(np.prod([hi - lo + 1 for lo, hi, _ in space.values()]))
+        if n > size:
+            print(f"[WARN] {controller}: only {size} distinct settings, sampling all of them")
+            n = size
+    out, seen = [], set()
+    while len(out) < n:
+        m = n - len(out)
+        # one point per stratum in every dimension, the strata paired at random
+        strata = rng.permuted(np.tile(np.arange(m), (len(space), 1)), axis=1).T
+        u = (strata + rng.random(strata.shape)) / m
+        for row in u:
+            cand = {name: int(lo + min(int(x * (hi - lo + 1)), hi - lo)) if is_int else float(lo + x * (hi - lo))
+                    for x, (name, (lo, hi, is_int)) in zip(row, space.items())}
+            key = tuple(cand.values())
+            if key not in seen:
+                seen.add(key)
+                out.append(cand)
+    return out
+
+def candidates_from_screen(controller: str, screen_csv: Path, n: int):
+    """Top rows of a queue_sim.py screen CSV, restricted to the controller's parameters."""
+    df = pd.read_csv(screen_csv)
+    cols = list(SPACES[controller])
+    df = df.drop_duplicates(subset=cols).head(n)
+    return [{c: (int(r[c]) if SPACES[controller][c][2] else float(r[c])) for c in cols}
+            for _, r in df.iterrows()]
+
+def _run_controller(controller: str, tls_id: str, until: float, params: dict, on_step, last_switch=None):
+    """Run to `until`, resuming the controller's switch timer; returns its last switch time."""
+    if controller == "minqueue":
+        import minqueue_tls
+        return minqueue_tls.run_controller(tls_id, params["min_green"], 1.0, until, on_step=on_step,
+                                           last_switch_time=-1e9 if last_switch is None else last_switch)
+    import controller_rule_based
+    return controller_rule_based.run_controller(tls_id, until=until, min_green=params["min_green"],
+                                                on_step=on_step, last_change=last_switch)
+
+def _evaluate(job: dict) -> dict:
+    """One candidate, one rung: resume from job['state'], run to job['until'], save state."""
+    out = Path(job["dir"])
+    out.mkdir(parents=True, exist_ok=True)
+    # rung states carry the RNG too, so the next rung continues the same random stream
+    cmd = ["sumo", "-c", str(quiet_cfg(job["cfg"])), "--seed", str(job["seed"]), "--no-step-log", "true",
+           "--save-state.rng", "true"]
+    cmd += load_state_args(Path(job["state"]), job["start"])
+    t0 = time.perf_counter()
+    with open(out / "worker.log", "a", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        traci.start(cmd)
+        try:
+            lanes = sorted(set(traci.trafficlight.getControlledLanes(job["tls"])))
+            step_len = traci.simulation.getDeltaT()
+            acc = {"queue": 0.0, "arrived": 0}
+
+            def on_step():
+                acc["queue"] += sum(traci.lane.getLastStepHaltingNumber(ln) for ln in lanes) * step_len
+                acc["arrived"] += traci.simulation.getArrivedNumber()
+
+            last_switch = _run_controller(job["controller"], job["tls"], job["until"], job["params"], on_step,
+                                          job["last_switch"])
+            end = traci.simulation.getTime()
+            state = out / f"rung{job['rung']}.state.xml.gz"
+            traci.simulation.saveState(str(state))
+        finally:
+            traci.close()
+    return {"id": job["id"], "rung": job["rung"], "end": end, "state": str(state), "last_switch": last_switch,
+            "queue_veh_s": acc["queue"], "arrived": acc["arrived"],
+            "wall_s": time.perf_counter() - t0}
+
+def successive_halving(candidates, args, warm_state: Path):
+    """Run the rungs; returns one record per candidate with the furthest rung it reached."""
+    records = {i: {"id": i, **c, "rung": -1, "sim_end": args.warmup, "queue_veh_s": 0.0,
+                   "arrived": 0, "wall_s": 0.0, "state": str(warm_state), "last_switch": None}
+               for i, c in enumerate(candidates)}
+    alive = list(records)
+    workers = args.workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for r, until in enumerate(args.rungs):
+            jobs = [{
+                "id": i, "rung": r, "controller": args.controller, "tls": args.tls,
+                "cfg": str(Path(args.cfg).resolve()), "seed": args.seed,
+                "params": candidates[i], "state": records[i]["state"], "last_switch": records[i]["last_switch"],
+                "start": records[i]["sim_end"], "until": until,
+                "dir": str(Path(args.out) / args.controller / f"cand{i:03d}"),
+            } for i in alive]
+            for res in pool.map(_evaluate, jobs):
+                rec = records[res["id"]]
+                rec["rung"] = r
+                rec["sim_end"] = res["end"]
+                rec["state"] = res["state"]
+                rec["last_switch"] = res["last_switch"]
+                rec["queue_veh_s"] += res["queue_veh_s"]
+                rec["arrived"] += res["arrived"]
+                rec["wall_s"] += res["wall_s"]
+            alive.sort(key=lambda i: records[i]["queue_veh_s"])
+            print(f"[rung {r}] t<={until:.0f}s  evaluated {len(alive)}  "
+                  f"best queue={records[alive[0]]['queue_veh_s']:.0f} veh*s ({candidates[alive[0]]})")
+            if r < len(args.rungs) - 1:
+                alive = alive[:max(1, len(alive) // args.eta)]
+    return list(records.values())
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Successive-halving search over controller settings")
+    p.add_argument("--cfg", required=True, help="*.sumocfg path")
+    p.add_argument("--tls", required=True, help="Traffic light ID to control")
+    p.add_argument("--controller", choices=sorted(SPACES), default="rule")
+    p.add_argument("--samples", type=int, default=27, help="Number of candidates")
+    p.add_argument("--from-screen", default=None, help="queue_sim.py screen CSV to take candidates from")
+    p.add_argument("--eta", type=int, default=3, help="Keep 1/eta of the candidates after each rung")
+    p.add_argument("--rungs", type=float, nargs="+", default=[600.0, 1200.0, 1800.0],
+                   help="Sim times (s) at which candidates are compared")
+    p.add_argument("--warmup", type=float, default=120.0, help="Shared warm-up (s), cached once")
+    p.add_argument("--seed", type=int, default=7, help="SUMO seed (also seeds sampling)")
+    p.add_argument("--workers", type=int, default=0, help="Worker processes (0 = all cores)")
+    p.add_argument("--out", default="runs/tuning", help="Output folder")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.rungs != sorted(args.rungs) or args.rungs[0] <= args.warmup:
+        raise SystemExit("[ERROR] --rungs must be increasing and start after --warmup")
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    if args.from_screen:
+        candidates = candidates_from_screen(args.controller, Path(args.from_screen), args.samples)
+    else:
+        candidates = sample_candidates(args.controller, args.samples, args.seed)
+    print(f"[INFO] {len(candidates)} {args.controller} candidates, rungs={args.rungs}, eta={args.eta}")
+
+    warm_state = SnapshotCache().ensure(Path(args.cfg), args.seed, args.warmup)
+    t0 = time.perf_counter()
+    records = successive_halving(candidates, args, warm_state)
+    elapsed = time.perf_counter() - t0
+
+    df = pd.DataFrame(records).drop(columns=["state", "last_switch"])
+    df["sim_s"] = df["sim_end"] - args.warmup
+    df["queue_per_s"] = (df["queue_veh_s"] / df["sim_s"].where(df["sim_s"] > 0)).round(3)
+    df = df.sort_values(["rung", "queue_veh_s"], ascending=[False, True]).reset_index(drop=True)
+    ranking = out / f"{args.controller}_ranking.csv"
+    df.to_csv(ranking, index=False)
+
+    best = df.iloc[0]
+    best_cfg = {k: (int(best[k]) if SPACES[args.controller][k][2] else float(best[k]))
+                for k in SPACES[args.controller]}
+    best_json = out / f"{args.controller}_best.json"
+    best_json.write_text(json.dumps({
+        "controller": args.controller, "tls": args.tls, "params": best_cfg,
+        "queue_veh_s": float(best["queue_veh_s"]), "arrived": int(best["arrived"]),
+        "sim_seconds_total": float(df["sim_s"].sum()), "wall_s": round(elapsed, 1),
+    }, indent=2), encoding="utf-8")
+
+    print(f"[OK] Wrote {ranking}")
+    print(f"[OK] Wrote {best_json}")
+    print(df.head(10).to_string(index=False))
+    print(f"[INFO] {df['sim_s'].sum():.0f} simulated s in {elapsed:.1f}s wall "
+          f"(full runs would need {len(candidates) * (args.rungs[-1] - args.warmup):.0f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+In-process TraCI stand-in for benchmarks
+- A module object with the subset of the traci API our controllers and the KPI
+  collector call (simulation / edge / lane / trafficlight, subscriptions,
+  TraCIException, constants), answering from a recorded or synthetic trace
+  instead of a SUMO process.
+- install(trace) registers it as sys.modules["traci"] BEFORE the controller modules
+  are imported, so ai/minqueue_tls.py etc. run unmodified on machines without SUMO.
+- synthetic_trace() builds a trace for one TLS straight from the .net.xml
+  (controlled links, phase states) with random halting counts; record_trace()
+  captures the same arrays from a live SUMO run (bench/run_bench.py --trace).
+
+Usage (record a trace; needs SUMO):
+  python bench/fake_traci.py --cfg north_test.sumocfg --begin 1200 --steps 3601 --out bench/.fixtures/north_test.npz
+
+Trace (.npz): times (T,), lane_ids, lane_halting (T, L), edge_ids, edge_halting,
+edge_count, edge_speed (T, E), tls_id, tls_states, tls_links (K, 3) in/out/via lanes.
+"""
+import os, sys, types
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from kpi_by_road import EDGE_GROUPS  # noqa: E402
+
+NET_XML = PROJECT_ROOT / "net" / "network.net.xml"
+TLS_ID = "cluster_3500447461_85576972"
+
+# the constants our code reads (values as in traci/constants.py)
+CONSTANTS = {
+    "LAST_STEP_VEHICLE_NUMBER": 0x10,
+    "LAST_STEP_MEAN_SPEED": 0x11,
+    "LAST_STEP_VEHICLE_ID_LIST": 0x12,
+    "LAST_STEP_VEHICLE_HALTING_NUMBER": 0x14,
+}
+
+def synthetic_trace(steps: int = 3600, dt: float = 0.5, net_xml: Path = NET_XML,
+                    tls_id: str = TLS_ID, seed: int = 0) -> dict:
+    states, links = [], {}
+    for ev, el in ET.iterparse(net_xml, events=("end",)):
+        if el.tag == "tlLogic" and el.get("id") == tls_id:
+            states = [p.get("state") for p in el.findall("phase")]
+        elif el.tag == "connection" and el.get("tl") == tls_id:
+            links[int(el.get("linkIndex"))] = (f"{el.get('from')}_{el.get('fromLane')}",
+                                               f"{el.get('to')}_{el.get('toLane')}",
+                                               el.get("via", ""))
+        elif el.tag == "edge":
+            el.clear()
+    tls_links = [links.get(i, ("", "", "")) for i in range(max(links) + 1)] if links else []
+    lane_ids = sorted({ln for trip in tls_links for ln in trip[:2] if ln})
+    edge_ids = [e for edges in EDGE_GROUPS.values() for e in edges]
+
+    rng = np.random.default_rng(seed)
+    # random walks, clipped at 0, so queues build up and drain like real ones
+    lane_h = np.clip(np.cumsum(rng.integers(-1, 2, (steps, len(lane_ids))), axis=0), 0, 40)
+    edge_h = np.clip(np.cumsum(rng.integers(-1, 2, (steps, len(edge_ids))), axis=0), 0, 60)
+    edge_n = edge_h + rng.integers(0, 8, (steps, len(edge_ids)))
+    edge_v = np.where(edge_n > 0, rng.uniform(0.0, 14.0, (steps, len(edge_ids))), 0.0)
+    return {
+        "times": np.arange(steps) * dt,
+        "lane_ids": np.array(lane_ids), "lane_halting": lane_h.astype(np.int32),
+        "edge_ids": np.array(edge_ids), "edge_halting": edge_h.astype(np.int32),
+        "edge_count": edge_n.astype(np.int32), "edge_speed": edge_v,
+        "tls_id": np.array(tls_id), "tls_states": np.array(states),
+        "tls_links": np.array(tls_links).reshape(-1, 3),
+    }
+
+def record_trace(cfg: Path, steps: int, tls_id: str = TLS_ID, step_len: float = 0.5,
+                 begin: float = 0.0, sumo_args: str = "") -> dict:
+    """Trace of `steps` steps of a live SUMO run from `begin` (the real traci, not the stand-in)."""
+    sumo_home = os.environ.get("SUMO_HOME")
+    if not sumo_home:
+        raise SystemExit("ERROR: SUMO_HOME not set. Set it to your SUMO installation folder.")
+    sys.path.insert(0, str(Path(sumo_home) / "tools"))
+    import traci
+    import traci.constants as tc
+    cmd = ["sumo", "-c", str(cfg), "--step-length", str(step_len), "--no-step-log", "true"]
+    cmd += sumo_args.split()
+    traci.start(cmd)
+    try:
+        if begin > 0:
+            traci.simulationStep(begin)
+        progs = traci.trafficlight.getCompleteRedYellowGreenDefinition(tls_id)
+        states = [ph.state for ph in progs[0].getPhases()]
+        tls_links = [lk[0] if lk else ("", "", "") for lk in traci.trafficlight.getControlledLinks(tls_id)]
+        lane_ids = sorted({ln for trip in tls_links for ln in trip[:2] if ln})
+        known = set(traci.edge.getIDList())
+        edge_ids = [e for edges in EDGE_GROUPS.values() for e in edges if e in known]
+        edge_vars = (tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_MEAN_SPEED)
+        for ln in lane_ids:
+            traci.lane.subscribe(ln, [tc.LAST_STEP_VEHICLE_HALTING_NUMBER])
+        for e in edge_ids:
+            traci.edge.subscribe(e, edge_vars)
+        times = np.zeros(steps)
+        lane_h = np.zeros((steps, len(lane_ids)), dtype=np.int32)
+        edge = np.zeros((3, steps, len(edge_ids)))
+        for i in range(steps):
+            times[i] = traci.simulation.getTime()
+            lanes = traci.lane.getAllSubscriptionResults()
+            lane_h[i] = [lanes[ln][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for ln in lane_ids]
+            edges = traci.edge.getAllSubscriptionResults()
+            edge[:, i] = [[edges[e][v] for e in edge_ids] for v in edge_vars]
+            traci.simulationStep()
+    finally:
+        traci.close()
+    return {
+        "times": times,
+        "lane_ids": np.array(lane_ids), "lane_halting": lane_h,
+        "edge_ids": np.array(edge_ids), "edge_halting": edge[0].astype(np.int32),
+        "edge_count": edge[1].astype(np.int32), "edge_speed": np.maximum(edge[2], 0.0),
+        "tls_id": np.array(tls_id), "tls_states": np.array(states),
+        "tls_links": np.array(tls_links).reshape(-1, 3),
+    }
+
+def save_trace(trace: dict, path: Path):
+    np.savez_compressed(path, **trace)
+
+def load_trace(path: Path) -> dict:
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+class TraCIException(Exception):
+    pass
+
+class FatalTraCIError(Exception):
+    pass
+
+class _Phase:
+    def __init__(self, state, duration=30.0):
+        self.state = state
+        self.duration = duration
+
+class _Logic:
+    def __init__(self, phases):
+        self.programID = "0"
+        self.phases = phases
+
+    def getPhases(self):
+        return self.phases
+
+class _Replay:
+    """Holds the trace and the step cursor; the domain namespaces read from it."""
+
+    def __init__(self, trace: dict):
+        self.t = trace
+        self.i = 0
+        self.times = trace["times"]
+        self.dt = float(self.times[1] - self.times[0]) if len(self.times) > 1 else 1.0
+        self.lane_idx = {str(x): k for k, x in enumerate(trace["lane_ids"])}
+        self.edge_idx = {str(x): k for k, x in enumerate(trace["edge_ids"])}
+        self.tls_id = str(trace["tls_id"])
+        self.logic = _Logic([_Phase(str(s)) for s in trace["tls_states"]])
+        self.links = [[(str(a), str(b), str(c))] for a, b, c in trace["tls_links"]]
+        self.phase = 0
+        self.subs = {}
+
+    def step(self, until=0.0):
+        last = len(self.times) - 1
+        self.i = min(self.i + 1, last)
+        while until and self.i < last and self.times[self.i] < until:
+            self.i += 1
+
+def make_module(trace: dict) -> types.ModuleType:
+    r = _Replay(trace)
+    tr = r.t
+    mod = types.ModuleType("traci")
+    mod.__file__ = __file__
+    mod._replay = r
+    mod.TraCIException = TraCIException
+    mod.FatalTraCIError = FatalTraCIError
+    mod.exceptions = types.SimpleNamespace(TraCIException=TraCIException, FatalTraCIError=FatalTraCIError)
+    mod.constants = types.ModuleType("traci.constants")
+    for k, v in CONSTANTS.items():
+        setattr(mod.constants, k, v)
+
+    def lane_h(ln):
+        k = r.lane_idx.get(ln)
+        if k is None:
+            raise TraCIException(f"Lane '{ln}' is not known")
+        return int(tr["lane_halting"][r.i, k])
+
+    def edge_val(key):
+        def get(e):
+            k = r.edge_idx.get(e)
+            if k is None:
+                raise TraCIException(f"Edge '{e}' is not known")
+            v = tr[key][r.i, k]
+            return float(v) if key == "edge_speed" else int(v)
+        return get
+
+    def subscribe(e, var_ids=()):
+        if e not in r.edge_idx:
+            raise TraCIException(f"Edge '{e}' is not known")
+        r.subs[e] = tuple(var_ids)
+
+    var_key = {CONSTANTS["LAST_STEP_VEHICLE_HALTING_NUMBER"]: "edge_halting",
+               CONSTANTS["LAST_STEP_VEHICLE_NUMBER"]: "edge_count",
+               CONSTANTS["LAST_STEP_MEAN_SPEED"]: "edge_speed"}
+
+    # the trace has counts only: made-up IDs 0..n-1 for the n vehicles on an edge
+    id_tuples = [tuple(range(c)) for c in range(int(tr["edge_count"].max(initial=0)) + 1)]
+
+    def step_column(v):
+        if v == CONSTANTS["LAST_STEP_VEHICLE_ID_LIST"]:
+            return [id_tuples[c] for c in tr["edge_count"][r.i].tolist()]
+        return tr[var_key[v]][r.i].tolist()
+
+    def all_subs():
+        cols = {v: step_column(v) for v in {v for vs in r.subs.values() for v in vs}}
+        return {e: {v: cols[v][r.edge_idx[e]] for v in vs} for e, vs in r.subs.items()}
+
+    def set_phase(tls, idx):
+        if not 0 <= idx < len(r.logic.phases):
+            raise TraCIException(f"Phase {idx} out of range")
+        r.phase = int(idx)
+
+    mod.start = lambda cmd, *a, **kw: (0, "fake_traci")
+    mod.close = lambda *a, **kw: None
+    mod.simulationStep = r.step
+    mod.simulation = types.SimpleNamespace(
+        getTime=lambda: float(r.times[r.i]),
+        getDeltaT=lambda: r.dt,
+        getMinExpectedNumber=lambda: 0 if r.i >= len(r.times) - 1 else 1,
+        getArrivedNumber=lambda: 0,
+        getArrivedIDList=lambda: (),
+    )
+    mod.lane = types.SimpleNamespace(getLastStepHaltingNumber=lane_h, getMaxSpeed=lambda ln: 13.89)
+    mod.edge = types.SimpleNamespace(
+        getIDList=lambda: list(r.edge_idx),
+        getLastStepHaltingNumber=edge_val("edge_halting"),
+        getLastStepVehicleNumber=edge_val("edge_count"),
+        getLastStepMeanSpeed=edge_val("edge_speed"),
+        subscribe=subscribe,
+        getAllSubscriptionResults=all_subs,
+    )
+    mod.trafficlight = types.SimpleNamespace(
+        getIDList=lambda: [r.tls_id],
+        getPhase=lambda tls: r.phase,
+        setPhase=set_phase,
+        setPhaseDuration=lambda tls, dur: None,
+        getControlledLinks=lambda tls: r.links,
+        getControlledLanes=lambda tls: [lk[0][0] for lk in r.links],
+        getCompleteRedYellowGreenDefinition=lambda tls: [r.logic],
+        getAllProgramLogics=lambda tls: [r.logic],
+    )
+    return mod
+
+def install(trace: dict) -> types.ModuleType:
+    """Register the stand-in as `traci` (and `traci.constants`) for later imports."""
+    mod = make_module(trace)
+    sys.modules["traci"] = mod
+    sys.modules["traci.constants"] = mod.constants
+    sys.modules["traci.exceptions"] = mod.exceptions
+    os.environ.setdefault("SUMO_HOME", str(BENCH_DIR))  # controllers only check it is set
+    return mod
+
+def rewind(mod: types.ModuleType):
+    mod._replay.i = 0
+    mod._replay.phase = 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Record a fake_traci trace from a live SUMO run")
+    ap.add_argument("--cfg", required=True, help="*.sumocfg path")
+    ap.add_argument("--out", required=True, help="Trace file (.npz)")
+    ap.add_argument("--tls", default=TLS_ID, help="Traffic light ID whose lanes are recorded")
+    ap.add_argument("--steps", type=int, default=3601, help="Steps to record (run_bench needs 3601)")
+    ap.add_argument("--step", type=float, default=0.5, help="Simulation step length (s)")
+    ap.add_argument("--begin", type=float, default=0.0, help="Sim time (s) to run before recording")
+    ap.add_argument("--sumo-args", default="", help="Extra args passed to SUMO")
+    args = ap.parse_args()
+    trace = record_trace(Path(args.cfg), args.steps, args.tls, args.step, args.begin, args.sumo_args)
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    save_trace(trace, out)
+    print(f"[OK] Recorded {len(trace['times'])} steps, {len(trace['lane_ids'])} lanes, "
+          f"{len(trace['edge_ids'])} edges -> {out}")
+
+if __name__ == "__main__":
+    main()
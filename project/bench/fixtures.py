@@ -0,0 +1,192 @@
+"""
+Synthetic SUMO outputs for the benchmarks
+- tripinfo.xml, edgeData.xml, summary.xml, emissions.xml and laneData.xml with the
+  attributes SUMO 1.2x writes, at any element count (10^3 .. 10^7; 10^7 emission
+  elements is ~3.5 GB), streamed to disk with a fixed seed.
+- Edge IDs are the EDGE_GROUPS edges plus filler edges that the KPI scripts skip,
+  vTypes / route prefixes follow routes/four_roads_ramped.rou.xml.
+- fixture(kind, n) caches generated files under bench/.fixtures.
+
+Usage:
+  python bench/fixtures.py --kind tripinfo --n 100000 --out /tmp/tripinfo.xml
+"""
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+FIXTURE_DIR = BENCH_DIR / ".fixtures"
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from kpi_by_road import EDGE_GROUPS  # noqa: E402
+
+GROUP_EDGES = [e for edges in EDGE_GROUPS.values() for e in edges]
+FILLER_EDGES = [f"{900000000 + i}#{i % 4}" for i in range(len(GROUP_EDGES))]
+VTYPES = ["car", "rickshaw", "bus"]
+ROUTES = ["north_up", "north_dn", "south_up", "south_dn", "east_up", "east_dn", "west_up", "west_dn"]
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n\n'
+CHUNK = 50_000
+
+def write_tripinfo(path: Path, n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    with Path(path).open("w", encoding="utf-8") as f:
+        f.write(HEADER + '<tripinfos xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            depart = np.sort(rng.uniform(0, 1800, k)).round(2)
+            dur = rng.gamma(4.0, 9.0, k).round(2)
+            wait = np.where(rng.random(k) < 0.3, rng.exponential(8.0, k), 0.0).round(2)
+            loss = (wait + rng.exponential(3.0, k)).round(2)
+            vt = rng.integers(0, len(VTYPES), k)
+            rt = rng.integers(0, len(ROUTES), k)
+            f.writelines(
+                f'    <tripinfo id="{ROUTES[rt[i]]}_{VTYPES[vt[i]]}.{start + i}" depart="{depart[i]:.2f}" '
+                f'departLane="{GROUP_EDGES[rt[i]]}_0" departPos="5.10" departSpeed="13.89" departDelay="0.00" '
+                f'arrival="{depart[i] + dur[i]:.2f}" arrivalLane="{GROUP_EDGES[-1 - rt[i]]}_0" arrivalPos="300.00" '
+                f'arrivalSpeed="12.50" duration="{dur[i]:.2f}" routeLength="435.32" waitingTime="{wait[i]:.2f}" '
+                f'waitingCount="{int(wait[i] > 0)}" stopTime="0.00" timeLoss="{loss[i]:.2f}" rerouteNo="0" '
+                f'devices="tripinfo" vType="{VTYPES[vt[i]]}" speedFactor="0.95" vaporized=""/>\n'
+                for i in range(k))
+        f.write("</tripinfos>\n")
+    return Path(path)
+
+def write_edgedata(path: Path, n: int, seed: int = 0, interval: float = 60.0):
+    """n <edge> elements, spread over intervals of all group + filler edges."""
+    rng = np.random.default_rng(seed)
+    edges = GROUP_EDGES + FILLER_EDGES
+    n_int = max(1, n // len(edges))
+    with Path(path).open("w", encoding="utf-8") as f:
+        f.write(HEADER + '<meandata xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        written = 0
+        for it in range(n_int):
+            k = min(len(edges), n - written) if it == n_int - 1 else len(edges)
+            ss = rng.uniform(0, 400, k).round(2)
+            spd = rng.uniform(2, 25, k).round(2)
+            wt = np.where(rng.random(k) < 0.2, rng.uniform(0, 60, k), 0.0).round(2)
+            tl = (wt + rng.uniform(0, 20, k)).round(2)
+            f.write(f'    <interval begin="{it * interval:.2f}" end="{(it + 1) * interval:.2f}" id="DEFAULT_EDGEDATA">\n')
+            f.writelines(
+                f'        <edge id="{edges[i]}" sampledSeconds="{ss[i]:.2f}" traveltime="3.32" '
+                f'overlapTraveltime="3.69" density="4.61" laneDensity="2.30" occupancy="0.94" '
+                f'waitingTime="{wt[i]:.2f}" timeLoss="{tl[i]:.2f}" speed="{spd[i]:.2f}" speedRelative="0.90" '
+                f'departed="0" arrived="0" entered="94" left="93" laneChangedFrom="2" laneChangedTo="2"/>\n'
+                for i in range(k))
+            f.write("    </interval>\n")
+            written += k
+        f.write("</meandata>\n")
+    return Path(path)
+
+def write_summary(path: Path, n: int, seed: int = 0, step: float = 0.5):
+    rng = np.random.default_rng(seed)
+    with Path(path).open("w", encoding="utf-8") as f:
+        f.write(HEADER + '<summary xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        running = 0
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            ins = rng.poisson(0.8, k)
+            arr = rng.poisson(0.8, k)
+            halt = rng.integers(0, 20, k)
+            lines = []
+            for i in range(k):
+                running = max(0, running + int(ins[i]) - int(arr[i]))
+                lines.append(
+                    f'    <step time="{(start + i) * step:.2f}" loaded="{start + i}" inserted="{start + i}" '
+                    f'running="{running}" waiting="0" ended="{start}" arrived="{start}" collisions="0" '
+                    f'teleports="0" halting="{halt[i]}" stopped="0" meanWaitingTime="1.20" '
+                    f'meanTravelTime="35.00" meanSpeed="12.34" meanSpeedRelative="0.80"/>\n')
+            f.writelines(lines)
+        f.write("</summary>\n")
+    return Path(path)
+
+def write_emissions(path: Path, n: int, seed: int = 0, step: float = 0.5, per_step: int = 60):
+    """n <vehicle> elements, per_step per <timestep>, on group and filler edge lanes."""
+    rng = np.random.default_rng(seed)
+    edges = GROUP_EDGES + FILLER_EDGES
+    with Path(path).open("w", encoding="utf-8") as f:
+        f.write(HEADER + '<emission-export xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            ed = rng.integers(0, len(edges), k)
+            ln = rng.integers(0, 2, k)
+            vt = rng.integers(0, len(VTYPES), k)
+            spd = rng.uniform(0, 14, k).round(2)
+            co2 = (2000 + 200 * spd + rng.uniform(0, 500, k)).round(2)
+            lines = []
+            for i in range(k):
+                j = start + i
+                if j % per_step == 0:
+                    if j:
+                        lines.append("    </timestep>\n")
+                    lines.append(f'    <timestep time="{j // per_step * step:.2f}">\n')
+                lines.append(
+                    f'        <vehicle id="{ROUTES[ed[i] % len(ROUTES)]}_{VTYPES[vt[i]]}.{j % 5000}" '
+                    f'eclass="HBEFA4/PC_petrol_Euro-4" CO2="{co2[i]:.2f}" CO="{co2[i] / 90:.2f}" HC="0.28" '
+                    f'NOx="{co2[i] / 2600:.2f}" PMx="0.75" fuel="{co2[i] / 3.08:.2f}" electricity="0.00" '
+                    f'noise="70.60" route="r_{ROUTES[ed[i] % len(ROUTES)]}" type="{VTYPES[vt[i]]}" '
+                    f'waiting="{0.5 if spd[i] < 0.1 else 0.0:.2f}" lane="{edges[ed[i]]}_{ln[i]}" pos="4.60" '
+                    f'speed="{spd[i]:.2f}" angle="327.38" x="1426.51" y="1604.85"/>\n')
+            f.writelines(lines)
+        if n:
+            f.write("    </timestep>\n")
+        f.write("</emission-export>\n")
+    return Path(path)
+
+def write_lanedata(path: Path, n: int, seed: int = 0, interval: float = 60.0):
+    """n <lane> elements (2 lanes per <edge>) over intervals of all group + filler edges."""
+    rng = np.random.default_rng(seed)
+    edges = GROUP_EDGES + FILLER_EDGES
+    per_int = 2 * len(edges)
+    with Path(path).open("w", encoding="utf-8") as f:
+        f.write(HEADER + '<meandata xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        for it in range(max(1, -(-n // per_int))):
+            k = min(per_int, n - it * per_int)
+            ss = rng.uniform(0, 400, k).round(2)
+            occ = rng.uniform(0, 30, k).round(2)
+            wt = np.where(rng.random(k) < 0.3, rng.uniform(0, 120, k), 0.0).round(2)
+            f.write(f'    <interval begin="{it * interval:.2f}" end="{(it + 1) * interval:.2f}" id="DEFAULT_LANEDATA">\n')
+            for i in range(k):
+                if i % 2 == 0:
+                    f.write(f'        <edge id="{edges[i // 2]}">\n')
+                f.write(f'            <lane id="{edges[i // 2]}_{i % 2}" sampledSeconds="{ss[i]:.2f}" traveltime="1.30" '
+                        f'overlapTraveltime="1.52" density="7.15" overlapDensity="8.53" laneDensity="7.15" '
+                        f'occupancy="{occ[i]:.2f}" waitingTime="{wt[i]:.2f}" timeLoss="{wt[i] + 4.97:.2f}" '
+                        f'speed="9.21" speedRelative="0.61" departed="0" arrived="0" entered="40" left="39" '
+                        f'laneChangedFrom="1" laneChangedTo="0" flow="522.62" distance="2300.40"/>\n')
+                if i % 2 == 1 or i == k - 1:
+                    f.write("        </edge>\n")
+            f.write("    </interval>\n")
+        f.write("</meandata>\n")
+    return Path(path)
+
+WRITERS = {
+    "tripinfo": write_tripinfo,
+    "edgedata": write_edgedata,
+    "summary": write_summary,
+    "emissions": write_emissions,
+    "lanedata": write_lanedata,
+}
+
+def fixture(kind: str, n: int) -> Path:
+    """Cached synthetic file with n elements."""
+    FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+    path = FIXTURE_DIR / f"{kind}_{n}.xml"
+    if not path.exists():
+        tmp = path.with_suffix(".part")
+        WRITERS[kind](tmp, n)
+        tmp.replace(path)
+    return path
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a synthetic SUMO output file")
+    ap.add_argument("--kind", choices=sorted(WRITERS), required=True)
+    ap.add_argument("--n", type=int, required=True, help="number of elements")
+    ap.add_argument("--out", required=True, help="output XML path")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    path = WRITERS[args.kind](Path(args.out), args.n, seed=args.seed)
+    print(f"[OK] Wrote {path} ({path.stat().st_size / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
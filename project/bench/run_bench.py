@@ -0,0 +1,361 @@
+"""
+Benchmark Suite (hot paths, stored baselines, regression thresholds)
+- Cases cover KPI extraction (scripts/kpi_by_road.py, scripts/emission_kpis.py), the baseline-vs-AI table
+  comparison, trace replay, controller step latency (min-queue, max-pressure, rule-based) and
+  the in-loop KPI collector on the fake_traci stand-in, network-wide phase scoring
+  (ai/phase_scoring.py), the queue-model screen,
+  and DQN inference when TensorFlow is installed.
+- Inputs are synthetic (bench/fixtures.py) and cached in bench/.fixtures, so runs
+  are repeatable on machines without SUMO. The TraCI cases replay a synthetic trace,
+  or one recorded from SUMO with bench/fake_traci.py (--trace).
+- Each case is timed --repeat times; min and median are recorded in
+  bench/results/<commit>.json (-dirty: uncommitted changes) and compared to
+  bench/baseline.json, which records no commit (git log of the file says which
+  change accepted it). A median slower
+  than baseline * (1 + --threshold) is reported as a regression. Timings from another
+  machine, platform, Python or trace are not comparable: the comparison is then only
+  printed, without regressions, unless --ignore-machine.
+
+Usage:
+  python bench/run_bench.py                       # default sizes, compare to baseline
+  python bench/run_bench.py --sizes 1000 100000 10000000 --only kpi.
+  python bench/run_bench.py --sizes 10000000 --only emissions.   # ~3 GB emission file
+  python bench/run_bench.py --save-baseline       # accept the current numbers
+  python bench/run_bench.py --only controller. --trace bench/.fixtures/north_test.npz
+  python bench/run_bench.py --fail-on-regression  # exit 1 on regressions (CI)
+"""
+import io, sys, json, time, platform, statistics, subprocess
+import argparse
+import contextlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+BASELINE = BENCH_DIR / "baseline.json"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+sys.path.insert(0, str(PROJECT_ROOT / "ai"))
+
+import fake_traci  # noqa: E402
+from fixtures import FIXTURE_DIR, fixture  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+STEP_SIZES = [1_000, 3_600]
+
+CASES = []
+
+def case(name, sizes=None):
+    """Register fn(size) -> zero-arg callable to time; sizes=None uses --sizes."""
+    def deco(fn):
+        CASES.append((name, sizes, fn))
+        return fn
+    return deco
+
+# ---------------- fake TraCI (installed before any controller import) ----------------
+
+_TRACE = None
+_TRACI = None
+
+def use_trace(trace: dict):
+    global _TRACE, _TRACI
+    if len(trace["times"]) < max(STEP_SIZES) + 1:
+        raise SystemExit(f"[ERROR] Trace has {len(trace['times'])} steps, the step cases need {max(STEP_SIZES) + 1}")
+    _TRACE = trace
+    _TRACI = fake_traci.install(trace)
+
+def _until(steps: int) -> float:
+    return float(_TRACE["times"][steps])
+
+# ---------------- cases ----------------
+
+@case("kpi.edgeData")
+def bench_kpi_edgedata(n):
+    import kpi_by_road
+    path = fixture("edgedata", n)
+    return lambda: kpi_by_road.summarize_edgeData(path)
+
+@case("kpi.tripinfo")
+def bench_kpi_tripinfo(n):
+    import kpi_by_road
+    path = fixture("tripinfo", n)
+    return lambda: kpi_by_road.summarize_tripinfo(path)
+
+@case("kpi.tripinfo_bin")
+def bench_kpi_tripinfo_bin(n):
+    import kpi_by_road
+    import trip_binary
+    # store kept apart from the fixture so kpi.tripinfo still measures the XML path
+    store = trip_binary.convert(fixture("tripinfo", n), out=FIXTURE_DIR / "stores" / f"tripinfo_{n}.bin")
+    return lambda: kpi_by_road.summarize_tripinfo(store)
+
+@case("trip_binary.convert")
+def bench_trip_binary_convert(n):
+    import trip_binary
+    path = fixture("tripinfo", n)
+    out = FIXTURE_DIR / "stores" / f"convert_{n}.bin"
+    return lambda: trip_binary.convert(path, out=out, workers=1)
+
+@case("emissions.scan")
+def bench_emissions(n):
+    import emission_kpis
+    path = fixture("emissions", n)
+    return lambda: emission_kpis.summarize_emissions(path)
+
+@case("lanedata.scan")
+def bench_lanedata(n):
+    import emission_kpis
+    path = fixture("lanedata", n)
+    return lambda: emission_kpis.summarize_lanedata(path)
+
+@case("compare.tables")
+def bench_compare_tables(n):
+    import pipeline_compare_and_plot as pcp
+    tmp = Path(tempfile.mkdtemp(prefix="bench_cmp_"))
+    rng = np.random.default_rng(0)
+    cols = ["AvgSpeed_mps", "TotalWaiting_s", "TotalTimeLoss_s", "Samples_weight"]
+    for name in ("base", "ai"):
+        df = pd.DataFrame(rng.uniform(0, 100, (n, len(cols))), columns=cols)
+        df.insert(0, "RoadDir", [f"edge_{i}" for i in range(n)])
+        df.to_csv(tmp / f"{name}.csv", index=False)
+    return lambda: pcp.compare_tables(tmp / "base.csv", tmp / "ai.csv", "road", tmp)
+
+@case("replay.step", sizes=STEP_SIZES)
+def bench_replay_step(n):
+    def run():
+        fake_traci.rewind(_TRACI)
+        for _ in range(n):
+            _TRACI.simulationStep()
+            _TRACI.lane.getLastStepHaltingNumber(str(_TRACE["lane_ids"][0]))
+    return run
+
+@case("controller.minqueue", sizes=STEP_SIZES)
+def bench_controller_minqueue(n):
+    import minqueue_tls
+    tls = str(_TRACE["tls_id"])
+
+    def run():
+        fake_traci.rewind(_TRACI)
+        with contextlib.redirect_stdout(io.StringIO()):
+            minqueue_tls.run_controller(tls, 8.0, 0.5, _until(n))
+    return run
+
+@case("controller.maxpressure", sizes=STEP_SIZES)
+def bench_controller_maxpressure(n):
+    import maxpressure_tls
+    tls = str(_TRACE["tls_id"])
+
+    def run():
+        fake_traci.rewind(_TRACI)
+        with contextlib.redirect_stdout(io.StringIO()):
+            maxpressure_tls.run_controller(tls, 8.0, _until(n))
+    return run
+
+@case("controller.rule", sizes=STEP_SIZES)
+def bench_controller_rule(n):
+    import controller_rule_based
+    tls = str(_TRACE["tls_id"])
+
+    def run():
+        fake_traci.rewind(_TRACI)
+        with contextlib.redirect_stdout(io.StringIO()):
+            controller_rule_based.run_controller(tls, until=_until(n))
+    return run
+
+@case("kpi_stream.on_step", sizes=STEP_SIZES)
+def bench_kpi_stream(n):
+    from kpi_stream import StreamingKPICollector
+
+    def run():
+        fake_traci.rewind(_TRACI)
+        col = StreamingKPICollector(window=60.0).attach()
+        for _ in range(n):
+            _TRACI.simulationStep()
+            col.on_step()
+    return run
+
+@case("phase_scoring.network", sizes=[100, 1_000])
+def bench_phase_scoring(k):
+    # k copies of the test TLS chained in a corridor (outgoing lanes of one are incoming
+    # lanes of the next); 100 steps of pressure scoring + per-TLS arg-max
+    from phase_scoring import PhaseScorer
+    states = [str(s) for s in _TRACE["tls_states"]]
+    links = [(str(a), str(b), str(c)) for a, b, c in _TRACE["tls_links"]]
+    defs = {f"tls{i}": (states, [[(f"{a}#{i}", f"{b}#{i + 1}", c)] if a else [] for a, b, c in links])
+            for i in range(k)}
+    scorer = PhaseScorer.from_links(defs, "pressure")
+    x = np.random.default_rng(0).integers(0, 30, (100, scorer.shape[1])).astype(np.float64)
+
+    def run():
+        for row in x:
+            scorer.best(scorer.scores(row))
+    return run
+
+@case("queue_sim.screen", sizes=[100, 1_000, 10_000])
+def bench_queue_sim(k):
+    import queue_sim
+    lam = queue_sim.arrival_rates(queue_sim.ROUTES_XML, 1800.0, 1.0)
+    durations, phase_axis, arm_axis = queue_sim.tls_plan(queue_sim.NET_XML, queue_sim.TLS_ID)
+    rng = np.random.default_rng(0)
+    mg = rng.integers(4, 40, k); ce = rng.integers(1, 10, k)
+    pol = np.full(k, queue_sim.POLICIES["rule"])
+    return lambda: queue_sim.simulate(lam, 1.0, durations, phase_axis, 1.0, pol, mg, ce, np.zeros(k), arm_axis)
+
+@case("inference.dqn", sizes=[100, 1_000])
+def bench_dqn_inference(n):
+    try:
+        from dqn_agent import DQNAgent
+    except ImportError as exc:
+        raise SkipCase(f"TensorFlow not available ({exc})")
+    agent = DQNAgent(4, 2)
+    agent.epsilon = 0.0
+    states = np.random.default_rng(0).uniform(0, 20, (n, 1, 4))
+
+    def run():
+        for s in states:
+            agent.act(s)
+    return run
+
+@case("inference.dqn_shared", sizes=[100, 1_000])
+def bench_dqn_shared_inference(n):
+    # one decision for n agents: a single batched forward pass (compare inference.dqn)
+    try:
+        from dqn_agent import SharedDQNAgent
+    except ImportError as exc:
+        raise SkipCase(f"TensorFlow not available ({exc})")
+    agent = SharedDQNAgent(25, 2)
+    agent.epsilon = 0.0
+    states = np.random.default_rng(0).uniform(0, 2, (n, 25)).astype(np.float32)
+    return lambda: agent.act(states)
+
+class SkipCase(Exception):
+    pass
+
+# ---------------- runner ----------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty", "--abbrev=7"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def time_case(fn, repeat: int):
+    fn()  # warm-up (imports, caches, page cache)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return min(samples), statistics.median(samples)
+
+def run_all(args):
+    results = {}
+    for name, sizes, factory in CASES:
+        if args.only and not any(name.startswith(o) for o in args.only):
+            continue
+        for n in (sizes or args.sizes):
+            key = f"{name}[{n}]"
+            try:
+                fn = factory(n)
+            except SkipCase as exc:
+                print(f"  {key:<34} skipped: {exc}")
+                continue
+            t_min, t_med = time_case(fn, args.repeat)
+            results[key] = {"n": n, "min_s": t_min, "median_s": t_med,
+                            "per_item_us": t_med / n * 1e6}
+            print(f"  {key:<34} median {t_med * 1e3:10.2f} ms   {t_med / n * 1e6:9.3f} us/item")
+    return results
+
+# run metadata that has to match the baseline's for timings to be comparable
+COMPARABLE = ["machine", "platform", "python", "trace"]
+
+def mismatches(meta: dict, baseline_meta: dict) -> list:
+    """(field, baseline value, current value) for each COMPARABLE field that differs."""
+    out = []
+    for k in COMPARABLE:
+        was = baseline_meta.get(k, "synthetic" if k == "trace" else None)  # older baselines: synthetic trace
+        if was is not None and was != meta[k]:
+            out.append((k, was, meta[k]))
+    return out
+
+def compare(results: dict, baseline: dict, threshold: float, comparable: bool = True):
+    regressions = []
+    print(f"\n{'case':<34} {'baseline ms':>12} {'now ms':>10} {'ratio':>7}")
+    for key, r in results.items():
+        b = baseline.get(key)
+        if not b:
+            continue
+        ratio = r["median_s"] / b["median_s"] if b["median_s"] else float("inf")
+        flag = "  REGRESSION" if ratio > 1.0 + threshold else ("  faster" if ratio < 1.0 - threshold else "")
+        if not comparable:
+            flag = ""  # another machine: ratios say nothing about the code
+        print(f"{key:<34} {b['median_s'] * 1e3:12.2f} {r['median_s'] * 1e3:10.2f} {ratio:7.2f}{flag}")
+        if flag.strip() == "REGRESSION":
+            regressions.append(key)
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Hot-path benchmarks with stored baselines")
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                    help="Element counts for the XML/CSV cases (up to 10^7)")
+    ap.add_argument("--only", nargs="*", default=None, help="Case name prefixes to run")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--save-baseline", action="store_true", help="Store these results as bench/baseline.json")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--trace", default=None,
+                    help="Trace (.npz) recorded with bench/fake_traci.py for the TraCI cases (default: synthetic)")
+    ap.add_argument("--ignore-machine", action="store_true",
+                    help="Flag regressions even when the baseline comes from another machine / platform")
+    args = ap.parse_args()
+
+    use_trace(fake_traci.load_trace(Path(args.trace)) if args.trace
+              else fake_traci.synthetic_trace(steps=max(STEP_SIZES) + 1))
+    commit = git_commit()
+    print(f"[INFO] commit {commit}, python {platform.python_version()}, {platform.machine()}")
+    results = run_all(args)
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    meta = {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "platform": platform.platform(), "trace": Path(args.trace).name if args.trace else "synthetic",
+            "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+    out = RESULTS_DIR / f"{commit}.json"
+    out.write_text(json.dumps({**meta, "results": results}, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote {out}")
+
+    if args.save_baseline:
+        stored = {}
+        if BASELINE.exists():
+            old = json.loads(BASELINE.read_text(encoding="utf-8"))
+            # cases not re-run are kept only if they were timed on the same setup
+            stored = {} if mismatches(meta, old) else old["results"]
+        stored.update(results)
+        # the commit is not known until the baseline itself is committed
+        base_meta = {k: v for k, v in meta.items() if k != "commit"}
+        BASELINE.write_text(json.dumps({**base_meta, "results": stored}, indent=2), encoding="utf-8")
+        print(f"[OK] Baseline updated: {BASELINE}")
+        return
+    if not BASELINE.exists():
+        print("[INFO] No baseline yet; run with --save-baseline to store one.")
+        return
+    baseline = json.loads(BASELINE.read_text(encoding="utf-8"))
+    diff = mismatches(meta, baseline)
+    for k, was, now in diff:
+        print(f"[WARN] baseline {k} '{was}' != '{now}'")
+    comparable = not diff or args.ignore_machine
+    if not comparable:
+        print("[WARN] Timings are not comparable with the baseline; no regressions flagged "
+              "(--ignore-machine to flag anyway, --save-baseline to re-baseline here).")
+    regressions = compare(results, baseline["results"], args.threshold, comparable)
+    if regressions:
+        print(f"[WARN] {len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
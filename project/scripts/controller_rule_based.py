@@ -13,6 +13,10 @@ if str(tools_path) not in sys.path:
 
 import traci  # noqa: E402
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "ai"))
+from kpi_stream import StreamingKPICollector  # noqa: E402
+from sim_checkpoint import quiet_cfg  # noqa: E402
+
 # ======= USER SETTINGS =======
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 SUMO_CFG = PROJECT_ROOT / "north_test.sumocfg"   # change to north_test_ramped.sumocfg if needed
@@ -20,6 +24,9 @@ USE_GUI = True
 SIM_END = 1800
 MIN_GREEN = 10      # s: minimum time we keep a green before switching
 CHECK_EVERY = 2     # s: decision cadence
+LIVE_KPI_DIR = None     # e.g. PROJECT_ROOT / "runs" / "rule" / "out" to collect KPIs inside the loop
+KPI_WINDOW = 60         # s: rolling window of the live KPIs
+NO_XML_OUTPUTS = False  # True = skip the cfg's SUMO XML outputs (use with LIVE_KPI_DIR)
 
 # Paste the exact TLS ID you printed (the one starting with "cluster_3500...")
 TLS_ID = "cluster_3500447461_85576972"  # <-- REPLACE with the exact string from your console
@@ -77,16 +84,16 @@ def choose_axis():
     return ("NS", ns, ew) if ns >= ew else ("EW", ns, ew)
 
 
-def start_sumo():
+def start_sumo(extra_args=(), cfg=SUMO_CFG):
     binary = "sumo-gui" if USE_GUI else "sumo"
-    traci.start([binary, "-c", str(SUMO_CFG), "--start"])
+    traci.start([binary, "-c", str(cfg), "--start", *extra_args])
 
 
 def main():
     if not SUMO_CFG.exists():
         raise SystemExit(f"Config not found: {SUMO_CFG}")
 
-    start_sumo()
+    start_sumo(cfg=quiet_cfg(SUMO_CFG) if NO_XML_OUTPUTS else SUMO_CFG)
     traci.simulationStep()  # prime APIs
 
     # Sanity print
@@ -107,29 +114,46 @@ def main():
         for i, ph in enumerate(p.phases):
             print(f"  Phase {i}: state={ph.state}, duration={ph.duration}")
 
-    # Initialize to best axis
-    target_axis, ns_q, ew_q = choose_axis()
-    traci.trafficlight.setPhase(TLS_ID, PHASE_FOR[target_axis])
-    last_change = traci.simulation.getTime()
+    collector = None
+    if LIVE_KPI_DIR:
+        collector = StreamingKPICollector(window=KPI_WINDOW,
+                                          windows_csv=Path(LIVE_KPI_DIR) / "kpi_windows.csv").attach()
+    run_controller(TLS_ID, on_step=collector.on_step if collector else None)
+    if collector:
+        print("Wrote", collector.write_summary(Path(LIVE_KPI_DIR) / "kpi_by_road.csv"))
+    traci.close()
+
 
-    while traci.simulation.getTime() < SIM_END:
+def run_controller(tls_id, until=SIM_END, min_green=MIN_GREEN, check_every=CHECK_EVERY, on_step=None,
+                   last_change=None):
+    """Axis-switching loop on an already started TraCI connection; on_step() runs after every step.
+    last_change resumes a run (e.g. from a saved state) instead of starting on the best axis.
+    Returns the time of the last change."""
+    if last_change is None:
+        # Initialize to best axis
+        target_axis, ns_q, ew_q = choose_axis()
+        traci.trafficlight.setPhase(tls_id, PHASE_FOR[target_axis])
+        last_change = traci.simulation.getTime()
+
+    while traci.simulation.getTime() < until:
         traci.simulationStep()
+        if on_step is not None:
+            on_step()
         t = traci.simulation.getTime()
 
-        if (t - last_change) >= CHECK_EVERY:
-            if (t - last_change) >= MIN_GREEN:
+        if (t - last_change) >= check_every:
+            if (t - last_change) >= min_green:
                 # What axis is currently green?
-                cur_phase = traci.trafficlight.getPhase(TLS_ID)
+                cur_phase = traci.trafficlight.getPhase(tls_id)
                 cur_axis = "NS" if cur_phase == PHASE_FOR["NS"] else "EW"
 
                 # Decide
                 new_axis, ns_q, ew_q = choose_axis()
                 if new_axis != cur_axis:
-                    traci.trafficlight.setPhase(TLS_ID, PHASE_FOR[new_axis])
+                    traci.trafficlight.setPhase(tls_id, PHASE_FOR[new_axis])
                     last_change = t
                     print(f"[t={t:.0f}] Switch to {new_axis} (NS={ns_q}, EW={ew_q})")
-
-    traci.close()
+    return last_change
 
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+# emission_kpis.py
+# Streaming KPIs from SUMO's two largest outputs, per road/direction and time bin:
+#   emissions.xml (emission-output, one <vehicle> per vehicle per step) -> CO2/CO/HC/NOx/PMx/fuel (g),
+#                                                                         vehicle-seconds, km driven
+#   laneData.xml  (lanedata-output, one <lane> per lane per interval)   -> occupancy, mean queue,
+#                                                                         waiting, time loss, throughput
+# Throughput counts each vehicle once per road: `left` on the road's exit edge (the last
+# edge of its EDGE_GROUPS chain) plus `arrived` on any of its lanes; "Other" has no exit.
+# Files are read in fixed-size chunks and never built into a tree (xml_scan.py), so
+# memory stays constant for multi-GB runs. The edge pre-filter (default: the
+# EDGE_GROUPS edges) is part of the chunk regex, so elements on other edges are
+# skipped without being split into attributes. --all-edges keeps every element and
+# reports edges outside EDGE_GROUPS as "Other".
+#
+# Usage:
+#   python scripts/emission_kpis.py --emissions out/emissions.xml --lanes out/laneData.xml --bin 300 --out out
+#   python scripts/emission_kpis.py --emissions runs/big/emissions.xml --all-edges --out runs/big
+
+import re
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from kpi_by_road import EDGE_GROUPS, write_csv
+from xml_scan import CHUNK_BYTES, Scanner, chunks, to_float
+OTHER = "Other"
+
+EMISSION_KEYS = ["CO2", "CO", "HC", "NOx", "PMx", "fuel"]  # mg/s in SUMO >= 1.14
+EMISSION_FIELDS = ["RoadDir", "VehSeconds", "Distance_km"] + [f"{k}_g" for k in EMISSION_KEYS] + ["CO2_g_per_km"]
+LANE_FIELDS = ["RoadDir", "Lanes", "Occupancy_avg_%", "AvgQueue_veh", "TotalWaiting_s",
+               "TotalTimeLoss_s", "VehSeconds", "Throughput_veh"]
+
+def _edge_of(lane_id: str) -> str:
+    return lane_id.rsplit("_", 1)[0]
+
+def _group_index(all_edges: bool):
+    groups = list(EDGE_GROUPS) + ([OTHER] if all_edges else [])
+    edge_to_gi = {e: gi for gi, g in enumerate(EDGE_GROUPS) for e in EDGE_GROUPS[g]}
+    return groups, edge_to_gi
+
+def scan_columns(xml_path: Path, ctx_tag: bytes, ctx_fields, item_tag: bytes, item_fields,
+                 lane_attr: bytes, edges=None, chunk_bytes: int = CHUNK_BYTES):
+    """
+    Yield per chunk (ctx, cols, lanes) for every <item_tag> whose lane lies on one of
+    `edges` (all items when None): the enclosing <ctx_tag>'s ctx_fields and the item's
+    item_fields as float arrays (dicts keyed by field name) and the lane ids.
+    """
+    key = None
+    if edges is not None:
+        key = (b"(?:" + b"|".join(re.escape(e.encode("utf-8")) for e in sorted(edges, key=len, reverse=True))
+               + rb")_\d+")
+    scanner = Scanner(xml_path, item_tag, list(item_fields) + [lane_attr], ctx_tag, ctx_fields,
+                      key_attr=lane_attr, key_pattern=key)
+    for data in chunks(xml_path, chunk_bytes=chunk_bytes):
+        ctx, items = scanner.scan(data)
+        lanes = items[lane_attr]
+        if not len(lanes):
+            continue
+        yield ({n: to_float(v) for n, v in ctx.items()},
+               {n: to_float(items[n]) for n in item_fields}, lanes)
+
+def _lane_groups(lanes: np.ndarray, edge_to_gi: dict, other: int) -> np.ndarray:
+    uniq, inv = np.unique(lanes, return_inverse=True)
+    lut = np.array([edge_to_gi.get(_edge_of(u.decode("utf-8")), other) for u in uniq], dtype=np.int64)
+    return lut[inv]
+
+def _lane_is_exit(lanes: np.ndarray) -> np.ndarray:
+    """True for lanes on the last edge of their EDGE_GROUPS chain."""
+    exits = {chain[-1] for chain in EDGE_GROUPS.values()}
+    uniq, inv = np.unique(lanes, return_inverse=True)
+    return np.array([_edge_of(u.decode("utf-8")) in exits for u in uniq], dtype=bool)[inv]
+
+def _step_length(xml_path: Path, default: float = 1.0) -> float:
+    """Time step of an emission file from its first two <timestep> elements."""
+    with Path(xml_path).open("rb") as f:
+        head = f.read(4 << 20)
+    times = [float(t) for t in re.findall(rb'<timestep time="([^"]+)"', head)[:2]]
+    return times[1] - times[0] if len(times) == 2 and times[1] > times[0] else default
+
+def _accumulate(bins: dict, b: np.ndarray, gi: np.ndarray, vals: np.ndarray, n_groups: int):
+    """bins[bin][group] += sum of vals rows per (bin, group)."""
+    key = b * n_groups + gi
+    ukeys, inv = np.unique(key, return_inverse=True)
+    sums = np.stack([np.bincount(inv, vals[:, j], len(ukeys)) for j in range(vals.shape[1])], axis=1)
+    for k, s in zip(ukeys.tolist(), sums):
+        acc = bins.get(k // n_groups)
+        if acc is None:
+            acc = bins[k // n_groups] = np.zeros((n_groups, vals.shape[1]))
+        acc[k % n_groups] += s
+
+def summarize_emissions(xml_path: Path, bin_s: float = 300.0, all_edges: bool = False, step: float | None = None):
+    """(rows per RoadDir, rows per RoadDir and bin) from an emission-output file."""
+    if not xml_path.exists():
+        raise SystemExit(f"[ERROR] Missing {xml_path}")
+    dt = step or _step_length(xml_path)
+    groups, edge_to_gi = _group_index(all_edges)
+    G = len(groups)
+    keys = [k.encode() for k in EMISSION_KEYS]
+    bins = {}  # bin index -> (G, [veh_s, dist_m, CO2 ... fuel in mg])
+    for ctx, cols, lanes in scan_columns(xml_path, b"timestep", [b"time"], b"vehicle", [b"speed"] + keys,
+                                         b"lane", edges=None if all_edges else edge_to_gi.keys()):
+        vals = np.column_stack([np.full(len(lanes), dt), cols[b"speed"] * dt] + [cols[k] * dt for k in keys])
+        _accumulate(bins, (ctx[b"time"] // bin_s).astype(np.int64), _lane_groups(lanes, edge_to_gi, G - 1), vals, G)
+
+    def make_row(g, v):
+        km = float(v[1]) / 1000.0
+        r = {"RoadDir": g, "VehSeconds": round(float(v[0]), 2), "Distance_km": round(km, 3)}
+        for i, k in enumerate(EMISSION_KEYS, 2):
+            r[f"{k}_g"] = round(float(v[i]) / 1000.0, 3)
+        r["CO2_g_per_km"] = round(float(v[2]) / 1000.0 / km, 2) if km > 0 else "NA"
+        return r
+
+    bin_rows = []
+    totals = np.zeros((G, 2 + len(keys)))
+    for b in sorted(bins):
+        for gi, v in enumerate(bins[b]):
+            if v[0] > 0:
+                bin_rows.append({"bin_begin": b * bin_s, "bin_end": (b + 1) * bin_s, **make_row(groups[gi], v)})
+        totals += bins[b]
+    rows = [make_row(g, totals[gi]) for gi, g in enumerate(groups) if totals[gi][0] > 0]
+    return rows, bin_rows
+
+def summarize_lanedata(xml_path: Path, bin_s: float = 300.0, all_edges: bool = False):
+    """(rows per RoadDir, rows per RoadDir and bin) from a lanedata-output file.
+    Intervals are binned by their begin time, so bins finer than the file's period
+    are not split further."""
+    if not xml_path.exists():
+        raise SystemExit(f"[ERROR] Missing {xml_path}")
+    groups, edge_to_gi = _group_index(all_edges)
+    G = len(groups)
+    fields = [b"occupancy", b"waitingTime", b"timeLoss", b"sampledSeconds", b"left", b"arrived"]
+    bins = {}   # bin index -> (G, [occ*period, period, wait, loss, vehs, left the road])
+    spans = {}  # bin index -> [first begin, last end]
+    lanes_in = {}  # (bin, group) -> lane ids
+    for ctx, cols, lanes in scan_columns(xml_path, b"interval", [b"begin", b"end"], b"lane", fields,
+                                         b"id", edges=None if all_edges else edge_to_gi.keys()):
+        begin, end = ctx[b"begin"], ctx[b"end"]
+        period = np.maximum(end - begin, 0.0)
+        b = (begin // bin_s).astype(np.int64)
+        gi = _lane_groups(lanes, edge_to_gi, G - 1)
+        # inner edges of a chain pass every vehicle on: counting their `left` multiplies it
+        through = cols[b"left"] * _lane_is_exit(lanes) + cols[b"arrived"]
+        vals = np.column_stack([cols[b"occupancy"] * period, period, cols[b"waitingTime"],
+                                cols[b"timeLoss"], cols[b"sampledSeconds"], through])
+        _accumulate(bins, b, gi, vals, G)
+        for k in np.unique(b).tolist():
+            sel = b == k
+            span = spans.setdefault(k, [float(begin[sel].min()), float(end[sel].max())])
+            span[0], span[1] = min(span[0], float(begin[sel].min())), max(span[1], float(end[sel].max()))
+            for g in np.unique(gi[sel]).tolist():
+                lanes_in.setdefault((k, g), set()).update(np.unique(lanes[sel & (gi == g)]).tolist())
+
+    def make_row(g, v, n_lanes, span_s):
+        return {
+            "RoadDir": g, "Lanes": n_lanes,
+            "Occupancy_avg_%": round(float(v[0] / v[1]), 3) if v[1] > 0 else "NA",
+            "AvgQueue_veh": round(float(v[2]) / span_s, 3) if span_s > 0 else "NA",  # halting vehicles, summed over lanes
+            "TotalWaiting_s": round(float(v[2]), 2),
+            "TotalTimeLoss_s": round(float(v[3]), 2),
+            "VehSeconds": round(float(v[4]), 2),
+            "Throughput_veh": round(float(v[5]), 1) if g != OTHER else "NA",
+        }
+
+    bin_rows = []
+    totals = np.zeros((G, 6))
+    all_lanes = [set() for _ in groups]
+    covered = 0.0
+    for b in sorted(bins):
+        t0, t1 = spans[b]
+        covered += t1 - t0
+        for gi in range(G):
+            lanes = lanes_in.get((b, gi))
+            if lanes:
+                bin_rows.append({"bin_begin": t0, "bin_end": t1, **make_row(groups[gi], bins[b][gi], len(lanes), t1 - t0)})
+                all_lanes[gi] |= lanes
+        totals += bins[b]
+    rows = [make_row(g, totals[gi], len(all_lanes[gi]), covered) for gi, g in enumerate(groups) if all_lanes[gi]]
+    return rows, bin_rows
+
+def _timed(label: str, path: Path, fn, *args, **kw):
+    size = path.stat().st_size if path.exists() else 0
+    t0 = time.perf_counter()
+    out = fn(path, *args, **kw)
+    wall = time.perf_counter() - t0
+    print(f"[INFO] {label}: {size / 1e6:.1f} MB in {wall:.2f}s ({size / 1e6 / max(wall, 1e-9):.0f} MB/s)")
+    return out
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Streaming emission / laneData KPIs per road and time bin")
+    ap.add_argument("--emissions", default="out/emissions.xml", help="emission-output file ('' to skip)")
+    ap.add_argument("--lanes", default="out/laneData.xml", help="lanedata-output file ('' to skip)")
+    ap.add_argument("--bin", type=float, default=300.0, help="time bin (s)")
+    ap.add_argument("--step", type=float, default=None, help="step length (s); default: read from the file")
+    ap.add_argument("--all-edges", action="store_true",
+                    help="no edge pre-filter; edges outside EDGE_GROUPS are reported as 'Other'")
+    ap.add_argument("--out", dest="outdir", default="out", help="output directory for CSVs")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    out_dir = Path(args.outdir)
+    bin_fields = ["bin_begin", "bin_end"]
+
+    if args.emissions:
+        em = Path(args.emissions)
+        print(f"[INFO] Reading: {em}")
+        rows, bin_rows = _timed("emissions", em, summarize_emissions, args.bin, args.all_edges, args.step)
+        write_csv(out_dir / "emissions_by_road.csv", rows, fieldnames=EMISSION_FIELDS)
+        write_csv(out_dir / "emissions_by_road_bins.csv", bin_rows, fieldnames=bin_fields + EMISSION_FIELDS)
+        print("[OK] Wrote", out_dir / "emissions_by_road.csv", "and", out_dir / "emissions_by_road_bins.csv")
+        print("\n=== Emissions per Road/Direction ===")
+        for r in rows:
+            print(r)
+
+    if args.lanes:
+        ln = Path(args.lanes)
+        print(f"[INFO] Reading: {ln}")
+        rows, bin_rows = _timed("laneData", ln, summarize_lanedata, args.bin, args.all_edges)
+        write_csv(out_dir / "lanes_by_road.csv", rows, fieldnames=LANE_FIELDS)
+        write_csv(out_dir / "lanes_by_road_bins.csv", bin_rows, fieldnames=bin_fields + LANE_FIELDS)
+        print("[OK] Wrote", out_dir / "lanes_by_road.csv", "and", out_dir / "lanes_by_road_bins.csv")
+        print("\n=== Lanes per Road/Direction (laneData) ===")
+        for r in rows:
+            print(r)
+
+if __name__ == "__main__":
+    main()
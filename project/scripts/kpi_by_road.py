@@ -1,6 +1,14 @@
 # kpi_by_road.py
 # Summarize SUMO outputs: per-road/direction KPIs from edgeData.xml,
 # and overall/by-type trip KPIs from tripinfo.xml.
+# If scripts/trip_binary.py has converted an output (edgeData.bin / tripinfo.bin next
+# to the XML, still matching its size and mtime), the KPIs are computed from the
+# memory-mapped binary store instead of re-parsing the XML. --edge / --trip may also
+# point at a store directory directly.
+# --incremental keeps parser state next to the CSVs (OUT_DIR/kpi_state.json: byte offset
+# and running sums per RoadDir / vType; trip durations for the percentiles appended to
+# OUT_DIR/kpi_state/*.f64), so re-running while SUMO is still writing only reads the lines
+# appended since the last run. A rewritten file (new run) or changed EDGE_GROUPS starts over.
 
 from pathlib import Path
 import argparse
@@ -9,6 +17,11 @@ from collections import defaultdict
 from pathlib import Path
 import csv
 import math
+import hashlib
+import json
+import os
+import re
+import shutil
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 OUT_DIR = PROJECT_ROOT / "out"
@@ -51,7 +64,89 @@ def pct(values, p):
     d1 = values[c] * (k - f)
     return d0 + d1
 
+def _pct_np(values, p):
+    """pct() on an unsorted NumPy array: only the two neighbouring order statistics are needed."""
+    import numpy as np
+    k = (len(values) - 1) * (p / 100.0)
+    f, c = math.floor(k), math.ceil(k)
+    part = np.partition(values, [f, c])
+    if f == c:
+        return float(part[int(k)])
+    return float(part[f] * (c - k) + part[c] * (k - f))
+
+def _edge_row(g, v):
+    """KPI row of one road group from its summed edgeData fields."""
+    denom = v["weight_sum"] if v["weight_sum"] > 0 else 1.0
+    avg_speed_mps = v["speed_weighted_sum"] / denom
+    return {
+        "RoadDir": g,
+        "AvgSpeed_mps": round(avg_speed_mps, 3),
+        "AvgSpeed_kph": round(avg_speed_mps * 3.6, 3),
+        "TotalWaiting_s": round(v["waitingTime"], 2),
+        "TotalTimeLoss_s": round(v["timeLoss"], 2),
+        "Samples_weight": round(denom, 2),
+        "nVehContrib_sum": round(v["nVehContrib"], 2),
+    }
+
+def _binary_store(xml_path: Path):
+    """Fresh binary store converted from xml_path (scripts/trip_binary.py), or None."""
+    try:
+        from trip_binary import fresh_store
+    except ImportError:  # numpy not installed: XML only
+        return None
+    return fresh_store(xml_path)
+
+def _edge_rows_from_store(store):
+    import numpy as np
+    r = store.records
+    groups = list(EDGE_GROUPS)
+    edge_to_gi = {e: gi for gi, g in enumerate(groups) for e in EDGE_GROUPS[g]}
+    lut = np.array([edge_to_gi.get(e, -1) for e in store.vocab("id")] or [-1], dtype=np.int64)
+    gi = lut[r["id"]]
+    keep = gi >= 0
+    gi = gi[keep]
+    ss, nvc = r["sampledSeconds"][keep], r["nVehContrib"][keep]
+    weight = np.where(nvc > 0, nvc, ss)
+    G = len(groups)
+    sums = {k: np.bincount(gi, v, G) for k, v in (
+        ("sampledSeconds", ss), ("nVehContrib", nvc), ("waitingTime", r["waitingTime"][keep]),
+        ("timeLoss", r["timeLoss"][keep]), ("speed_weighted_sum", r["speed"][keep] * weight),
+        ("weight_sum", weight))}
+    # same row order as the XML path: groups in order of first appearance
+    present, first = np.unique(gi, return_index=True)
+    return [_edge_row(groups[g], {k: float(s[g]) for k, s in sums.items()})
+            for g in present[np.argsort(first)].tolist()]
+
+def _trip_rows_from_store(store):
+    import numpy as np
+    r = store.records
+
+    def make_row(label, sel):
+        dur, wt, tl = r["duration"][sel], r["waitingTime"][sel], r["timeLoss"][sel]
+        n = len(dur)
+        return {
+            "Group": label,
+            "N": n,
+            "Dur_avg_s": round(float(dur.sum()) / n, 3),
+            "Dur_p50_s": round(_pct_np(dur, 50), 3),
+            "Dur_p95_s": round(_pct_np(dur, 95), 3),
+            "Wait_avg_s": round(float(wt.sum()) / n, 3),
+            "TimeLoss_avg_s": round(float(tl.sum()) / n, 3),
+        }
+
+    if len(r) == 0:
+        return []
+    vtypes = store.vocab("vType")
+    codes = r["vType"]
+    rows = [make_row("ALL", slice(None))]
+    for code in sorted(np.unique(codes).tolist(), key=lambda c: vtypes[c]):
+        rows.append(make_row(vtypes[code], codes == code))
+    return rows
+
 def summarize_edgeData(xml_path: Path):
+    store = _binary_store(xml_path)
+    if store is not None:
+        return _edge_rows_from_store(store)
     if not xml_path.exists():
         raise SystemExit(f"[ERROR] Missing {xml_path}")
     tree = ET.parse(xml_path)
@@ -95,22 +190,12 @@ def summarize_edgeData(xml_path: Path):
             sums[g]["weight_sum"]          += weight
 
     # compute KPIs
-    rows = []
-    for g, v in sums.items():
-        denom = v["weight_sum"] if v["weight_sum"] > 0 else 1.0
-        avg_speed_mps = v["speed_weighted_sum"] / denom
-        rows.append({
-            "RoadDir": g,
-            "AvgSpeed_mps": round(avg_speed_mps, 3),
-            "AvgSpeed_kph": round(avg_speed_mps * 3.6, 3),
-            "TotalWaiting_s": round(v["waitingTime"], 2),
-            "TotalTimeLoss_s": round(v["timeLoss"], 2),
-            "Samples_weight": round(denom, 2),
-            "nVehContrib_sum": round(v["nVehContrib"], 2),
-        })
-    return rows
+    return [_edge_row(g, v) for g, v in sums.items()]
 
 def summarize_tripinfo(xml_path: Path):
+    store = _binary_store(xml_path)
+    if store is not None:
+        return _trip_rows_from_store(store)
     if not xml_path.exists():
         raise SystemExit(f"[ERROR] Missing {xml_path}")
 
@@ -161,6 +246,171 @@ def summarize_tripinfo(xml_path: Path):
     rows = [make_rows(lbl) for lbl in sorted(labels, key=lambda x: (x!="ALL", x))]
     return rows
 
+# ---------------- incremental mode ----------------
+
+STATE_VERSION = 1
+EDGE_SUMS = ("sampledSeconds", "nVehContrib", "waitingTime", "timeLoss", "speed_weighted_sum", "weight_sum")
+TRIP_SUMS = ("duration", "waitingTime", "timeLoss")
+HEAD_BYTES = 4096
+
+def _head_digest(xml_path: Path, n: int) -> str:
+    with xml_path.open("rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+def _complete_end(xml_path: Path, start: int) -> int:
+    """Offset just past the last complete line at or after start (start if there is none)."""
+    with xml_path.open("rb") as f:
+        hi = xml_path.stat().st_size
+        while hi > start:
+            lo = max(start, hi - (1 << 16))
+            f.seek(lo)
+            k = f.read(hi - lo).rfind(b"\n")
+            if k >= 0:
+                return lo + k + 1
+            hi = lo
+    return start
+
+def _seq_add(total: float, values) -> float:
+    """total + values[0] + values[1] + ... left to right, i.e. bit-identical to the XML path's += loop."""
+    import numpy as np
+    if not len(values):
+        return total
+    return float(np.cumsum(np.concatenate(([total], values)))[-1])
+
+def load_state(out_dir: Path, reset: bool = False) -> dict:
+    path = out_dir / "kpi_state.json"
+    state = {} if reset or not path.exists() else json.loads(path.read_text(encoding="utf-8"))
+    if state.get("version") != STATE_VERSION:
+        state = {"version": STATE_VERSION}
+    return state
+
+def save_state(out_dir: Path, state: dict):
+    path = out_dir / "kpi_state.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(state, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+def _source_entry(state: dict, name: str, xml_path: Path, config) -> dict:
+    """State of one output file; a fresh one when the file was rewritten, truncated or re-configured."""
+    if not xml_path.exists():
+        raise SystemExit(f"[ERROR] Missing {xml_path}")
+    e = state.get(name)
+    if (e and e["path"] == str(xml_path.resolve()) and e["config"] == config
+            and e["offset"] <= xml_path.stat().st_size and _head_digest(xml_path, e["head_len"]) == e["head"]):
+        return e
+    if e:
+        print(f"[INFO] {xml_path}: new or rewritten file, incremental state reset")
+    e = state[name] = {"path": str(xml_path.resolve()), "config": config, "offset": 0,
+                       "head_len": 0, "head": _head_digest(xml_path, 0), "acc": {}}
+    return e
+
+def _advance(xml_path: Path, entry: dict, consume):
+    """Run consume(start, end) over the complete lines appended since the last run."""
+    start = entry["offset"]
+    end = _complete_end(xml_path, start)
+    if end > start and consume(start, end):
+        entry["offset"] = end
+        entry["head_len"] = min(end, HEAD_BYTES)
+        entry["head"] = _head_digest(xml_path, entry["head_len"])
+    print(f"[INFO] {xml_path}: {(entry['offset'] - start) / 1e6:.1f} MB new since the last run "
+          f"(offset {entry['offset']})")
+
+def summarize_edgeData_incremental(xml_path: Path, state: dict):
+    import numpy as np
+    from xml_scan import Scanner, chunks, to_float
+    entry = _source_entry(state, "edge", xml_path, EDGE_GROUPS)
+    acc = entry["acc"]
+    groups = list(EDGE_GROUPS)
+    edge_to_gi = {e: gi for gi, g in enumerate(groups) for e in EDGE_GROUPS[g]}
+    fields = [b"sampledSeconds", b"nVehContrib", b"waitingTime", b"timeLoss", b"speed"]
+
+    def consume(start, end):
+        key = b"|".join(re.escape(e.encode("utf-8")) for e in sorted(edge_to_gi, key=len, reverse=True))
+        scanner = Scanner(xml_path, b"edge", fields + [b"id"], key_attr=b"id", key_pattern=key)
+        if not scanner.item_caps:
+            return False  # no <edge> written yet: keep the offset
+        for data in chunks(xml_path, start, end):
+            _, items = scanner.scan(data)
+            if not len(items[b"id"]):
+                continue
+            ss, nvc, wt, tl, spd = (to_float(items[n]) for n in fields)
+            weight = np.where(nvc > 0, nvc, ss)
+            cols = dict(zip(EDGE_SUMS, (ss, nvc, wt, tl, spd * weight, weight)))
+            uniq, inv = np.unique(items[b"id"], return_inverse=True)
+            gi = np.array([edge_to_gi[u.decode("utf-8")] for u in uniq], dtype=np.int64)[inv]
+            present, first = np.unique(gi, return_index=True)
+            for g in present[np.argsort(first)].tolist():
+                v = acc.setdefault(groups[g], dict.fromkeys(EDGE_SUMS, 0.0))
+                sel = gi == g
+                for k in EDGE_SUMS:
+                    v[k] = _seq_add(v[k], cols[k][sel])
+        return True
+
+    _advance(xml_path, entry, consume)
+    return [_edge_row(g, v) for g, v in acc.items()]
+
+def summarize_tripinfo_incremental(xml_path: Path, state: dict, out_dir: Path):
+    import numpy as np
+    from xml_scan import Scanner, chunks, to_float
+    entry = _source_entry(state, "trip", xml_path, None)
+    acc = entry["acc"]
+    dur_dir = out_dir / "kpi_state"
+    dur_file = lambda a: dur_dir / f"dur_{a['file']:03d}.f64"
+    if entry["offset"] == 0:
+        shutil.rmtree(dur_dir, ignore_errors=True)
+    dur_dir.mkdir(parents=True, exist_ok=True)
+    for a in acc.values():
+        # drop durations appended by a run that stopped before saving its state
+        if dur_file(a).stat().st_size > 8 * a["n"]:
+            os.truncate(dur_file(a), 8 * a["n"])
+    fields = [b"duration", b"waitingTime", b"timeLoss"]
+
+    def consume(start, end):
+        scanner = Scanner(xml_path, b"tripinfo", fields + [b"vType"])
+        if not scanner.item_caps:
+            return False
+        for data in chunks(xml_path, start, end):
+            _, items = scanner.scan(data)
+            vt = items[b"vType"]
+            if not len(vt):
+                continue
+            cols = {k: to_float(items[n]) for k, n in zip(TRIP_SUMS, fields)}
+            vt = np.where(vt == b"", b"ALL", vt)
+            # as in the XML path: every trip counts for ALL and for its vType (ALL twice without one)
+            sel = {"ALL": np.repeat(np.arange(len(vt)), np.where(vt == b"ALL", 2, 1))}
+            for t in np.unique(vt).tolist():
+                if t != b"ALL":
+                    sel[t.decode("utf-8")] = np.flatnonzero(vt == t)
+            for label, idx in sel.items():
+                a = acc.get(label)
+                if a is None:
+                    a = acc[label] = {"file": len(acc), "n": 0, **dict.fromkeys(TRIP_SUMS, 0.0)}
+                    dur_file(a).write_bytes(b"")
+                for k in TRIP_SUMS:
+                    a[k] = _seq_add(a[k], cols[k][idx])
+                with dur_file(a).open("ab") as f:
+                    f.write(cols["duration"][idx].astype("<f8").tobytes())
+                a["n"] += len(idx)
+        return True
+
+    _advance(xml_path, entry, consume)
+    rows = []
+    for label in sorted(acc, key=lambda x: (x != "ALL", x)):
+        a = acc[label]
+        n = a["n"]
+        dur = np.fromfile(dur_file(a), dtype="<f8", count=n)
+        rows.append({
+            "Group": label,
+            "N": n,
+            "Dur_avg_s": round(a["duration"] / n, 3),
+            "Dur_p50_s": round(_pct_np(dur, 50), 3),
+            "Dur_p95_s": round(_pct_np(dur, 95), 3),
+            "Wait_avg_s": round(a["waitingTime"] / n, 3),
+            "TimeLoss_avg_s": round(a["timeLoss"] / n, 3),
+        })
+    return rows
+
 def write_csv(path: Path, rows, fieldnames):
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", newline="", encoding="utf-8") as f:
@@ -173,6 +423,9 @@ def _parse_args():
     ap.add_argument("--edge", default="out/edgeData.xml", help="path to edgeData.xml")
     ap.add_argument("--trip", default="out/tripinfo.xml", help="path to tripinfo.xml")
     ap.add_argument("--out",  dest="outdir", default="out", help="output directory for CSVs")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only parse what was appended since the last --incremental run (state in --out)")
+    ap.add_argument("--reset-state", action="store_true", help="with --incremental: start over from byte 0")
     return ap.parse_args()
 
 def main():
@@ -186,9 +439,13 @@ def main():
 
     print(f"[INFO] Reading: {EDGE_XML}")
     print(f"[INFO] Reading: {TRIP_XML}")
+    state = load_state(OUT_DIR, reset=args.reset_state) if args.incremental else None
 
     print("[INFO] Reading:", EDGE_XML)
-    edge_rows = summarize_edgeData(EDGE_XML)
+    if state is None:
+        edge_rows = summarize_edgeData(EDGE_XML)
+    else:
+        edge_rows = summarize_edgeData_incremental(EDGE_XML, state)
     edge_csv = OUT_DIR / "kpi_by_road.csv"
     write_csv(edge_csv, edge_rows, fieldnames=[
         "RoadDir","AvgSpeed_mps","AvgSpeed_kph",
@@ -198,7 +455,11 @@ def main():
     print("[OK] Wrote", edge_csv)
 
     print("[INFO] Reading:", TRIP_XML)
-    trip_rows = summarize_tripinfo(TRIP_XML)
+    if state is None:
+        trip_rows = summarize_tripinfo(TRIP_XML)
+    else:
+        trip_rows = summarize_tripinfo_incremental(TRIP_XML, state, OUT_DIR)
+        save_state(OUT_DIR, state)
     trip_csv = OUT_DIR / "tripinfo_kpis.csv"
     write_csv(trip_csv, trip_rows, fieldnames=[
         "Group","N","Dur_avg_s","Dur_p50_s","Dur_p95_s","Wait_avg_s","TimeLoss_avg_s"
@@ -0,0 +1,424 @@
+# net_heatmap.py
+# Whole-network congestion maps from edgeData intervals, fast enough for time-lapse
+# animations of a run.
+# - Geometry: one polyline per edge (its middle vehicle lane, so both directions of a
+#   road stay apart), read with net_spatial.scan_net. Douglas-Peucker is run once over
+#   all polylines together (vectorised, one pass per recursion depth) and stores each
+#   vertex's significance: the largest tolerance at which DP still keeps it. Any zoom
+#   level's decimated geometry is then just `significance > tolerance`; the tolerance
+#   of level z is half a pixel of a 256 px tile at that level. Saved as
+#   <net>.heatmap.index.npz, reused while the net is unchanged (size / mtime, then SHA-1).
+# - Base tiles: the static map (all edges in grey) is rendered per level as 256 px tiles
+#   and cached as PNGs under --tile-dir/<net sha1>/<z>/<i>_<j>.png; a view stitches the
+#   tiles it covers, so repeated renders of a net never redraw the base.
+# - Frames: edges are one LineCollection of the level's segments; per interval only the
+#   colour array changes (set_array of the per-edge KPI), and the frame is blitted over
+#   the cached background (base tiles, colour bar), so an animation costs one artist
+#   draw per frame.
+# - KPIs: any edgeData attribute (--metric speedRelative / occupancy / density /
+#   waitingTime / timeLoss / ...), from the trip_binary store when it is fresh, else
+#   streamed from the XML. Edges without vehicles in an interval (sampledSeconds 0)
+#   are left grey.
+#
+# Usage:
+#   python scripts/net_heatmap.py --edgedata out/edgeData.xml --metric speedRelative --gif
+#   python scripts/net_heatmap.py --edgedata out/edgeData.xml --metric occupancy --bbox 1500,1500,2500,2300 --width 800
+#   python scripts/net_heatmap.py --info
+#   from net_heatmap import load_geometry, HeatmapRenderer
+
+import json
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import Normalize
+
+from net_spatial import NET_FILE, PROJECT_ROOT, file_sha1, scan_net
+
+FORMAT_VERSION = 1
+TILE_PX = 256
+MAX_LEVEL = 8
+TILE_DIR = PROJECT_ROOT / "net" / "tiles"
+BASE_COLOR = (0.72, 0.72, 0.72, 1.0)
+BACKGROUND = (0.97, 0.97, 0.96, 1.0)
+
+def cache_path(net_path: Path) -> Path:
+    return Path(net_path).with_name(Path(net_path).name + ".heatmap.index.npz")
+
+def _stamp(path: Path) -> list:
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+# ---------------------------------------------------------------------------
+# Geometry and Douglas-Peucker
+# ---------------------------------------------------------------------------
+
+def dp_significance(xy: np.ndarray, ptr: np.ndarray) -> np.ndarray:
+    """
+    Douglas-Peucker significance of every vertex of the polylines xy[ptr[i]:ptr[i+1]]:
+    the vertex survives DP with tolerance tol iff significance > tol. End points are inf;
+    a vertex is never more significant than the split that exposed it, so the levels nest.
+    """
+    sig = np.zeros(len(xy))
+    first, last = ptr[:-1], ptr[1:] - 1
+    ok = last > first
+    sig[first[ok]] = sig[last[ok]] = np.inf
+    a, b = first[ok], last[ok]
+    parent = np.full(len(a), np.inf)
+    while len(a):
+        inner = b - a - 1
+        keep = inner > 0
+        a, b, parent, inner = a[keep], b[keep], parent[keep], inner[keep]
+        if not len(a):
+            break
+        group = np.repeat(np.arange(len(a)), inner)
+        starts = np.cumsum(inner) - inner
+        k = np.arange(len(group)) - starts[group] + a[group] + 1
+        # distance of every inner vertex to the chord (a, b) of its interval
+        p0 = xy[a[group]]
+        d = xy[b[group]] - p0
+        rel = xy[k] - p0
+        ll = (d * d).sum(axis=1)
+        t = np.clip((rel * d).sum(axis=1) / np.where(ll > 0, ll, 1.0), 0.0, 1.0)
+        dist = np.hypot(*(rel - t[:, None] * d).T)
+        dmax = np.maximum.reduceat(dist, starts)
+        hit = dist == dmax[group]
+        _, pos = np.unique(group[hit], return_index=True)
+        split = k[hit][pos]
+        s = np.minimum(dmax, parent)
+        sig[split] = s
+        a, b = np.concatenate([a, split]), np.concatenate([split, b])
+        parent = np.concatenate([s, s])
+    return sig
+
+def build(net_path: Path = NET_FILE, out: Path | None = None) -> Path:
+    """Parse the net, compute the DP significances and write the geometry cache; returns its path."""
+    net_path = Path(net_path)
+    if not net_path.exists():
+        raise SystemExit(f"[ERROR] Missing {net_path}")
+    _location, lanes = scan_net(net_path)
+    by_edge = {}
+    for lane, edge, shape in lanes:
+        by_edge.setdefault(edge, []).append((int(lane.rsplit("_", 1)[1]), shape))
+    if not by_edge:
+        raise SystemExit(f"[ERROR] {net_path}: no vehicle lanes")
+    edge_ids, pts, ptr = [], [], [0]
+    for edge, shapes in by_edge.items():
+        shapes.sort()
+        shape = shapes[len(shapes) // 2][1]
+        xy = np.array([[float(v) for v in p.split(",")[:2]] for p in shape.split()], dtype=np.float64)
+        edge_ids.append(edge)
+        pts.append(xy)
+        ptr.append(ptr[-1] + len(xy))
+    xy = np.concatenate(pts)
+    ptr = np.array(ptr, dtype=np.int64)
+    sig = dp_significance(xy, ptr)
+
+    meta = {"version": FORMAT_VERSION, "net": str(net_path.resolve()), "sha1": file_sha1(net_path),
+            "stamp": _stamp(net_path)}
+    out = Path(out) if out else cache_path(net_path)
+    tmp = out.with_name(out.name + ".part.npz")
+    np.savez(tmp, meta=np.array(json.dumps(meta)), edge_ids=np.array(edge_ids, dtype=str),
+             xy=xy, ptr=ptr, sig=sig)
+    tmp.replace(out)
+    return out
+
+class NetGeometry:
+    """Edge polylines with per-vertex DP significance; decimated segments per zoom level."""
+
+    def __init__(self, path: Path):
+        with np.load(path) as z:
+            self.meta = json.loads(str(z["meta"]))
+            self.edge_ids = z["edge_ids"]
+            self.xy = z["xy"]
+            self.ptr = z["ptr"]
+            self.sig = z["sig"]
+        self.edge_index = {str(e): i for i, e in enumerate(self.edge_ids)}
+        self.vertex_edge = np.repeat(np.arange(len(self.edge_ids)), np.diff(self.ptr))
+        lo, hi = self.xy.min(axis=0), self.xy.max(axis=0)
+        # square level-0 tile over the whole net (tile rows count down from the top)
+        self.extent = float(max(hi - lo)) * 1.02
+        mid = (lo + hi) / 2
+        self.origin = (float(mid[0] - self.extent / 2), float(mid[1] + self.extent / 2))
+        self._levels = {}
+
+    def tile_size(self, z: int) -> float:
+        return self.extent / 2 ** z
+
+    def tolerance(self, z: int) -> float:
+        """DP tolerance of level z: half a pixel of its tiles."""
+        return self.tile_size(z) / TILE_PX / 2
+
+    def level_for(self, metres_per_px: float) -> int:
+        z = int(np.ceil(np.log2(self.extent / TILE_PX / max(metres_per_px, 1e-9))))
+        return int(np.clip(z, 0, MAX_LEVEL))
+
+    def segments(self, z: int):
+        """(segments (S, 2, 2), segment edge (S,)) of the geometry decimated for level z."""
+        if z not in self._levels:
+            kept = np.flatnonzero(self.sig > self.tolerance(z))
+            same = self.vertex_edge[kept[:-1]] == self.vertex_edge[kept[1:]]
+            i0, i1 = kept[:-1][same], kept[1:][same]
+            segs = np.stack([self.xy[i0], self.xy[i1]], axis=1)
+            self._levels[z] = (segs, self.vertex_edge[i0])
+        return self._levels[z]
+
+def load_geometry(net_path: Path = NET_FILE, rebuild: bool = False) -> NetGeometry:
+    """The saved geometry of net_path, rebuilt if missing or built from another net file."""
+    net_path = Path(net_path)
+    path = cache_path(net_path)
+    if not rebuild and path.exists() and net_path.exists():
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+        if meta.get("version") == FORMAT_VERSION and (
+                meta.get("stamp") == _stamp(net_path) or meta.get("sha1") == file_sha1(net_path)):
+            return NetGeometry(path)
+    return NetGeometry(build(net_path, path))
+
+def _in_box(segs: np.ndarray, box) -> np.ndarray:
+    """Segments whose bounding box overlaps box = (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = box
+    xs, ys = segs[:, :, 0], segs[:, :, 1]
+    return (xs.max(axis=1) >= x0) & (xs.min(axis=1) <= x1) & (ys.max(axis=1) >= y0) & (ys.min(axis=1) <= y1)
+
+# ---------------------------------------------------------------------------
+# Base tiles
+# ---------------------------------------------------------------------------
+
+class TileCache:
+    """Static base tiles of one net, rendered on first use and kept as PNGs (and in memory)."""
+
+    def __init__(self, geom: NetGeometry, tile_dir: Path = TILE_DIR, linewidth: float = 1.0):
+        self.geom = geom
+        self.dir = Path(tile_dir) / geom.meta["sha1"][:16]
+        self.linewidth = linewidth
+        self._mem = {}
+        self.rendered = 0
+
+    def bounds(self, z: int, i: int, j: int):
+        s = self.geom.tile_size(z)
+        x0 = self.geom.origin[0] + i * s
+        y1 = self.geom.origin[1] - j * s
+        return x0, y1 - s, x0 + s, y1
+
+    def tile(self, z: int, i: int, j: int) -> np.ndarray:
+        """RGBA float image (TILE_PX, TILE_PX, 4) of tile (z, i, j)."""
+        key = (z, i, j)
+        if key not in self._mem:
+            path = self.dir / str(z) / f"{i}_{j}.png"
+            if path.exists():
+                img = plt.imread(path)
+            else:
+                img = self._render(z, i, j)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                plt.imsave(path, img)
+                self.rendered += 1
+            self._mem[key] = img
+        return self._mem[key]
+
+    def _render(self, z: int, i: int, j: int) -> np.ndarray:
+        x0, y0, x1, y1 = self.bounds(z, i, j)
+        segs, _ = self.geom.segments(z)
+        segs = segs[_in_box(segs, (x0, y0, x1, y1))]
+        fig = plt.figure(figsize=(1, 1), dpi=TILE_PX, facecolor=BACKGROUND)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.set_xlim(x0, x1)
+        ax.set_ylim(y0, y1)
+        ax.add_collection(LineCollection(segs, colors=[BASE_COLOR], linewidths=self.linewidth,
+                                         capstyle="round"))
+        fig.canvas.draw()
+        img = np.asarray(fig.canvas.buffer_rgba(), dtype=np.float32) / 255.0
+        plt.close(fig)
+        return img
+
+    def mosaic(self, z: int, box):
+        """Stitched tiles of level z covering box; returns (image, extent (x0, x1, y0, y1))."""
+        s = self.geom.tile_size(z)
+        ox, oy = self.geom.origin
+        n = 2 ** z
+        i0, i1 = (int(np.clip(np.floor((v - ox) / s), 0, n - 1)) for v in (box[0], box[2]))
+        j0, j1 = (int(np.clip(np.floor((oy - v) / s), 0, n - 1)) for v in (box[3], box[1]))
+        img = np.empty(((j1 - j0 + 1) * TILE_PX, (i1 - i0 + 1) * TILE_PX, 4), dtype=np.float32)
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                img[(j - j0) * TILE_PX:(j - j0 + 1) * TILE_PX,
+                    (i - i0) * TILE_PX:(i - i0 + 1) * TILE_PX] = self.tile(z, i, j)
+        return img, (ox + i0 * s, ox + (i1 + 1) * s, oy - (j1 + 1) * s, oy - j0 * s)
+
+# ---------------------------------------------------------------------------
+# KPIs and frames
+# ---------------------------------------------------------------------------
+
+def load_edge_kpis(xml_path: Path, metric: str, edge_index: dict):
+    """(interval begins, ends, values (T, E) with NaN where an edge has no data)."""
+    xml_path = Path(xml_path)
+    try:
+        from trip_binary import fresh_store
+        store = fresh_store(xml_path)
+    except ImportError:
+        store = None
+    if store is not None and store.kind == "edgedata":
+        r = store.records
+        if metric not in r.dtype.names:
+            raise SystemExit(f"[ERROR] {metric!r} is not an edgeData field of the store ({', '.join(r.dtype.names)})")
+        begins, t = np.unique(r["begin"], return_inverse=True)
+        ends = np.array([float(r["end"][np.argmax(r["begin"] == b)]) for b in begins])
+        lut = np.array([edge_index.get(e, -1) for e in store.vocab("id")] or [-1], dtype=np.int64)
+        e = lut[r["id"]]
+        keep = (e >= 0) & (r["sampledSeconds"] > 0)
+        values = np.full((len(begins), len(edge_index)), np.nan)
+        values[t[keep], e[keep]] = r[metric][keep]
+        return begins, ends, values
+    if not xml_path.exists():
+        raise SystemExit(f"[ERROR] Missing {xml_path}")
+    begins, ends, rows = [], [], []
+    for _ev, el in ET.iterparse(str(xml_path), events=("end",)):
+        if el.tag == "edge":
+            v = el.get(metric)
+            ei = edge_index.get(el.get("id"))
+            if v is not None and ei is not None and float(el.get("sampledSeconds", 0)) > 0:
+                rows.append((len(begins), ei, float(v)))
+        elif el.tag == "interval":
+            begins.append(float(el.get("begin")))
+            ends.append(float(el.get("end")))
+            el.clear()
+    values = np.full((len(begins), len(edge_index)), np.nan)
+    if rows:
+        t, e, v = (np.array(c) for c in zip(*rows))
+        values[t.astype(np.int64), e.astype(np.int64)] = v
+    return np.array(begins), np.array(ends), values
+
+class HeatmapRenderer:
+    """One view of the net: cached base image plus a LineCollection recoloured per frame."""
+
+    def __init__(self, geom: NetGeometry, tiles: TileCache, box=None, width: int = 1024,
+                 cmap: str = "RdYlGn", vmin: float = 0.0, vmax: float = 1.0, linewidth: float = 2.0,
+                 label: str = ""):
+        self.geom = geom
+        if box is None:
+            lo, hi = geom.xy.min(axis=0), geom.xy.max(axis=0)
+            pad = 0.02 * float(max(hi - lo))
+            box = (lo[0] - pad, lo[1] - pad, hi[0] + pad, hi[1] + pad)
+        self.box = tuple(float(v) for v in box)
+        x0, y0, x1, y1 = self.box
+        self.width = int(width)
+        self.height = max(1, int(round(self.width * (y1 - y0) / (x1 - x0))))
+        self.level = geom.level_for((x1 - x0) / self.width)
+        segs, seg_edge = geom.segments(self.level)
+        inside = _in_box(segs, self.box)
+        self.seg_edge = seg_edge[inside]
+
+        dpi = 100
+        self.fig = plt.figure(figsize=(self.width / dpi, self.height / dpi), dpi=dpi, facecolor=BACKGROUND)
+        self.ax = self.fig.add_axes([0, 0, 1, 1])
+        self.ax.set_axis_off()
+        img, extent = tiles.mosaic(self.level, self.box)
+        self.ax.imshow(img, extent=extent, interpolation="antialiased", zorder=0)
+        self.ax.set_xlim(x0, x1)
+        self.ax.set_ylim(y0, y1)
+        cm = plt.get_cmap(cmap).copy()
+        cm.set_bad((0, 0, 0, 0))  # no data: the grey base shows through
+        self.lines = LineCollection(segs[inside], cmap=cm, norm=Normalize(vmin, vmax), linewidths=linewidth,
+                                    capstyle="round", zorder=1, animated=True)
+        self.ax.add_collection(self.lines)
+        self.stamp = self.ax.text(0.01, 0.99, "", transform=self.ax.transAxes, va="top", ha="left",
+                                  fontsize=10, animated=True,
+                                  bbox={"facecolor": "white", "alpha": 0.8, "edgecolor": "none"})
+        cax = self.fig.add_axes([0.93, 0.1, 0.015, 0.35])
+        self.fig.colorbar(self.lines, cax=cax, label=label)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def frame(self, edge_values: np.ndarray, text: str = "") -> np.ndarray:
+        """RGBA uint8 image (height, width, 4) of the view coloured by edge_values (one per edge)."""
+        canvas = self.fig.canvas
+        self.lines.set_array(np.ma.masked_invalid(edge_values[self.seg_edge]))
+        self.stamp.set_text(text)
+        canvas.restore_region(self.background)
+        self.ax.draw_artist(self.lines)
+        self.ax.draw_artist(self.stamp)
+        return np.asarray(canvas.buffer_rgba()).copy()
+
+    def close(self):
+        plt.close(self.fig)
+
+def _clock(t: float) -> str:
+    t = int(t)
+    return f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}"
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Network heatmaps / time-lapse of edgeData KPIs")
+    ap.add_argument("--net", default=str(NET_FILE), help="SUMO network (.net.xml)")
+    ap.add_argument("--edgedata", default="out/edgeData.xml", help="edgeData output (or its trip_binary store)")
+    ap.add_argument("--metric", default="speedRelative", help="edgeData attribute to colour by")
+    ap.add_argument("--out", default="out/heatmap", help="Output folder for the frames")
+    ap.add_argument("--bbox", default=None, help="'x0,y0,x1,y1' view in net coordinates (default: whole net)")
+    ap.add_argument("--width", type=int, default=1024, help="Frame width (px)")
+    ap.add_argument("--cmap", default=None, help="Matplotlib colormap (default: RdYlGn for speedRelative, "
+                                                 "else RdYlGn_r)")
+    ap.add_argument("--vmin", type=float, default=None, help="Colour scale minimum (default: 2nd percentile)")
+    ap.add_argument("--vmax", type=float, default=None, help="Colour scale maximum (default: 98th percentile)")
+    ap.add_argument("--linewidth", type=float, default=2.0, help="Edge line width (pt)")
+    ap.add_argument("--tile-dir", default=str(TILE_DIR), help="Base tile cache folder")
+    ap.add_argument("--gif", action="store_true", help="Also write <metric>.gif of all frames")
+    ap.add_argument("--fps", type=float, default=8.0, help="GIF frame rate")
+    ap.add_argument("--rebuild", action="store_true", help="Rebuild the geometry cache")
+    ap.add_argument("--info", action="store_true", help="Only print the decimation per zoom level")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    t0 = time.perf_counter()
+    geom = load_geometry(Path(args.net), args.rebuild)
+    print(f"[OK] {cache_path(Path(args.net))}: {len(geom.edge_ids)} edges, {len(geom.xy)} vertices "
+          f"in {time.perf_counter() - t0:.2f}s")
+    if args.info:
+        for z in range(MAX_LEVEL + 1):
+            segs, _ = geom.segments(z)
+            print(f"[INFO] level {z}: tolerance {geom.tolerance(z):8.3f} m, {len(segs)} segments "
+                  f"({len(segs) / max(len(geom.xy) - len(geom.edge_ids), 1):.0%})")
+        return
+
+    begins, ends, values = load_edge_kpis(Path(args.edgedata), args.metric, geom.edge_index)
+    if not len(begins) or np.isnan(values).all():
+        raise SystemExit(f"[ERROR] {args.edgedata}: no {args.metric} values for edges of {args.net}")
+    finite = values[np.isfinite(values)]
+    vmin = args.vmin if args.vmin is not None else float(np.percentile(finite, 2))
+    vmax = args.vmax if args.vmax is not None else float(np.percentile(finite, 98))
+    cmap = args.cmap or ("RdYlGn" if args.metric.startswith("speed") else "RdYlGn_r")
+    box = tuple(float(v) for v in args.bbox.split(",")) if args.bbox else None
+
+    t0 = time.perf_counter()
+    tiles = TileCache(geom, Path(args.tile_dir))
+    view = HeatmapRenderer(geom, tiles, box, args.width, cmap, vmin, vmax, args.linewidth, args.metric)
+    print(f"[INFO] View {view.width}x{view.height} px at level {view.level}: {len(view.seg_edge)} segments, "
+          f"{tiles.rendered} new base tiles, setup {time.perf_counter() - t0:.2f}s")
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    frames, t_render = [], 0.0
+    for k, (b, e) in enumerate(zip(begins, ends)):
+        t1 = time.perf_counter()
+        img = view.frame(values[k], f"{args.metric}  {_clock(b)}-{_clock(e)}")
+        t_render += time.perf_counter() - t1
+        plt.imsave(out / f"{args.metric}_{k:04d}.png", img)
+        if args.gif:
+            frames.append(img)
+    view.close()
+    print(f"[OK] Wrote {len(begins)} frames to {out} ({len(begins) / max(t_render, 1e-9):.1f} frames/s rendered)")
+    if args.gif:
+        from PIL import Image
+        gif = out / f"{args.metric}.gif"
+        imgs = [Image.fromarray(f[:, :, :3]) for f in frames]
+        imgs[0].save(gif, save_all=True, append_images=imgs[1:], duration=int(1000 / args.fps), loop=0)
+        print(f"[OK] Wrote {gif}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+# net_spatial.py
+# Spatial index over the lane geometry of a SUMO network, for geo queries (camera / field
+# count locations given as lat/lon) and detector-to-edge mapping.
+# - Projection: the net's <location> (projParameter "+proj=utm +zone=46 ...", netOffset)
+#   is applied with a NumPy UTM implementation (Krueger / USGS series, WGS84), both ways,
+#   vectorised over arrays of points; no pyproj needed.
+# - Geometry: every lane shape is cut into segments; segments are registered in a uniform
+#   grid (cell = --cell m) stored CSR-style (cell_ptr / cell_seg), so a query touches only
+#   the segments of the cells around it.
+# - Queries (all vectorised over thousands of points):
+#     nearest(x, y)        nearest lane / edge, distance, position along the lane and the
+#                          snapped point; the search radius doubles until a hit or max_dist
+#     radius(x, y, r)      every (point, edge) pair within r, with its distance
+#     bbox(x0, y0, x1, y1) edges with a segment crossing the rectangle (exact segment test)
+#   lonlat_to_xy / xy_to_lonlat convert between WGS84 and net coordinates.
+# - Internal lanes and lanes that only allow pedestrians / bicycles / delivery (footways)
+#   are left out unless --all-lanes, so points snap to the carriageway.
+# - The index is saved as <net>.spatial.index.npz with the SHA-1 of the net file; it is
+#   reused while the file is unchanged (size / mtime checked first, hash only if those
+#   differ) and rebuilt otherwise.
+# - --points maps a CSV of field points (id, lat, lon, ...) to edges and to the road
+#   groups of kpi_by_road.EDGE_GROUPS (RoadEdge.txt), for edge grouping and calibration.
+#
+# Usage:
+#   python scripts/net_spatial.py --points field_counts.csv --out out/field_points_edges.csv
+#   python scripts/net_spatial.py --lonlat 90.4172912,23.7958512 --radius 30
+#   python scripts/net_spatial.py --bbox 1500,1600,1800,1900
+#   from net_spatial import load_spatial; idx = load_spatial(); hit = idx.nearest(*idx.lonlat_to_xy(lon, lat))
+
+import re
+import csv
+import json
+import time
+import hashlib
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+NET_FILE = PROJECT_ROOT / "net" / "network.net.xml"
+
+FORMAT_VERSION = 1
+CELL_M = 25.0
+VEHICLE_CLASSES = {"passenger", "private", "taxi", "bus", "coach", "truck", "trailer", "motorcycle", "moped",
+                   "evehicle", "emergency", "authority", "army", "vip", "custom1", "custom2"}
+
+# WGS84
+_A = 6378137.0
+_F = 1 / 298.257223563
+_E2 = _F * (2 - _F)
+_EP2 = _E2 / (1 - _E2)
+_K0 = 0.9996
+
+# ---------------------------------------------------------------------------
+# Projection
+# ---------------------------------------------------------------------------
+
+def _meridian_arc(phi):
+    e2, e4, e6 = _E2, _E2 ** 2, _E2 ** 3
+    return _A * ((1 - e2 / 4 - 3 * e4 / 64 - 5 * e6 / 256) * phi
+                 - (3 * e2 / 8 + 3 * e4 / 32 + 45 * e6 / 1024) * np.sin(2 * phi)
+                 + (15 * e4 / 256 + 45 * e6 / 1024) * np.sin(4 * phi)
+                 - (35 * e6 / 3072) * np.sin(6 * phi))
+
+def utm_forward(lon, lat, zone: int, south: bool = False):
+    """WGS84 degrees -> UTM easting / northing (m), arrays in, arrays out."""
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    lam = np.radians(np.asarray(lon, dtype=np.float64) - (zone * 6 - 183))
+    sin, cos, tan = np.sin(phi), np.cos(phi), np.tan(phi)
+    n = _A / np.sqrt(1 - _E2 * sin ** 2)
+    t = tan ** 2
+    c = _EP2 * cos ** 2
+    a = cos * lam
+    x = _K0 * n * (a + (1 - t + c) * a ** 3 / 6 + (5 - 18 * t + t ** 2 + 72 * c - 58 * _EP2) * a ** 5 / 120)
+    y = _K0 * (_meridian_arc(phi) + n * tan * (a ** 2 / 2 + (5 - t + 9 * c + 4 * c ** 2) * a ** 4 / 24
+                                              + (61 - 58 * t + t ** 2 + 600 * c - 330 * _EP2) * a ** 6 / 720))
+    return x + 500000.0, y + (10000000.0 if south else 0.0)
+
+def utm_inverse(x, y, zone: int, south: bool = False):
+    """UTM easting / northing (m) -> WGS84 lon, lat degrees."""
+    x = np.asarray(x, dtype=np.float64) - 500000.0
+    y = np.asarray(y, dtype=np.float64) - (10000000.0 if south else 0.0)
+    mu = y / _K0 / (_A * (1 - _E2 / 4 - 3 * _E2 ** 2 / 64 - 5 * _E2 ** 3 / 256))
+    e1 = (1 - np.sqrt(1 - _E2)) / (1 + np.sqrt(1 - _E2))
+    phi1 = (mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * np.sin(2 * mu)
+            + (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * np.sin(4 * mu)
+            + (151 * e1 ** 3 / 96) * np.sin(6 * mu) + (1097 * e1 ** 4 / 512) * np.sin(8 * mu))
+    sin, cos, tan = np.sin(phi1), np.cos(phi1), np.tan(phi1)
+    c1 = _EP2 * cos ** 2
+    t1 = tan ** 2
+    n1 = _A / np.sqrt(1 - _E2 * sin ** 2)
+    r1 = _A * (1 - _E2) / (1 - _E2 * sin ** 2) ** 1.5
+    d = x / (n1 * _K0)
+    lat = phi1 - (n1 * tan / r1) * (d ** 2 / 2 - (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * _EP2) * d ** 4 / 24
+                                    + (61 + 90 * t1 + 298 * c1 + 45 * t1 ** 2 - 252 * _EP2 - 3 * c1 ** 2)
+                                    * d ** 6 / 720)
+    lon = (d - (1 + 2 * t1 + c1) * d ** 3 / 6
+           + (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * _EP2 + 24 * t1 ** 2) * d ** 5 / 120) / cos
+    return np.degrees(lon) + (zone * 6 - 183), np.degrees(lat)
+
+def parse_projection(proj: str):
+    """(zone, south) from a UTM proj string; None for '!' (no projection) or other projections."""
+    if "+proj=utm" not in proj:
+        return None
+    m = re.search(r"\+zone=(\d+)", proj)
+    if not m:
+        return None
+    return int(m.group(1)), "+south" in proj
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def file_sha1(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _stamp(path: Path) -> list:
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+def cache_path(net_path: Path) -> Path:
+    return Path(net_path).with_name(Path(net_path).name + ".spatial.index.npz")
+
+def _vehicle_lane(lane: ET.Element) -> bool:
+    allow = lane.get("allow")
+    if allow is not None:
+        return bool(VEHICLE_CLASSES & set(allow.split()))
+    return lane.get("disallow") != "all"
+
+def scan_net(net_path: Path, all_lanes: bool = False):
+    """Stream the net: location attributes, and (lane id, edge id, shape) of the indexed lanes."""
+    location, lanes = {}, []
+    context = ET.iterparse(str(net_path), events=("start", "end"))
+    _, root = next(context)
+    depth = 1
+    for ev, el in context:
+        if ev == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if el.tag == "location":
+            location = dict(el.attrib)
+        elif el.tag == "edge" and (all_lanes or el.get("function") != "internal"):
+            for lane in el.iter("lane"):
+                if all_lanes or _vehicle_lane(lane):
+                    lanes.append((lane.get("id"), el.get("id"), lane.get("shape", "")))
+        root.clear()
+    return location, lanes
+
+def build(net_path: Path = NET_FILE, out: Path | None = None, cell: float = CELL_M,
+          all_lanes: bool = False) -> Path:
+    """Parse the net and write the grid index; returns its path."""
+    net_path = Path(net_path)
+    if not net_path.exists():
+        raise SystemExit(f"[ERROR] Missing {net_path}")
+    location, lanes = scan_net(net_path, all_lanes)
+    if not lanes:
+        raise SystemExit(f"[ERROR] {net_path}: no lanes to index")
+
+    edge_code = {}
+    lane_edge, pts = [], []
+    lane_ptr = [0]
+    for li, (_lane, edge, shape) in enumerate(lanes):
+        lane_edge.append(edge_code.setdefault(edge, len(edge_code)))
+        xy = np.array([[float(v) for v in p.split(",")[:2]] for p in shape.split()], dtype=np.float64)
+        pts.append(xy)
+        lane_ptr.append(lane_ptr[-1] + len(xy))
+    shape_xy = np.concatenate(pts)
+    lane_ptr = np.array(lane_ptr, dtype=np.int64)
+    # segment k goes from point k to k+1 unless k is the last point of its lane
+    n_pts = np.diff(lane_ptr)
+    seg_start = np.concatenate([np.arange(a, b - 1) for a, b in zip(lane_ptr[:-1], lane_ptr[1:])])
+    seg_lane = np.repeat(np.arange(len(lanes)), np.maximum(n_pts - 1, 0))
+    p0, p1 = shape_xy[seg_start], shape_xy[seg_start + 1]
+    seg_len = np.hypot(*(p1 - p0).T)
+    # lane offset of each segment start (for positions along the lane)
+    first = np.r_[True, seg_lane[1:] != seg_lane[:-1]]
+    csum = np.cumsum(seg_len)
+    base = np.maximum.accumulate(np.where(first, csum - seg_len, 0.0))
+    seg_offset = csum - seg_len - base
+
+    origin = shape_xy.min(axis=0) - cell
+    lo = np.floor((np.minimum(p0, p1) - origin) / cell).astype(np.int64)
+    hi = np.floor((np.maximum(p0, p1) - origin) / cell).astype(np.int64)
+    dims = np.floor((shape_xy.max(axis=0) + cell - origin) / cell).astype(np.int64) + 1
+    span = hi - lo + 1
+    reps = span[:, 0] * span[:, 1]
+    seg_ids = np.repeat(np.arange(len(seg_len)), reps)
+    k = np.arange(len(seg_ids)) - np.repeat(np.cumsum(reps) - reps, reps)
+    cx = lo[seg_ids, 0] + k % span[seg_ids, 0]
+    cy = lo[seg_ids, 1] + k // span[seg_ids, 0]
+    cell_id = cy * dims[0] + cx
+    order = np.argsort(cell_id, kind="stable")
+    cell_ptr = np.zeros(dims[0] * dims[1] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cell_id, minlength=dims[0] * dims[1]), out=cell_ptr[1:])
+
+    meta = {"version": FORMAT_VERSION, "net": str(net_path.resolve()), "sha1": file_sha1(net_path),
+            "stamp": _stamp(net_path), "cell": cell, "all_lanes": all_lanes,
+            "origin": origin.tolist(), "dims": dims.tolist(), "location": location}
+    out = Path(out) if out else cache_path(net_path)
+    tmp = out.with_name(out.name + ".part.npz")
+    np.savez(tmp, meta=np.array(json.dumps(meta)),
+             lane_ids=np.array([ln for ln, _, _ in lanes], dtype=str),
+             edge_ids=np.array(list(edge_code), dtype=str), lane_edge=np.array(lane_edge, dtype=np.int32),
+             seg_p0=p0, seg_p1=p1, seg_lane=seg_lane.astype(np.int32), seg_offset=seg_offset,
+             cell_ptr=cell_ptr, cell_seg=seg_ids[order].astype(np.int32))
+    tmp.replace(out)
+    return out
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _point_segment(px, py, x0, y0, dx, dy, ll):
+    """Distance from points to segments (start, direction, squared length; pairwise arrays) and t."""
+    t = ((px - x0) * dx + (py - y0) * dy) / ll
+    np.clip(t, 0.0, 1.0, out=t)
+    return np.hypot(px - x0 - t * dx, py - y0 - t * dy), t
+
+class SpatialIndex:
+    """Grid index over lane segments; every query takes coordinate arrays (net x/y)."""
+
+    def __init__(self, npz_path: Path):
+        with np.load(npz_path) as z:
+            self.meta = json.loads(str(z["meta"]))
+            self.lane_ids = z["lane_ids"]
+            self.edge_ids = z["edge_ids"]
+            self.lane_edge = z["lane_edge"]
+            self.seg_p0 = z["seg_p0"]
+            self.seg_p1 = z["seg_p1"]
+            self.seg_lane = z["seg_lane"]
+            self.seg_offset = z["seg_offset"]
+            self.cell_ptr = z["cell_ptr"]
+            self.cell_seg = z["cell_seg"]
+        self.cell = float(self.meta["cell"])
+        self.origin = np.array(self.meta["origin"])
+        self.dims = np.array(self.meta["dims"], dtype=np.int64)
+        loc = self.meta.get("location", {})
+        self.net_offset = np.array([float(v) for v in loc.get("netOffset", "0,0").split(",")])
+        self.projection = parse_projection(loc.get("projParameter", "!"))
+        # contiguous per-segment columns for the pairwise distance gathers
+        self._x0 = np.ascontiguousarray(self.seg_p0[:, 0])
+        self._y0 = np.ascontiguousarray(self.seg_p0[:, 1])
+        self._dx = self.seg_p1[:, 0] - self._x0
+        self._dy = self.seg_p1[:, 1] - self._y0
+        self._ll = np.maximum(self._dx ** 2 + self._dy ** 2, 1e-12)
+
+    # --- coordinates ---
+    def lonlat_to_xy(self, lon, lat):
+        if self.projection is None:
+            raise ValueError("Network has no UTM projection (projParameter); geo queries unavailable")
+        x, y = utm_forward(lon, lat, *self.projection)
+        return x + self.net_offset[0], y + self.net_offset[1]
+
+    def xy_to_lonlat(self, x, y):
+        if self.projection is None:
+            raise ValueError("Network has no UTM projection (projParameter); geo queries unavailable")
+        return utm_inverse(np.asarray(x) - self.net_offset[0], np.asarray(y) - self.net_offset[1],
+                           *self.projection)
+
+    # --- candidates ---
+    def _candidates(self, x, y, r: float):
+        """(point index, segment index) pairs for all segments in the cells within r of each point."""
+        k = int(np.ceil(r / self.cell))
+        cx = np.floor((x - self.origin[0]) / self.cell).astype(np.int64)
+        cy = np.floor((y - self.origin[1]) / self.cell).astype(np.int64)
+        off = np.arange(-k, k + 1)
+        ox, oy = np.meshgrid(off, off)
+        gx = cx[:, None] + ox.ravel()[None, :]
+        gy = cy[:, None] + oy.ravel()[None, :]
+        # only cells whose rectangle comes within r of the point
+        fx = (x - self.origin[0])[:, None] - gx * self.cell
+        fy = (y - self.origin[1])[:, None] - gy * self.cell
+        ex = np.maximum(np.maximum(-fx, fx - self.cell), 0.0)
+        ey = np.maximum(np.maximum(-fy, fy - self.cell), 0.0)
+        ok = ((gx >= 0) & (gx < self.dims[0]) & (gy >= 0) & (gy < self.dims[1])
+              & (ex * ex + ey * ey <= r * r))
+        pt = np.broadcast_to(np.arange(len(x))[:, None], gx.shape)[ok]
+        cells = (gy * self.dims[0] + gx)[ok]
+        start, stop = self.cell_ptr[cells], self.cell_ptr[cells + 1]
+        n = stop - start
+        pt = np.repeat(pt, n)
+        pos = np.repeat(start - (np.cumsum(n) - n), n) + np.arange(int(n.sum()))
+        return pt, self.cell_seg[pos].astype(np.int64)
+
+    def _pairs(self, x, y, r: float):
+        """Candidate pairs within r: (point index, segment index, distance, t), grouped by point."""
+        pt, seg = self._candidates(x, y, r)
+        d, t = _point_segment(x[pt], y[pt], self._x0[seg], self._y0[seg], self._dx[seg], self._dy[seg],
+                              self._ll[seg])
+        hit = d <= r
+        return pt[hit], seg[hit], d[hit], t[hit]
+
+    # --- queries ---
+    def nearest(self, x, y, max_dist: float = 200.0) -> dict:
+        """Nearest lane per point (lane / edge -1 and NaN distance if none within max_dist)."""
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        n = len(x)
+        res = {"lane": np.full(n, -1, np.int64), "dist": np.full(n, np.nan), "pos": np.full(n, np.nan),
+               "x": np.full(n, np.nan), "y": np.full(n, np.nan)}
+        todo = np.arange(n)
+        r = self.cell
+        while len(todo):
+            r = min(r, max_dist)
+            pt, seg, d, t = self._pairs(x[todo], y[todo], r)
+            if len(pt):
+                # pairs come grouped by point: per-group minimum, then its first pair
+                starts = np.flatnonzero(np.r_[True, pt[1:] != pt[:-1]])
+                dmin = np.minimum.reduceat(d, starts)
+                at_min = np.flatnonzero(d == np.repeat(dmin, np.diff(np.r_[starts, len(pt)])))
+                _, first = np.unique(pt[at_min], return_index=True)
+                first = at_min[first]
+                idx = todo[pt[first]]
+                s, t = seg[first], t[first]
+                p0, p1 = self.seg_p0[s], self.seg_p1[s]
+                res["lane"][idx] = self.seg_lane[s]
+                res["dist"][idx] = d[first]
+                res["pos"][idx] = self.seg_offset[s] + t * np.hypot(*(p1 - p0).T)
+                res["x"][idx] = p0[:, 0] + t * (p1[:, 0] - p0[:, 0])
+                res["y"][idx] = p0[:, 1] + t * (p1[:, 1] - p0[:, 1])
+            if r >= max_dist:
+                break
+            done = np.zeros(len(todo), dtype=bool)
+            done[pt] = True
+            todo = todo[~done]
+            r *= 2
+        res["edge"] = np.where(res["lane"] >= 0, self.lane_edge[np.maximum(res["lane"], 0)], -1)
+        return res
+
+    def radius(self, x, y, r: float):
+        """(point index, edge index, distance) for every edge within r of a point (closest lane)."""
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        pt, seg, d, _t = self._pairs(x, y, r)
+        edge = self.lane_edge[self.seg_lane[seg]].astype(np.int64)
+        order = np.lexsort((d, edge, pt))
+        pt, edge, d = pt[order], edge[order], d[order]
+        first = np.r_[True, (pt[1:] != pt[:-1]) | (edge[1:] != edge[:-1])] if len(pt) else np.zeros(0, bool)
+        return pt[first], edge[first], d[first]
+
+    def bbox(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Edge indices with at least one segment crossing the rectangle."""
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        c0 = np.floor((np.array([x0, y0]) - self.origin) / self.cell).astype(np.int64).clip(0, self.dims - 1)
+        c1 = np.floor((np.array([x1, y1]) - self.origin) / self.cell).astype(np.int64).clip(0, self.dims - 1)
+        gx, gy = np.meshgrid(np.arange(c0[0], c1[0] + 1), np.arange(c0[1], c1[1] + 1))
+        cells = (gy * self.dims[0] + gx).ravel()
+        n = self.cell_ptr[cells + 1] - self.cell_ptr[cells]
+        pos = np.repeat(self.cell_ptr[cells] - (np.cumsum(n) - n), n) + np.arange(int(n.sum()))
+        seg = np.unique(self.cell_seg[pos])
+        p0, p1 = self.seg_p0[seg], self.seg_p1[seg]
+        # separating axes: x, y, and the segment's normal (rectangle corners all on one side)
+        overlap = ((np.minimum(p0[:, 0], p1[:, 0]) <= x1) & (np.maximum(p0[:, 0], p1[:, 0]) >= x0)
+                   & (np.minimum(p0[:, 1], p1[:, 1]) <= y1) & (np.maximum(p0[:, 1], p1[:, 1]) >= y0))
+        d = p1 - p0
+        corners = np.array([[x0, y0], [x0, y1], [x1, y0], [x1, y1]])
+        side = (d[:, None, 0] * (corners[None, :, 1] - p0[:, None, 1])
+                - d[:, None, 1] * (corners[None, :, 0] - p0[:, None, 0]))
+        crosses = overlap & ~((side > 0).all(axis=1) | (side < 0).all(axis=1))
+        return np.unique(self.lane_edge[self.seg_lane[seg[crosses]]])
+
+def load_spatial(net_path: Path = NET_FILE, rebuild: bool = False, cell: float = CELL_M,
+                 all_lanes: bool = False) -> SpatialIndex:
+    """The saved index of net_path, rebuilt if missing, built from another net file or options."""
+    net_path = Path(net_path)
+    path = cache_path(net_path)
+    if not rebuild and path.exists() and net_path.exists():
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+        same = (meta.get("version") == FORMAT_VERSION and meta.get("cell") == cell
+                and meta.get("all_lanes") == all_lanes)
+        if same and (meta.get("stamp") == _stamp(net_path) or meta.get("sha1") == file_sha1(net_path)):
+            return SpatialIndex(path)
+    return SpatialIndex(build(net_path, path, cell, all_lanes))
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def edge_groups() -> dict:
+    """edge -> road group name from kpi_by_road.EDGE_GROUPS (RoadEdge.txt)."""
+    from kpi_by_road import EDGE_GROUPS
+    return {e: g for g, edges in EDGE_GROUPS.items() for e in edges}
+
+def map_points(idx: SpatialIndex, csv_in: Path, csv_out: Path, max_dist: float):
+    """Snap the lat/lon rows of a CSV to edges; writes the rows with edge / lane / distance / group added."""
+    with Path(csv_in).open("r", newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        raise SystemExit(f"[ERROR] {csv_in}: no rows")
+    cols = {c.lower(): c for c in rows[0]}
+    lat_c = cols.get("lat") or cols.get("latitude")
+    lon_c = cols.get("lon") or cols.get("lng") or cols.get("longitude")
+    if not lat_c or not lon_c:
+        raise SystemExit(f"[ERROR] {csv_in}: needs lat and lon columns")
+    lon = np.array([float(r[lon_c]) for r in rows])
+    lat = np.array([float(r[lat_c]) for r in rows])
+    t0 = time.perf_counter()
+    hit = idx.nearest(*idx.lonlat_to_xy(lon, lat), max_dist=max_dist)
+    ms = 1000 * (time.perf_counter() - t0)
+    groups = edge_groups()
+    out = Path(csv_out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    fields = list(rows[0]) + ["edge", "lane", "dist_m", "pos_m", "group"]
+    with out.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        for i, r in enumerate(rows):
+            found = hit["lane"][i] >= 0
+            edge = str(idx.edge_ids[hit["edge"][i]]) if found else ""
+            w.writerow({**r, "edge": edge, "lane": str(idx.lane_ids[hit["lane"][i]]) if found else "",
+                        "dist_m": round(float(hit["dist"][i]), 2) if found else "",
+                        "pos_m": round(float(hit["pos"][i]), 2) if found else "", "group": groups.get(edge, "")})
+    missed = int((hit["lane"] < 0).sum())
+    print(f"[OK] Wrote {out}: {len(rows)} points mapped in {ms:.1f} ms"
+          + (f", {missed} without a lane within {max_dist:.0f} m" if missed else ""))
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Spatial index over SUMO lane shapes (nearest / radius / bbox)")
+    ap.add_argument("--net", default=str(NET_FILE), help="SUMO network (.net.xml)")
+    ap.add_argument("--rebuild", action="store_true", help="Rebuild even if the saved index is current")
+    ap.add_argument("--cell", type=float, default=CELL_M, help="Grid cell size (m)")
+    ap.add_argument("--all-lanes", action="store_true", help="Also index internal and footway lanes")
+    ap.add_argument("--points", default=None, help="CSV with lat / lon columns to map to edges")
+    ap.add_argument("--out", default="out/field_points_edges.csv", help="Output CSV for --points")
+    ap.add_argument("--lonlat", default=None, help="One point 'lon,lat' to query")
+    ap.add_argument("--xy", default=None, help="One point 'x,y' (net coordinates) to query")
+    ap.add_argument("--radius", type=float, default=None, help="With --lonlat/--xy: list edges within this radius")
+    ap.add_argument("--bbox", default=None, help="'x0,y0,x1,y1' (net coordinates): list edges crossing it")
+    ap.add_argument("--max-dist", type=float, default=200.0, help="Nearest-lane search limit (m)")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    t0 = time.perf_counter()
+    idx = load_spatial(Path(args.net), args.rebuild, args.cell, args.all_lanes)
+    print(f"[OK] {cache_path(Path(args.net))}: {len(idx.lane_ids)} lanes, {len(idx.seg_p0)} segments, "
+          f"grid {idx.dims[0]}x{idx.dims[1]} of {idx.cell:.0f} m in {time.perf_counter() - t0:.2f}s")
+
+    if args.points:
+        map_points(idx, Path(args.points), Path(args.out), args.max_dist)
+
+    if args.lonlat or args.xy:
+        if args.lonlat:
+            lon, lat = (float(v) for v in args.lonlat.split(","))
+            x, y = idx.lonlat_to_xy(np.array([lon]), np.array([lat]))
+        else:
+            x, y = (np.array([float(v)]) for v in args.xy.split(","))
+        hit = idx.nearest(x, y, args.max_dist)
+        if hit["lane"][0] < 0:
+            print(f"[WARN] No lane within {args.max_dist:.0f} m of ({x[0]:.1f}, {y[0]:.1f})")
+        else:
+            print(f"[INFO] ({x[0]:.1f}, {y[0]:.1f}) -> edge {idx.edge_ids[hit['edge'][0]]} lane "
+                  f"{idx.lane_ids[hit['lane'][0]]}, {hit['dist'][0]:.1f} m away, pos {hit['pos'][0]:.1f} m")
+        if args.radius:
+            _pt, edges, dist = idx.radius(x, y, args.radius)
+            print(f"[INFO] {len(edges)} edges within {args.radius:.0f} m: "
+                  + ", ".join(f"{idx.edge_ids[e]} ({d:.1f} m)" for e, d in zip(edges, dist)))
+
+    if args.bbox:
+        x0, y0, x1, y1 = (float(v) for v in args.bbox.split(","))
+        edges = idx.bbox(x0, y0, x1, y1)
+        print(f"[INFO] {len(edges)} edges cross the box: " + ", ".join(str(idx.edge_ids[e]) for e in edges))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# osm_index.py
+# Highway-class index of an OSM extract, joined to the SUMO network's edge IDs.
+# - net/map.osm is read in one streaming pass (iterparse, every top-level element cleared
+#   as soon as it is complete): nodes and relations are skipped, only the tags of
+#   highway ways are kept, so memory grows with the number of roads, not the file size.
+# - Per way: highway class, lanes and maxspeed (km/h; "30 mph" converted; "none", "walk"
+#   ... -> NaN), oneway.
+# - SUMO edges are joined by their OSM prefix: "498169188#0", "-498169188#3" and
+#   "498169188#0-AddedOnRampEdge" all map to way 498169188. Edges whose way is not in the
+#   extract fall back to the net's edge type ("highway.residential"), without lanes or
+#   maxspeed from OSM.
+# - The index is cached as <osm>.index.npz (plain arrays: sorted way IDs with their
+#   attributes, edge IDs with their way row) stamped with the size / mtime of both inputs
+#   and rebuilt only when one changes. OsmIndex turns it into dicts, so lookups per edge
+#   are O(1).
+# - Weights per edge from config/flows.yaml type_weights (the demand weights by highway
+#   type); "primary_link" etc. use the weight of their base class.
+#
+# Usage:
+#   python scripts/osm_index.py                       # build / refresh the cache, print a summary
+#   python scripts/osm_index.py --csv out/edge_osm.csv --weights config/flows.yaml
+#   python scripts/osm_index.py --edge 498169188#0 --edge=-10262594#2
+#   from osm_index import load_index; idx = load_index(); idx.edge("498169188#0")["highway"]
+
+import re
+import json
+import time
+import argparse
+import csv
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OSM_FILE = PROJECT_ROOT / "net" / "map.osm"
+NET_FILE = PROJECT_ROOT / "net" / "network.net.xml"
+FLOWS_YAML = PROJECT_ROOT / "config" / "flows.yaml"
+
+FORMAT_VERSION = 1
+WAY_PREFIX_RE = re.compile(r"^-?(\d+)")
+SPEED_RE = re.compile(r"^\s*([0-9.]+)\s*(mph|km/h|kmh|kph)?\s*$")
+
+def cache_path(osm_path: Path) -> Path:
+    return Path(osm_path).with_name(Path(osm_path).name + ".index.npz")
+
+def _stamp(path: Path) -> list:
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+def parse_maxspeed(value: str | None) -> float:
+    """'50' -> 50.0, '30 mph' -> 48.28, anything else (none, signals, walk ...) -> NaN."""
+    m = SPEED_RE.match(value or "")
+    if not m:
+        return float("nan")
+    v = float(m.group(1))
+    return v * 1.609344 if m.group(2) == "mph" else v
+
+def parse_lanes(value: str | None) -> float:
+    """'2' -> 2.0, '2;3' -> 2.0 (first value), missing / invalid -> NaN."""
+    try:
+        return float((value or "").split(";")[0])
+    except ValueError:
+        return float("nan")
+
+def edge_way_id(edge_id: str) -> int:
+    """OSM way ID from a SUMO edge ID, -1 if it has no numeric prefix (internal, cluster ...)."""
+    m = WAY_PREFIX_RE.match(edge_id)
+    return int(m.group(1)) if m else -1
+
+def scan_ways(osm_path: Path):
+    """Stream the OSM file; returns (way_ids, highway, lanes, maxspeed, oneway) lists of highway ways."""
+    ids, hw, lanes, speed, oneway = [], [], [], [], []
+    context = ET.iterparse(str(osm_path), events=("start", "end"))
+    _, root = next(context)
+    depth = 1
+    for ev, el in context:
+        if ev == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if el.tag == "way":
+            tags = {t.get("k"): t.get("v") for t in el.iter("tag")}
+            if "highway" in tags:
+                ids.append(int(el.get("id")))
+                hw.append(tags["highway"])
+                lanes.append(parse_lanes(tags.get("lanes")))
+                speed.append(parse_maxspeed(tags.get("maxspeed")))
+                oneway.append(tags.get("oneway") in ("yes", "true", "1", "-1"))
+        root.clear()
+    return ids, hw, lanes, speed, oneway
+
+def scan_edges(net_path: Path):
+    """(edge id, edge type) of every non-internal edge in a .net.xml, streamed."""
+    out = []
+    context = ET.iterparse(str(net_path), events=("start", "end"))
+    _, root = next(context)
+    depth = 1
+    for ev, el in context:
+        if ev == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if el.tag == "edge" and el.get("function") != "internal":
+            out.append((el.get("id"), el.get("type", "")))
+        root.clear()
+    return out
+
+def build(osm_path: Path = OSM_FILE, net_path: Path = NET_FILE, out: Path | None = None) -> Path:
+    """Parse both files and write the npz index; returns its path."""
+    osm_path, net_path = Path(osm_path), Path(net_path)
+    for p in (osm_path, net_path):
+        if not p.exists():
+            raise SystemExit(f"[ERROR] Missing {p}")
+    ids, hw, lanes, speed, oneway = scan_ways(osm_path)
+    classes = sorted(set(hw))
+    code = {c: i for i, c in enumerate(classes)}
+    order = np.argsort(np.array(ids, dtype=np.int64), kind="stable")
+    way_ids = np.array(ids, dtype=np.int64)[order]
+    way_class = np.array([code[c] for c in hw], dtype=np.int16)[order]
+
+    edges = scan_edges(net_path)
+    edge_ids = np.array([e for e, _ in edges], dtype=str)
+    prefix = np.array([edge_way_id(e) for e, _ in edges], dtype=np.int64)
+    pos = np.searchsorted(way_ids, prefix)
+    pos = np.minimum(pos, max(len(way_ids) - 1, 0))
+    found = way_ids[pos] == prefix if len(way_ids) else np.zeros(len(prefix), dtype=bool)
+    edge_row = np.where(found, pos, -1).astype(np.int32)
+    # class from the net's edge type where the way is not in the extract
+    net_class = np.array([t.split(".", 1)[1] if t.startswith("highway.") else "" for _, t in edges], dtype=str)
+
+    meta = {"version": FORMAT_VERSION, "osm": str(osm_path.resolve()), "net": str(net_path.resolve()),
+            "osm_stamp": _stamp(osm_path), "net_stamp": _stamp(net_path)}
+    out = Path(out) if out else cache_path(osm_path)
+    tmp = out.with_name(out.name + ".part.npz")
+    np.savez(tmp, meta=np.array(json.dumps(meta)), classes=np.array(classes, dtype=str),
+             way_ids=way_ids, way_class=way_class,
+             way_lanes=np.array(lanes, dtype=np.float32)[order],
+             way_maxspeed=np.array(speed, dtype=np.float32)[order],
+             way_oneway=np.array(oneway, dtype=bool)[order],
+             edge_ids=edge_ids, edge_way=prefix, edge_row=edge_row, edge_net_class=net_class)
+    tmp.replace(out)
+    return out
+
+class OsmIndex:
+    """Loaded index; edge() / way() are dict lookups."""
+
+    def __init__(self, npz_path: Path):
+        with np.load(npz_path) as z:
+            self.meta = json.loads(str(z["meta"]))
+            self.classes = [str(c) for c in z["classes"]]
+            self.way_ids = z["way_ids"]
+            self.way_class = z["way_class"]
+            self.way_lanes = z["way_lanes"]
+            self.way_maxspeed = z["way_maxspeed"]
+            self.way_oneway = z["way_oneway"]
+            self.edge_ids = z["edge_ids"]
+            self.edge_way = z["edge_way"]
+            self.edge_row = z["edge_row"]
+            self.edge_net_class = z["edge_net_class"]
+        self._way_row = {int(w): i for i, w in enumerate(self.way_ids.tolist())}
+        self._edges = {}
+        for e, way, row, net_cls in zip(self.edge_ids.tolist(), self.edge_way.tolist(),
+                                        self.edge_row.tolist(), self.edge_net_class.tolist()):
+            if row >= 0:
+                self._edges[e] = self._way_attrs(row)
+            else:
+                self._edges[e] = {"way": way if way >= 0 else None, "highway": net_cls or None,
+                                  "lanes": None, "maxspeed_kmh": None, "oneway": None, "source": "net"}
+
+    def _way_attrs(self, row: int) -> dict:
+        lanes, speed = float(self.way_lanes[row]), float(self.way_maxspeed[row])
+        return {"way": int(self.way_ids[row]), "highway": self.classes[self.way_class[row]],
+                "lanes": None if np.isnan(lanes) else lanes,
+                "maxspeed_kmh": None if np.isnan(speed) else round(speed, 2),
+                "oneway": bool(self.way_oneway[row]), "source": "osm"}
+
+    def __len__(self):
+        return len(self._edges)
+
+    def __contains__(self, edge_id: str):
+        return edge_id in self._edges
+
+    def edge(self, edge_id: str) -> dict | None:
+        """Attributes of a SUMO edge: way, highway, lanes, maxspeed_kmh, oneway, source (osm|net)."""
+        return self._edges.get(edge_id)
+
+    def way(self, way_id: int) -> dict | None:
+        row = self._way_row.get(int(way_id))
+        return None if row is None else self._way_attrs(row)
+
+    def edges(self):
+        return self._edges.items()
+
+    def class_counts(self) -> dict:
+        counts = {}
+        for attrs in self._edges.values():
+            counts[attrs["highway"]] = counts.get(attrs["highway"], 0) + 1
+        return dict(sorted(counts.items(), key=lambda kv: -kv[1]))
+
+    def weights(self, type_weights: dict, default: float = 0.0) -> dict:
+        """edge -> demand weight by highway class ('*_link' falls back to its base class)."""
+        out = {}
+        for e, attrs in self._edges.items():
+            hw = attrs["highway"] or ""
+            w = type_weights.get(hw)
+            if w is None and hw.endswith("_link"):
+                w = type_weights.get(hw[:-len("_link")])
+            out[e] = float(default if w is None else w)
+        return out
+
+def load_index(osm_path: Path = OSM_FILE, net_path: Path = NET_FILE, rebuild: bool = False) -> OsmIndex:
+    """The cached index, rebuilt first if missing, stale or rebuild=True."""
+    path = cache_path(osm_path)
+    if not rebuild and path.exists():
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+        fresh = (meta.get("version") == FORMAT_VERSION and Path(osm_path).exists() and Path(net_path).exists()
+                 and meta.get("osm_stamp") == _stamp(osm_path) and meta.get("net_stamp") == _stamp(net_path)
+                 and meta.get("net") == str(Path(net_path).resolve()))
+        if fresh:
+            return OsmIndex(path)
+    return OsmIndex(build(osm_path, net_path, path))
+
+def read_type_weights(yaml_path: Path) -> dict:
+    """type_weights mapping from a flows.yaml (needs PyYAML)."""
+    try:
+        import yaml
+    except ImportError:
+        raise SystemExit("[ERROR] Reading --weights needs PyYAML (pip install pyyaml)")
+    with Path(yaml_path).open("r", encoding="utf-8-sig") as f:
+        cfg = yaml.safe_load(f) or {}
+    return {str(k): float(v) for k, v in (cfg.get("type_weights") or {}).items()}
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Index OSM highway attributes by SUMO edge ID")
+    ap.add_argument("--osm", default=str(OSM_FILE), help="OSM extract (.osm)")
+    ap.add_argument("--net", default=str(NET_FILE), help="SUMO network built from it")
+    ap.add_argument("--rebuild", action="store_true", help="Rebuild even if the cache is current")
+    ap.add_argument("--edge", action="append", default=[], help="Print the attributes of this edge (repeatable)")
+    ap.add_argument("--weights", nargs="?", const=str(FLOWS_YAML), default=None,
+                    help="flows.yaml with type_weights (default config/flows.yaml), adds a weight column to --csv")
+    ap.add_argument("--csv", default=None, help="Write one row per edge to this CSV")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    t0 = time.perf_counter()
+    idx = load_index(Path(args.osm), Path(args.net), args.rebuild)
+    from_osm = sum(1 for _, a in idx.edges() if a["source"] == "osm")
+    print(f"[OK] {cache_path(Path(args.osm))}: {len(idx.way_ids)} highway ways, {len(idx)} edges "
+          f"({from_osm} joined to OSM) in {time.perf_counter() - t0:.2f}s")
+    print("[INFO] Edges per class: " + ", ".join(f"{k}={v}" for k, v in idx.class_counts().items()))
+
+    for e in args.edge:
+        attrs = idx.edge(e)
+        print(f"{e}: {attrs}" if attrs else f"[WARN] {e}: not an edge of {args.net}")
+
+    if args.csv:
+        weights = idx.weights(read_type_weights(Path(args.weights))) if args.weights else None
+        out = Path(args.csv)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with out.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["edge", "way", "highway", "lanes", "maxspeed_kmh", "oneway", "source"]
+                       + (["weight"] if weights else []))
+            for e, a in idx.edges():
+                w.writerow([e, a["way"], a["highway"], a["lanes"], a["maxspeed_kmh"], a["oneway"], a["source"]]
+                           + ([weights[e]] if weights else []))
+        print(f"[OK] Wrote {out}")
+
+if __name__ == "__main__":
+    main()
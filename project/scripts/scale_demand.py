@@ -0,0 +1,445 @@
+# scale_demand.py
+# Rescale the demand of a SUMO route / trip file for load testing, in one streaming pass:
+#   - a time-of-day profile (piecewise-constant factors over simulation time) times a
+#     global --scale gives the demand factor f(t)
+#   - <flow> elements are split at the profile breakpoints inside [begin, end) and each
+#     piece's rate is multiplied by f (vehsPerHour, period, period="exp(r)", probability,
+#     number); a probability pushed above 1 becomes several parallel flows
+#   - single <vehicle> / <trip> elements are thinned or duplicated by f(depart): floor(f)
+#     copies plus one more with probability frac(f) (seeded, so repeatable)
+#   - vTypes, routes, comments and everything else are copied unchanged
+# The file is read with a pull parser and every top-level element is dropped as soon as
+# it is complete. Elements with a start time (flow begin, vehicle / trip depart) go out
+# through a heap of up to --sort-buffer elements keyed by that time, so the output is
+# sorted by departure as SUMO requires (it ignores out-of-order flows), even though a
+# split flow's later pieces and unsorted inputs break the input order; vTypes, routes and
+# other definitions are written at once, i.e. never after the vehicles using them. Memory
+# is bounded by the buffer; inputs more out of order than that are reported.
+# --check runs SUMO (with --cfg) on the scaled file and fails if it ignored any element.
+# --sweep writes one scaled scenario per factor in parallel (and, with --cfg, a matching
+# .sumocfg per scenario with its outputs in its own folder) for capacity sweeps.
+#
+# Profile: comma-separated TIME=FACTOR, TIME in seconds or HH:MM (clock time, mapped with
+# --clock-start = the clock time of simulation time 0); the factor of the first entry
+# also applies before it.
+#
+# Usage:
+#   python scripts/scale_demand.py routes/four_roads_ramped.rou.xml --scale 2 -o routes/four_roads_x2.rou.xml
+#   python scripts/scale_demand.py routes/four_roads_ramped.rou.xml --clock-start 07:30 \
+#       --profile "07:30=1.0,08:00=1.8,08:20=1.2" -o routes/four_roads_peak.rou.xml
+#   python scripts/scale_demand.py routes/four_roads_ramped.rou.xml --profile "0=1,300=3,900=0.5" \
+#       -o /tmp/peak.rou.xml --cfg north_test.sumocfg --check
+#   python scripts/scale_demand.py routes/four_roads_ramped.rou.xml --sweep 1 2 3 5 \
+#       --cfg north_test.sumocfg --out-dir runs/demand_sweep --workers 4
+
+import os
+import re
+import math
+import heapq
+import shutil
+import argparse
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+READ_BYTES = 1 << 20
+FLOW_RATES = ("vehsPerHour", "period", "probability", "number")
+SINGLE_TAGS = ("vehicle", "trip")
+FLOW_TAGS = ("flow", "personFlow", "containerFlow")
+SORT_BUFFER = 100_000
+EXP_RE = re.compile(r"exp\(\s*([0-9.eE+-]+)\s*\)")
+ROOT_RE = re.compile(r"<(routes|trips)\b[^>]*>", re.S)
+
+ET.register_namespace("xsi", "http://www.w3.org/2001/XMLSchema-instance")
+
+def parse_time(s: str, clock_start: float = 0.0) -> float:
+    """'600' -> 600.0 s; 'HH:MM[:SS]' -> seconds after --clock-start."""
+    s = s.strip()
+    if ":" in s:
+        parts = [float(p) for p in s.split(":")]
+        clock = parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0.0)
+        return clock - clock_start
+    return float(s)
+
+def parse_profile(spec: str | None, clock_start: float = 0.0):
+    """'0=1,600=2.5' -> (breakpoints array, factors array), sorted by time."""
+    if not spec:
+        return np.array([0.0]), np.array([1.0])
+    pts = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        t, sep, f = item.partition("=")
+        if not sep:
+            raise SystemExit(f"[ERROR] Profile entry '{item}' is not TIME=FACTOR")
+        factor = float(f)
+        if factor < 0:
+            raise SystemExit(f"[ERROR] Negative factor in profile entry '{item}'")
+        pts.append((parse_time(t, clock_start), factor))
+    pts.sort()
+    return np.array([p[0] for p in pts]), np.array([p[1] for p in pts])
+
+class Profile:
+    """Demand factor f(t) = scale * piecewise-constant profile."""
+
+    def __init__(self, times, factors, scale: float = 1.0):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.factors = np.asarray(factors, dtype=np.float64) * scale
+
+    def at(self, t: float) -> float:
+        i = int(np.searchsorted(self.times, t, side="right")) - 1
+        return float(self.factors[max(i, 0)])
+
+    def pieces(self, begin: float, end: float):
+        """[(b, e, factor)] covering [begin, end), split at the breakpoints."""
+        cuts = [begin] + [float(t) for t in self.times if begin < t < end] + [end]
+        return [(b, e, self.at(b)) for b, e in zip(cuts[:-1], cuts[1:]) if e > b]
+
+def _fmt(x: float) -> str:
+    return f"{x:.6g}" if x != int(x) else str(int(x))
+
+class Transformer:
+    """Per-element rules; counts what went in and what came out."""
+
+    def __init__(self, profile: Profile, seed: int = 0, step: float = 1.0):
+        self.profile = profile
+        self.rng = np.random.default_rng(seed)
+        self.step = step
+        self.stats = {"vehicles_in": 0, "vehicles_out": 0, "flows_in": 0, "flows_out": 0,
+                      "expected_in": 0.0, "expected_out": 0.0, "unscaled": 0}
+
+    def _round(self, x: float) -> int:
+        """Stochastic rounding: floor(x) + 1 with probability frac(x)."""
+        base = math.floor(x)
+        return int(base + (self.rng.random() < x - base))
+
+    def _expected(self, attrs: dict, begin: float, end: float) -> float:
+        dur = max(end - begin, 0.0)
+        if "vehsPerHour" in attrs:
+            return float(attrs["vehsPerHour"]) * dur / 3600.0
+        if "period" in attrs:
+            m = EXP_RE.fullmatch(attrs["period"].strip())
+            rate = float(m.group(1)) if m else 1.0 / float(attrs["period"])
+            return rate * dur
+        if "probability" in attrs:
+            return float(attrs["probability"]) * dur / self.step
+        if "number" in attrs:
+            return float(attrs["number"])
+        return 0.0
+
+    def elements(self, el: ET.Element):
+        """Transformed copies of one top-level element (attribute dicts applied to el in turn)."""
+        if el.tag == "flow":
+            yield from self._flow(el)
+        elif el.tag in SINGLE_TAGS:
+            yield from self._single(el)
+        else:
+            yield el
+
+    def _single(self, el: ET.Element):
+        self.stats["vehicles_in"] += 1
+        try:
+            depart = float(el.get("depart", "0"))
+        except ValueError:
+            # triggered / containerTriggered / now ...: not tied to a time, keep as is
+            self.stats["unscaled"] += 1
+            self.stats["vehicles_out"] += 1
+            yield el
+            return
+        copies = self._round(self.profile.at(depart))
+        vid = el.get("id")
+        for k in range(copies):
+            el.set("id", vid if k == 0 else f"{vid}_x{k}")
+            self.stats["vehicles_out"] += 1
+            yield el
+        el.set("id", vid)
+
+    def _flow(self, el: ET.Element):
+        self.stats["flows_in"] += 1
+        attrs = dict(el.attrib)
+        rate_key = next((k for k in FLOW_RATES if k in attrs), None)
+        begin = float(attrs.get("begin", 0.0))
+        if rate_key is None or ("end" not in attrs and rate_key != "number"):
+            self.stats["unscaled"] += 1
+            self.stats["flows_out"] += 1
+            yield el
+            return
+        if "end" not in attrs:
+            # number-only flow without end: no time span to split, scale the count
+            end = begin
+            pieces = [(begin, None, self.profile.at(begin))]
+        else:
+            end = float(attrs["end"])
+            pieces = self.profile.pieces(begin, end)
+        self.stats["expected_in"] += self._expected(attrs, begin, end)
+
+        fid = attrs["id"]
+        total_len = sum(e - b for b, e, _ in pieces if e is not None) or 1.0
+        out = []
+        for k, (b, e, f) in enumerate(pieces):
+            if f <= 0:
+                continue
+            a = {key: val for key, val in attrs.items() if key not in FLOW_RATES}
+            a["id"] = fid if len(pieces) == 1 else f"{fid}_s{k}"
+            a["begin"] = _fmt(b)
+            if e is not None:
+                a["end"] = _fmt(e)
+            val = attrs[rate_key]
+            if rate_key == "vehsPerHour":
+                a["vehsPerHour"] = _fmt(float(val) * f)
+            elif rate_key == "period":
+                m = EXP_RE.fullmatch(val.strip())
+                a["period"] = f"exp({float(m.group(1)) * f:.6g})" if m else _fmt(float(val) / f)
+            elif rate_key == "number":
+                share = (e - b) / total_len if e is not None else 1.0
+                n = self._round(float(val) * share * f)
+                if n <= 0:
+                    continue
+                a["number"] = str(n)
+            else:
+                p = float(val) * f
+                copies = max(1, math.ceil(p))
+                for c in range(copies):
+                    ac = dict(a, probability=_fmt(p / copies))
+                    if copies > 1:
+                        ac["id"] = f"{a['id']}_c{c}"
+                    out.append(ac)
+                continue
+            out.append(a)
+
+        for a in out:
+            el.attrib.clear()
+            el.attrib.update(a)
+            self.stats["flows_out"] += 1
+            self.stats["expected_out"] += self._expected(a, float(a["begin"]),
+                                                         float(a.get("end", a["begin"])))
+            yield el
+        el.attrib.clear()
+        el.attrib.update(attrs)
+
+def start_time(el: ET.Element):
+    """Time SUMO sorts a top-level element by (flow begin / depart), or None for definitions."""
+    try:
+        if el.tag in FLOW_TAGS:
+            return float(el.get("begin", 0.0))
+        if "depart" in el.attrib:
+            return float(el.get("depart"))
+    except ValueError:
+        pass  # depart="triggered" etc.
+    return None
+
+class DepartureOrder:
+    """Writes timed elements in (time, input order) through a bounded heap; others straight away."""
+
+    def __init__(self, fout, capacity: int = SORT_BUFFER):
+        self.fout = fout
+        self.capacity = max(int(capacity), 1)
+        self.heap = []
+        self.seq = 0
+        self.last = -math.inf
+        self.late = 0
+
+    def write(self, text: str, t: float | None = None):
+        if t is None:
+            self.fout.write(text)
+            return
+        heapq.heappush(self.heap, (t, self.seq, text))
+        self.seq += 1
+        if len(self.heap) > self.capacity:
+            self._pop()
+
+    def _pop(self):
+        t, _, text = heapq.heappop(self.heap)
+        if t < self.last:
+            self.late += 1  # arrived after the buffer had already moved past its time
+        self.last = max(self.last, t)
+        self.fout.write(text)
+
+    def flush(self):
+        while self.heap:
+            self._pop()
+
+def _root_tags(src: Path):
+    """(verbatim root start tag, root tag name) from the head of the file."""
+    with src.open("r", encoding="utf-8") as f:
+        head = f.read(1 << 16)
+    m = ROOT_RE.search(head)
+    if not m:
+        raise SystemExit(f"[ERROR] {src}: no <routes> or <trips> root element")
+    return m.group(0), m.group(1)
+
+def transform(src: Path, dst: Path, profile: Profile, seed: int = 0, step: float = 1.0,
+              sort_buffer: int = SORT_BUFFER) -> dict:
+    """Stream src -> dst with the demand scaled by profile, sorted by departure; returns the counters."""
+    src, dst = Path(src), Path(dst)
+    start_tag, root_name = _root_tags(src)
+    tr = Transformer(profile, seed, step)
+    parser = ET.XMLPullParser(events=("start", "end", "comment"))
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".part")
+    depth = 0
+    root = None
+    with src.open("rb") as fin, tmp.open("w", encoding="utf-8", newline="\n") as fout:
+        fout.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fout.write(start_tag + "\n")
+        order = DepartureOrder(fout, sort_buffer)
+        for block in iter(lambda: fin.read(READ_BYTES), b""):
+            parser.feed(block)
+            for ev, el in parser.read_events():
+                if ev == "start":
+                    if root is None:
+                        root = el
+                    depth += 1
+                elif ev == "comment":
+                    # comments are reported but not kept in the tree
+                    if depth == 1:
+                        order.write(f"\n  <!--{el.text}-->\n")
+                else:
+                    depth -= 1
+                    if depth == 1:
+                        tail, el.tail = el.tail, None
+                        for out in tr.elements(el):
+                            order.write("  " + ET.tostring(out, encoding="unicode").strip() + "\n",
+                                        start_time(out))
+                        el.tail = tail
+                        root.remove(el)
+        parser.close()
+        order.flush()
+        fout.write(f"\n</{root_name}>\n")
+    tmp.replace(dst)
+    tr.stats["late"] = order.late
+    return tr.stats
+
+def write_cfg(cfg: Path, routes: Path, dst: Path, out_dir: Path):
+    """Copy of cfg that uses routes (absolute paths) and writes its outputs into out_dir."""
+    tree = ET.parse(cfg)
+    base = cfg.resolve().parent
+    root = tree.getroot()
+    for el in root.iter():
+        if el.tag == "net-file" or el.tag.endswith("-files") or el.tag == "additional-files":
+            el.set("value", ",".join(str((base / v.strip()).resolve()) for v in el.get("value", "").split(",")
+                                     if v.strip()))
+        if el.tag.endswith("-output"):
+            el.set("value", str((out_dir / Path(el.get("value", "out.xml")).name).resolve()))
+    files = root.find("./input/route-files")
+    if files is None:
+        raise SystemExit(f"[ERROR] {cfg} has no <route-files>")
+    files.set("value", str(routes.resolve()))
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tree.write(dst, encoding="UTF-8", xml_declaration=True)
+
+def check_with_sumo(cfg: Path, routes: Path) -> dict:
+    """Run SUMO on cfg with routes in place of its route files (outputs to a temp folder).
+
+    Returns {"inserted": n, "ignored": [ids SUMO skipped as out of departure order]}.
+    """
+    sumo_home = os.environ.get("SUMO_HOME")
+    binary = str(Path(sumo_home) / "bin" / "sumo") if sumo_home else shutil.which("sumo")
+    if not binary:
+        raise SystemExit("[ERROR] --check needs SUMO (set SUMO_HOME or put sumo on PATH)")
+    with tempfile.TemporaryDirectory(prefix="scale_check_") as tmp:
+        tmp_cfg = Path(tmp) / "check.sumocfg"
+        write_cfg(Path(cfg), Path(routes), tmp_cfg, Path(tmp) / "out")
+        proc = subprocess.run([binary, "-c", str(tmp_cfg), "--no-step-log", "true",
+                               "--duration-log.statistics", "true"], capture_output=True, text=True)
+    log = proc.stdout + proc.stderr
+    if proc.returncode != 0:
+        raise SystemExit(f"[ERROR] SUMO failed on {routes}:\n{log[-2000:]}")
+    ignored = re.findall(r"sorted by departure time, ignoring '([^']*)'", log)
+    m = re.search(r"Inserted:\s*(\d+)", log)
+    return {"inserted": int(m.group(1)) if m else -1, "ignored": ignored}
+
+def _check(cfg: Path, routes: Path):
+    res = check_with_sumo(cfg, routes)
+    if res["ignored"]:
+        raise SystemExit(f"[ERROR] SUMO ignored {len(res['ignored'])} out-of-order element(s) in {routes}, "
+                         f"e.g. {', '.join(res['ignored'][:5])}")
+    print(f"[OK] SUMO check: {routes} loads in order, {res['inserted']} vehicles inserted")
+
+def _sweep_job(job: dict) -> dict:
+    profile = Profile(job["times"], job["factors"], job["scale"])
+    t0 = time.perf_counter()
+    stats = transform(Path(job["src"]), Path(job["dst"]), profile, job["seed"], job["step"], job["sort_buffer"])
+    if job["cfg"]:
+        write_cfg(Path(job["cfg"]), Path(job["dst"]), Path(job["cfg_out"]), Path(job["sim_out"]))
+    return {**job, **stats, "seconds": time.perf_counter() - t0}
+
+def _report(src, dst, stats: dict, seconds: float):
+    ratio = stats["expected_out"] / stats["expected_in"] if stats["expected_in"] else float("nan")
+    print(f"[OK] {src} -> {dst}: vehicles {stats['vehicles_in']} -> {stats['vehicles_out']}, "
+          f"flows {stats['flows_in']} -> {stats['flows_out']}, flow demand "
+          f"{stats['expected_in']:.0f} -> {stats['expected_out']:.0f} veh (x{ratio:.2f}) in {seconds:.2f}s")
+    if stats["unscaled"]:
+        print(f"[INFO] {stats['unscaled']} element(s) without a time or rate were copied unscaled")
+    if stats["late"]:
+        print(f"[WARN] {stats['late']} element(s) could not be put in departure order; "
+              f"raise --sort-buffer (SUMO ignores out-of-order flows)")
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Stream a SUMO route file and rescale its demand")
+    ap.add_argument("routes", help="*.rou.xml / *.trips.xml to transform")
+    ap.add_argument("-o", "--out", default=None, help="Output route file (single scale)")
+    ap.add_argument("--scale", type=float, default=1.0, help="Global demand factor")
+    ap.add_argument("--profile", default=None, help="Time-of-day factors, e.g. '0=1,600=2.5,1200=0.8'")
+    ap.add_argument("--clock-start", default="00:00", help="Clock time of simulation time 0 (for HH:MM entries)")
+    ap.add_argument("--seed", type=int, default=7, help="Seed for thinning / duplication")
+    ap.add_argument("--step", type=float, default=1.0, help="Step length, for probability flows' expected counts")
+    ap.add_argument("--sweep", type=float, nargs="+", default=None, help="Write one scenario per global factor")
+    ap.add_argument("--out-dir", default="runs/demand_sweep", help="Folder for --sweep scenarios")
+    ap.add_argument("--cfg", default=None,
+                    help="With --sweep: also write a .sumocfg per scenario from this one; the cfg for --check")
+    ap.add_argument("--check", action="store_true",
+                    help="Run SUMO (--cfg) on each scaled file and fail if it ignores elements as unsorted")
+    ap.add_argument("--sort-buffer", type=int, default=SORT_BUFFER,
+                    help="Timed elements held to restore departure order (bounds memory)")
+    ap.add_argument("--workers", type=int, default=0, help="Parallel scenarios (0 = all cores)")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    src = Path(args.routes)
+    if not src.exists():
+        raise SystemExit(f"[ERROR] Missing {src}")
+    times, factors = parse_profile(args.profile, parse_time(args.clock_start))
+    if args.check and not args.cfg:
+        raise SystemExit("[ERROR] --check needs --cfg")
+
+    if not args.sweep:
+        dst = Path(args.out) if args.out else src.with_name(src.name.replace(".rou.", f".x{_fmt(args.scale)}.rou."))
+        if dst.resolve() == src.resolve():
+            raise SystemExit("[ERROR] Output would overwrite the input")
+        t0 = time.perf_counter()
+        stats = transform(src, dst, Profile(times, factors, args.scale), args.seed, args.step, args.sort_buffer)
+        _report(src, dst, stats, time.perf_counter() - t0)
+        if args.check:
+            _check(Path(args.cfg), dst)
+        return
+
+    out_dir = Path(args.out_dir)
+    stem = src.name.split(".")[0]
+    jobs = []
+    for scale in args.sweep:
+        name = f"{stem}_x{_fmt(scale)}"
+        jobs.append({"src": str(src), "dst": str(out_dir / f"{name}.rou.xml"), "scale": scale,
+                     "times": times.tolist(), "factors": factors.tolist(), "seed": args.seed, "step": args.step,
+                     "sort_buffer": args.sort_buffer,
+                     "cfg": args.cfg, "cfg_out": str(out_dir / f"{name}.sumocfg"),
+                     "sim_out": str(out_dir / f"{name}_out")})
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers or None) as pool:
+        for res in pool.map(_sweep_job, jobs):
+            _report(src, res["dst"], res, res["seconds"])
+            if res["cfg"]:
+                print(f"[OK] Wrote {res['cfg_out']}")
+            if args.check:
+                _check(Path(args.cfg), Path(res["dst"]))
+    print(f"[INFO] {len(jobs)} scenarios in {time.perf_counter() - t0:.1f}s wall")
+
+if __name__ == "__main__":
+    main()
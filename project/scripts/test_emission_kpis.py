@@ -0,0 +1,77 @@
+import unittest
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+# Make emission_kpis.py / kpi_by_road.py importable whatever the working directory
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+if scripts_dir not in sys.path:
+    sys.path.insert(0, scripts_dir)
+
+from emission_kpis import summarize_lanedata
+from kpi_by_road import EDGE_GROUPS
+
+PROJECT_ROOT = Path(scripts_dir).parent
+
+def _sumo_binary():
+    sumo_home = os.environ.get("SUMO_HOME")
+    if sumo_home and (Path(sumo_home) / "bin" / "sumo").exists():
+        return str(Path(sumo_home) / "bin" / "sumo")
+    return shutil.which("sumo")
+
+def _trips_by_group(tripinfo: Path) -> Counter:
+    """Finished trips per RoadDir of their departure edge."""
+    edge_to_group = {e: g for g, edges in EDGE_GROUPS.items() for e in edges}
+    text = tripinfo.read_text(encoding="utf-8")
+    return Counter(edge_to_group.get(lane.rsplit("_", 1)[0], "Other")
+                   for lane in re.findall(r'<tripinfo [^>]*departLane="([^"]*)"', text))
+
+class TestLaneThroughput(unittest.TestCase):
+
+    def test_chain_counts_each_vehicle_once(self):
+        # 10 vehicles drive North_up end to end: every inner edge passes all of them on
+        chain = EDGE_GROUPS["North_up"]
+        lanes = []
+        for k, edge in enumerate(chain):
+            last = k == len(chain) - 1
+            lanes.append(f'        <lane id="{edge}_0" sampledSeconds="50.00" waitingTime="0.00" '
+                         f'timeLoss="1.00" occupancy="1.00" departed="{10 if k == 0 else 0}" '
+                         f'arrived="{10 if last else 0}" entered="{0 if k == 0 else 10}" '
+                         f'left="{0 if last else 10}"/>')
+        xml = ("<meandata>\n"
+               '    <interval begin="0.00" end="300.00" id="lanes">\n'
+               '        <edge id="x">\n' + "\n".join(lanes) + "\n        </edge>\n"
+               "    </interval>\n</meandata>\n")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "laneData.xml"
+            path.write_text(xml, encoding="utf-8")
+            rows, _ = summarize_lanedata(path)
+        row = next(r for r in rows if r["RoadDir"] == "North_up")
+        self.assertEqual(row["Throughput_veh"], 10.0)
+
+    @unittest.skipUnless(_sumo_binary(), "SUMO not installed")
+    def test_throughput_matches_tripinfo(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            subprocess.run([_sumo_binary(), "-c", str(PROJECT_ROOT / "north_test.sumocfg"),
+                            "--no-step-log", "true", "--no-warnings", "true",
+                            "--tripinfo-output", str(tmp / "tripinfo.xml"),
+                            "--lanedata-output", str(tmp / "laneData.xml"),
+                            "--summary-output", str(tmp / "summary.xml"),
+                            "--edgedata-output", str(tmp / "edgeData.xml"),
+                            "--emission-output", str(tmp / "emissions.xml")],
+                           check=True, capture_output=True)
+            rows, _ = summarize_lanedata(tmp / "laneData.xml")
+            trips = _trips_by_group(tmp / "tripinfo.xml")
+        self.assertTrue(trips)
+        for r in rows:
+            with self.subTest(road=r["RoadDir"]):
+                self.assertEqual(r["Throughput_veh"], float(trips[r["RoadDir"]]))
+
+if __name__ == "__main__":
+    unittest.main()
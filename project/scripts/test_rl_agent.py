@@ -5,7 +5,7 @@ import sys
 import os
 
 # Add the directory containing dqn_agent.py to sys.path so it can be imported
-agent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'your_agent_folder'))
+agent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ai'))
 if agent_dir not in sys.path:
     sys.path.insert(0, agent_dir)
 
@@ -0,0 +1,296 @@
+# trip_binary.py
+# Convert SUMO tripinfo.xml / edgeData.xml / summary.xml into a compact binary store
+# that later analysis passes open instantly instead of re-parsing XML:
+#   <name>.bin/records.npy   fixed-width NumPy structured array, one row per element
+#                            (float64 values, int32 counts and string codes)
+#   <name>.bin/keys.npy      UTF-8 blob of the per-row IDs (trip / vehicle ids) ...
+#   <name>.bin/key_offsets.npy   ... and their int64 offsets (string table)
+#   <name>.bin/meta.json     kind, fields, vocabularies (vType, edge, lane ids), source size/mtime
+# records.npy is opened with np.load(mmap_mode="r"), so KPIs read columns zero-copy.
+# Conversion runs in parallel: the XML is split into byte ranges on element (line)
+# boundaries, each worker scans its range with xml_scan.Scanner (the <interval>
+# context of a range is looked up backwards), and the parts are stitched into the
+# final arrays. kpi_by_road.py uses a fresh store automatically.
+#
+# Usage:
+#   python scripts/trip_binary.py out/tripinfo.xml out/edgeData.xml out/summary.xml --workers 8
+#   python scripts/trip_binary.py --info out/tripinfo.bin
+
+import os
+import json
+import shutil
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from xml_scan import CHUNK_BYTES, Scanner, chunks, context_before, to_float
+
+FORMAT_VERSION = 1
+
+# kind -> root tag, element tag, optional context (<interval>) and fields:
+#   "key" = per-row string (string table), "vocab" = repeated string (int32 code), else a NumPy dtype
+KINDS = {
+    "tripinfo": {
+        "root": b"tripinfos", "tag": b"tripinfo", "ctx": None,
+        "fields": [("id", "key"), ("vType", "vocab"), ("depart", "f8"), ("arrival", "f8"),
+                   ("duration", "f8"), ("routeLength", "f8"), ("waitingTime", "f8"), ("waitingCount", "i4"),
+                   ("timeLoss", "f8"), ("departDelay", "f8"), ("speedFactor", "f8"), ("rerouteNo", "i4"),
+                   ("departLane", "vocab"), ("arrivalLane", "vocab")],
+    },
+    "edgedata": {
+        "root": b"meandata", "tag": b"edge", "ctx": (b"interval", [("begin", "f8"), ("end", "f8")]),
+        "fields": [("id", "vocab"), ("sampledSeconds", "f8"), ("nVehContrib", "f8"), ("traveltime", "f8"),
+                   ("density", "f8"), ("occupancy", "f8"), ("waitingTime", "f8"), ("timeLoss", "f8"),
+                   ("speed", "f8"), ("speedRelative", "f8"), ("departed", "i4"), ("arrived", "i4"),
+                   ("entered", "i4"), ("left", "i4")],
+    },
+    "summary": {
+        "root": b"summary", "tag": b"step", "ctx": None,
+        "fields": [("time", "f8"), ("loaded", "i4"), ("inserted", "i4"), ("running", "i4"), ("waiting", "i4"),
+                   ("ended", "i4"), ("arrived", "i4"), ("collisions", "i4"), ("teleports", "i4"),
+                   ("halting", "i4"), ("stopped", "i4"), ("meanWaitingTime", "f8"), ("meanTravelTime", "f8"),
+                   ("meanSpeed", "f8"), ("meanSpeedRelative", "f8")],
+    },
+}
+
+def record_dtype(kind: str) -> np.dtype:
+    spec = KINDS[kind]
+    cols = [(n, "f8") for n, _ in spec["ctx"][1]] if spec["ctx"] else []
+    for n, t in spec["fields"]:
+        if t != "key":
+            cols.append((n, "i4" if t == "vocab" else t))
+    return np.dtype(cols)
+
+def detect_kind(xml_path: Path) -> str:
+    with Path(xml_path).open("rb") as f:
+        head = f.read(1 << 16)
+    for kind, spec in KINDS.items():
+        if b"<" + spec["root"] + b" " in head or b"<" + spec["root"] + b">" in head:
+            return kind
+    raise SystemExit(f"[ERROR] {xml_path}: not a tripinfo / edgeData / summary output")
+
+def store_path(xml_path: Path) -> Path:
+    return Path(xml_path).with_suffix(".bin")
+
+def _source_stamp(xml_path: Path) -> dict:
+    st = Path(xml_path).stat()
+    return {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+def _split_points(xml_path: Path, parts: int, tag: bytes):
+    """Byte offsets of <tag> line starts, ~evenly spaced (first 0, last the file size)."""
+    size = Path(xml_path).stat().st_size
+    points = [0]
+    with Path(xml_path).open("rb") as f:
+        for k in range(1, parts):
+            pos = size * k // parts
+            if pos <= points[-1]:
+                continue
+            f.seek(pos)
+            f.readline()  # to the next line start
+            while True:
+                line_start = f.tell()
+                line = f.readline()
+                if not line or line.lstrip().startswith(b"<" + tag + b" "):
+                    break
+            if line and line_start > points[-1]:
+                points.append(line_start)
+    return points + [size]
+
+def _convert_range(job):
+    """Worker: scan bytes [start, end) into a part file; returns (n, part, local vocabs)."""
+    spec = KINDS[job["kind"]]
+    path = Path(job["xml"])
+    ctx_tag, ctx_fields = spec["ctx"] if spec["ctx"] else (None, [])
+    names = [n.encode() for n, _ in spec["fields"]]
+    scanner = Scanner(path, spec["tag"], names, ctx_tag, [n.encode() for n, _ in ctx_fields])
+    if ctx_tag and job["start"] > 0:
+        scanner.set_context(context_before(path, job["start"], ctx_tag))
+    dtype = record_dtype(job["kind"])
+    vocabs = {n: {} for n, t in spec["fields"] if t == "vocab"}
+    parts, keys = [], []
+    for data in chunks(path, job["start"], job["end"], job.get("chunk_bytes", CHUNK_BYTES)):
+        ctx, items = scanner.scan(data)
+        n = len(items[names[0]])
+        if not n:
+            continue
+        rec = np.zeros(n, dtype=dtype)
+        for cname, _ in ctx_fields:
+            rec[cname] = to_float(ctx[cname.encode()])
+        for name, t in spec["fields"]:
+            col = items[name.encode()]
+            if t == "key":
+                keys.append(col)
+            elif t == "vocab":
+                uniq, inv = np.unique(col, return_inverse=True)
+                voc = vocabs[name]
+                lut = np.array([voc.setdefault(u.decode("utf-8"), len(voc)) for u in uniq], dtype=np.int32)
+                rec[name] = lut[inv]
+            else:
+                rec[name] = to_float(col)
+        parts.append(rec)
+    records = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    part = Path(job["part"])
+    np.save(part.with_suffix(".records.npy"), records)
+    if keys:
+        k = np.concatenate(keys)
+        np.save(part.with_suffix(".keys.npy"), np.frombuffer(b"".join(k.tolist()), dtype=np.uint8))
+        np.save(part.with_suffix(".keylen.npy"), np.char.str_len(k).astype(np.int64))
+    return len(records), str(part), {n: list(v) for n, v in vocabs.items()}
+
+def convert(xml_path: Path, out: Path | None = None, workers: int = 0, kind: str | None = None,
+            chunk_bytes: int = CHUNK_BYTES) -> Path:
+    """Convert one SUMO output into a binary store directory; returns its path."""
+    xml_path = Path(xml_path)
+    if not xml_path.exists():
+        raise SystemExit(f"[ERROR] Missing {xml_path}")
+    kind = kind or detect_kind(xml_path)
+    spec = KINDS[kind]
+    out = Path(out) if out else store_path(xml_path)
+    workers = workers or os.cpu_count() or 1
+    size = xml_path.stat().st_size
+    n_parts = max(1, min(workers * 2, size // (8 << 20) or 1))
+    # ranges start at element lines, possibly inside an <interval>: workers look its context up backwards
+    points = _split_points(xml_path, n_parts, spec["tag"])
+
+    tmp = out.with_name(out.name + ".part")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    jobs = [{"kind": kind, "xml": str(xml_path), "start": a, "end": b, "part": str(tmp / f"part{i:04d}"),
+             "chunk_bytes": chunk_bytes} for i, (a, b) in enumerate(zip(points[:-1], points[1:]))]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as ex:
+            results = list(ex.map(_convert_range, jobs))
+    else:
+        results = [_convert_range(j) for j in jobs]
+
+    # global vocabularies in order of first appearance, local codes remapped per part
+    vocab = {n: {} for n, t in spec["fields"] if t == "vocab"}
+    for _, _, local in results:
+        for n, words in local.items():
+            for w in words:
+                vocab[n].setdefault(w, len(vocab[n]))
+    total = sum(n for n, _, _ in results)
+    dtype = record_dtype(kind)
+    records = np.lib.format.open_memmap(tmp / "records.npy", mode="w+", dtype=dtype, shape=(total,))
+    has_key = any(t == "key" for _, t in spec["fields"])
+    key_lens = []
+    pos = 0
+    for n, part, local in results:
+        part = Path(part)
+        rec = np.load(part.with_suffix(".records.npy"))
+        for name, words in local.items():
+            lut = np.array([vocab[name][w] for w in words], dtype=np.int32)
+            if len(lut):
+                rec[name] = lut[rec[name]]
+        records[pos:pos + n] = rec
+        pos += n
+        if has_key and part.with_suffix(".keylen.npy").exists():
+            key_lens.append(np.load(part.with_suffix(".keylen.npy")))
+    records.flush()
+    del records
+    if has_key:
+        lens = np.concatenate(key_lens) if key_lens else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(lens) + 1, dtype=np.int64)
+        np.cumsum(lens, out=offsets[1:])
+        np.save(tmp / "key_offsets.npy", offsets)
+        blob = np.lib.format.open_memmap(tmp / "keys.npy", mode="w+", dtype=np.uint8, shape=(int(offsets[-1]),))
+        at = 0
+        for _, part, _ in results:
+            kp = Path(part).with_suffix(".keys.npy")
+            if kp.exists():
+                k = np.load(kp)
+                blob[at:at + len(k)] = k
+                at += len(k)
+        blob.flush()
+        del blob
+    for p in tmp.glob("part*"):
+        p.unlink()
+
+    meta = {"format": FORMAT_VERSION, "kind": kind, "n": total, "dtype": dtype.descr,
+            "key_field": next((n for n, t in spec["fields"] if t == "key"), None),
+            "vocab": {n: list(v) for n, v in vocab.items()},
+            "source": str(xml_path), **_source_stamp(xml_path),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+class BinaryStore:
+    """Memory-mapped view of a converted output."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise SystemExit(f"[ERROR] {self.path}: store format {self.meta.get('format')}, expected {FORMAT_VERSION}")
+        self.kind = self.meta["kind"]
+        self.records = np.load(self.path / "records.npy", mmap_mode="r")
+        self._keys = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def vocab(self, field: str):
+        return self.meta["vocab"][field]
+
+    def decode(self, field: str) -> np.ndarray:
+        """Strings of a vocab field, one per row."""
+        return np.asarray(self.vocab(field), dtype=object)[self.records[field]]
+
+    def key(self, i: int) -> str:
+        if self._keys is None:
+            self._keys = (np.load(self.path / "keys.npy", mmap_mode="r"),
+                          np.load(self.path / "key_offsets.npy", mmap_mode="r"))
+        blob, off = self._keys
+        return bytes(blob[off[i]:off[i + 1]]).decode("utf-8")
+
+def open_store(path: Path) -> BinaryStore:
+    return BinaryStore(path)
+
+def fresh_store(xml_path: Path):
+    """The store converted from xml_path if it is still current (or the XML is gone), else None."""
+    xml_path = Path(xml_path)
+    cand = xml_path if (xml_path / "meta.json").exists() else store_path(xml_path)
+    if not (cand / "meta.json").exists():
+        return None
+    store = BinaryStore(cand)
+    if cand != xml_path and xml_path.exists():
+        stamp = _source_stamp(xml_path)
+        if any(store.meta.get(k) != v for k, v in stamp.items()):
+            return None
+    return store
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Convert SUMO XML outputs to memory-mappable binary stores")
+    ap.add_argument("xml", nargs="*", help="tripinfo.xml / edgeData.xml / summary.xml files")
+    ap.add_argument("--workers", type=int, default=0, help="parallel workers (default: all cores)")
+    ap.add_argument("--out", default=None, help="store directory (single input only; default <name>.bin)")
+    ap.add_argument("--info", default=None, help="print a store's metadata")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    if args.info:
+        st = open_store(Path(args.info))
+        meta = {k: v for k, v in st.meta.items() if k != "vocab"}
+        meta["vocab_sizes"] = {k: len(v) for k, v in st.meta["vocab"].items()}
+        print(json.dumps(meta, indent=2))
+        return
+    if not args.xml:
+        raise SystemExit("[ERROR] Give at least one XML file (or --info STORE)")
+    if args.out and len(args.xml) > 1:
+        raise SystemExit("[ERROR] --out works with a single input")
+    for x in args.xml:
+        t0 = time.perf_counter()
+        out = convert(Path(x), Path(args.out) if args.out else None, workers=args.workers)
+        st = open_store(out)
+        disk = sum(p.stat().st_size for p in out.iterdir())
+        print(f"[OK] {x} -> {out}: {len(st)} {st.kind} records, {Path(x).stat().st_size / 1e6:.1f} MB -> "
+              f"{disk / 1e6:.1f} MB in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# trip_diff.py
+# Trip-level comparison of two or more runs: which vehicles got faster or slower, and where.
+# - Every run's tripinfo.xml is opened as a trip_binary store (converted on first use, reused
+#   while fresh), so the columns are memory-mapped NumPy arrays and the vehicle IDs a string
+#   table (blob + offsets).
+# - Hash join on the vehicle id: a 64-bit FNV-1a hash of every id is computed column-wise
+#   (one vectorised pass per character position); both runs are split into 2^k partitions by
+#   the hash's top bits, and each partition is joined on its own (sort + searchsorted), with
+#   the matched ids compared byte for byte, so hash collisions cannot pair the wrong trips.
+#   Only one partition's rows are ever gathered from the memory maps (--partition-rows), so
+#   memory stays bounded however many trips the runs have.
+# - Per matched vehicle: deltas (run - baseline) of duration, waitingTime and timeLoss.
+#   Group-bys are np.unique / bincount partials per partition, merged at the end:
+#     by vType, by departure time bin (--bin s, baseline depart) and by route (origin ->
+#     destination edge of the baseline trip; unfinished trips have no destination).
+# - The first run is the baseline; every other run is compared with it.
+#
+# Usage:
+#   python scripts/trip_diff.py runs/baseline/out/tripinfo.xml runs/ai/out/tripinfo.xml --out out/trip_diff
+#   python scripts/trip_diff.py runs/paired/s1/fixed runs/paired/s1/rule --bin 600 --worst 100
+#
+# Outputs (in --out, per compared run <name>):
+#   summary.csv               one row per compared run: matched / missing trips, mean and p50 / p95 deltas
+#   <name>_by_vtype.csv       per vType: trips, baseline / run means and mean deltas, share worse / better
+#   <name>_by_depart.csv      the same per departure time bin
+#   <name>_by_route.csv       the same per origin -> destination edge pair
+#   <name>_worst.csv          the --worst trips with the largest --rank delta
+
+import csv
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from trip_binary import convert, fresh_store
+
+METRICS = ["duration", "waitingTime", "timeLoss"]
+PARTITION_ROWS = 2_000_000
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+# ---------------------------------------------------------------------------
+# Loading and hashing
+# ---------------------------------------------------------------------------
+
+def open_run(path: Path, workers: int = 0):
+    """Fresh tripinfo store of a run: a tripinfo.xml, its .bin store, or a run folder holding either."""
+    path = Path(path)
+    if path.is_dir() and not (path / "meta.json").exists():
+        path = path / "tripinfo.xml" if (path / "tripinfo.xml").exists() else path / "tripinfo.bin"
+    store = fresh_store(path)
+    if store is None:
+        if not path.exists():
+            raise SystemExit(f"[ERROR] Missing {path}")
+        t0 = time.perf_counter()
+        store = fresh_store(convert(path, workers=workers))
+        print(f"[INFO] Converted {path} ({len(store)} records, {time.perf_counter() - t0:.1f}s)")
+    if store.kind != "tripinfo":
+        raise SystemExit(f"[ERROR] {path}: a {store.kind} store, expected tripinfo")
+    return store
+
+def run_name(path: Path) -> str:
+    path = Path(path)
+    if path.is_dir():
+        return path.name
+    return path.parent.name if path.stem in ("tripinfo", "tripinfos") else path.stem
+
+def key_table(store):
+    """(blob uint8, offsets int64) of the store's vehicle ids."""
+    return (np.load(store.path / "keys.npy", mmap_mode="r"), np.load(store.path / "key_offsets.npy", mmap_mode="r"))
+
+def key_hashes(blob: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """64-bit FNV-1a hash of every key, one vectorised pass per character position."""
+    start = np.asarray(offsets[:-1], dtype=np.int64)
+    lens = np.diff(offsets)
+    h = np.full(len(lens), FNV_OFFSET, dtype=np.uint64)
+    if not len(lens):
+        return h
+    last = max(len(blob) - 1, 0)
+    for p in range(int(lens.max())):
+        active = lens > p
+        byte = blob[np.minimum(start + p, last)].astype(np.uint64)
+        h = np.where(active, (h ^ byte) * FNV_PRIME, h)
+    return h
+
+def keys_equal(blob_a, off_a, ia: np.ndarray, blob_b, off_b, ib: np.ndarray) -> np.ndarray:
+    """Byte-wise equality of key ia of one table and key ib of another (vectorised over pairs)."""
+    la = off_a[ia + 1] - off_a[ia]
+    same = la == off_b[ib + 1] - off_b[ib]
+    if not same.any():
+        return same
+    for p in range(int(la[same].max())):
+        check = same & (la > p)
+        if not check.any():
+            break
+        sa = blob_a[off_a[ia[check]] + p]
+        sb = blob_b[off_b[ib[check]] + p]
+        same[np.flatnonzero(check)[sa != sb]] = False
+    return same
+
+# ---------------------------------------------------------------------------
+# Join and aggregation
+# ---------------------------------------------------------------------------
+
+class GroupAcc:
+    """Partial group-by results (key, trips, sums) collected per partition and merged at the end."""
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, keys: np.ndarray, base: np.ndarray, delta: np.ndarray, worse: np.ndarray, better: np.ndarray):
+        if not len(keys):
+            return
+        u, inv = np.unique(keys, return_inverse=True)
+        cols = [np.bincount(inv, minlength=len(u))]
+        cols += [np.bincount(inv, base[:, m], len(u)) for m in range(base.shape[1])]
+        cols += [np.bincount(inv, delta[:, m], len(u)) for m in range(delta.shape[1])]
+        cols += [np.bincount(inv, worse, len(u)), np.bincount(inv, better, len(u))]
+        self.parts.append((u, np.column_stack(cols)))
+
+    def result(self):
+        """(keys, table): table columns = trips, base sums (M), delta sums (M), worse, better."""
+        if not self.parts:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 3 + 2 * len(METRICS)))
+        keys = np.concatenate([k for k, _ in self.parts])
+        vals = np.concatenate([v for _, v in self.parts])
+        u, inv = np.unique(keys, return_inverse=True)
+        out = np.zeros((len(u), vals.shape[1]))
+        np.add.at(out, inv, vals)
+        return u, out
+
+class RunDiff:
+    """Partitioned hash join of a run against the baseline, with its group-bys."""
+
+    def __init__(self, base, run, name: str, bin_s: float, rank: str, worst: int, tol: float,
+                 partition_rows: int = PARTITION_ROWS):
+        self.base, self.run, self.name = base, run, name
+        self.bin_s, self.rank, self.worst, self.tol = bin_s, rank, worst, tol
+        n = max(len(base), len(run), 1)
+        self.bits = max(0, int(np.ceil(np.log2(n / partition_rows)))) if n > partition_rows else 0
+
+        # shared vocabularies: vType names and edges (from lane ids) across both stores
+        self.vtypes = sorted(set(base.vocab("vType")) | set(run.vocab("vType")))
+        vt_code = {v: i for i, v in enumerate(self.vtypes)}
+        self.base_vt = np.array([vt_code[v] for v in base.vocab("vType")] or [0], dtype=np.int64)
+        lanes = list(base.vocab("departLane")) + list(base.vocab("arrivalLane"))
+        self.edges = sorted({ln.rsplit("_", 1)[0] if ln else "" for ln in lanes})
+        e_code = {e: i for i, e in enumerate(self.edges)}
+        self.dep_edge = np.array([e_code[ln.rsplit("_", 1)[0] if ln else ""] for ln in base.vocab("departLane")]
+                                 or [0], dtype=np.int64)
+        self.arr_edge = np.array([e_code[ln.rsplit("_", 1)[0] if ln else ""] for ln in base.vocab("arrivalLane")]
+                                 or [0], dtype=np.int64)
+
+    def _partitions(self, h: np.ndarray):
+        """Row indices of every partition (top `bits` bits of the hash)."""
+        if self.bits == 0:
+            yield np.arange(len(h))
+            return
+        part = (h >> np.uint64(64 - self.bits)).astype(np.int64)
+        order = np.argsort(part, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(part, minlength=1 << self.bits))])
+        for k in range(1 << self.bits):
+            yield order[bounds[k]:bounds[k + 1]]
+
+    def compute(self) -> dict:
+        t0 = time.perf_counter()
+        blob_a, off_a = key_table(self.base)
+        blob_b, off_b = key_table(self.run)
+        ha, hb = key_hashes(blob_a, off_a), key_hashes(blob_b, off_b)
+        t_hash = time.perf_counter() - t0
+
+        groups = {"vtype": GroupAcc(), "depart": GroupAcc(), "route": GroupAcc()}
+        deltas, worst = [], []
+        matched = collisions = 0
+        rank_m = METRICS.index(self.rank)
+        n_edges = max(len(self.edges), 1)
+        for ia, ib in zip(self._partitions(ha), self._partitions(hb)):
+            if not len(ia) or not len(ib):
+                continue
+            order = np.argsort(ha[ia], kind="stable")
+            sa = ha[ia][order]
+            pos = np.searchsorted(sa, hb[ib])
+            hit = pos < len(sa)
+            hit[hit] = sa[pos[hit]] == hb[ib][hit]
+            ra, rb = ia[order[pos[hit]]], ib[hit]
+            ok = keys_equal(blob_a, off_a, ra, blob_b, off_b, rb)
+            collisions += int((~ok).sum())
+            ra, rb = ra[ok], rb[ok]
+            # gather only this partition's matched rows (sorted reads from the memory maps)
+            sort_a = np.argsort(ra)
+            ra, rb = ra[sort_a], rb[sort_a]
+            a, b = self.base.records[ra], self.run.records[rb]
+            base_v = np.column_stack([a[m] for m in METRICS])
+            delta = np.column_stack([b[m] - a[m] for m in METRICS])
+            worse = (delta[:, rank_m] > self.tol).astype(np.float64)
+            better = (delta[:, rank_m] < -self.tol).astype(np.float64)
+            groups["vtype"].add(self.base_vt[a["vType"]], base_v, delta, worse, better)
+            groups["depart"].add(np.floor(a["depart"] / self.bin_s).astype(np.int64), base_v, delta, worse, better)
+            od = self.dep_edge[a["departLane"]] * n_edges + self.arr_edge[a["arrivalLane"]]
+            groups["route"].add(od, base_v, delta, worse, better)
+            deltas.append(delta.astype(np.float32))
+            if self.worst:
+                k = min(self.worst, len(ra))
+                top = np.lexsort((ra, -delta[:, rank_m]))[:k]  # ties: baseline order
+                worst.append((ra[top], rb[top], delta[top], base_v[top]))
+            matched += len(ra)
+
+        d = np.concatenate(deltas) if deltas else np.zeros((0, len(METRICS)), dtype=np.float32)
+        summary = {"run": self.name, "baseline_trips": len(self.base), "run_trips": len(self.run),
+                   "matched": matched, "only_baseline": len(self.base) - matched,
+                   "only_run": len(self.run) - matched, "hash_collisions": collisions,
+                   "partitions": 1 << self.bits}
+        for m, name in enumerate(METRICS):
+            summary[f"{name}_delta_avg"] = round(float(d[:, m].mean()), 3) if len(d) else ""
+            summary[f"{name}_delta_p50"] = round(float(np.percentile(d[:, m], 50)), 3) if len(d) else ""
+            summary[f"{name}_delta_p95"] = round(float(np.percentile(d[:, m], 95)), 3) if len(d) else ""
+        summary["worse_share"] = round(float((d[:, rank_m] > self.tol).mean()), 4) if len(d) else 0.0
+        summary["better_share"] = round(float((d[:, rank_m] < -self.tol).mean()), 4) if len(d) else 0.0
+        summary["hash_s"] = round(t_hash, 2)
+        summary["join_s"] = round(time.perf_counter() - t0 - t_hash, 2)
+        self.summary = summary
+        self.groups = {g: acc.result() for g, acc in groups.items()}
+        self.worst_rows = self._worst(worst)
+        return summary
+
+    def _worst(self, cands) -> list:
+        if not cands:
+            return []
+        ra = np.concatenate([c[0] for c in cands])
+        rb = np.concatenate([c[1] for c in cands])
+        delta = np.concatenate([c[2] for c in cands])
+        base_v = np.concatenate([c[3] for c in cands])
+        m = METRICS.index(self.rank)
+        top = np.lexsort((ra, -delta[:, m]))[:self.worst]
+        rows = []
+        for i in top:
+            a = self.base.records[ra[i]]
+            row = {"id": self.base.key(int(ra[i])), "vType": self.base.vocab("vType")[a["vType"]],
+                   "depart": float(a["depart"]), "route": self._route_label(int(a["departLane"]), int(a["arrivalLane"]))}
+            for k, name in enumerate(METRICS):
+                row[f"base_{name}"] = round(float(base_v[i, k]), 2)
+                row[f"delta_{name}"] = round(float(delta[i, k]), 2)
+            rows.append(row)
+        return rows
+
+    def _route_label(self, dep_code: int, arr_code: int) -> str:
+        dep = self.edges[self.dep_edge[dep_code]]
+        arr = self.edges[self.arr_edge[arr_code]]
+        return f"{dep or '?'} -> {arr or '(unfinished)'}"
+
+    def group_rows(self, group: str) -> list:
+        keys, t = self.groups[group]
+        n_edges = max(len(self.edges), 1)
+        M = len(METRICS)
+        rows = []
+        for key, v in zip(keys.tolist(), t):
+            if group == "vtype":
+                label = {"vType": self.vtypes[key]}
+            elif group == "depart":
+                label = {"depart_from_s": key * self.bin_s, "depart_to_s": (key + 1) * self.bin_s}
+            else:
+                dep, arr = divmod(key, n_edges)
+                label = {"from_edge": self.edges[dep] or "?", "to_edge": self.edges[arr] or "(unfinished)"}
+            n = v[0]
+            row = {**label, "trips": int(n)}
+            for m, name in enumerate(METRICS):
+                base = v[1 + m] / n
+                d = v[1 + M + m] / n
+                row[f"base_{name}_avg"] = round(base, 3)
+                row[f"run_{name}_avg"] = round(base + d, 3)
+                row[f"delta_{name}_avg"] = round(d, 3)
+            row["worse_share"] = round(v[1 + 2 * M] / n, 4)
+            row["better_share"] = round(v[2 + 2 * M] / n, 4)
+            rows.append(row)
+        if group == "route":
+            rows.sort(key=lambda r: -r["trips"] * abs(r[f"delta_{self.rank}_avg"]))
+        return rows
+
+def write_csv(path: Path, rows: list):
+    if not rows:
+        return
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Per-vehicle trip comparison of runs (first run = baseline)")
+    ap.add_argument("runs", nargs="+", help="tripinfo.xml files, their .bin stores or run folders")
+    ap.add_argument("--out", default="out/trip_diff", help="Output folder")
+    ap.add_argument("--bin", type=float, default=300.0, help="Departure time bin (s)")
+    ap.add_argument("--rank", choices=METRICS, default="timeLoss", help="Metric for worse / better and --worst")
+    ap.add_argument("--tol", type=float, default=1.0, help="A trip is worse / better beyond this delta (s)")
+    ap.add_argument("--worst", type=int, default=50, help="Trips listed in <name>_worst.csv")
+    ap.add_argument("--partition-rows", type=int, default=PARTITION_ROWS, help="Rows per join partition")
+    ap.add_argument("--workers", type=int, default=0, help="Workers for XML conversion (default: all cores)")
+    args = ap.parse_args()
+    if len(args.runs) < 2:
+        ap.error("give a baseline and at least one run to compare")
+    return args
+
+def main():
+    args = _parse_args()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    stores = [open_run(Path(r), args.workers) for r in args.runs]
+    names = []
+    for r in args.runs:
+        n = run_name(Path(r))
+        names.append(n if n not in names else f"{n}_{len(names)}")
+    print(f"[INFO] Baseline {names[0]}: {len(stores[0])} trips")
+
+    summaries = []
+    for store, name in zip(stores[1:], names[1:]):
+        diff = RunDiff(stores[0], store, name, args.bin, args.rank, args.worst, args.tol, args.partition_rows)
+        s = diff.compute()
+        summaries.append(s)
+        for group in ("vtype", "depart", "route"):
+            write_csv(out / f"{name}_by_{group}.csv", diff.group_rows(group))
+        write_csv(out / f"{name}_worst.csv", diff.worst_rows)
+        print(f"[OK] {name}: {s['matched']} trips matched ({s['only_baseline']} only in baseline, "
+              f"{s['only_run']} only in run) in {s['partitions']} partition(s), "
+              f"hash {s['hash_s']}s + join {s['join_s']}s")
+        print(f"     {args.rank} delta avg {s[f'{args.rank}_delta_avg']} s, p95 {s[f'{args.rank}_delta_p95']} s; "
+              f"worse {s['worse_share']:.1%}, better {s['better_share']:.1%}")
+    write_csv(out / "summary.csv", summaries)
+    print(f"[OK] Wrote {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# xml_scan.py
+# Chunked scanning of SUMO's line-per-element XML outputs, shared by emission_kpis.py
+# and trip_binary.py.
+# - The file is read in large blocks cut at line ends; no tree is ever built.
+# - A regex is built from the attribute order of the file's first <item> (SUMO writes
+#   one fixed order per output), so one findall per block returns the wanted raw
+#   attribute values of every matching element, plus those of the enclosing context
+#   element (<interval>, <timestep>), forward-filled onto the items.
+# - An optional key pattern filters items by one attribute inside that regex, so
+#   non-matching elements are skipped without being split into attributes.
+# - A block whose match count disagrees with a plain count of the element (a different
+#   attribute layout, e.g. optional attributes) is parsed element by element instead.
+
+import re
+from pathlib import Path
+
+import numpy as np
+
+CHUNK_BYTES = 64 << 20
+ATTR_RE = re.compile(rb'(\w+)="([^"]*)"')
+
+def layout(xml_path: Path, tag: bytes, head_bytes: int = 8 << 20):
+    """Attribute names of the first <tag> element in the file."""
+    with Path(xml_path).open("rb") as f:
+        head = f.read(head_bytes)
+    m = re.search(rb"<" + tag + rb"\s([^>]*)>", head)
+    return [k for k, _ in ATTR_RE.findall(m.group(1))] if m else []
+
+def chunks(xml_path: Path, start: int = 0, end: int | None = None, chunk_bytes: int = CHUNK_BYTES):
+    """Blocks of complete lines covering bytes [start, end) (start must be a line start)."""
+    with Path(xml_path).open("rb") as f:
+        f.seek(start)
+        left = (end - start) if end is not None else None
+        tail = b""
+        while True:
+            n = chunk_bytes if left is None else min(chunk_bytes, left)
+            block = f.read(n) if n > 0 else b""
+            if left is not None:
+                left -= len(block)
+            if not block:
+                if tail:
+                    yield tail
+                return
+            data = tail + block
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                tail = data
+                continue
+            tail = data[cut:]
+            yield data[:cut]
+
+def context_before(xml_path: Path, pos: int, ctx_tag: bytes, window: int = 1 << 20) -> dict:
+    """Attributes of the last <ctx_tag> starting before byte pos ({} if none)."""
+    needle = b"<" + ctx_tag + b" "
+    with Path(xml_path).open("rb") as f:
+        hi = pos
+        while hi > 0:
+            lo = max(0, hi - window)
+            f.seek(lo)
+            buf = f.read(hi - lo + len(needle))
+            k = buf.rfind(needle, 0, hi - lo + len(needle) - 1)
+            if k >= 0:
+                end = buf.find(b">", k)
+                if end < 0:
+                    f.seek(lo + k)
+                    line = f.readline()
+                    end, buf, k = line.find(b">"), line, 0
+                return dict(ATTR_RE.findall(buf, k, end))
+            hi = lo
+    return {}
+
+class Scanner:
+    """
+    Raw attribute columns of <item_tag> elements (and of their <ctx_tag> context).
+    scan(block) -> (ctx, items): dicts of field name -> bytes array, one entry per
+    item; missing attributes are b"". Context carries over between blocks.
+    """
+
+    def __init__(self, xml_path: Path, item_tag: bytes, fields, ctx_tag: bytes | None = None,
+                 ctx_fields=(), key_attr: bytes | None = None, key_pattern: bytes | None = None):
+        self.item_tag = item_tag
+        self.fields = list(fields)
+        self.ctx_tag = ctx_tag
+        self.ctx_fields = list(ctx_fields) if ctx_tag else []
+        self.key_attr = key_attr
+        self.key_re = re.compile(key_pattern) if key_pattern is not None else None
+        self.last_ctx = {n: b"" for n in self.ctx_fields}
+
+        item_names = layout(xml_path, item_tag)
+        self.item_caps = [n for n in item_names if n in self.fields or n == key_attr]
+        item_pattern = self._pattern(item_names, self.fields, key_attr, key_pattern)
+        if ctx_tag:
+            # the item's "( )" group is the only per-match marker: b" " on items, b"" on context
+            ctx_names = layout(xml_path, ctx_tag)
+            self.ctx_caps = [n for n in ctx_names if n in self.ctx_fields]
+            pattern = (b"<" + ctx_tag + b" " + self._pattern(ctx_names, self.ctx_fields)
+                       + b"|<" + item_tag + b"( )" + item_pattern)
+        else:
+            self.ctx_caps = []
+            pattern = b"<" + item_tag + b" " + item_pattern
+        self.fast_re = re.compile(pattern)
+        self.count_re = (re.compile(b" " + key_attr + b'="(?:' + key_pattern + b')"')
+                         if key_pattern is not None else None)
+        self.slow_re = re.compile(rb"<(" + item_tag + (rb"|" + ctx_tag if ctx_tag else b"") + rb")\s[^>]*>")
+        self.n_ctx_cols = (len(self.ctx_caps) + 1) if ctx_tag else 0
+
+    @staticmethod
+    def _pattern(names, wanted, key_attr=None, key_pattern=None) -> bytes:
+        parts = []
+        for n in names:
+            if n == key_attr and key_pattern is not None:
+                parts.append(n + b'="(' + key_pattern + b')"')
+            elif n in wanted or n == key_attr:
+                parts.append(n + b'="([^"]*)"')
+            else:
+                parts.append(n + b'="[^"]*"')
+        # anchored at the tag's end: an element with more attributes than the layout must
+        # not match a prefix of itself (it is counted as a miss and parsed slowly)
+        return b" ".join(parts) + rb"\s*/?>"
+
+    def set_context(self, attrs: dict):
+        self.last_ctx = {n: attrs.get(n, b"") for n in self.ctx_fields}
+
+    def scan(self, data: bytes):
+        width = self.n_ctx_cols + len(self.item_caps)
+        rows = self.fast_re.findall(data) if width else []  # no layout: file without items
+        table = np.array(rows, dtype=bytes).reshape(len(rows), width)
+        if self.ctx_tag:
+            is_item = table[:, self.n_ctx_cols - 1] != b""
+        else:
+            is_item = np.ones(len(table), dtype=bool)
+        expected = (len(self.count_re.findall(data)) if self.count_re is not None
+                    else data.count(b"<" + self.item_tag + b" "))
+        if int(is_item.sum()) == expected:
+            ctx_cols = {n: table[:, i] for i, n in enumerate(self.ctx_caps)}
+            item_cols = {n: table[is_item, self.n_ctx_cols + i] for i, n in enumerate(self.item_caps)}
+        else:
+            ctx_cols, item_cols, is_item = self._scan_slow(data)
+        n_items = int(is_item.sum())
+
+        ctx = {}
+        if self.ctx_tag:
+            is_ctx = ~is_item
+            idx = np.maximum.accumulate(np.where(is_ctx, np.arange(len(is_item)), -1))[is_item]
+            for n in self.ctx_fields:
+                col = ctx_cols.get(n)
+                carry = np.array([self.last_ctx[n]], dtype=bytes)
+                if col is None or not is_ctx.any():
+                    ctx[n] = np.repeat(carry, n_items)
+                    continue
+                vals = np.concatenate([carry, col.astype(bytes)])
+                ctx[n] = vals[idx + 1]
+                self.last_ctx[n] = col[is_ctx][-1]
+        items = {n: item_cols[n] if n in item_cols else np.full(n_items, b"", dtype="S1") for n in self.fields}
+        return ctx, items
+
+    def _scan_slow(self, data: bytes):
+        item_tag = self.item_tag
+        # every wanted field, not just those of the first element's layout (an empty first
+        # <edge> of edgeData has no waitingTime / speed / ...)
+        names = list(dict.fromkeys(self.item_caps + self.fields))
+        ctx_rows, item_rows, is_item = [], [], []
+        for m in self.slow_re.finditer(data):
+            a = dict(ATTR_RE.findall(data, m.start(), m.end()))
+            if m.group(1) == item_tag:
+                if self.key_re is not None and not self.key_re.fullmatch(a.get(self.key_attr, b"")):
+                    continue
+                is_item.append(True)
+                ctx_rows.append([b""] * len(self.ctx_caps))
+                item_rows.append([a.get(n, b"") for n in names])
+            else:
+                is_item.append(False)
+                ctx_rows.append([a.get(n, b"") for n in self.ctx_caps])
+        is_item = np.array(is_item, dtype=bool)
+        ct = np.array(ctx_rows, dtype=bytes).reshape(len(ctx_rows), len(self.ctx_caps))
+        it = np.array(item_rows, dtype=bytes).reshape(len(item_rows), len(names))
+        return ({n: ct[:, i] for i, n in enumerate(self.ctx_caps)},
+                {n: it[:, i] for i, n in enumerate(names)}, is_item)
+
+def to_float(col: np.ndarray, default: float = 0.0) -> np.ndarray:
+    """Raw attribute bytes -> float64; missing (b"") -> default."""
+    col = np.asarray(col)
+    if not col.size:
+        return np.zeros(0)
+    missing = col == b""
+    if missing.any():
+        col = np.where(missing, b"0", col)
+        out = col.astype(np.float64)
+        out[missing] = default
+        return out
+    return col.astype(np.float64)